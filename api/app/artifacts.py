@@ -0,0 +1,161 @@
+import os, posixpath, re, time
+from typing import Optional
+
+import botocore
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .db import get_async_db
+from .models import Run, ProjectMember, Role
+from .auth import get_current_user
+from .s3client import client as s3client, presign, stats as s3_stats, S3_BUCKET_RUNS
+
+# Артефакты запуска: листинг S3-префикса запуска (постранично, с presigned-ссылками) и прокси-скачивание
+# с поддержкой Range — тело идёт из S3 кусками, API не держит объект целиком (BAM/VCF на десятки ГБ, IGV).
+ARTIFACTS_URL_TTL = int(os.environ.get("ARTIFACTS_URL_TTL", "3600"))            # сек жизни presigned-ссылки
+ARTIFACTS_CHUNK = int(os.environ.get("ARTIFACTS_CHUNK_KB", "1024")) * 1024      # кусок стрима из S3
+ARTIFACTS_MAX_LIMIT = 1000                                                       # MaxKeys S3 на страницу
+
+router = APIRouter(prefix="/runs", tags=["artifacts"])
+
+async def _require_view(db: AsyncSession, user: dict, project_id: str):
+    if user["role"] == Role.Admin.value: return
+    if not await db.get(ProjectMember, (user["id"], project_id)):
+        raise HTTPException(403, "Forbidden")
+
+def run_prefix(runner_job_id: str | None) -> tuple[str, str] | None:
+    """(bucket, префикс ключей) запуска: раннер пишет всё под <runner_job_id>/ в S3_BUCKET_RUNS."""
+    if not runner_job_id:
+        return None
+    return S3_BUCKET_RUNS, f"{runner_job_id}/"
+
+async def _load(db: AsyncSession, user: dict, run_id: str) -> tuple[str, str]:
+    r = await db.get(Run, run_id)
+    if not r:
+        raise HTTPException(404, "Run not found")
+    await _require_view(db, user, r.project_id)
+    loc = run_prefix(r.runner_job_id)
+    if loc is None:
+        raise HTTPException(404, "Run has no artifacts in S3")
+    return loc
+
+def _list(bucket: str, prefix: str, path: str, limit: int, cursor: str | None, recursive: bool) -> dict:
+    kw = {"Bucket": bucket, "Prefix": prefix + path, "MaxKeys": limit}
+    if cursor:
+        kw["ContinuationToken"] = cursor
+    if not recursive:
+        kw["Delimiter"] = "/"
+    page = s3client().list_objects_v2(**kw)
+    items = [{
+        "path": o["Key"][len(prefix):], "uri": f"s3://{bucket}/{o['Key']}", "size": o["Size"],
+        "etag": o["ETag"].strip('"'), "last_modified": o["LastModified"],
+        "url": presign(f"s3://{bucket}/{o['Key']}", ARTIFACTS_URL_TTL, filename=posixpath.basename(o["Key"])),
+    } for o in page.get("Contents", [])]
+    return {
+        "prefix": f"s3://{bucket}/{prefix}", "path": path,
+        "dirs": [d["Prefix"][len(prefix):] for d in page.get("CommonPrefixes", [])],
+        "items": items, "url_ttl": ARTIFACTS_URL_TTL,
+        "next_cursor": page.get("NextContinuationToken") if page.get("IsTruncated") else None,
+    }
+
+@router.get("/{run_id}/artifacts")
+async def list_artifacts(
+    run_id: str,
+    path: str = Query("", description="подкаталог относительно префикса запуска, напр. results/"),
+    recursive: bool = Query(False, description="все объекты под path, без группировки по каталогам"),
+    limit: int = Query(200, ge=1, le=ARTIFACTS_MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    bucket, prefix = await _load(db, user, run_id)
+    try:
+        return await run_in_threadpool(_list, bucket, prefix, path.lstrip("/"), limit, cursor, recursive)
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchBucket", "InvalidArgument"):
+            raise HTTPException(422, f"Cannot list artifacts: {e.response['Error']['Code']}")
+        raise
+
+# --- прокси-скачивание ---
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def _range(header: str | None) -> str | None:
+    """Один диапазон (bytes=a-b, a-, -n) передаётся в S3 как есть; multipart/ranges и мусор — игнорируются (200)."""
+    if not header:
+        return None
+    m = _RANGE.match(header.strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if m.group(1) and m.group(2) and int(m.group(2)) < int(m.group(1)):
+        return None
+    return header.strip()
+
+def _get(bucket: str, key: str, rng: str | None, if_range: str | None) -> dict:
+    kw = {"Bucket": bucket, "Key": key}
+    if rng:
+        kw["Range"] = rng
+        if if_range and if_range.startswith('"'):
+            kw["IfMatch"] = if_range   # If-Range с ETag: объект изменился → 412 → отдаём целиком
+    try:
+        return s3client().get_object(**kw)
+    except botocore.exceptions.ClientError as e:
+        if rng and if_range and e.response["Error"]["Code"] == "PreconditionFailed":
+            return s3client().get_object(Bucket=bucket, Key=key)
+        raise
+
+def _size(bucket: str, key: str) -> int:
+    return s3client().head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+def _stream(body, chunk: int):
+    t0, n = time.perf_counter(), 0
+    try:
+        for part in body.iter_chunks(chunk):
+            n += len(part)
+            yield part
+    finally:
+        body.close()   # клиент оборвал соединение — соединение пула S3 освобождается
+        s3_stats.observe_transfer("proxy", n, time.perf_counter() - t0)
+
+def _headers(obj: dict) -> dict:
+    h = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(obj["ContentLength"]),
+        "ETag": obj["ETag"],
+        "Last-Modified": obj["LastModified"].strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "X-Accel-Buffering": "no",   # nginx: не буферизовать тело на диск прокси
+        "Content-Encoding": "identity",   # GZipMiddleware пропускает: Range — по байтам объекта, BAM/gz уже сжаты
+    }
+    if obj.get("ContentRange"):
+        h["Content-Range"] = obj["ContentRange"]
+    return h
+
+@router.api_route("/{run_id}/artifacts/{path:path}", methods=["GET", "HEAD"])
+async def download_artifact(
+    run_id: str,
+    path: str,
+    request: Request,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Скачивание артефакта через API; Range → 206 с тем же куском из S3 (IGV, samtools по http)."""
+    bucket, prefix = await _load(db, user, run_id)
+    key = prefix + path
+    try:
+        if request.method == "HEAD":
+            obj = await run_in_threadpool(s3client().head_object, Bucket=bucket, Key=key)
+            return Response(status_code=200, headers=_headers(obj), media_type=obj.get("ContentType"))
+        rng = _range(request.headers.get("range"))
+        obj = await run_in_threadpool(_get, bucket, key, rng, request.headers.get("if-range"))
+    except botocore.exceptions.ClientError as e:
+        code = e.response["Error"]["Code"]
+        if code in ("NoSuchKey", "404", "NotFound"):
+            raise HTTPException(404, "Artifact not found")
+        if code == "InvalidRange":
+            size = await run_in_threadpool(_size, bucket, key)
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        raise
+    return StreamingResponse(_stream(obj["Body"], ARTIFACTS_CHUNK),
+                             status_code=206 if obj.get("ContentRange") else 200,
+                             headers=_headers(obj), media_type=obj.get("ContentType") or "application/octet-stream")
@@ -1,18 +1,11 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from .db import SessionLocal
+from .db import get_db
 from .models import AuditLog, Role
 from .auth import require_role
 
 router = APIRouter(prefix="/audit", tags=["audit"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def log_event(
     db: Session,
     *,
@@ -3,9 +3,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel
 from passlib.hash import bcrypt
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .db import SessionLocal, Base, engine
+from .db import SessionLocal, get_db, get_async_db
 from .models import User, Role
 
 # --- конфиг ---
@@ -26,14 +27,6 @@ class TokenOut(BaseModel):
     token_type: str = "bearer"
     expires_in: int
 
-# --- DB session dep ---
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # --- pw utils ---
 def hash_pw(p: str) -> str:
     return bcrypt.hash(p)
@@ -56,20 +49,20 @@ def decode_token(token: str):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 # --- deps: current user & role check ---
-def get_current_user(
+async def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     if not creds or creds.scheme.lower() != "bearer":
         raise HTTPException(status_code=401, detail="Missing bearer token")
     payload = decode_token(creds.credentials)
-    user = db.get(User, payload.get("sub"))
+    user = await db.get(User, payload.get("sub"))
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     return {"id": user.id, "username": user.username, "role": user.role.value}
 
 def require_role(*roles: Role):
-    def dep(user = Depends(get_current_user)):
+    async def dep(user = Depends(get_current_user)):
         role = user["role"]
         if role == Role.Admin.value or role in [r.value for r in roles]:
             return user
@@ -94,9 +87,8 @@ def logout():
 def me(user = Depends(get_current_user)):
     return user
 
-# --- инициализация БД + дефолтный админ при первом старте ---
+# --- дефолтный админ при первом старте (схема — app.startup) ---
 def ensure_admin():
-    Base.metadata.create_all(bind=engine)
     db = SessionLocal()
     try:
         if not db.query(User).first():
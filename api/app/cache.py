@@ -0,0 +1,153 @@
+import os, time, hashlib, threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response
+
+from .responses import dumps
+
+# Кэш ответов для read-mostly реестров (workflows, references).
+# По умолчанию — in-process; при REDIS_URL — общий для всех воркеров (инвалидация видна всем).
+REDIS_URL = os.environ.get("REDIS_URL")
+CACHE_TTL_SEC = int(os.environ.get("RESPONSE_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "512"))  # на namespace
+
+def make_etag(body: bytes) -> str:
+    # strong ETag: хэш байтов тела
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == etag for t in header.split(","))
+
+# Поколение namespace растёт при каждой инвалидации: ответ, собранный build() до инвалидации,
+# в кэш не пишется (иначе устаревшее тело жило бы с валидным ETag весь TTL).
+class _LocalBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ns: dict[str, OrderedDict] = {}
+        self._gen: dict[str, int] = {}
+
+    async def generation(self, ns: str) -> int:
+        with self._lock:
+            return self._gen.get(ns, 0)
+
+    async def get(self, ns: str, key: str):
+        with self._lock:
+            entries = self._ns.get(ns)
+            hit = entries.get(key) if entries else None
+            if not hit:
+                return None
+            etag, body, exp = hit
+            if exp < time.monotonic():
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            return etag, body
+
+    async def set(self, ns: str, key: str, etag: str, body: bytes, gen: int) -> bool:
+        with self._lock:
+            if self._gen.get(ns, 0) != gen:
+                return False
+            entries = self._ns.setdefault(ns, OrderedDict())
+            entries[key] = (etag, body, time.monotonic() + CACHE_TTL_SEC)
+            entries.move_to_end(key)
+            while len(entries) > CACHE_MAX_ENTRIES:
+                entries.popitem(last=False)
+            return True
+
+    def invalidate(self, ns: str):
+        with self._lock:
+            self._gen[ns] = self._gen.get(ns, 0) + 1
+            self._ns.pop(ns, None)
+
+class _RedisBackend:
+    # namespace = один redis-hash: инвалидация — DEL + INCR поколения, чтение — один HGET
+    # запись — скриптом: сравнение поколения и HSET атомарны относительно инвалидации
+    _SET = """
+    if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then return 0 end
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return 1
+    """
+
+    def __init__(self, url: str):
+        import redis
+        import redis.asyncio as aredis
+        self._sync = redis.Redis.from_url(url)
+        self._async = aredis.Redis.from_url(url)
+
+    @staticmethod
+    def _hkey(ns: str) -> str:
+        return f"respcache:{ns}"
+
+    @staticmethod
+    def _gkey(ns: str) -> str:
+        return f"respcache-gen:{ns}"
+
+    async def generation(self, ns: str) -> str:
+        raw = await self._async.get(self._gkey(ns))
+        return raw.decode("ascii") if raw else "0"
+
+    async def get(self, ns: str, key: str):
+        raw = await self._async.hget(self._hkey(ns), key)
+        if not raw:
+            return None
+        etag, _, body = raw.partition(b"\n")
+        return etag.decode("ascii"), body
+
+    async def set(self, ns: str, key: str, etag: str, body: bytes, gen: str) -> bool:
+        return bool(await self._async.eval(
+            self._SET, 2, self._hkey(ns), self._gkey(ns),
+            gen, key, etag.encode("ascii") + b"\n" + body, CACHE_TTL_SEC,
+        ))
+
+    def invalidate(self, ns: str):
+        with self._sync.pipeline(transaction=True) as p:
+            p.incr(self._gkey(ns))
+            p.delete(self._hkey(ns))
+            p.execute()
+
+class ResponseCache:
+    def __init__(self, backend=None):
+        self.backend = backend or (_RedisBackend(REDIS_URL) if REDIS_URL else _LocalBackend())
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def _key(request: Request) -> str:
+        q = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{q}"
+
+    def _respond(self, request: Request, etag: str, body: bytes) -> Response:
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def respond(self, request: Request, ns: str, build: Callable[[], Awaitable[Any]]) -> Response:
+        """Отдаёт JSON из кэша (или 304 по If-None-Match); при промахе вызывает build()."""
+        key = self._key(request)
+        hit = await self.backend.get(ns, key)
+        if hit:
+            self.hits += 1
+            return self._respond(request, *hit)
+        self.misses += 1
+        gen = await self.backend.generation(ns)   # до build(): инвалидация во время сборки отменит запись
+        body = dumps(await build())
+        etag = make_etag(body)
+        await self.backend.set(ns, key, etag, body, gen)
+        return self._respond(request, etag, body)
+
+    def invalidate(self, ns: str):
+        self.backend.invalidate(ns)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
+
+response_cache = ResponseCache()
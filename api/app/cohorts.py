@@ -0,0 +1,109 @@
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .db import get_db, get_async_db
+from .models import Cohort, Run, RunStatus, Sample
+from .auth import get_current_user
+from .reports import submit_report
+from .runs import ComputeOverrides, _require_edit, _require_view, _reusable_many, _runner_samples, link_reused, resolve_inputs, run_fingerprint
+from .scheduler import scheduler
+
+# Когорта: выборка сэмплов (или весь проект) → запуски в очереди; порядок выдачи — app.scheduler.
+router = APIRouter(prefix="/cohorts", tags=["cohorts"])
+
+class CohortCreate(BaseModel):
+    project_id: str
+    workflow_id: str
+    reference_set_id: str
+    sample_ids: Optional[List[str]] = None   # None — все сэмплы проекта
+    params: dict = Field(default_factory=dict)
+    compute_profile: str = "local-docker"
+    compute_overrides: Optional[ComputeOverrides] = None   # на каждый запуск когорты
+    samples_per_run: int = Field(1, ge=1, le=1000)
+    reuse: bool = True
+
+class CohortOut(BaseModel):
+    id: str
+    project_id: str
+    run_ids: List[str]
+    queued: int
+    reused: int
+
+@router.post("", response_model=CohortOut, status_code=201)
+def create_cohort(payload: CohortCreate, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    _require_edit(db, user, payload.project_id)
+    wf, ref = resolve_inputs(db, payload.workflow_id, payload.reference_set_id)
+
+    q = db.query(Sample).filter(Sample.project_id == payload.project_id)
+    if payload.sample_ids is not None:
+        s_rows = db.query(Sample).filter(Sample.id.in_(payload.sample_ids)).all()
+        if len(s_rows) != len(set(payload.sample_ids)):
+            raise HTTPException(422, "Some sample_ids not found")
+        if any(s.project_id != payload.project_id for s in s_rows):
+            raise HTTPException(403, "Sample from another project")
+    else:
+        s_rows = q.all()
+    if not s_rows:
+        raise HTTPException(422, "No samples selected")
+    s_rows.sort(key=lambda s: s.name)
+    runner_samples = _runner_samples(db, s_rows)   # R1/R2 всей когорты — одним запросом
+
+    now = datetime.utcnow()
+    cohort = Cohort(project_id=payload.project_id, workflow_id=wf.id, reference_set_id=ref.id,
+                    params=payload.params, compute_profile=payload.compute_profile,
+                    samples_per_run=payload.samples_per_run, created_by=user["id"])
+    db.add(cohort); db.flush()
+    created, reused = [], []
+    overrides = payload.compute_overrides.model_dump(exclude_none=True) if payload.compute_overrides else None
+    n = payload.samples_per_run
+    starts = range(0, len(s_rows), n)
+    fingerprints = [run_fingerprint(wf, ref, runner_samples[i:i + n], payload.params) for i in starts]
+    # переиспользуемые — одним запросом по всем отпечаткам, S3 проверяется только у найденных
+    sources = _reusable_many(db, payload.project_id, [f for f in fingerprints if f]) if payload.reuse else {}
+    for i, fingerprint in zip(starts, fingerprints):
+        chunk = s_rows[i:i + n]
+        src = sources.get(fingerprint) if fingerprint else None
+        r = Run(project_id=payload.project_id, workflow_id=wf.id, reference_set_id=ref.id,
+                sample_ids=[s.id for s in chunk], sample_count=len(chunk), params=payload.params,
+                compute_profile=payload.compute_profile, compute_overrides=overrides, status=RunStatus.Queued, fingerprint=fingerprint,
+                created_by=user["id"], cohort_id=cohort.id, queued_at=now)
+        if src:
+            link_reused(r, src)
+            reused.append(r)
+        created.append(r)
+    cohort.run_count = len(created)
+    db.add_all(created)
+    db.commit()
+
+    for r in reused:
+        submit_report(r.id, user["id"])
+    scheduler.wake()
+    return CohortOut(id=cohort.id, project_id=cohort.project_id, run_ids=[r.id for r in created],
+                     queued=len(created) - len(reused), reused=len(reused))
+
+@router.get("/{cohort_id}")
+async def get_cohort(cohort_id: str, user=Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    c = await db.get(Cohort, cohort_id)
+    if not c:
+        raise HTTPException(404, "Not found")
+    await _require_view(db, user, c.project_id)
+    rows = (await db.execute(
+        select(Run.id, Run.status, Run.sample_count, Run.started_at, Run.finished_at)
+        .where(Run.cohort_id == cohort_id).order_by(Run.queued_at, Run.id)
+    )).all()
+    counts = Counter(r.status.value for r in rows)
+    return {
+        "id": c.id, "project_id": c.project_id, "workflow_id": c.workflow_id,
+        "reference_set_id": c.reference_set_id, "samples_per_run": c.samples_per_run,
+        "created_at": c.created_at, "run_count": c.run_count,
+        "status_counts": {s.value: counts.get(s.value, 0) for s in RunStatus},
+        "runs": [{"id": r.id, "status": r.status, "sample_count": r.sample_count,
+                  "started_at": r.started_at, "finished_at": r.finished_at} for r in rows],
+    }
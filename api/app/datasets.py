@@ -1,32 +1,26 @@
-import os, tempfile, hashlib
-from typing import List
+import os, re, tempfile, hashlib
+from datetime import datetime
+from typing import List, Optional
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .db import SessionLocal
-from .models import Dataset, DatasetType, ProjectMember, Role
+from . import jobs, metering
+from .db import SessionLocal, get_db, get_async_db
+from .models import Dataset, DatasetType, ProjectMember, Role, uuid4
 from .auth import get_current_user
-from .s3client import client as s3client, ensure_bucket, S3_BUCKET_DATASETS
+from .responses import rows_response
+from .samples import pair_datasets
+from .s3client import client as s3client, ensure_bucket, split_uri, upload_file, S3_BUCKET_DATASETS
 
 router = APIRouter(prefix="/datasets", tags=["datasets"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def _is_member(db: Session, user_id: str, project_id: str) -> bool:
-    return db.query(ProjectMember).filter(
-        ProjectMember.user_id == user_id,
-        ProjectMember.project_id == project_id
-    ).first() is not None
-
-def _require_view(db: Session, user: dict, project_id: str):
+async def _require_view(db: AsyncSession, user: dict, project_id: str):
     if user["role"] == Role.Admin.value:
         return
-    if not _is_member(db, user["id"], project_id):
+    if not await db.get(ProjectMember, (user["id"], project_id)):
         raise HTTPException(status_code=403, detail="Forbidden")
 
 def _require_edit(db: Session, user: dict, project_id: str):
@@ -60,18 +54,17 @@ class DatasetOut(BaseModel):
     md5: str | None = None
 
 @router.get("", response_model=List[DatasetOut])
-def list_datasets(
+async def list_datasets(
     project_id: str = Query(...),
     user = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    _require_view(db, user, project_id)
-    rows = db.query(Dataset)\
-             .filter(Dataset.project_id == project_id)\
-             .order_by(Dataset.created_at.desc())\
-             .all()
-    return [DatasetOut(id=r.id, project_id=r.project_id, uri=r.uri, type=r.type,
-                       size_bytes=r.size_bytes, md5=r.md5) for r in rows]
+    await _require_view(db, user, project_id)
+    return rows_response(await db.execute(
+        select(Dataset.id, Dataset.project_id, Dataset.uri, Dataset.type, Dataset.size_bytes, Dataset.md5)
+        .where(Dataset.project_id == project_id)
+        .order_by(Dataset.created_at.desc())
+    ))
 
 @router.post("/upload", response_model=DatasetOut, status_code=201)
 async def upload_dataset(
@@ -100,15 +93,17 @@ async def upload_dataset(
         tmp_path = tmp.name
 
     key = f"{project_id}/{file.filename}"
-    s3 = s3client()
-    ensure_bucket()
-    s3.upload_file(tmp_path, S3_BUCKET_DATASETS, key)
-    os.remove(tmp_path)
+    ensure_bucket()  # кэшируется после старта: HEAD не повторяется на каждую загрузку
+    try:
+        await run_in_threadpool(upload_file, tmp_path, S3_BUCKET_DATASETS, key)
+    finally:
+        os.remove(tmp_path)
 
     uri = f"s3://{S3_BUCKET_DATASETS}/{key}"
     ds = Dataset(project_id=project_id, uri=uri, type=dtype,
                  size_bytes=size, md5=md5.hexdigest(), owner_user_id=user["id"])
     db.add(ds)
+    metering.add_storage(db, project_id, size)
     db.commit()
     return DatasetOut(id=ds.id, project_id=project_id, uri=uri, type=dtype,
                       size_bytes=size, md5=md5.hexdigest())
@@ -130,6 +125,83 @@ def register_dataset(
     ds = Dataset(project_id=payload.project_id, uri=payload.uri, type=payload.type,
                  size_bytes=payload.size_bytes, md5=payload.md5, owner_user_id=user["id"])
     db.add(ds)
+    metering.add_storage(db, payload.project_id, payload.size_bytes)
     db.commit()
     return DatasetOut(id=ds.id, project_id=ds.project_id, uri=ds.uri, type=ds.type,
                       size_bytes=ds.size_bytes, md5=ds.md5)
+
+# --- bulk-регистрация по S3-префиксу (фоновая задача) ---
+BULK_INSERT_CHUNK = int(os.environ.get("DATASETS_BULK_CHUNK", "5000"))   # строк на один executemany
+_MD5_ETAG = re.compile(r"^[0-9a-f]{32}$")   # ETag = md5 только у не-multipart объектов
+
+class BulkRegisterIn(BaseModel):
+    project_id: str
+    prefix: str                                  # s3://bucket/run42/ — все объекты под префиксом
+    types: Optional[List[DatasetType]] = None    # None — все типы
+    autopair: bool = False                       # после регистрации собрать сэмплы из пар R1/R2
+
+def run_bulk_register(job: jobs.Job, project_id: str, prefix: str, owner_user_id: str | None,
+                      types: list[DatasetType] | None = None, autopair: bool = False) -> dict:
+    bucket, key_prefix = split_uri(prefix)
+    # размеры и ETag — из листинга, без HEAD на объект
+    found: dict[str, dict] = {}
+    pages = 0
+    for page in s3client().get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=key_prefix):
+        pages += 1
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            if key.endswith("/"):
+                continue   # «папки» консоли S3
+            dtype = _detect_type(key)
+            if types and dtype not in types:
+                continue
+            etag = obj.get("ETag", "").strip('"')
+            found[f"s3://{bucket}/{key}"] = {"type": dtype, "size_bytes": obj["Size"],
+                                             "md5": etag if _MD5_ETAG.match(etag) else None}
+        job.update(phase="list", pages=pages, listed=len(found))
+
+    db = SessionLocal()
+    try:
+        have = {u for (u,) in db.execute(select(Dataset.uri).where(
+            Dataset.project_id == project_id, Dataset.uri.startswith(prefix, autoescape=True)))}
+        now = datetime.utcnow()
+        rows = [{"id": uuid4(), "project_id": project_id, "uri": uri, "owner_user_id": owner_user_id,
+                 "created_at": now, **meta}
+                for uri, meta in sorted(found.items()) if uri not in have]
+        job.update(phase="insert", new=len(rows), skipped=len(found) - len(rows))
+        # одна транзакция: при ошибке не остаётся половины прогона
+        for i in range(0, len(rows), BULK_INSERT_CHUNK):
+            db.execute(insert(Dataset), rows[i:i + BULK_INSERT_CHUNK])
+            job.update(inserted=min(i + BULK_INSERT_CHUNK, len(rows)))
+        metering.add_storage(db, project_id, sum(r["size_bytes"] for r in rows), now)
+        db.commit()
+
+        paired = None
+        if autopair:
+            job.update(phase="autopair")
+            res = pair_datasets(db, project_id)
+            paired = {"created": len(res.created), "updated": len(res.updated), "orphans": len(res.orphans)}
+    finally:
+        db.close()
+
+    by_type: dict[str, int] = {}
+    for r in rows:
+        by_type[r["type"].value] = by_type.get(r["type"].value, 0) + 1
+    return {"prefix": prefix, "listed": len(found), "registered": len(rows), "skipped_existing": len(found) - len(rows),
+            "bytes": sum(r["size_bytes"] for r in rows), "by_type": by_type, "autopair": paired}
+
+@router.post("/register/bulk", status_code=202)
+def register_bulk(
+    payload: BulkRegisterIn,
+    user = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Регистрирует все объекты под S3-префиксом; статус и прогресс — GET /jobs/{job_id}."""
+    _require_edit(db, user, payload.project_id)
+    try:
+        split_uri(payload.prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    job = jobs.submit("datasets.register_bulk", run_bulk_register, payload.project_id, payload.prefix, user["id"],
+                      payload.types, payload.autopair, user_id=user["id"], entity_id=payload.project_id)
+    return {"job_id": job.id, "status": job.status}
@@ -0,0 +1,296 @@
+import os, re, time, zlib, struct, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from .s3client import client as s3client, split_uri, MB
+
+# Построение .fai/.dict (и .gzi для bgzip) из FASTA в S3 за один проход — без samtools/Picard.
+# FASTA читается параллельными ranged GET по порядку; MD5 контигов (для @SQ M5) считается в пуле:
+# контиг i → однопоточный исполнитель i % N, так что куски одного контига хэшируются строго по порядку,
+# а соседние контиги — параллельно (hashlib отпускает GIL).
+FAIDX_PART_MB = int(os.environ.get("FAIDX_PART_MB", "16"))
+FAIDX_FETCH_CONCURRENCY = int(os.environ.get("FAIDX_FETCH_CONCURRENCY", "4"))
+FAIDX_HASH_WORKERS = int(os.environ.get("FAIDX_HASH_WORKERS", "4"))
+FAIDX_INFLIGHT = int(os.environ.get("FAIDX_INFLIGHT", "16"))   # кусков в очереди на хэширование (память)
+
+_NL, _GT = 0x0A, 0x3E
+_STRIP = b"\r\n\t "
+
+class FaidxError(ValueError):
+    pass
+
+# --- чтение ---
+def iter_s3(uri: str, part: int = FAIDX_PART_MB * MB, concurrency: int = FAIDX_FETCH_CONCURRENCY) -> Iterator[bytes]:
+    """Объект S3 кусками по part байт: до concurrency ranged GET впереди читателя, выдача — по порядку."""
+    bucket, key = split_uri(uri)
+    s3 = s3client()
+    size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+    def fetch(start: int) -> bytes:
+        end = min(start + part, size) - 1
+        return s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")["Body"].read()
+
+    starts = iter(range(0, size, part))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        window = [pool.submit(fetch, s) for _, s in zip(range(concurrency), starts)]
+        while window:
+            data = window.pop(0).result()
+            nxt = next(starts, None)
+            if nxt is not None:
+                window.append(pool.submit(fetch, nxt))
+            yield data
+
+def is_bgzf(head: bytes) -> bool:
+    # gzip + FEXTRA + подполе "BC" (RFC 1952 / спецификация SAM, раздел BGZF)
+    return len(head) >= 18 and head[:3] == b"\x1f\x8b\x08" and head[3] & 4 and head[12:14] == b"BC"
+
+class BgzfReader:
+    """Распаковывает поток BGZF-блоков (конкатенация gzip-членов) и собирает индекс .gzi."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = chunks
+        self.blocks: list[tuple[int, int]] = []   # (compressed, uncompressed) offset начала блоков, кроме первого
+
+    def __iter__(self) -> Iterator[bytes]:
+        d = zlib.decompressobj(31)
+        coff = uoff = 0
+        pending = None
+        first = True
+        for data in self._chunks:
+            if first:
+                if not is_bgzf(data):
+                    raise FaidxError("gzip-compressed FASTA must be BGZF (bgzip), not plain gzip")
+                first = False
+            while data:
+                if pending is not None:
+                    self.blocks.append(pending)
+                    pending = None
+                out = d.decompress(data)
+                if out:
+                    uoff += len(out)
+                    yield out
+                if not d.eof:
+                    coff += len(data)
+                    break
+                coff += len(data) - len(d.unused_data)
+                data = d.unused_data
+                d = zlib.decompressobj(31)
+                pending = (coff, uoff)
+        if pending is None and not first:
+            raise FaidxError("Truncated BGZF stream")
+
+    def gzi(self) -> bytes:
+        # пустой EOF-маркер в конце файла в индекс не входит
+        return struct.pack("<Q", len(self.blocks)) + b"".join(struct.pack("<QQ", c, u) for c, u in self.blocks)
+
+# --- разбор ---
+class FastaIndexer:
+    """Потоковый разбор FASTA: feed(chunk)… finish() → список контигов в формате FAI + M5.
+
+    Раскладка строк проверяется по правилам samtools: все строки контига, кроме последней, одной длины.
+    """
+
+    def __init__(self, hash_workers: int = FAIDX_HASH_WORKERS, inflight: int = FAIDX_INFLIGHT):
+        self.contigs: list[dict] = []
+        self._names: set[str] = set()
+        self._cur: dict | None = None
+        self._pos = 0                 # абсолютный offset начала текущего куска (несжатые координаты)
+        self._header: bytes | None = None
+        self._line_start = True
+        self._prev = b""              # последний байт предыдущего куска (для \r\n на стыке)
+        self._eol: int | None = None  # 1 = \n, 2 = \r\n
+        self._hashers = [ThreadPoolExecutor(max_workers=1, thread_name_prefix="faidx-md5")
+                         for _ in range(max(1, hash_workers))]
+        self._slots = threading.BoundedSemaphore(max(1, inflight))
+        self._futures: list = []
+
+    # --- md5 ---
+    @staticmethod
+    def _update(h, seg: bytes):
+        h.update(seg.translate(None, _STRIP).upper())
+
+    def _hash(self, c: dict, seg: bytes):
+        self._slots.acquire()
+        f = self._hashers[c["_idx"] % len(self._hashers)].submit(self._update, c["_md5"], seg)
+        f.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(f)
+        if len(self._futures) > 4 * len(self._hashers):
+            keep = []
+            for x in self._futures:
+                if x.done():
+                    x.result()   # ошибка хэширования — сразу, а не в finish()
+                else:
+                    keep.append(x)
+            self._futures = keep
+
+    # --- контиги ---
+    def _open(self, header: bytes, offset: int):
+        fields = header.rstrip(b"\r").split()
+        if not fields:
+            raise FaidxError(f"Empty FASTA header at byte {offset}")
+        name = fields[0].decode()
+        if name in self._names:
+            raise FaidxError(f"Duplicate sequence name '{name}'")
+        self._names.add(name)
+        self._cur = {"name": name, "length": 0, "offset": offset, "linebases": None, "linewidth": None,
+                     "_short": False, "_col": 0, "_idx": len(self.contigs), "_md5": hashlib.md5()}
+        self.contigs.append(self._cur)
+
+    def _close(self):
+        c = self._cur
+        if c is None:
+            return
+        if c["_col"]:
+            # последняя строка без перевода строки (конец файла)
+            self._line(c, c["_col"] + (self._eol or 1))
+        self._cur = None
+
+    def _line(self, c: dict, width: int, cr: bool = False):
+        if self._eol is None:
+            self._eol = 2 if cr else 1
+        bases = width - self._eol
+        if c["linewidth"] is None:
+            if bases > 0:
+                c["linewidth"], c["linebases"] = width, bases
+                c["length"] += bases
+            return
+        if (c["_short"] and bases > 0) or width > c["linewidth"]:
+            raise FaidxError(f"Different line length in sequence '{c['name']}'")
+        elif width < c["linewidth"]:
+            c["_short"] = True
+        c["length"] += max(bases, 0)
+
+    def _seq(self, seg: bytes):
+        c = self._cur
+        if c is None:
+            if seg.strip():
+                raise FaidxError("FASTA must start with a '>' header line")
+            return
+        self._hash(c, seg)
+        k = seg.find(b"\n")
+        if k < 0:
+            c["_col"] += len(seg)
+            return
+        cr = (seg[k - 1:k] if k else self._prev) == b"\r"
+        self._line(c, c["_col"] + k + 1, cr=cr)
+        j = seg.rfind(b"\n")
+        if j > k:
+            n = seg.count(b"\n", k + 1, j + 1)
+            w = c["linewidth"]
+            if w and not c["_short"] and n * w == j - k and seg[k + w:j + 1:w].count(b"\n") == n:
+                c["length"] += n * c["linebases"]   # быстрый путь: кусок из n полных строк
+            else:
+                start = k + 1
+                for _ in range(n):
+                    e = seg.index(b"\n", start)
+                    self._line(c, e - start + 1, cr=seg[e - 1:e] == b"\r")
+                    start = e + 1
+        c["_col"] = len(seg) - j - 1
+
+    def feed(self, chunk: bytes):
+        i, n, base = 0, len(chunk), self._pos
+        while i < n:
+            if self._header is not None:
+                j = chunk.find(b"\n", i)
+                if j < 0:
+                    self._header += chunk[i:]
+                    break
+                self._open(self._header + chunk[i:j], base + j + 1)
+                self._header = None
+                self._line_start = True
+                i = j + 1
+                continue
+            if self._line_start and chunk[i] == _GT:
+                self._close()
+                self._header = b""
+                i += 1
+                continue
+            j = chunk.find(b"\n>", i)
+            end = n if j < 0 else j + 1
+            self._seq(chunk[i:end])
+            self._line_start = chunk[end - 1] == _NL
+            i = end
+        if n:
+            self._prev = chunk[-1:]
+        self._pos += n
+
+    def finish(self) -> list[dict]:
+        if self._header is not None:
+            self._open(self._header, self._pos)
+            self._header = None
+        self._close()
+        try:
+            for f in self._futures:
+                f.result()
+        finally:
+            for ex in self._hashers:
+                ex.shutdown(wait=True)
+        out = []
+        for c in self.contigs:
+            out.append({"name": c["name"], "length": c["length"], "offset": c["offset"],
+                        "linebases": c["linebases"] or 0, "linewidth": c["linewidth"] or 0,
+                        "md5": c["_md5"].hexdigest()})
+        return out
+
+    @property
+    def position(self) -> int:
+        return self._pos
+
+# --- вывод ---
+def render_fai(contigs: list[dict]) -> bytes:
+    return "".join(
+        f"{c['name']}\t{c['length']}\t{c['offset']}\t{c['linebases']}\t{c['linewidth']}\n" for c in contigs
+    ).encode()
+
+def render_dict(contigs: list[dict], uri: str | None = None, assembly: str | None = None) -> bytes:
+    # формат Picard CreateSequenceDictionary
+    lines = ["@HD\tVN:1.6"]
+    for c in contigs:
+        f = [f"SN:{c['name']}", f"LN:{c['length']}", f"M5:{c['md5']}"]
+        if assembly:
+            f.append(f"AS:{assembly}")
+        if uri:
+            f.append(f"UR:{uri}")
+        lines.append("@SQ\t" + "\t".join(f))
+    return ("\n".join(lines) + "\n").encode()
+
+def dict_uri(fasta_uri: str) -> str:
+    # Picard: genome.fa(.gz) → genome.dict
+    return re.sub(r"\.(fa|fasta|fna)(\.b?gz)?$", "", fasta_uri, flags=re.I) + ".dict"
+
+def build_index(chunks: Iterable[bytes], compressed: bool = False,
+                progress: Callable[..., None] | None = None) -> tuple[list[dict], bytes | None]:
+    """Поток байтов FASTA (или BGZF) → (контиги, .gzi или None)."""
+    progress = progress or (lambda **_: None)
+    reader = BgzfReader(chunks) if compressed else None
+    idx = FastaIndexer()
+    try:
+        for chunk in (reader if reader is not None else chunks):
+            idx.feed(chunk)
+            progress(bytes=idx.position, contigs=len(idx.contigs))
+    finally:
+        contigs = idx.finish()
+    return contigs, (reader.gzi() if reader is not None else None)
+
+def index_fasta(fasta_uri: str, assembly: str | None = None, progress: Callable[..., None] | None = None) -> dict:
+    """Строит и выгружает рядом с FASTA .fai, .dict (и .gzi для bgzip). Возвращает описания выходов."""
+    t0 = time.perf_counter()
+    compressed = fasta_uri.lower().endswith((".gz", ".bgz"))
+    contigs, gzi = build_index(iter_s3(fasta_uri), compressed=compressed, progress=progress)
+    if not contigs:
+        raise FaidxError("No sequences found in FASTA")
+
+    s3 = s3client()
+    outputs = {}
+    for role, uri, body in (
+        ("FAI", fasta_uri + ".fai", render_fai(contigs)),
+        ("DICT", dict_uri(fasta_uri), render_dict(contigs, fasta_uri, assembly)),
+        ("GZI", fasta_uri + ".gzi", gzi),
+    ):
+        if body is None:
+            continue
+        bucket, key = split_uri(uri)
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
+        outputs[role] = {"uri": uri, "md5": hashlib.md5(body).hexdigest(), "size_bytes": len(body)}
+    return {"contigs": len(contigs), "bases": sum(c["length"] for c in contigs),
+            "outputs": outputs, "seconds": round(time.perf_counter() - t0, 3)}
@@ -0,0 +1,169 @@
+import hmac, os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from pydantic import BaseModel, Field
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session, undefer
+
+from .db import get_db
+from .models import Run, RunStatus, RunnerJob, RunnerJobStatus, RunnerNode, Role
+from .auth import require_role
+from . import runs
+
+# Парк раннеров: задание запуска — строка runner_jobs. Раннеры сами забирают задания под свободные слоты
+# (SELECT … FOR UPDATE SKIP LOCKED), продлевают аренду heartbeat'ом и присылают результат. Аренда истекла
+# (раннер умер / потерял сеть) — задание возвращается в очередь, после FLEET_MAX_ATTEMPTS выдач — Failed.
+FLEET_TOKEN = os.environ.get("RUNNER_TOKEN", "")                          # общий секрет API ↔ раннеры
+FLEET_LEASE_S = int(os.environ.get("FLEET_LEASE_S", "120"))
+FLEET_HEARTBEAT_S = int(os.environ.get("FLEET_HEARTBEAT_S", "30"))        # рекомендуемый период, < LEASE_S / 3
+FLEET_MAX_ATTEMPTS = int(os.environ.get("FLEET_MAX_ATTEMPTS", "3"))
+
+router = APIRouter(prefix="/fleet", tags=["fleet"])
+
+def _require_runner(x_runner_token: str | None = Header(None)):
+    if not FLEET_TOKEN or not hmac.compare_digest(x_runner_token or "", FLEET_TOKEN):
+        raise HTTPException(401, "Invalid runner token")
+
+# --- очередь заданий ---
+def enqueue(db: Session, r: Run, kind: str, payload: dict) -> RunnerJob:
+    """Задание для парка; коммит — за вызывающим (вместе со статусом запуска)."""
+    job = RunnerJob(run_id=r.id, kind=kind, payload=payload)
+    db.add(job)
+    return job
+
+def _reap(db: Session, now: datetime):
+    expired = db.execute(
+        select(RunnerJob).where(RunnerJob.status == RunnerJobStatus.Leased, RunnerJob.lease_expires_at < now)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    for j in expired:
+        if j.attempts >= FLEET_MAX_ATTEMPTS:
+            j.status, j.finished_at = RunnerJobStatus.Failed, now
+            j.error = f"lease expired {j.attempts} times, last runner {j.runner_id}"
+            r = db.get(Run, j.run_id)
+            r.status, r.artifact_count, r.finished_at = RunStatus.Failed, 0, now
+        else:
+            j.status, j.runner_id, j.lease_expires_at = RunnerJobStatus.Queued, None, None
+    db.flush()   # autoflush выключен: выборка очереди ниже должна видеть возвращённые задания
+
+def claim(db: Session, runner_id: str, capacity: int, now: datetime | None = None) -> list[RunnerJob]:
+    """До capacity старейших заданий из очереди — в аренду runner_id."""
+    now = now or datetime.utcnow()
+    _reap(db, now)
+    out = []
+    if capacity > 0:
+        # SKIP LOCKED: параллельные раннеры не ждут друг друга и разбирают разные строки
+        candidates = db.execute(
+            select(RunnerJob.id).where(RunnerJob.status == RunnerJobStatus.Queued)
+            .order_by(RunnerJob.created_at).limit(capacity).with_for_update(skip_locked=True)
+        ).scalars().all()
+        for job_id in candidates:
+            # условный UPDATE — защита и там, где FOR UPDATE нет (sqlite)
+            res = db.execute(
+                update(RunnerJob).where(RunnerJob.id == job_id, RunnerJob.status == RunnerJobStatus.Queued)
+                .values(status=RunnerJobStatus.Leased, runner_id=runner_id, attempts=RunnerJob.attempts + 1,
+                        lease_expires_at=now + timedelta(seconds=FLEET_LEASE_S), heartbeat_at=now)
+            )
+            if res.rowcount == 1:
+                out.append(job_id)
+        # запуск фактически стартует при первой выдаче, а не при постановке задания scheduler'ом
+        first = select(RunnerJob.run_id).where(RunnerJob.id.in_(out), RunnerJob.started_at.is_(None))
+        db.execute(update(Run).where(Run.id.in_(first)).values(started_at=now, heartbeat_at=now)
+                   .execution_options(synchronize_session=False))
+        db.execute(update(RunnerJob).where(RunnerJob.id.in_(out), RunnerJob.started_at.is_(None)).values(started_at=now))
+    db.commit()
+    if not out:
+        return []
+    return db.execute(select(RunnerJob).options(undefer(RunnerJob.payload)).where(RunnerJob.id.in_(out))
+                      .order_by(RunnerJob.created_at)).scalars().all()
+
+def heartbeat(db: Session, runner_id: str, job_ids: list[str], capacity: int, info: dict | None,
+              now: datetime | None = None) -> list[str]:
+    """Продлевает аренду заданий раннера; возвращает те, что он больше не держит (перехвачены/завершены)."""
+    now = now or datetime.utcnow()
+    held = set(db.execute(
+        select(RunnerJob.id).where(RunnerJob.id.in_(job_ids), RunnerJob.runner_id == runner_id,
+                                   RunnerJob.status == RunnerJobStatus.Leased)
+    ).scalars())
+    node = db.get(RunnerNode, runner_id) or RunnerNode(id=runner_id)
+    # running — только удерживаемые задания: потерянные (lost) слот узла в API уже не занимают
+    node.capacity, node.running, node.info, node.last_seen = capacity, len(held), info, now
+    db.merge(node)
+    if held:
+        db.execute(update(RunnerJob).where(RunnerJob.id.in_(held), RunnerJob.runner_id == runner_id,
+                                           RunnerJob.status == RunnerJobStatus.Leased)
+                   .values(lease_expires_at=now + timedelta(seconds=FLEET_LEASE_S), heartbeat_at=now))
+    db.commit()
+    return [j for j in job_ids if j not in held]
+
+def complete(db: Session, runner_id: str, job_id: str, result: dict) -> RunnerJob:
+    j = db.get(RunnerJob, job_id, with_for_update=True)
+    if not j:
+        raise HTTPException(404, "Job not found")
+    # поздний результат после истечения аренды принимается, пока задание никто не перехватил
+    mine = j.status == RunnerJobStatus.Leased and j.runner_id == runner_id
+    if not (mine or j.status == RunnerJobStatus.Queued):
+        raise HTTPException(409, "Lease lost")
+    now = datetime.utcnow()
+    j.status = RunnerJobStatus.Succeeded if result.get("status") == "Succeeded" else RunnerJobStatus.Failed
+    j.runner_id, j.result, j.finished_at, j.lease_expires_at = runner_id, result, now, None
+    j.error = result.get("error")
+    r = db.get(Run, j.run_id, options=[undefer(Run.artifacts)])
+    runs.apply_result(db, r, result, r.created_by)   # коммитит и задание
+    return j
+
+# --- API раннеров ---
+class ClaimIn(BaseModel):
+    runner_id: str
+    capacity: int = Field(ge=0, le=256)      # свободных слотов
+
+class HeartbeatIn(BaseModel):
+    runner_id: str
+    capacity: int = Field(0, ge=0)
+    running: List[str] = Field(default_factory=list)   # id заданий, которые раннер выполняет
+    info: Optional[dict] = None
+
+class CompleteIn(BaseModel):
+    runner_id: str
+    result: dict                              # ответ /run/<kind> раннера
+
+@router.post("/claim", dependencies=[Depends(_require_runner)])
+def claim_jobs(payload: ClaimIn, db: Session = Depends(get_db)):
+    jobs = claim(db, payload.runner_id, payload.capacity)
+    return {"lease_s": FLEET_LEASE_S, "heartbeat_s": FLEET_HEARTBEAT_S,
+            "jobs": [{"id": j.id, "run_id": j.run_id, "kind": j.kind, "payload": j.payload,
+                      "attempt": j.attempts} for j in jobs]}
+
+@router.post("/heartbeat", dependencies=[Depends(_require_runner)])
+def runner_heartbeat(payload: HeartbeatIn, db: Session = Depends(get_db)):
+    lost = heartbeat(db, payload.runner_id, payload.running, payload.capacity, payload.info)
+    return {"lost": lost, "lease_s": FLEET_LEASE_S}
+
+@router.post("/jobs/{job_id}/complete", dependencies=[Depends(_require_runner)])
+def complete_job(job_id: str, payload: CompleteIn, db: Session = Depends(get_db)):
+    j = complete(db, payload.runner_id, job_id, payload.result)
+    return {"id": j.id, "run_id": j.run_id, "status": j.status}
+
+# --- просмотр ---
+@router.get("/runners", dependencies=[Depends(require_role(Role.Admin))])
+def list_runners(db: Session = Depends(get_db)):
+    alive_after = datetime.utcnow() - timedelta(seconds=FLEET_LEASE_S)
+    return [{"id": n.id, "capacity": n.capacity, "running": n.running, "info": n.info, "last_seen": n.last_seen,
+             "alive": n.last_seen is not None and n.last_seen >= alive_after}
+            for n in db.query(RunnerNode).order_by(RunnerNode.id)]
+
+@router.get("/jobs", dependencies=[Depends(require_role(Role.Admin))])
+def list_jobs(
+    status: Optional[RunnerJobStatus] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    q = db.query(RunnerJob)
+    if status:
+        q = q.filter(RunnerJob.status == status)
+    return [{"id": j.id, "run_id": j.run_id, "kind": j.kind, "status": j.status, "runner_id": j.runner_id,
+             "attempts": j.attempts, "lease_expires_at": j.lease_expires_at, "heartbeat_at": j.heartbeat_at,
+             "created_at": j.created_at, "started_at": j.started_at, "finished_at": j.finished_at, "error": j.error}
+            for j in q.order_by(RunnerJob.created_at.desc()).limit(limit)]
@@ -0,0 +1,90 @@
+import os, time, uuid, threading, traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from .models import Role
+from .auth import get_current_user
+
+# Фоновые задачи API (валидация референсов, построение индексов, bulk-регистрация...).
+# Реестр in-process: статус задачи виден в том воркере uvicorn, который её принял.
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", "4"))
+JOBS_KEEP = int(os.environ.get("JOBS_KEEP", "1000"))  # сколько завершённых задач помнить
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+class Job:
+    def __init__(self, kind: str, user_id: str | None, entity_id: str | None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.entity_id = entity_id
+        self.status = "Queued"
+        self.progress: dict[str, Any] = {}
+        self.result: Any = None
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    def update(self, **progress):
+        self.progress.update(progress)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "kind": self.kind, "entity_id": self.entity_id, "status": self.status,
+            "progress": self.progress, "result": self.result, "error": self.error,
+            "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+        }
+
+_lock = threading.Lock()
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_pool = ThreadPoolExecutor(max_workers=JOBS_WORKERS, thread_name_prefix="job")
+
+def _run(job: Job, fn: Callable, args, kwargs):
+    job.status, job.started_at = "Running", time.time()
+    try:
+        job.result = fn(job, *args, **kwargs)
+        job.status = "Succeeded"
+    except Exception as e:
+        job.error = f"{type(e).__name__}: {e}"
+        job.status = "Failed"
+        traceback.print_exc()
+    finally:
+        job.finished_at = time.time()
+
+def submit(kind: str, fn: Callable, *args, user_id: str | None = None, entity_id: str | None = None, **kwargs) -> Job:
+    """Ставит fn(job, *args, **kwargs) в пул; прогресс — через job.update(...)."""
+    job = Job(kind, user_id, entity_id)
+    with _lock:
+        _jobs[job.id] = job
+        while len(_jobs) > JOBS_KEEP:
+            oldest = next(iter(_jobs.values()))
+            if oldest.finished_at is None:
+                break
+            _jobs.popitem(last=False)
+    _pool.submit(_run, job, fn, args, kwargs)
+    return job
+
+def get(job_id: str) -> Job | None:
+    with _lock:
+        return _jobs.get(job_id)
+
+def counts() -> dict[tuple[str, str], int]:
+    """(kind, status) → число задач в реестре (очередь = Queued)."""
+    out: dict[tuple[str, str], int] = {}
+    with _lock:
+        for j in _jobs.values():
+            out[(j.kind, j.status)] = out.get((j.kind, j.status), 0) + 1
+    return out
+
+@router.get("/{job_id}")
+def get_job(job_id: str, user=Depends(get_current_user)):
+    job = get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Not found")
+    if user["role"] != Role.Admin.value and job.user_id != user["id"]:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return job.to_dict()
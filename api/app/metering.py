@@ -0,0 +1,272 @@
+import os, re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+import botocore
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer
+
+from .db import SessionLocal, get_db, get_async_db
+from .models import (Run, RunStatus, Dataset, Project, ProjectMember, Role, RunUsage, UsageRollup, ProjectUsage)
+from .auth import get_current_user, require_role
+from .s3client import client as s3client, split_uri
+from . import jobs
+
+# Учёт потребления: vCPU·ч и ГБ·ч памяти запуска — из trace.txt Nextflow, хранение — из Dataset.size_bytes
+# и размеров артефактов. Каждое событие сразу добавляется инкрементом в агрегаты hour/day/month и в итог
+# проекта (project_usage) — биллинг и проверка квот читают готовые строки, а не сырые trace.
+METERING_HEAD_WORKERS = int(os.environ.get("METERING_HEAD_WORKERS", "16"))   # параллельные HEAD по артефактам
+GRANULARITIES = ("hour", "day", "month")
+
+router = APIRouter(prefix="/usage", tags=["usage"])
+
+async def _require_view(db: AsyncSession, user: dict, project_id: str):
+    if user["role"] == Role.Admin.value: return
+    if not await db.get(ProjectMember, (user["id"], project_id)):
+        raise HTTPException(403, "Forbidden")
+
+# --- разбор trace.txt ---
+_DURATION = re.compile(r"([\d.]+)\s*(ms|s|m|h|d)")
+_DURATION_S = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+_SIZE = re.compile(r"([\d.]+)\s*([KMGTP]?B)", re.I)
+_SIZE_B = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4, "PB": 1024 ** 5}
+_SKIP_STATUS = {"CACHED", "ABORTED"}   # -resume: задача не выполнялась; ABORTED — без realtime
+
+def _seconds(v: str) -> float | None:
+    """'1h 2m 3s' / '2.5s' / '120ms' (формат по умолчанию) или миллисекунды (trace.raw = true)."""
+    v = (v or "").strip()
+    if not v or v == "-":
+        return None
+    if v.isdigit():
+        return int(v) / 1000
+    parts = _DURATION.findall(v)
+    return sum(float(n) * _DURATION_S[u] for n, u in parts) if parts else None
+
+def _bytes(v: str) -> float | None:
+    v = (v or "").strip()
+    if not v or v == "-":
+        return None
+    if v.isdigit():
+        return float(v)
+    m = _SIZE.fullmatch(v)
+    return float(m.group(1)) * _SIZE_B[m.group(2).upper()] if m else None
+
+def parse_trace(lines) -> dict:
+    """Потребление по строкам trace.txt (TSV с заголовком).
+
+    vCPU·ч — cpus × realtime, если в trace.fields есть cpus (выделенное — то, что тарифицируется),
+    иначе %cpu × realtime. ГБ·ч — запрошенная memory × realtime, иначе peak_rss × realtime.
+    """
+    it = iter(lines)
+    header = next(it, "").rstrip("\n").split("\t")
+    col = {name: i for i, name in enumerate(header)}
+    if "realtime" not in col:
+        raise ValueError("trace.txt without realtime column")
+    tasks, cpu_s, mem_gb_s = 0, 0.0, 0.0
+    for line in it:
+        f = line.rstrip("\n").split("\t")
+        if len(f) < len(header):
+            continue
+        if "status" in col and f[col["status"]] in _SKIP_STATUS:
+            continue
+        realtime = _seconds(f[col["realtime"]])
+        if realtime is None:
+            continue
+        tasks += 1
+        if "cpus" in col and f[col["cpus"]].isdigit():
+            cpus = int(f[col["cpus"]])
+        elif "%cpu" in col and f[col["%cpu"]] not in ("", "-"):
+            cpus = float(f[col["%cpu"]].rstrip("%")) / 100
+        else:
+            cpus = 1
+        mem = _bytes(f[col["memory"]]) if "memory" in col else None
+        if mem is None and "peak_rss" in col:
+            mem = _bytes(f[col["peak_rss"]])
+        cpu_s += cpus * realtime
+        mem_gb_s += (mem or 0) / _SIZE_B["GB"] * realtime
+    return {"tasks": tasks, "cpu_hours": cpu_s / 3600, "mem_gb_hours": mem_gb_s / 3600}
+
+def _read_trace(uri: str) -> dict:
+    bucket, key = split_uri(uri)
+    body = s3client().get_object(Bucket=bucket, Key=key)["Body"]
+    return parse_trace(line.decode("utf-8", "replace") for line in body.iter_lines(keepends=True))
+
+def _artifact_size(uri: str) -> int:
+    try:
+        bucket, key = split_uri(uri)
+        return s3client().head_object(Bucket=bucket, Key=key)["ContentLength"]
+    except (ValueError, botocore.exceptions.ClientError):
+        return 0   # артефакт удалён / внешний URI — не хранится у нас
+
+# --- инкременты агрегатов ---
+def buckets(ts: datetime) -> dict[str, datetime]:
+    hour = ts.replace(minute=0, second=0, microsecond=0)
+    return {"hour": hour, "day": hour.replace(hour=0), "month": hour.replace(day=1, hour=0)}
+
+def _upsert_add(db: Session, model, key: dict, delta: dict):
+    """INSERT … ON CONFLICT DO UPDATE SET col = col + excluded.col — атомарно, без чтения строки."""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(model).values(**key, **delta)
+    extra = {"updated_at": datetime.utcnow()} if "updated_at" in model.__table__.c else {}
+    db.execute(stmt.values(**extra).on_conflict_do_update(
+        index_elements=list(key),
+        set_={c: model.__table__.c[c] + stmt.excluded[c] for c in delta} | extra,
+    ))
+
+def record(db: Session, project_id: str, ts: datetime, **delta):
+    """Добавляет потребление в агрегаты периода ts и в итог проекта; коммит — за вызывающим."""
+    delta = {k: v for k, v in delta.items() if v}
+    if not delta:
+        return
+    for granularity, bucket in buckets(ts).items():
+        _upsert_add(db, UsageRollup, {"project_id": project_id, "granularity": granularity, "bucket": bucket}, delta)
+    _upsert_add(db, ProjectUsage, {"project_id": project_id},
+                {k: v for k, v in delta.items() if k in ProjectUsage.__table__.c})
+
+def add_storage(db: Session, project_id: str, nbytes: int | None, ts: datetime | None = None):
+    """Новые датасеты проекта — в той же транзакции, что и их вставка."""
+    record(db, project_id, ts or datetime.utcnow(), dataset_bytes=nbytes or 0)
+
+# --- учёт запуска (фоновая задача) ---
+def run_metering(job: jobs.Job, run_id: str) -> dict:
+    db = SessionLocal()
+    try:
+        r = db.get(Run, run_id, options=[undefer(Run.artifacts)])
+        if not r:
+            raise ValueError(f"Run not found: {run_id}")
+        if db.get(RunUsage, run_id):
+            return {"run_id": run_id, "skipped": "already metered"}
+        # переиспользованный запуск не считал и не хранит новых артефактов — учитывается только как запуск
+        own = [] if r.reused_from else list(r.artifacts or [])
+        trace_uri = next((u for u in own if u.endswith("/trace.txt")), None)
+        job.update(phase="trace", trace_uri=trace_uri)
+        usage = _read_trace(trace_uri) if trace_uri else {"tasks": 0, "cpu_hours": 0.0, "mem_gb_hours": 0.0}
+        job.update(phase="artifacts", artifacts=len(own))
+        with ThreadPoolExecutor(max_workers=METERING_HEAD_WORKERS) as pool:
+            artifact_bytes = sum(pool.map(_artifact_size, own))
+        period = r.finished_at or datetime.utcnow()
+        db.add(RunUsage(run_id=run_id, project_id=r.project_id, trace_uri=trace_uri, period=period,
+                        artifact_bytes=artifact_bytes, **usage))
+        try:
+            db.flush()   # PK run_id: параллельный учёт того же запуска упадёт здесь, до инкрементов
+        except IntegrityError:
+            db.rollback()
+            return {"run_id": run_id, "skipped": "already metered"}
+        record(db, r.project_id, period, runs=1, artifact_bytes=artifact_bytes, **usage)
+        db.commit()
+        return {"run_id": run_id, "artifact_bytes": artifact_bytes, **usage}
+    finally:
+        db.close()
+
+def submit_metering(run_id: str, user_id: str | None = None) -> jobs.Job:
+    return jobs.submit("usage.meter", run_metering, run_id, user_id=user_id, entity_id=run_id)
+
+def _backfill_storage():
+    """Проекты без строки project_usage (данные до учёта): хранение датасетов — одним GROUP BY."""
+    db = SessionLocal()
+    try:
+        have = select(ProjectUsage.project_id)
+        rows = db.execute(
+            select(Dataset.project_id, func.coalesce(func.sum(Dataset.size_bytes), 0))
+            .where(Dataset.project_id.not_in(have)).group_by(Dataset.project_id)
+        ).all()
+        for project_id, nbytes in rows:
+            db.add(ProjectUsage(project_id=project_id, dataset_bytes=nbytes))
+        db.commit()
+    finally:
+        db.close()
+
+# --- API ---
+class QuotaIn(BaseModel):
+    cpu_hours: Optional[float] = Field(None, ge=0)         # None — без лимита
+    storage_bytes: Optional[int] = Field(None, ge=0)
+
+def _quota(project: Project, total: ProjectUsage | None, month: UsageRollup | None, bucket: datetime) -> dict:
+    cpu = month.cpu_hours if month else 0.0
+    storage = (total.dataset_bytes + total.artifact_bytes) if total else 0
+    return {
+        "project_id": project.id, "month": bucket,
+        "cpu_hours": round(cpu, 4), "cpu_hours_limit": project.quota_cpu_hours,
+        "storage_bytes": storage, "storage_bytes_limit": project.quota_storage_bytes,
+        "cpu_ok": project.quota_cpu_hours is None or cpu < project.quota_cpu_hours,
+        "storage_ok": project.quota_storage_bytes is None or storage < project.quota_storage_bytes,
+    }
+
+@router.get("/projects/{project_id}/quota")
+async def get_quota(project_id: str, user=Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Проверка квот: три чтения по первичному ключу, без агрегирования."""
+    await _require_view(db, user, project_id)
+    project = await db.get(Project, project_id)
+    if not project:
+        raise HTTPException(404, "Not found")
+    bucket = buckets(datetime.utcnow())["month"]
+    total = await db.get(ProjectUsage, project_id)
+    month = await db.get(UsageRollup, (project_id, "month", bucket))
+    out = _quota(project, total, month, bucket)
+    return {**out, "ok": out["cpu_ok"] and out["storage_ok"]}
+
+@router.put("/projects/{project_id}/quota", dependencies=[Depends(require_role(Role.Admin))])
+def set_quota(project_id: str, payload: QuotaIn, db: Session = Depends(get_db)):
+    project = db.get(Project, project_id)
+    if not project:
+        raise HTTPException(404, "Not found")
+    project.quota_cpu_hours, project.quota_storage_bytes = payload.cpu_hours, payload.storage_bytes
+    db.commit()
+    return {"project_id": project.id, "cpu_hours": project.quota_cpu_hours,
+            "storage_bytes": project.quota_storage_bytes}
+
+@router.get("/projects/{project_id}")
+async def get_usage(
+    project_id: str,
+    granularity: str = Query("day", pattern="^(hour|day|month)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Ряд агрегатов за период [start, end) — диапазон по первичному ключу; по умолчанию последние 30 дней."""
+    await _require_view(db, user, project_id)
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=30)
+    rows = (await db.execute(
+        select(UsageRollup)
+        .where(UsageRollup.project_id == project_id, UsageRollup.granularity == granularity,
+               UsageRollup.bucket >= buckets(start)[granularity], UsageRollup.bucket < end)
+        .order_by(UsageRollup.bucket)
+    )).scalars().all()
+    total = await db.get(ProjectUsage, project_id)
+    return {
+        "project_id": project_id, "granularity": granularity, "start": start, "end": end,
+        "total": {c: getattr(total, c) for c in ("runs", "cpu_hours", "mem_gb_hours", "dataset_bytes",
+                                                  "artifact_bytes", "updated_at")} if total else None,
+        "items": [{"bucket": r.bucket, "runs": r.runs, "tasks": r.tasks, "cpu_hours": r.cpu_hours,
+                   "mem_gb_hours": r.mem_gb_hours, "dataset_bytes": r.dataset_bytes,
+                   "artifact_bytes": r.artifact_bytes} for r in rows],
+    }
+
+@router.get("/runs/{run_id}")
+async def get_run_usage(run_id: str, user=Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    u = await db.get(RunUsage, run_id)
+    if not u:
+        raise HTTPException(404, "Not metered")
+    await _require_view(db, user, u.project_id)
+    return {"run_id": u.run_id, "project_id": u.project_id, "tasks": u.tasks, "cpu_hours": u.cpu_hours,
+            "mem_gb_hours": u.mem_gb_hours, "artifact_bytes": u.artifact_bytes, "trace_uri": u.trace_uri,
+            "period": u.period, "metered_at": u.metered_at}
+
+@router.post("/meter", status_code=202, dependencies=[Depends(require_role(Role.Admin))])
+def meter_pending(limit: int = Query(1000, ge=1, le=100000), user=Depends(get_current_user),
+                  db: Session = Depends(get_db)):
+    """Досчитывает завершённые запуски без учёта (запуски до включения учёта, упавшие задачи)."""
+    ids = db.execute(
+        select(Run.id).outerjoin(RunUsage, RunUsage.run_id == Run.id)
+        .where(RunUsage.run_id.is_(None), Run.status.in_([RunStatus.Succeeded, RunStatus.Failed]))
+        .order_by(Run.finished_at).limit(limit)
+    ).scalars().all()
+    return {"submitted": len(ids), "job_ids": [submit_metering(i, user["id"]).id for i in ids]}
@@ -0,0 +1,124 @@
+import os, time
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, SummaryMetricFamily
+from sqlalchemy import event
+
+from . import jobs
+from .db import engine, async_engine, pool_stats
+from .s3client import stats as s3_stats
+
+# Prometheus-метрики API. Хуки дешёвые: на запрос — пара observe(), на SQL-запрос — два perf_counter;
+# пул, S3 и фоновые задачи читаются из уже существующих счётчиков только в момент scrape.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+router = APIRouter(tags=["metrics"])
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Время обработки запроса",
+                         ["method", "route", "status"], buckets=_BUCKETS)
+DB_QUERIES = Histogram("db_queries_per_request", "SQL-запросов на HTTP-запрос", ["route"],
+                       buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500))
+DB_TIME = Histogram("db_query_seconds_per_request", "Время в SQL на HTTP-запрос", ["route"], buckets=_BUCKETS)
+DB_QUERIES_TOTAL = Counter("db_queries_total", "SQL-запросы (включая фоновые задачи)", ["engine"])
+DB_SECONDS_TOTAL = Counter("db_query_seconds_total", "Время в SQL (включая фоновые задачи)", ["engine"])
+
+# [запросов, секунд] текущего HTTP-запроса; в threadpool и greenlet async-драйвера контекст копируется
+_request_db: ContextVar[list | None] = ContextVar("request_db", default=None)
+
+def _track_queries(sync_engine, name: str):
+    queries, seconds = DB_QUERIES_TOTAL.labels(name), DB_SECONDS_TOTAL.labels(name)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_query_t0", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        dt = time.perf_counter() - conn.info["_query_t0"].pop()
+        queries.inc()
+        seconds.inc(dt)
+        acc = _request_db.get()
+        if acc is not None:
+            acc[0] += 1
+            acc[1] += dt
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность по шаблону маршрута (/runs/{run_id}), SQL на запрос."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        status = 500
+        acc = [0, 0.0]
+        token = _request_db.set(acc)
+        t0 = time.perf_counter()
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _request_db.reset(token)
+            route = getattr(scope.get("route"), "path", "<unmatched>")   # не сырой путь — без взрыва кардинальности
+            HTTP_LATENCY.labels(scope["method"], route, str(status)).observe(time.perf_counter() - t0)
+            DB_QUERIES.labels(route).observe(acc[0])
+            DB_TIME.labels(route).observe(acc[1])
+
+class _SnapshotCollector:
+    """Пул соединений, S3 и фоновые задачи — из существующих счётчиков, на момент scrape."""
+    def collect(self):
+        pools = pool_stats()
+        gauges = {k: GaugeMetricFamily(f"db_pool_{k}", f"Пул соединений: {k}", labels=["engine"])
+                  for k in ("size", "checkedin", "checkedout", "overflow")}
+        limit = GaugeMetricFamily("db_pool_limit", "Максимум соединений пула (pool_size + max_overflow)", labels=["engine"])
+        counters = {k: CounterMetricFamily(f"db_pool_{k}", f"Пул соединений: {k}", labels=["engine"])
+                    for k in ("connects", "checkouts", "invalidated")}
+        cfg = pools["config"]
+        for name in ("sync", "async"):
+            p = pools[name]
+            for k, g in gauges.items():
+                if k in p:
+                    g.add_metric([name], p[k])
+            for k, c in counters.items():
+                c.add_metric([name], p[k])
+            limit.add_metric([name], cfg["pool_size"] + cfg["max_overflow"])
+        yield from gauges.values()
+        yield limit
+        yield from counters.values()
+
+        snap = s3_stats.snapshot()
+        ops = SummaryMetricFamily("s3_operation_seconds", "Вызовы S3 API", labels=["op"])
+        errors = CounterMetricFamily("s3_operation_errors", "Ошибки вызовов S3 API", labels=["op"])
+        for op, o in snap["ops"].items():
+            ops.add_metric([op], o["count"], o["seconds"])
+            errors.add_metric([op], o["errors"])
+        nbytes = CounterMetricFamily("s3_transfer_bytes", "Байты upload/download", labels=["kind"])
+        tsecs = SummaryMetricFamily("s3_transfer_seconds", "Трансферы upload/download", labels=["kind"])
+        for kind, t in snap["transfers"].items():
+            nbytes.add_metric([kind], t["bytes"])
+            tsecs.add_metric([kind], t["count"], t["seconds"])
+        yield from (ops, errors, nbytes, tsecs)
+
+        depth = GaugeMetricFamily("background_jobs", "Фоновые задачи в реестре", labels=["kind", "status"])
+        for (kind, status), n in jobs.counts().items():
+            depth.add_metric([kind, status], n)
+        yield depth
+
+_track_queries(engine, "sync")
+_track_queries(async_engine.sync_engine, "async")
+REGISTRY.register(_SnapshotCollector())
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -1,6 +1,6 @@
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Enum, ForeignKey, Integer, JSON, BigInteger
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, DateTime, Enum, ForeignKey, Integer, JSON, BigInteger, Float, Text
+from sqlalchemy.orm import relationship, deferred
 import uuid, enum
 from sqlalchemy import JSON as SAJSON
 
@@ -26,6 +26,9 @@ class Project(Base):
     __tablename__ = "projects"
     id = Column(String, primary_key=True, default=uuid4)
     name = Column(String, nullable=False)
+    share = Column(Float, nullable=True)   # вес в fair-share очереди запусков (None → 1)
+    quota_cpu_hours = Column(Float, nullable=True)          # vCPU·ч в календарный месяц (None — без лимита)
+    quota_storage_bytes = Column(BigInteger, nullable=True)  # датасеты + артефакты (None — без лимита)
 
 class ProjectMember(Base):
     __tablename__ = "project_members"
@@ -89,8 +92,14 @@ class ReferenceSet(Base):
     id = Column(String, primary_key=True, default=uuid4)
     name = Column(String, nullable=False, index=True)
     genome_build = Column(Enum(GenomeBuild), nullable=False)
-    components = Column(JSON, nullable=False)   # [{role, uri, md5?}]
+    # тяжёлые JSON-колонки грузятся только на detail-эндпойнтах (undefer), списки берут счётчики
+    components = deferred(Column(JSON, nullable=False))   # [{role, uri, md5?}]
+    component_count = Column(Integer, nullable=True)      # len(components), считается при записи
     is_complete = Column(Integer, nullable=False, default=0)  # 1 = true, 0 = false
+    # отчёт проверки против S3 (refvalidate); сбрасывается при смене components
+    validation = deferred(Column(JSON, nullable=True))
+    validation_ok = Column(Integer, nullable=True)        # None = не проверялся, 1/0 = результат
+    validated_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 # --- Workflows registry (E5.1) ---
@@ -103,7 +112,8 @@ class Workflow(Base):
     repo = Column(String, nullable=True)                     # git URL
     revision = Column(String, nullable=True)                 # git tag/branch
     git_sha = Column(String, nullable=True)                  # зафиксированная ревизия
-    lock = Column(JSON, nullable=False)                      # lockfile в JSON
+    lock = deferred(Column(JSON, nullable=False))            # lockfile в JSON
+    image_count = Column(Integer, nullable=True)             # число контейнеров в lock, считается при записи
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class RunStatus(str, enum.Enum):
@@ -118,11 +128,131 @@ class Run(Base):
     project_id = Column(String, ForeignKey("projects.id"), index=True, nullable=False)
     workflow_id = Column(String, ForeignKey("workflows.id"), nullable=False)
     reference_set_id = Column(String, ForeignKey("reference_sets.id"), nullable=False)
-    sample_ids = Column(SAJSON, nullable=False, default=list)   # список IDs из таблицы samples
-    params = Column(SAJSON, nullable=False, default=dict)       # произвольные параметры
+    sample_ids = deferred(Column(SAJSON, nullable=False, default=list))   # список IDs из таблицы samples
+    sample_count = Column(Integer, nullable=True)
+    params = deferred(Column(SAJSON, nullable=False, default=dict))       # произвольные параметры
     compute_profile = Column(String, nullable=False, default="local-docker")
+    compute_overrides = deferred(Column(SAJSON, nullable=True))   # cpus/memory_gb/queue_size/... поверх профиля
+    compute = deferred(Column(SAJSON, nullable=True))             # во что профиль развернулся на узле раннера
+    nextflow_config = deferred(Column(Text, nullable=True))       # отрендеренный раннером nextflow.config
     runner_job_id = Column(String, nullable=True)               # run_id из Runner
     status = Column(Enum(RunStatus), nullable=False, default=RunStatus.Queued)
-    artifacts = Column(SAJSON, nullable=False, default=list)    # список S3 URI
+    artifacts = deferred(Column(SAJSON, nullable=False, default=list))    # список S3 URI
+    artifact_count = Column(Integer, nullable=True)
+    variant_count = Column(Integer, nullable=True)              # записей в колоночном хранилище (varstore)
+    qc_metrics = deferred(Column(SAJSON, nullable=True))        # Ti/Tv, het/hom, indel, покрытие, дубликаты (qc)
+    # sha256 воспроизводимых входов (git_sha, digest контейнеров, md5 референса и FASTQ, params);
+    # None — входы не зафиксированы полностью, такой запуск не кэшируется
+    fingerprint = Column(String, nullable=True, index=True)
+    reused_from = Column(String, ForeignKey("runs.id"), nullable=True)   # артефакты взяты из этого запуска
     created_by = Column(String, ForeignKey("users.id"), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # очередь (scheduler): когорта, постановка, старт и завершение на раннере
+    cohort_id = Column(String, ForeignKey("cohorts.id"), nullable=True, index=True)
+    queued_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)   # http-режим: процесс API, ждущий раннер, жив (scheduler)
+
+# --- Когорты: пакетная постановка запусков (cohorts) ---
+class Cohort(Base):
+    __tablename__ = "cohorts"
+    id = Column(String, primary_key=True, default=uuid4)
+    project_id = Column(String, ForeignKey("projects.id"), index=True, nullable=False)
+    workflow_id = Column(String, ForeignKey("workflows.id"), nullable=False)
+    reference_set_id = Column(String, ForeignKey("reference_sets.id"), nullable=False)
+    params = Column(SAJSON, nullable=False, default=dict)
+    compute_profile = Column(String, nullable=False, default="local-docker")
+    samples_per_run = Column(Integer, nullable=False, default=1)
+    run_count = Column(Integer, nullable=False, default=0)
+    created_by = Column(String, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# --- Отчёты по запускам (reports) ---
+class ReportStatus(str, enum.Enum):
+    Pending = "Pending"
+    Ready = "Ready"
+    Failed = "Failed"
+
+class Report(Base):
+    __tablename__ = "reports"
+    run_id = Column(String, ForeignKey("runs.id"), primary_key=True)
+    status = Column(Enum(ReportStatus), nullable=False, default=ReportStatus.Pending)
+    input_hash = Column(String, nullable=True, index=True)   # sha256 входов рендера — ключ кэша
+    html_uri = Column(String, nullable=True)
+    pdf_uri = Column(String, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    job_id = Column(String, nullable=True)                    # последняя фоновая задача рендера
+    error = Column(String, nullable=True)
+    requested_at = Column(DateTime, default=datetime.utcnow)
+    rendered_at = Column(DateTime, nullable=True)
+
+# --- Учёт потребления (metering) ---
+class RunUsage(Base):
+    """Потребление одного запуска (из trace.txt) — строка пишется один раз, вместе с инкрементом агрегатов."""
+    __tablename__ = "run_usage"
+    run_id = Column(String, ForeignKey("runs.id"), primary_key=True)
+    project_id = Column(String, ForeignKey("projects.id"), index=True, nullable=False)
+    tasks = Column(Integer, nullable=False, default=0)
+    cpu_hours = Column(Float, nullable=False, default=0.0)
+    mem_gb_hours = Column(Float, nullable=False, default=0.0)
+    artifact_bytes = Column(BigInteger, nullable=False, default=0)
+    trace_uri = Column(String, nullable=True)
+    period = Column(DateTime, nullable=False)                 # момент, к которому отнесено потребление (finished_at)
+    metered_at = Column(DateTime, default=datetime.utcnow)
+
+class UsageRollup(Base):
+    """Агрегаты по проекту: hour / day / month. Только аддитивные счётчики — обновляются инкрементом."""
+    __tablename__ = "usage_rollups"
+    project_id = Column(String, ForeignKey("projects.id"), primary_key=True)
+    granularity = Column(String, primary_key=True)            # hour | day | month
+    bucket = Column(DateTime, primary_key=True)               # начало периода (UTC)
+    runs = Column(Integer, nullable=False, default=0)
+    tasks = Column(Integer, nullable=False, default=0)
+    cpu_hours = Column(Float, nullable=False, default=0.0)
+    mem_gb_hours = Column(Float, nullable=False, default=0.0)
+    dataset_bytes = Column(BigInteger, nullable=False, default=0)    # прирост хранения за период
+    artifact_bytes = Column(BigInteger, nullable=False, default=0)
+
+class ProjectUsage(Base):
+    """Итоги по проекту на текущий момент: хранение и суммарное потребление — одна строка на проект."""
+    __tablename__ = "project_usage"
+    project_id = Column(String, ForeignKey("projects.id"), primary_key=True)
+    runs = Column(Integer, nullable=False, default=0)
+    cpu_hours = Column(Float, nullable=False, default=0.0)
+    mem_gb_hours = Column(Float, nullable=False, default=0.0)
+    dataset_bytes = Column(BigInteger, nullable=False, default=0)
+    artifact_bytes = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+# --- Парк раннеров: задания в БД, аренда с heartbeat (fleet) ---
+class RunnerJobStatus(str, enum.Enum):
+    Queued = "Queued"
+    Leased = "Leased"
+    Succeeded = "Succeeded"
+    Failed = "Failed"
+
+class RunnerJob(Base):
+    __tablename__ = "runner_jobs"
+    id = Column(String, primary_key=True, default=uuid4)
+    run_id = Column(String, ForeignKey("runs.id"), index=True, nullable=False)
+    kind = Column(String, nullable=False)                     # эндпоинт раннера: nfcore_dna_seq | container_smoke
+    payload = deferred(Column(SAJSON, nullable=False, default=dict))
+    status = Column(Enum(RunnerJobStatus), nullable=False, default=RunnerJobStatus.Queued, index=True)
+    runner_id = Column(String, nullable=True)                 # держатель аренды
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)     # выдач раннерам (истёкшая аренда → повтор)
+    error = Column(String, nullable=True)
+    result = deferred(Column(SAJSON, nullable=True))          # ответ раннера: run_id, status, artifacts, timings
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class RunnerNode(Base):
+    __tablename__ = "runner_nodes"
+    id = Column(String, primary_key=True)                     # RUNNER_ID (по умолчанию hostname)
+    capacity = Column(Integer, nullable=False, default=0)     # слотов под запуски
+    running = Column(Integer, nullable=False, default=0)
+    info = Column(SAJSON, nullable=True)                      # cpu/память/версия — как прислал раннер
+    last_seen = Column(DateTime, default=datetime.utcnow)
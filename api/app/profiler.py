@@ -0,0 +1,233 @@
+import json, os, re, sys, threading, time, uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+from .auth import require_role
+from .db import engine, async_engine
+from .models import Role
+
+# Профилировщик запросов: все SQL-запросы запроса (фингерпринты повторов → N+1) и семплы стеков
+# медленных запросов. Записи — JSON-файлы в PROFILE_DIR, хранятся последние PROFILE_KEEP.
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED", "1") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/var/lib/genomeai/profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "500"))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "1000"))        # порог записи медленного запроса
+PROFILE_SAMPLE_AFTER_MS = float(os.environ.get("PROFILE_SAMPLE_AFTER_MS", "50"))  # быстрые запросы не семплируются
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_N1_MIN = int(os.environ.get("PROFILE_N1_MIN", "10"))             # повторов одного запроса → N+1
+
+router = APIRouter(prefix="/admin/profiles", tags=["admin"])
+
+_STACK_DEPTH = 48
+# литералы и раскрытые IN (?, ?, ?) → один фингерпринт
+_NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)\s*\)"), "(?+)"),
+    (re.compile(r"\s+"), " "),
+]
+
+def fingerprint(statement: str) -> str:
+    for rx, sub in _NORMALIZE:
+        statement = rx.sub(sub, statement)
+    return statement.strip()
+
+class _Recorder:
+    __slots__ = ("t0", "statements", "threads", "stacks", "samples")
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.statements: dict[str, list] = {}   # сырой текст → [count, seconds]; нормализация — только при записи
+        self.threads = {threading.get_ident()}
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+_current: ContextVar[_Recorder | None] = ContextVar("profile_recorder", default=None)
+_active: set[_Recorder] = set()
+_active_lock = threading.Lock()
+_wake = threading.Event()
+_sampler: threading.Thread | None = None
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-store")
+
+def _track(sync_engine):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("_profile_t0", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        rec = _current.get()
+        if rec is None or not conn.info.get("_profile_t0"):
+            return
+        dt = time.perf_counter() - conn.info["_profile_t0"].pop()
+        s = rec.statements.get(statement)
+        if s is None:
+            rec.statements[statement] = [1, dt]
+        else:
+            s[0] += 1
+            s[1] += dt
+        rec.threads.add(threading.get_ident())   # поток threadpool, в котором работает sync-обработчик
+
+def _stack(frame) -> tuple:
+    out = []
+    while frame is not None and len(out) < _STACK_DEPTH:
+        code = frame.f_code
+        out.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return tuple(reversed(out))
+
+def _sample_loop():
+    while True:
+        _wake.wait()
+        now = time.perf_counter()
+        with _active_lock:
+            due = [r for r in _active if now - r.t0 >= PROFILE_SAMPLE_AFTER_MS / 1000]
+            if not _active:
+                _wake.clear()
+        if due:
+            frames = sys._current_frames()
+            for rec in due:
+                rec.samples += 1
+                for tid in tuple(rec.threads):
+                    f = frames.get(tid)
+                    # простаивающий event loop (sync-обработчик ушёл в threadpool) — не семпл запроса
+                    if f is not None and not f.f_code.co_filename.endswith("selectors.py"):
+                        rec.stacks[_stack(f)] += 1
+            del frames
+        time.sleep(PROFILE_INTERVAL_MS / 1000)
+
+def _start_sampler():
+    global _sampler
+    with _active_lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="profile-sampler", daemon=True)
+            _sampler.start()
+
+def _n_plus_one(statements: list[dict]) -> list[dict]:
+    return [s for s in statements if s["count"] >= PROFILE_N1_MIN]
+
+def _store(record: dict):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{record['id']}.json")
+    with open(path + ".tmp", "w") as fh:
+        json.dump(record, fh)
+    os.replace(path + ".tmp", path)
+    files = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+    for f in files[:max(0, len(files) - PROFILE_KEEP)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, f))
+        except FileNotFoundError:
+            pass
+
+def _finish(rec: _Recorder, scope: dict, status: int, duration: float):
+    grouped: dict[str, list] = {}
+    for stmt, (n, sec) in rec.statements.items():
+        g = grouped.setdefault(fingerprint(stmt), [0, 0.0])
+        g[0] += n
+        g[1] += sec
+    statements = sorted(({"fingerprint": f, "count": n, "seconds": round(s, 6)} for f, (n, s) in grouped.items()),
+                        key=lambda s: -s["seconds"])
+    n1 = _n_plus_one(statements)
+    slow = duration * 1000 >= PROFILE_SLOW_MS
+    if not (slow or n1):
+        return
+    ts = time.time()
+    record = {
+        # имя файла = id: сортировка по времени → ротация по именам
+        "id": f"{int(ts * 1000):013d}-{uuid.uuid4().hex[:8]}",
+        "ts": ts, "method": scope["method"], "path": scope["path"],
+        "route": getattr(scope.get("route"), "path", "<unmatched>"), "status": status,
+        "duration_ms": round(duration * 1000, 2), "slow": slow,
+        "queries": sum(s["count"] for s in statements),
+        "db_ms": round(sum(s["seconds"] for s in statements) * 1000, 2),
+        "n_plus_one": n1, "statements": statements[:50],
+        "samples": rec.samples, "interval_ms": PROFILE_INTERVAL_MS,
+        "stacks": [{"stack": list(st), "count": c} for st, c in rec.stacks.most_common(200)],
+    }
+    _writer.submit(_store, record)
+
+class ProfilerMiddleware:
+    """ASGI-middleware: SQL запроса → N+1; семплы стеков запросов дольше PROFILE_SAMPLE_AFTER_MS."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILE_ENABLED:
+            return await self.app(scope, receive, send)
+        if _sampler is None:
+            _start_sampler()
+        rec = _Recorder()
+        token = _current.set(rec)
+        with _active_lock:
+            _active.add(rec)
+        _wake.set()
+        status = 500
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            with _active_lock:
+                _active.discard(rec)
+            _current.reset(token)
+            _finish(rec, scope, status, time.perf_counter() - rec.t0)
+
+_track(engine)
+_track(async_engine.sync_engine)
+
+# --- просмотр ---
+def _load(profile_id: str) -> dict:
+    if not re.fullmatch(r"[0-9a-f-]+", profile_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+
+@router.get("", dependencies=[Depends(require_role(Role.Admin))])
+def list_profiles(
+    kind: str | None = Query(None, pattern="^(slow|n_plus_one)$"),
+    route: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    out = []
+    for f in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not f.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, f)) as fh:
+                r = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue   # вытеснен ротацией между listdir и open
+        if kind == "slow" and not r["slow"] or kind == "n_plus_one" and not r["n_plus_one"]:
+            continue
+        if route and r["route"] != route:
+            continue
+        out.append({k: r[k] for k in ("id", "ts", "method", "path", "route", "status", "duration_ms",
+                                      "slow", "queries", "db_ms", "samples")}
+                   | {"n_plus_one": [{"fingerprint": s["fingerprint"], "count": s["count"]} for s in r["n_plus_one"]]})
+        if len(out) >= limit:
+            break
+    return out
+
+@router.get("/{profile_id}", dependencies=[Depends(require_role(Role.Admin))])
+def get_profile(profile_id: str, format: str = Query("json", pattern="^(json|folded)$")):
+    r = _load(profile_id)
+    if format == "folded":
+        # формат flamegraph.pl / speedscope: "a;b;c count"
+        return PlainTextResponse("".join(f"{';'.join(s['stack'])} {s['count']}\n" for s in r["stacks"]))
+    return r
@@ -1,21 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from .db import SessionLocal
+from sqlalchemy import and_, select
+from .db import get_db, get_async_db
 from .models import Project, ProjectMember, User, Role
 from .auth import get_current_user, require_role
 from .audit import log_event
+from .responses import rows_response
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ---- Pydantic ----
 class ProjectCreate(BaseModel):
     name: str = Field(min_length=1, max_length=200)
@@ -44,10 +39,10 @@ def is_member(db: Session, user_id: str, project_id: str) -> ProjectMember | Non
         .first()
     )
 
-def ensure_access(db: Session, user: dict, project_id: str):
+async def ensure_access(db: AsyncSession, user: dict, project_id: str):
     if user["role"] == Role.Admin.value:
         return
-    if not is_member(db, user["id"], project_id):
+    if not await db.get(ProjectMember, (user["id"], project_id)):
         raise HTTPException(status_code=403, detail="Forbidden")
 
 def ensure_project_admin(db: Session, user: dict, project_id: str):
@@ -69,22 +64,19 @@ def create_project(payload: ProjectCreate, user = Depends(get_current_user), db:
     return ProjectOut(id=p.id, name=p.name)
 
 @router.get("", response_model=list[ProjectOut])
-def list_projects(user = Depends(get_current_user), db: Session = Depends(get_db)):
-    if user["role"] == Role.Admin.value:
-        rows = db.query(Project).all()
-    else:
-        rows = (
-            db.query(Project)
-            .join(ProjectMember, Project.id == ProjectMember.project_id)
-            .filter(ProjectMember.user_id == user["id"])
-            .all()
+async def list_projects(user = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    q = select(Project.id, Project.name)
+    if user["role"] != Role.Admin.value:
+        q = (
+            q.join(ProjectMember, Project.id == ProjectMember.project_id)
+            .where(ProjectMember.user_id == user["id"])
         )
-    return [ProjectOut(id=r.id, name=r.name) for r in rows]
+    return rows_response(await db.execute(q))
 
 @router.get("/{project_id}", response_model=ProjectOut)
-def get_project(project_id: str, user = Depends(get_current_user), db: Session = Depends(get_db)):
-    ensure_access(db, user, project_id)
-    p = db.get(Project, project_id)
+async def get_project(project_id: str, user = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    await ensure_access(db, user, project_id)
+    p = await db.get(Project, project_id)
     if not p:
         raise HTTPException(status_code=404, detail="Not found")
     return ProjectOut(id=p.id, name=p.name)
@@ -120,14 +112,15 @@ def delete_project(project_id: str, user = Depends(get_current_user), db: Sessio
     return {"status": "ok"}
 
 @router.get("/{project_id}/members", response_model=list[MemberOut])
-def list_members(project_id: str, user = Depends(get_current_user), db: Session = Depends(get_db)):
-    ensure_access(db, user, project_id)
+async def list_members(project_id: str, user = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    await ensure_access(db, user, project_id)
     q = (
-        db.query(ProjectMember, User)
-        .join(User, User.id == ProjectMember.user_id)
-        .filter(ProjectMember.project_id == project_id)
-        .all()
-    )
+        await db.execute(
+            select(ProjectMember, User)
+            .join(User, User.id == ProjectMember.user_id)
+            .where(ProjectMember.project_id == project_id)
+        )
+    ).all()
     return [MemberOut(user_id=u.id, username=u.username, role=pm.role) for pm, u in q]
 
 @router.post("/{project_id}/members")
@@ -0,0 +1,209 @@
+import os
+from typing import Iterable
+
+import numpy as np
+
+from . import vcf
+from .s3client import client as s3client, split_uri
+
+# QC-метрики запуска из VCF и файлов покрытия/дубликатов, без отдельного прохода MultiQC.
+# VCF приходит теми же батчами, что и в колоночное хранилище (vcf.read_vcf), и сворачивается
+# векторными операциями в накопители фиксированного размера — память не зависит от размера VCF.
+QC_PASS_ONLY = os.environ.get("QC_PASS_ONLY", "1") == "1"   # метрики по PASS/"." записям
+QC_INDEL_MAX = int(os.environ.get("QC_INDEL_MAX", "50"))     # гистограмма размеров indel: [-MAX, MAX]
+QC_DP_MAX = int(os.environ.get("QC_DP_MAX", "500"))          # гистограмма DP: 0..MAX (больше — в MAX)
+QC_COVERAGE_MAX_BYTES = 64 * 1024 * 1024
+
+_A, _C, _G, _T = (ord(b) for b in "ACGT")
+
+def _first_bytes(values: list[str]) -> np.ndarray:
+    # первый символ каждой строки, в верхнем регистре (uint8)
+    b = np.frombuffer("".join(v[:1] or "N" for v in values).encode("ascii", "replace"), dtype=np.uint8)
+    return b & 0xDF
+
+class QCAccumulator:
+    """start(header) → add(batch)… → result(). Совместим с consumers у varstore.ingest."""
+
+    def __init__(self, pass_only: bool = QC_PASS_ONLY):
+        self.pass_only = pass_only
+        self.samples: list[str] = []
+        self.contig_lengths: dict[str, int | None] = {}
+        self.records = self.filtered = 0
+        self.snv = self.ti = self.tv = self.indel = self.mnp = self.other = self.multiallelic = 0
+        self.indel_hist = np.zeros(2 * QC_INDEL_MAX + 1, dtype=np.int64)
+        self.indel_tails = [0, 0]   # < -MAX, > MAX
+        self.per_contig: dict[str, int] = {}
+        self.het = self.hom_alt = self.hom_ref = self.missing = None
+        self.dp_hist = None
+
+    def start(self, header: vcf.VcfHeader):
+        self.samples = list(header.samples)
+        self.contig_lengths = dict(header.contigs)
+        n = len(self.samples)
+        self.het, self.hom_alt = np.zeros(n, np.int64), np.zeros(n, np.int64)
+        self.hom_ref, self.missing = np.zeros(n, np.int64), np.zeros(n, np.int64)
+        self.dp_hist = np.zeros((n, QC_DP_MAX + 1), np.int64)
+
+    def add(self, batch: vcf.VcfBatch):
+        n = len(batch)
+        self.records += n
+        if self.pass_only:
+            keep = np.fromiter((f in ("PASS", ".") for f in batch.filter), dtype=bool, count=n)
+            self.filtered += int(n - keep.sum())
+        else:
+            keep = np.ones(n, dtype=bool)
+        if not keep.any():
+            return
+
+        first_alt = [a.split(",", 1)[0] for a in batch.alt]
+        ref_len = np.fromiter(map(len, batch.ref), dtype=np.int32, count=n)
+        alt_len = np.fromiter(map(len, first_alt), dtype=np.int32, count=n)
+        multi = np.fromiter(("," in a for a in batch.alt), dtype=bool, count=n)
+        symbolic = np.fromiter((a[:1] in ("<", "*", ".", "") or "[" in a or "]" in a for a in first_alt),
+                               dtype=bool, count=n)
+        plain = keep & ~symbolic
+
+        snv = plain & (ref_len == 1) & (alt_len == 1)
+        indel = plain & (ref_len != alt_len)
+        mnp = plain & (ref_len == alt_len) & (ref_len > 1)
+        self.snv += int(snv.sum())
+        self.indel += int(indel.sum())
+        self.mnp += int(mnp.sum())
+        self.other += int((keep & symbolic).sum())
+        self.multiallelic += int((keep & multi).sum())
+
+        # Ti/Tv: A<->G, C<->T — переходы, остальные пары оснований ACGT — трансверсии
+        rb, ab = _first_bytes(batch.ref), _first_bytes(first_alt)
+        acgt = lambda x: (x == _A) | (x == _C) | (x == _G) | (x == _T)  # noqa: E731
+        bases = snv & acgt(rb) & acgt(ab) & (rb != ab)
+        purine = lambda x: (x == _A) | (x == _G)  # noqa: E731
+        ti = bases & (purine(rb) == purine(ab))
+        self.ti += int(ti.sum())
+        self.tv += int((bases & ~ti).sum())
+
+        size = (alt_len - ref_len)[indel]
+        self.indel_tails[0] += int((size < -QC_INDEL_MAX).sum())
+        self.indel_tails[1] += int((size > QC_INDEL_MAX).sum())
+        size = size[np.abs(size) <= QC_INDEL_MAX]
+        self.indel_hist += np.bincount(size + QC_INDEL_MAX, minlength=self.indel_hist.size)
+
+        # плотность по контигам: батч — отрезки одной хромосомы (VCF отсортирован)
+        chrom = np.asarray(batch.chrom, dtype=object)[keep]
+        names, counts = np.unique(chrom, return_counts=True)
+        for name, c in zip(names, counts):
+            self.per_contig[name] = self.per_contig.get(name, 0) + int(c)
+
+        if self.samples:
+            gt = batch.gt[keep]
+            self.het += (gt == vcf.GT_HET).sum(axis=0)
+            self.hom_alt += (gt == vcf.GT_HOMALT).sum(axis=0)
+            self.hom_ref += (gt == vcf.GT_HOMREF).sum(axis=0)
+            self.missing += (gt == vcf.GT_MISSING).sum(axis=0)
+            dp = batch.dp[keep]
+            for j in range(len(self.samples)):
+                d = dp[:, j]
+                d = d[d >= 0]
+                self.dp_hist[j] += np.bincount(np.minimum(d, QC_DP_MAX), minlength=QC_DP_MAX + 1)
+
+    @staticmethod
+    def _hist_stats(hist: np.ndarray) -> dict:
+        total = int(hist.sum())
+        if not total:
+            return {"n": 0, "mean": None, "median": None}
+        values = np.arange(hist.size)
+        median = int(np.searchsorted(np.cumsum(hist), (total + 1) / 2))
+        return {"n": total, "mean": round(float((hist * values).sum() / total), 2), "median": median}
+
+    def result(self) -> dict:
+        samples = {}
+        for j, s in enumerate(self.samples):
+            het, hom = int(self.het[j]), int(self.hom_alt[j])
+            samples[s] = {
+                "het": het, "hom_alt": hom, "hom_ref": int(self.hom_ref[j]), "missing": int(self.missing[j]),
+                "het_hom_ratio": round(het / hom, 3) if hom else None,
+                "variant_dp": self._hist_stats(self.dp_hist[j]),
+            }
+        density = {}
+        for name, count in self.per_contig.items():
+            length = self.contig_lengths.get(name)
+            density[name] = {"variants": count,
+                             "per_mb": round(count / (length / 1e6), 3) if length else None}
+        return {
+            "pass_only": self.pass_only,
+            "records": self.records,
+            "filtered": self.filtered,
+            "snv": self.snv, "indel": self.indel, "mnp": self.mnp, "other": self.other,
+            "multiallelic": self.multiallelic,
+            "ti": self.ti, "tv": self.tv,
+            "ti_tv": round(self.ti / self.tv, 3) if self.tv else None,
+            "indel_sizes": {
+                "min": -QC_INDEL_MAX, "max": QC_INDEL_MAX,
+                "counts": self.indel_hist.tolist(),
+                "below_min": self.indel_tails[0], "above_max": self.indel_tails[1],
+            },
+            "contigs": density,
+            "samples": samples,
+        }
+
+def accumulate(batches: Iterable[vcf.VcfBatch], header: vcf.VcfHeader, pass_only: bool = QC_PASS_ONLY) -> dict:
+    acc = QCAccumulator(pass_only)
+    acc.start(header)
+    for b in batches:
+        acc.add(b)
+    return acc.result()
+
+# --- покрытие и дубликаты (mosdepth, MarkDuplicates) ---
+def parse_mosdepth_summary(text: str) -> dict:
+    """*.mosdepth.summary.txt: chrom length bases mean min max; строка "total" — по геному."""
+    rows = [ln.split("\t") for ln in text.splitlines() if ln and not ln.startswith("chrom")]
+    total = next((r for r in rows if r[0] == "total"), None)
+    return {"mean_coverage": float(total[3]) if total else None,
+            "per_contig": {r[0]: float(r[3]) for r in rows if r[0] not in ("total",) and not r[0].endswith("_region")}}
+
+def parse_mosdepth_dist(text: str, thresholds=(1, 10, 20, 30)) -> dict:
+    """*.mosdepth.global.dist.txt: доля оснований с покрытием ≥ X (строки "total")."""
+    cov = {}
+    for ln in text.splitlines():
+        f = ln.split("\t")
+        if len(f) == 3 and f[0] == "total":
+            cov[int(f[1])] = float(f[2])
+    return {f"pct_ge_{t}x": round(cov[t] * 100, 2) for t in thresholds if t in cov}
+
+def parse_markduplicates(text: str) -> dict:
+    """Picard/GATK MarkDuplicates metrics: строка после заголовка LIBRARY…"""
+    lines = text.splitlines()
+    for i, ln in enumerate(lines):
+        if ln.startswith("LIBRARY\t") and i + 1 < len(lines):
+            row = dict(zip(ln.split("\t"), lines[i + 1].split("\t")))
+            pct = row.get("PERCENT_DUPLICATION")
+            return {"percent_duplication": round(float(pct) * 100, 3) if pct not in (None, "", "?") else None,
+                    "read_pairs_examined": int(row["READ_PAIRS_EXAMINED"]) if row.get("READ_PAIRS_EXAMINED", "").isdigit() else None}
+    return {}
+
+_COVERAGE_PARSERS = (
+    (".mosdepth.summary.txt", "coverage", parse_mosdepth_summary),
+    (".mosdepth.global.dist.txt", "coverage", parse_mosdepth_dist),
+    (".metrics", "duplicates", parse_markduplicates),
+)
+
+def _sample_of(uri: str, suffix: str) -> str:
+    name = uri.rsplit("/", 1)[-1][: -len(suffix)]
+    return name.split(".", 1)[0]
+
+def coverage_metrics(artifacts: list[str]) -> dict:
+    """Сводит маленькие текстовые отчёты из артефактов по сэмплам: {sample: {coverage, duplicates}}."""
+    out: dict[str, dict] = {}
+    s3 = s3client()
+    for uri in artifacts:
+        for suffix, kind, parse in _COVERAGE_PARSERS:
+            if not uri.endswith(suffix) or (kind == "duplicates" and "markduplicates" not in uri.lower()):
+                continue
+            bucket, key = split_uri(uri)
+            obj = s3.get_object(Bucket=bucket, Key=key)
+            if obj["ContentLength"] > QC_COVERAGE_MAX_BYTES:
+                continue
+            metrics = parse(obj["Body"].read().decode(errors="replace"))
+            if metrics:
+                out.setdefault(_sample_of(uri, suffix), {}).setdefault(kind, {}).update(metrics)
+            break
+    return out
@@ -1,27 +1,31 @@
+import os
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer
 
-from .db import SessionLocal, Base, engine
+from .db import SessionLocal, get_db, get_async_db
 from .models import ReferenceSet, ReferenceRole, GenomeBuild, Role
 from .auth import get_current_user, require_role
+from .cache import response_cache
+from .responses import rows_to_dicts
+from . import jobs, refvalidate, faidx, seqstore
 
-router = APIRouter(prefix="/references", tags=["references"])
+# проверка компонентов в S3 сразу после create/update компонентов
+REF_VALIDATE_ON_WRITE = os.environ.get("REF_VALIDATE_ON_WRITE", "1") == "1"
 
-# --- deps ---
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+router = APIRouter(prefix="/references", tags=["references"])
 
 # --- схемы ---
 class Component(BaseModel):
     role: ReferenceRole
     uri: str = Field(min_length=1)
     md5: Optional[str] = None
+    size_bytes: Optional[int] = Field(default=None, ge=0)
 
 class ReferenceCreate(BaseModel):
     name: str = Field(min_length=1, max_length=200)
@@ -39,6 +43,29 @@ class ReferenceOut(BaseModel):
     components: List[Component]
     is_complete: bool
 
+class ValidationOut(BaseModel):
+    ok: Optional[bool] = None
+    validated_at: Optional[datetime] = None
+    report: Optional[dict] = None
+
+class SequenceOut(BaseModel):
+    region: str
+    contig: str
+    start: int   # 1-based, включительно
+    end: int
+    sequence: str
+
+class SequenceBatchIn(BaseModel):
+    regions: List[str] = Field(min_length=1, max_length=int(os.environ.get("SEQ_MAX_BATCH", "10000")))
+
+class ReferenceListOut(BaseModel):
+    id: str
+    name: str
+    genome_build: GenomeBuild
+    component_count: int
+    is_complete: bool
+    validation_ok: Optional[bool] = None
+
 # --- валидация полноты ---
 REQUIRED = {ReferenceRole.FASTA, ReferenceRole.FAI, ReferenceRole.DICT, ReferenceRole.BWA_INDEX}
 
@@ -69,10 +96,75 @@ def evaluate_complete(components: List[Component]) -> bool:
 
     return True
 
-# --- таблицы на старте (на всякий случай) ---
-@router.on_event("startup")
-def _init():
-    Base.metadata.create_all(bind=engine)
+def _backfill_counts():
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(ReferenceSet)
+            .options(undefer(ReferenceSet.components))
+            .filter(ReferenceSet.component_count.is_(None))
+            .all()
+        )
+        for r in rows:
+            r.component_count = len(r.components or [])
+        db.commit()
+    finally:
+        db.close()
+
+# --- проверка против S3 (фоновая задача) ---
+def run_validation(job: jobs.Job, ref_id: str) -> dict:
+    db = SessionLocal()
+    try:
+        r = db.get(ReferenceSet, ref_id, options=[undefer(ReferenceSet.components)])
+        if not r:
+            raise ValueError(f"Reference set {ref_id} not found")
+        components = list(r.components or [])
+        report = refvalidate.validate(components, progress=job.update)
+        db.refresh(r, ["components"])
+        if r.components != components:
+            # components поменялись во время проверки — отчёт устарел, его перепроверит новая задача
+            return {"ok": None, "stale": True}
+        r.validation = report
+        r.validation_ok = 1 if report["ok"] else 0
+        r.validated_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+    response_cache.invalidate("references")
+    return {"ok": report["ok"], "seconds": report["seconds"]}
+
+def _submit_validation(ref_id: str, user: dict) -> jobs.Job:
+    return jobs.submit("reference.validate", run_validation, ref_id, user_id=user["id"], entity_id=ref_id)
+
+# --- построение FAI/DICT из FASTA (фоновая задача) ---
+def run_index(job: jobs.Job, ref_id: str, user: dict) -> dict:
+    db = SessionLocal()
+    try:
+        r = db.get(ReferenceSet, ref_id, options=[undefer(ReferenceSet.components)])
+        if not r:
+            raise ValueError(f"Reference set {ref_id} not found")
+        fasta = next((c for c in (r.components or []) if c.get("role") == ReferenceRole.FASTA.value), None)
+        if not fasta:
+            raise ValueError("Reference set has no FASTA component")
+        build = r.genome_build.value if r.genome_build else None
+        result = faidx.index_fasta(fasta["uri"], assembly=build, progress=job.update)
+
+        # FAI/DICT заменяют ранее заданные; .gzi отдельной роли не имеет и остаётся рядом с FASTA
+        db.refresh(r, ["components"])
+        comps = [c for c in (r.components or []) if c.get("role") not in (ReferenceRole.FAI.value, ReferenceRole.DICT.value)]
+        for role in (ReferenceRole.FAI, ReferenceRole.DICT):
+            comps.append({"role": role.value, **result["outputs"][role.value]})
+        r.components = comps
+        r.component_count = len(comps)
+        r.is_complete = 1 if evaluate_complete([Component(**c) for c in comps]) else 0
+        r.validation, r.validation_ok, r.validated_at = None, None, None
+        db.commit()
+    finally:
+        db.close()
+    response_cache.invalidate("references")
+    if REF_VALIDATE_ON_WRITE:
+        _submit_validation(ref_id, user)
+    return result
 
 # --- эндпойнты ---
 @router.post(
@@ -88,34 +180,123 @@ def create_ref(payload: ReferenceCreate, user=Depends(get_current_user), db: Ses
         name=payload.name,
         genome_build=payload.genome_build,
         components=comps,
+        component_count=len(comps),
         is_complete=complete,
     )
     db.add(rs); db.commit()
+    response_cache.invalidate("references")
+    if REF_VALIDATE_ON_WRITE:
+        _submit_validation(rs.id, user)
     return ReferenceOut(
         id=rs.id, name=rs.name, genome_build=rs.genome_build,
         components=payload.components, is_complete=bool(rs.is_complete)
     )
 
-@router.get("", response_model=List[ReferenceOut])
-def list_refs(db: Session = Depends(get_db), user=Depends(get_current_user)):
-    rows = db.query(ReferenceSet).order_by(ReferenceSet.created_at.desc()).all()
-    out = []
-    for r in rows:
-        out.append(ReferenceOut(
+@router.get("", response_model=List[ReferenceListOut])
+async def list_refs(request: Request, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    async def build():
+        # список без components: полный документ — только в GET /references/{id}
+        res = await db.execute(
+            select(
+                ReferenceSet.id, ReferenceSet.name, ReferenceSet.genome_build,
+                func.coalesce(ReferenceSet.component_count, 0).label("component_count"),
+                (ReferenceSet.is_complete == 1).label("is_complete"),
+                (ReferenceSet.validation_ok == 1).label("validation_ok"),
+            ).order_by(ReferenceSet.created_at.desc())
+        )
+        return rows_to_dicts(list(res.keys()), res.all())
+    return await response_cache.respond(request, "references", build)
+
+@router.get("/{ref_id}", response_model=ReferenceOut)
+async def get_ref(ref_id: str, request: Request, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    async def build():
+        r = await db.get(ReferenceSet, ref_id, options=[undefer(ReferenceSet.components)])
+        if not r:
+            raise HTTPException(status_code=404, detail="Not found")
+        return ReferenceOut(
             id=r.id, name=r.name, genome_build=r.genome_build,
             components=r.components, is_complete=bool(r.is_complete)
-        ))
-    return out
+        )
+    return await response_cache.respond(request, "references", build)
 
-@router.get("/{ref_id}", response_model=ReferenceOut)
-def get_ref(ref_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    r = db.get(ReferenceSet, ref_id)
+@router.post(
+    "/{ref_id}/validate",
+    status_code=202,
+    dependencies=[Depends(require_role(Role.Editor))],
+)
+def validate_ref(ref_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    if not db.get(ReferenceSet, ref_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    job = _submit_validation(ref_id, user)
+    return {"job_id": job.id, "status": job.status}
+
+@router.post(
+    "/{ref_id}/index",
+    status_code=202,
+    dependencies=[Depends(require_role(Role.Editor))],
+)
+def index_ref(ref_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    """Строит .fai/.dict из FASTA-компонента и регистрирует их в наборе."""
+    if not db.get(ReferenceSet, ref_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    job = jobs.submit("reference.index", run_index, ref_id, user, user_id=user["id"], entity_id=ref_id)
+    return {"job_id": job.id, "status": job.status}
+
+@router.get("/{ref_id}/validation", response_model=ValidationOut)
+async def get_validation(ref_id: str, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    r = await db.get(ReferenceSet, ref_id, options=[undefer(ReferenceSet.validation)])
     if not r:
         raise HTTPException(status_code=404, detail="Not found")
-    return ReferenceOut(
-        id=r.id, name=r.name, genome_build=r.genome_build,
-        components=r.components, is_complete=bool(r.is_complete)
-    )
+    ok = None if r.validation_ok is None else bool(r.validation_ok)
+    return ValidationOut(ok=ok, validated_at=r.validated_at, report=r.validation)
+
+# --- последовательность (mmap локальной копии FASTA) ---
+async def _sequence_source(db: AsyncSession, ref_id: str, user: dict) -> seqstore.IndexedFasta:
+    r = await db.get(ReferenceSet, ref_id, options=[undefer(ReferenceSet.components)])
+    if not r:
+        raise HTTPException(status_code=404, detail="Not found")
+    fasta = next((c for c in (r.components or []) if c.get("role") == ReferenceRole.FASTA.value), None)
+    if not fasta:
+        raise HTTPException(status_code=422, detail="Reference set has no FASTA component")
+    try:
+        fa, job = await run_in_threadpool(seqstore.get_store().open, fasta["uri"], fasta.get("md5"), user["id"])
+    except seqstore.StagingFailed as e:
+        raise HTTPException(status_code=502, detail=f"Reference FASTA staging failed: {e}")
+    if fa is None:
+        raise HTTPException(
+            status_code=503,
+            detail={"status": "staging", "job_id": job.id, "progress": job.progress},
+            headers={"Retry-After": str(seqstore.SEQ_RETRY_AFTER)},
+        )
+    return fa
+
+def _slice(fa: seqstore.IndexedFasta, region: str) -> SequenceOut:
+    try:
+        name, start, end = fa.parse_region(region)
+    except seqstore.RegionError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return SequenceOut(region=region, contig=name, start=start + 1, end=end, sequence=fa.fetch(name, start, end))
+
+@router.get("/{ref_id}/sequence", response_model=SequenceOut)
+async def get_sequence(
+    ref_id: str,
+    region: str = Query(..., min_length=1, description="samtools-style, e.g. chr20:1000-2000"),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    fa = await _sequence_source(db, ref_id, user)
+    return _slice(fa, region)
+
+@router.post("/{ref_id}/sequence", response_model=List[SequenceOut])
+async def get_sequences(
+    ref_id: str,
+    payload: SequenceBatchIn,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    fa = await _sequence_source(db, ref_id, user)
+    # тысячи срезов подряд — вне event loop
+    return await run_in_threadpool(lambda: [_slice(fa, reg) for reg in payload.regions])
 
 @router.patch(
     "/{ref_id}",
@@ -131,8 +312,13 @@ def update_ref(ref_id: str, payload: ReferenceUpdate, db: Session = Depends(get_
     if payload.components is not None:
         comps = [c.dict() for c in payload.components]
         r.components = comps
+        r.component_count = len(comps)
         r.is_complete = 1 if evaluate_complete(payload.components) else 0
+        r.validation, r.validation_ok, r.validated_at = None, None, None
     db.commit()
+    response_cache.invalidate("references")
+    if payload.components is not None and REF_VALIDATE_ON_WRITE:
+        _submit_validation(r.id, user)
     return ReferenceOut(
         id=r.id, name=r.name, genome_build=r.genome_build,
         components=r.components, is_complete=bool(r.is_complete)
@@ -147,4 +333,5 @@ def delete_ref(ref_id: str, db: Session = Depends(get_db), user=Depends(get_curr
     if not r:
         raise HTTPException(status_code=404, detail="Not found")
     db.delete(r); db.commit()
+    response_cache.invalidate("references")
     return {"status": "ok"}
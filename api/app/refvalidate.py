@@ -0,0 +1,291 @@
+import os, time, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable
+
+import botocore
+
+from .s3client import client as s3client, split_uri
+
+# Проверка Reference Set против объектного хранилища: существование/размер/контрольные суммы компонентов
+# и согласованность FAI/DICT с FASTA. Читаются только заголовки и индексы (ranged GET), FASTA целиком — никогда.
+REFVAL_WORKERS = int(os.environ.get("REFVAL_WORKERS", "16"))
+REFVAL_FASTA_PROBES = int(os.environ.get("REFVAL_FASTA_PROBES", "8"))   # контигов, чьи заголовки сверяются в FASTA
+REFVAL_CACHE_SIZE = int(os.environ.get("REFVAL_CACHE_SIZE", "1024"))
+REFVAL_INDEX_MAX_MB = int(os.environ.get("REFVAL_INDEX_MAX_MB", "64"))  # FAI/DICT больше — не читаем
+
+HEADER_CHUNK = 256 * 1024
+HEADER_WINDOW = 1024   # байт перед offset контига, где должен лежать его заголовок ">name ..."
+
+BWA_SUFFIXES = (".amb", ".ann", ".bwt", ".pac", ".sa")
+BWA_MEM2_SUFFIXES = (".0123", ".amb", ".ann", ".bwt.2bit.64", ".pac")
+
+class ValidationError(RuntimeError):
+    pass
+
+# --- кэш разборов по версии объекта (uri + etag): неизменившийся индекс повторно не читается ---
+_cache: "OrderedDict[tuple, object]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cached(key: tuple, build: Callable[[], object]):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    value = build()
+    with _cache_lock:
+        _cache[key] = value
+        while len(_cache) > REFVAL_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+# --- удалённая сторона ---
+def _not_found(e: botocore.exceptions.ClientError) -> bool:
+    return e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+def _head(uri: str) -> dict:
+    """uri → {objects: [(key, size, etag)], stored_md5}. Нет объекта — пробуем как префикс (BWA-индекс, VEP cache)."""
+    bucket, key = split_uri(uri)
+    s3 = s3client()
+    try:
+        h = s3.head_object(Bucket=bucket, Key=key)
+        return {"objects": [(key, h["ContentLength"], h["ETag"].strip('"'))],
+                "stored_md5": (h.get("Metadata") or {}).get("md5")}
+    except botocore.exceptions.ClientError as e:
+        if not _not_found(e):
+            raise
+    # как runner/refcache: каталог (с "/" — без соседних bwamem2/, bwa.old/), иначе базовое имя файлов индекса
+    base = key.rstrip("/")
+    objs = _list(s3, bucket, base + "/")
+    if not objs:
+        objs = [o for o in _list(s3, bucket, base)
+                if o[0][len(base):].startswith(".") and "/" not in o[0][len(base):]]
+    return {"objects": objs, "stored_md5": None}
+
+def _list(s3, bucket: str, prefix: str) -> list:
+    objs = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        objs.extend((o["Key"], o["Size"], o["ETag"].strip('"')) for o in page.get("Contents", []))
+    return objs
+
+def _read_range(bucket: str, key: str, start: int, end: int) -> bytes:
+    return s3client().get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")["Body"].read()
+
+def _read_header(bucket: str, key: str, size: int) -> bytes:
+    # DICT: читаем чанками, пока идут строки заголовка "@..."
+    buf, pos = b"", 0
+    while pos < size:
+        chunk = _read_range(bucket, key, pos, min(pos + HEADER_CHUNK, size) - 1)
+        pos += len(chunk)
+        buf += chunk
+        last_nl = buf.rfind(b"\n")
+        if last_nl >= 0 and any(ln and not ln.startswith(b"@") for ln in buf[:last_nl].split(b"\n")):
+            break
+        if not chunk:
+            break
+    return buf
+
+# --- разбор индексов ---
+def parse_fai(data: bytes) -> list[dict]:
+    out = []
+    for n, line in enumerate(data.decode().splitlines(), 1):
+        if not line.strip():
+            continue
+        f = line.split("\t")
+        if len(f) < 5:
+            raise ValidationError(f"FAI line {n}: expected 5 columns, got {len(f)}")
+        try:
+            c = {"name": f[0], "length": int(f[1]), "offset": int(f[2]),
+                 "linebases": int(f[3]), "linewidth": int(f[4])}
+        except ValueError:
+            raise ValidationError(f"FAI line {n}: non-integer field")
+        # linebases=0 дал бы деление на ноль в _contig_end; linewidth включает перевод строки
+        if c["length"] < 0 or c["offset"] < 0 or c["linebases"] <= 0 or c["linewidth"] < c["linebases"]:
+            raise ValidationError(f"FAI line {n} ({f[0]}): invalid length/offset/linebases/linewidth")
+        out.append(c)
+    return out
+
+def parse_dict(data: bytes) -> list[dict]:
+    out = []
+    for line in data.decode(errors="replace").splitlines():
+        if not line.startswith("@SQ"):
+            continue
+        tags = dict(t.split(":", 1) for t in line.split("\t")[1:] if ":" in t)
+        if "SN" in tags and "LN" in tags:
+            out.append({"name": tags["SN"], "length": int(tags["LN"]), "m5": tags.get("M5")})
+    return out
+
+def _contig_end(c: dict) -> int:
+    full, rest = divmod(c["length"], c["linebases"])
+    return c["offset"] + full * c["linewidth"] + rest
+
+def _probe_indexes(n: int, k: int) -> list[int]:
+    if n <= k:
+        return list(range(n))
+    step = (n - 1) / (k - 1)
+    return sorted({round(i * step) for i in range(k)})
+
+# --- проверки ---
+def _check_component(comp: dict, head: dict) -> dict:
+    role, uri = comp["role"], comp["uri"]
+    objs = head["objects"]
+    res = {"role": role, "uri": uri, "status": "ok", "objects": len(objs),
+           "size": sum(s for _, s, _ in objs), "etag": objs[0][2] if len(objs) == 1 else None,
+           "errors": [], "warnings": []}
+    if not objs:
+        res["status"] = "missing"
+        res["errors"].append("object not found")
+        return res
+
+    if role == "BWA_INDEX":
+        keys = [k for k, _, _ in objs]
+        if not any(all(any(k.endswith(sfx) for k in keys) for sfx in sfxs)
+                   for sfxs in (BWA_SUFFIXES, BWA_MEM2_SUFFIXES)):
+            res["errors"].append(f"BWA index incomplete: expected files {', '.join(BWA_SUFFIXES)}")
+
+    if len(objs) == 1:
+        _, size, etag = objs[0]
+        if comp.get("size_bytes") is not None and int(comp["size_bytes"]) != size:
+            res["errors"].append(f"size mismatch: expected {comp['size_bytes']}, got {size}")
+        md5 = (comp.get("md5") or "").lower()
+        # ETag = md5 только у single-part объектов; для multipart — смотрим x-amz-meta-md5
+        actual = etag if "-" not in etag else (head.get("stored_md5") or "").lower() or None
+        if md5 and actual and md5 != actual:
+            res["errors"].append(f"md5 mismatch: expected {md5}, got {actual}")
+        elif md5 and not actual:
+            res["warnings"].append("md5 not verifiable: multipart ETag and no stored checksum")
+    if res["errors"]:
+        res["status"] = "mismatch"
+    return res
+
+def _fai_for(uri: str, etag: str, size: int) -> list[dict]:
+    def build():
+        if size > REFVAL_INDEX_MAX_MB * 1024 * 1024:
+            raise ValidationError(f"FAI too large to validate ({size} B)")
+        bucket, key = split_uri(uri)
+        return parse_fai(_read_range(bucket, key, 0, size - 1) if size else b"")
+    return _cached(("fai", uri, etag), build)
+
+def _dict_for(uri: str, etag: str, size: int) -> list[dict]:
+    def build():
+        if size > REFVAL_INDEX_MAX_MB * 1024 * 1024:
+            raise ValidationError(f"DICT too large to validate ({size} B)")
+        bucket, key = split_uri(uri)
+        return parse_dict(_read_header(bucket, key, size) if size else b"")
+    return _cached(("dict", uri, etag), build)
+
+def _probe_fasta(uri: str, etag: str, size: int, fai_etag: str, contigs: list[dict]) -> list[str]:
+    """Сверяет заголовки выбранных контигов по offset из FAI и что FASTA не короче последнего контига."""
+    def build():
+        bucket, key = split_uri(uri)
+        errors = []
+        end = max(_contig_end(c) for c in contigs)
+        if end > size:
+            errors.append(f"FASTA is {size} B but FAI places sequence up to byte {end}")
+            return errors
+
+        def probe(c):
+            start = max(0, c["offset"] - len(c["name"]) - HEADER_WINDOW)
+            window = _read_range(bucket, key, start, c["offset"] - 1) if c["offset"] else b""
+            if not window.endswith(b"\n"):
+                return f"{c['name']}: FAI offset {c['offset']} is not at a line start"
+            body = window[:-1]
+            cut = body.rfind(b"\n")
+            header = body[cut + 1:]
+            if not header.startswith(b">") or header[1:].split()[:1] != [c["name"].encode()]:
+                return f"{c['name']}: FASTA header at FAI offset does not match (found {header[:60]!r})"
+            return None
+
+        picks = [contigs[i] for i in _probe_indexes(len(contigs), REFVAL_FASTA_PROBES)]
+        with ThreadPoolExecutor(max_workers=min(REFVAL_WORKERS, len(picks))) as pool:
+            errors.extend(e for e in pool.map(probe, picks) if e)
+        return errors
+    return _cached(("fasta", uri, etag, fai_etag), build)
+
+def _compare_fai_dict(fai: list[dict], dct: list[dict]) -> list[str]:
+    errors = []
+    fl = {c["name"]: c["length"] for c in fai}
+    dl = {c["name"]: c["length"] for c in dct}
+    only_fai = [n for n in fl if n not in dl]
+    only_dict = [n for n in dl if n not in fl]
+    if only_fai:
+        errors.append(f"{len(only_fai)} contig(s) in FAI but not in DICT: {', '.join(only_fai[:5])}")
+    if only_dict:
+        errors.append(f"{len(only_dict)} contig(s) in DICT but not in FAI: {', '.join(only_dict[:5])}")
+    bad = [n for n in fl if n in dl and fl[n] != dl[n]]
+    for n in bad[:5]:
+        errors.append(f"{n}: FAI length {fl[n]} != DICT length {dl[n]}")
+    if len(bad) > 5:
+        errors.append(f"... and {len(bad) - 5} more length mismatches")
+    if not only_fai and not only_dict and [c["name"] for c in fai] != [c["name"] for c in dct]:
+        errors.append("contig order differs between FAI and DICT")
+    return errors
+
+def _consistency(by_role: dict) -> dict:
+    out = {"checked": False, "contigs": None, "errors": [], "warnings": []}
+    fasta, fai, dct = by_role.get("FASTA"), by_role.get("FAI"), by_role.get("DICT")
+    if not (fasta and fai and dct) or any(c["status"] == "missing" for c in (fasta, fai, dct)):
+        out["warnings"].append("FASTA/FAI/DICT not all present: consistency not checked")
+        return out
+    if not fai["etag"] or not dct["etag"] or not fasta["etag"]:
+        out["warnings"].append("FASTA/FAI/DICT must be single objects: consistency not checked")
+        return out
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        f_fai = pool.submit(_fai_for, fai["uri"], fai["etag"], fai["size"])
+        f_dict = pool.submit(_dict_for, dct["uri"], dct["etag"], dct["size"])
+        try:
+            fai_contigs, dict_contigs = f_fai.result(), f_dict.result()
+        except (ValidationError, ValueError) as e:
+            out["errors"].append(str(e))
+            return out
+
+    out["checked"] = True
+    out["contigs"] = len(fai_contigs)
+    if not fai_contigs:
+        out["errors"].append("FAI has no contigs")
+        return out
+    out["errors"].extend(_compare_fai_dict(fai_contigs, dict_contigs))
+    if fasta["uri"].endswith((".gz", ".bgz")):
+        # offset'ы FAI для bgzip — в несжатых координатах, ranged GET по ним не работает
+        out["warnings"].append("compressed FASTA: header probes skipped")
+    else:
+        out["errors"].extend(_probe_fasta(fasta["uri"], fasta["etag"], fasta["size"], fai["etag"], fai_contigs))
+    return out
+
+def validate(components: list[dict], progress: Callable[..., None] | None = None) -> dict:
+    """HEAD всех компонентов параллельно + согласованность FASTA/FAI/DICT. Возвращает отчёт (JSON-совместимый)."""
+    t0 = time.perf_counter()
+    progress = progress or (lambda **_: None)
+    progress(phase="head", total=len(components))
+
+    def one(c: dict) -> dict:
+        base = {"role": c.get("role"), "uri": c.get("uri"), "objects": 0, "size": None, "etag": None}
+        if not (c.get("uri") or "").startswith("s3://"):
+            return {**base, "status": "unchecked", "errors": [],
+                    "warnings": ["not an s3:// URI: existence not checked"]}
+        try:
+            return _check_component(c, _head(c["uri"]))
+        except botocore.exceptions.ClientError as e:
+            return {**base, "status": "error", "errors": [str(e)], "warnings": []}
+
+    results: list[dict] = []
+    if components:
+        with ThreadPoolExecutor(max_workers=min(REFVAL_WORKERS, len(components))) as pool:
+            results = list(pool.map(one, components))
+
+    progress(phase="consistency")
+    by_role = {}
+    for r in results:
+        by_role.setdefault(r["role"], r)
+    consistency = _consistency(by_role)
+
+    ok = not consistency["errors"] and all(not r["errors"] for r in results)
+    return {
+        "ok": ok,
+        "checked_at": datetime.utcnow().isoformat() + "Z",
+        "seconds": round(time.perf_counter() - t0, 3),
+        "components": results,
+        "consistency": consistency,
+    }
@@ -0,0 +1,355 @@
+import hashlib, html, os, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import botocore
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, RedirectResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer
+
+from .db import SessionLocal, get_db, get_async_db
+from .models import (Run, RunStatus, Workflow, ReferenceSet, Sample, Dataset, Project, User,
+                     ProjectMember, Role, Report, ReportStatus)
+from .auth import get_current_user
+from .s3client import client as s3client, ensure_bucket, presign, split_uri
+from . import jobs
+
+# Отчёты по запускам: HTML (+ PDF, если есть weasyprint) собирается фоновой задачей после завершения
+# запуска и лежит в S3 по хэшу входов. Запросы отдают только presigned-ссылку — рендер не на пути запроса.
+REPORTS_BUCKET = os.environ.get("S3_BUCKET_REPORTS", "reports")
+REPORTS_URL_TTL = int(os.environ.get("REPORTS_URL_TTL", "3600"))             # сек жизни presigned-ссылки
+REPORTS_PDF = os.environ.get("REPORTS_PDF", "auto")                         # auto — PDF при наличии weasyprint; 0 — только HTML
+REPORTS_HEAD_WORKERS = int(os.environ.get("REPORTS_HEAD_WORKERS", "16"))     # параллельные HEAD по артефактам
+REPORTS_PENDING_TIMEOUT = int(os.environ.get("REPORTS_PENDING_TIMEOUT", "600"))  # сек, после которых Pending перезапускается
+REPORTS_RETRY_AFTER = 5
+# версия разметки входит в хэш: после правки шаблона старые отчёты перерендериваются
+REPORT_TEMPLATE_VERSION = "1"
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+async def _require_view(db: AsyncSession, user: dict, project_id: str):
+    if user["role"] == Role.Admin.value: return
+    if not await db.get(ProjectMember, (user["id"], project_id)):
+        raise HTTPException(403, "Forbidden")
+
+def _require_edit(db: Session, user: dict, project_id: str):
+    if user["role"] == Role.Admin.value: return
+    pm = db.get(ProjectMember, (user["id"], project_id))
+    if not pm or pm.role not in [Role.Admin, Role.Editor]:
+        raise HTTPException(403, "Forbidden")
+
+# --- входы отчёта ---
+def _head(uri: str) -> dict:
+    try:
+        bucket, key = split_uri(uri)
+        h = s3client().head_object(Bucket=bucket, Key=key)
+        return {"uri": uri, "size": h["ContentLength"], "etag": h["ETag"].strip('"')}
+    except (ValueError, botocore.exceptions.ClientError) as e:
+        return {"uri": uri, "error": str(e)}
+
+def collect_inputs(db: Session, run: Run) -> tuple[dict, dict]:
+    """(inputs, context). inputs определяют содержимое отчёта и входят в хэш; context — шапка запуска.
+
+    Идентичность запуска (id, дата, автор) в хэш не входит: клон с теми же артефактами
+    получает уже собранный отчёт исходного запуска.
+    """
+    wf = db.get(Workflow, run.workflow_id, options=[undefer(Workflow.lock)])
+    ref = db.get(ReferenceSet, run.reference_set_id, options=[undefer(ReferenceSet.components)])
+    project = db.get(Project, run.project_id)
+    samples = db.query(Sample).filter(Sample.id.in_(run.sample_ids or [])).all()
+    ds = {d.id: d for d in db.query(Dataset).filter(
+        Dataset.id.in_({s.r1_dataset_id for s in samples} | {s.r2_dataset_id for s in samples})).all()}
+    artifacts = list(run.artifacts or [])
+    with ThreadPoolExecutor(max_workers=max(1, min(REPORTS_HEAD_WORKERS, len(artifacts)))) as pool:
+        heads = list(pool.map(_head, artifacts))
+
+    def _fq(dataset_id):
+        d = ds.get(dataset_id)
+        return {"uri": d.uri, "md5": d.md5, "size": d.size_bytes} if d else None
+
+    inputs = {
+        "template": REPORT_TEMPLATE_VERSION,
+        "project": {"id": run.project_id, "name": project.name if project else None},
+        "status": run.status.value,
+        "params": run.params or {},
+        "workflow": wf and {
+            "name": wf.name, "version": wf.version, "engine": wf.engine, "repo": wf.repo,
+            "revision": wf.revision, "git_sha": wf.git_sha, "lock": wf.lock,
+        },
+        "reference": ref and {
+            "id": ref.id, "name": ref.name, "genome_build": ref.genome_build.value,
+            "validation_ok": ref.validation_ok,
+            "components": [{k: c.get(k) for k in ("role", "uri", "md5", "size_bytes")} for c in (ref.components or [])],
+        },
+        "samples": sorted(({"name": s.name, "r1": _fq(s.r1_dataset_id), "r2": _fq(s.r2_dataset_id)} for s in samples),
+                          key=lambda s: s["name"]),
+        "artifacts": heads,
+        "qc": run.qc_metrics,
+    }
+    author = db.get(User, run.created_by) if run.created_by else None
+    context = {
+        "run_id": run.id, "runner_job_id": run.runner_job_id, "compute_profile": run.compute_profile,
+        "created_at": run.created_at, "created_by": author.username if author else None,
+    }
+    return inputs, context
+
+def input_hash(inputs: dict) -> str:
+    return hashlib.sha256(orjson.dumps(inputs, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+# --- рендер ---
+def _e(v) -> str:
+    return html.escape("—" if v is None or v == "" else str(v))
+
+def _table(headers: list[str], rows: list[list]) -> str:
+    if not rows:
+        return "<p class=muted>нет данных</p>"
+    head = "".join(f"<th>{_e(h)}</th>" for h in headers)
+    body = "".join("<tr>" + "".join(f"<td>{_e(c)}</td>" for c in r) + "</tr>" for r in rows)
+    return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+def _size(n) -> str | None:
+    if n is None:
+        return None
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if n < 1024 or unit == "TB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+def _containers(lock: dict | None) -> list[list]:
+    items = (lock or {}).get("containers") or (lock or {}).get("images") or []
+    if isinstance(items, dict):
+        return [[k, v if not isinstance(v, dict) else v.get("image") or v.get("uri"), None] for k, v in items.items()]
+    rows = []
+    for c in items:
+        if isinstance(c, dict):
+            rows.append([c.get("name") or c.get("process"), c.get("image") or c.get("uri"), c.get("digest") or c.get("sha256")])
+        else:
+            rows.append([None, c, None])
+    return rows
+
+_CSS = """
+body{font:13px/1.45 -apple-system,Segoe UI,Roboto,sans-serif;color:#1c1c1c;margin:32px}
+h1{font-size:20px;margin:0 0 4px}h2{font-size:15px;margin:28px 0 8px;border-bottom:1px solid #ccc}
+table{border-collapse:collapse;width:100%;margin:4px 0}th,td{border:1px solid #ddd;padding:3px 6px;text-align:left;
+vertical-align:top;word-break:break-all}th{background:#f3f3f3}.muted{color:#777}
+pre{background:#f7f7f7;padding:8px;font-size:11px;white-space:pre-wrap;word-break:break-all}
+"""
+
+def render_html(inputs: dict, context: dict) -> str:
+    wf, ref, qc = inputs["workflow"] or {}, inputs["reference"] or {}, inputs["qc"] or {}
+    v = qc.get("variants") or {}
+    per_sample = qc.get("samples") or {}
+    names = sorted(set(v.get("samples") or {}) | set(per_sample))
+    sample_rows = []
+    for n in names:
+        g = (v.get("samples") or {}).get(n, {})
+        cov = per_sample.get(n, {}).get("coverage", {})
+        dup = per_sample.get(n, {}).get("duplicates", {})
+        sample_rows.append([n, g.get("het"), g.get("hom_alt"), g.get("het_hom_ratio"),
+                            (g.get("variant_dp") or {}).get("mean"), cov.get("mean_coverage"),
+                            cov.get("pct_ge_10x"), cov.get("pct_ge_30x"), dup.get("percent_duplication")])
+    ref_validation = {None: "не проверялся", 1: "пройдена", 0: "ошибки"}.get(ref.get("validation_ok"), "—")
+    parts = [
+        f"<h1>Отчёт по запуску {_e(context['run_id'])}</h1>",
+        f"<p class=muted>Сформирован {_e(datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC'))}</p>",
+        "<h2>Контекст запуска</h2>",
+        _table(["Run ID", "Проект", "Статус", "Создан", "Пользователь", "Профиль", "Runner job"],
+               [[context["run_id"], inputs["project"]["name"], inputs["status"],
+                 context["created_at"] and context["created_at"].strftime("%Y-%m-%d %H:%M UTC"),
+                 context["created_by"], context["compute_profile"], context["runner_job_id"]]]),
+        "<h2>Workflow и версии</h2>",
+        _table(["Workflow", "Версия", "Engine", "Репозиторий", "Ревизия", "Git SHA"],
+               [[wf.get("name"), wf.get("version"), wf.get("engine"), wf.get("repo"), wf.get("revision"), wf.get("git_sha")]]),
+        _table(["Процесс", "Контейнер", "Digest"], _containers(wf.get("lock"))),
+        "<h2>Reference Set</h2>",
+        f"<p>{_e(ref.get('name'))} · {_e(ref.get('genome_build'))} · проверка: {_e(ref_validation)}</p>",
+        _table(["Роль", "URI", "MD5", "Размер"],
+               [[c["role"], c["uri"], c["md5"], _size(c["size_bytes"])] for c in ref.get("components") or []]),
+        "<h2>Сэмплы и входные данные</h2>",
+        _table(["Сэмпл", "FASTQ R1", "MD5 R1", "FASTQ R2", "MD5 R2"],
+               [[s["name"], (s["r1"] or {}).get("uri"), (s["r1"] or {}).get("md5"),
+                 (s["r2"] or {}).get("uri"), (s["r2"] or {}).get("md5")] for s in inputs["samples"]]),
+        "<h2>QC-метрики</h2>",
+    ]
+    if qc:
+        parts += [
+            _table(["Записей", "Отфильтровано", "SNV", "Indel", "MNP", "Multiallelic", "Ti/Tv"],
+                   [[v.get("records"), v.get("filtered"), v.get("snv"), v.get("indel"), v.get("mnp"),
+                     v.get("multiallelic"), v.get("ti_tv")]]),
+            _table(["Сэмпл", "Het", "Hom alt", "Het/Hom", "DP (среднее)", "Покрытие", "≥10x, %", "≥30x, %", "Дубликаты, %"],
+                   sample_rows),
+            f"<p class=muted>VCF: {_e(qc.get('source'))}</p>",
+        ]
+    else:
+        parts.append("<p class=muted>QC-метрики не рассчитаны (нет VCF или загрузка вариантов ещё идёт)</p>")
+    parts += [
+        "<h2>Артефакты</h2>",
+        _table(["URI", "Размер", "ETag"],
+               [[a["uri"], _size(a.get("size")), a.get("etag") or a.get("error")] for a in inputs["artifacts"]]),
+        "<h2>Манифест воспроизводимости</h2>",
+        f"<pre>{_e(orjson.dumps({k: x for k, x in inputs.items() if k != 'qc'}, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode())}</pre>",
+    ]
+    return (f"<!doctype html><html lang=ru><head><meta charset=utf-8><title>Отчёт {_e(context['run_id'])}</title>"
+            f"<style>{_CSS}</style></head><body>{''.join(parts)}</body></html>")
+
+def render_pdf(doc: str) -> bytes | None:
+    if REPORTS_PDF != "auto":
+        return None
+    try:
+        from weasyprint import HTML  # опционально: нужны системные cairo/pango
+    except Exception:
+        return None
+    return HTML(string=doc).write_pdf()
+
+# --- хранилище ---
+def _exists(bucket: str, key: str) -> int | None:
+    try:
+        return s3client().head_object(Bucket=bucket, Key=key)["ContentLength"]
+    except botocore.exceptions.ClientError:
+        return None
+
+def _cached(db: Session, digest: str) -> tuple[str, str | None, int] | None:
+    hit = (db.query(Report)
+           .filter(Report.input_hash == digest, Report.status == ReportStatus.Ready, Report.html_uri.isnot(None))
+           .first())
+    if hit:
+        return hit.html_uri, hit.pdf_uri, hit.size_bytes
+    # строки могли потеряться, а объекты — остаться (ключи адресуются хэшем)
+    size = _exists(REPORTS_BUCKET, f"{digest}/report.html")
+    if size is None:
+        return None
+    pdf = f"s3://{REPORTS_BUCKET}/{digest}/report.pdf" if _exists(REPORTS_BUCKET, f"{digest}/report.pdf") else None
+    return f"s3://{REPORTS_BUCKET}/{digest}/report.html", pdf, size
+
+def _store(digest: str, inputs: dict, doc: str, pdf: bytes | None) -> tuple[str, str | None, int]:
+    ensure_bucket(REPORTS_BUCKET)
+    s3 = s3client()
+    body = doc.encode()
+    s3.put_object(Bucket=REPORTS_BUCKET, Key=f"{digest}/manifest.json", ContentType="application/json",
+                  Body=orjson.dumps(inputs, option=orjson.OPT_SORT_KEYS))
+    pdf_uri = None
+    if pdf is not None:
+        s3.put_object(Bucket=REPORTS_BUCKET, Key=f"{digest}/report.pdf", Body=pdf, ContentType="application/pdf")
+        pdf_uri = f"s3://{REPORTS_BUCKET}/{digest}/report.pdf"
+    # HTML — последним: по нему _cached считает отчёт готовым
+    s3.put_object(Bucket=REPORTS_BUCKET, Key=f"{digest}/report.html", Body=body, ContentType="text/html; charset=utf-8")
+    return f"s3://{REPORTS_BUCKET}/{digest}/report.html", pdf_uri, len(body)
+
+# --- фоновая задача ---
+def run_report(job: jobs.Job, run_id: str) -> dict:
+    db = SessionLocal()
+    try:
+        run = db.get(Run, run_id, options=[undefer(Run.sample_ids), undefer(Run.params),
+                                           undefer(Run.artifacts), undefer(Run.qc_metrics)])
+        if not run:
+            raise ValueError(f"Run not found: {run_id}")
+        rep = db.get(Report, run_id)
+        if not rep:
+            rep = Report(run_id=run_id, job_id=job.id)
+            db.add(rep)
+        try:
+            job.update(phase="inputs", artifacts=run.artifact_count)
+            inputs, context = collect_inputs(db, run)
+            digest = input_hash(inputs)
+            job.update(phase="cache", input_hash=digest)
+            hit = _cached(db, digest)
+            cached = hit is not None
+            if not cached:
+                job.update(phase="render")
+                doc = render_html(inputs, context)
+                hit = _store(digest, inputs, doc, render_pdf(doc))
+            rep.html_uri, rep.pdf_uri, rep.size_bytes = hit
+            rep.input_hash, rep.status, rep.error = digest, ReportStatus.Ready, None
+            rep.rendered_at = datetime.utcnow()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            rep = db.get(Report, run_id) or Report(run_id=run_id)
+            rep.status, rep.error = ReportStatus.Failed, f"{type(e).__name__}: {e}"
+            db.merge(rep)
+            db.commit()
+            raise
+        return {"input_hash": digest, "cached": cached, "html_uri": rep.html_uri}
+    finally:
+        db.close()
+
+def submit_report(run_id: str, user_id: str | None = None) -> jobs.Job:
+    """Ставит рендер в очередь задач; повторный вызов во время рендера возвращает ту же задачу."""
+    db = SessionLocal()
+    try:
+        rep = db.get(Report, run_id)
+        live = jobs.get(rep.job_id) if rep and rep.job_id else None
+        if live and live.status in ("Queued", "Running"):
+            return live
+        if not rep:
+            rep = Report(run_id=run_id, status=ReportStatus.Pending)
+            db.add(rep)
+        elif rep.status == ReportStatus.Failed:
+            rep.status, rep.error = ReportStatus.Pending, None
+        # готовый отчёт отдаётся и дальше, пока новый не собран
+        rep.requested_at = datetime.utcnow()
+        db.commit()
+        job = jobs.submit("report.render", run_report, run_id, user_id=user_id, entity_id=run_id)
+        rep.job_id = job.id
+        db.commit()
+        return job
+    finally:
+        db.close()
+
+# --- API ---
+def _pending(run_id: str, job_id: str | None) -> JSONResponse:
+    return JSONResponse(status_code=202, headers={"Retry-After": str(REPORTS_RETRY_AFTER)},
+                        content={"run_id": run_id, "status": "pending", "job_id": job_id})
+
+@router.get("/{run_id}")
+async def get_report(
+    run_id: str,
+    format: str = Query("html", pattern="^(html|pdf)$"),
+    redirect: bool = Query(False, description="307 на presigned-ссылку вместо JSON"),
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    run = await db.get(Run, run_id)
+    if not run: raise HTTPException(404, "Not found")
+    await _require_view(db, user, run.project_id)
+    rep = await db.get(Report, run_id)
+    if rep is None or rep.status == ReportStatus.Pending:
+        if run.status not in (RunStatus.Succeeded, RunStatus.Failed):
+            raise HTTPException(409, "Run is not finished")
+        live = jobs.get(rep.job_id) if rep and rep.job_id else None
+        stale = rep is not None and not live and (time.time() - rep.requested_at.timestamp() > REPORTS_PENDING_TIMEOUT
+                                                  if rep.requested_at else True)
+        if rep is None or stale:
+            # запуски до появления отчётов или задача потеряна при рестарте — ставим рендер сами
+            job = await run_in_threadpool(submit_report, run_id, user["id"])
+            return _pending(run_id, job.id)
+        return _pending(run_id, rep.job_id)
+    if rep.status == ReportStatus.Failed:
+        raise HTTPException(502, detail={"status": "failed", "error": rep.error, "job_id": rep.job_id})
+
+    uri = rep.pdf_uri if format == "pdf" else rep.html_uri
+    if not uri:
+        raise HTTPException(404, "PDF rendering is not available")
+    url = presign(uri, REPORTS_URL_TTL, filename=f"report-{run_id}.{format}",
+                  content_type="application/pdf" if format == "pdf" else "text/html; charset=utf-8")
+    if redirect:
+        return RedirectResponse(url, status_code=307)
+    return {
+        "run_id": run_id, "status": "ready", "format": format, "url": url, "expires_in": REPORTS_URL_TTL,
+        "pdf_available": rep.pdf_uri is not None, "input_hash": rep.input_hash,
+        "size_bytes": rep.size_bytes, "rendered_at": rep.rendered_at,
+    }
+
+@router.post("/{run_id}", status_code=202)
+def rerender_report(run_id: str, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    """Пересобирает отчёт; при неизменных входах задача лишь подтверждает кэш."""
+    run = db.get(Run, run_id)
+    if not run: raise HTTPException(404, "Not found")
+    _require_edit(db, user, run.project_id)
+    if run.status not in (RunStatus.Succeeded, RunStatus.Failed):
+        raise HTTPException(409, "Run is not finished")
+    job = submit_report(run_id, user["id"])
+    return {"job_id": job.id, "status": job.status}
@@ -1,28 +1,42 @@
-import json, os, urllib.request
+import hashlib, json, os, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import List, Optional
+
+import botocore
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer
 
-from .db import SessionLocal, Base, engine
-from .models import Run, RunStatus, Workflow, ReferenceSet, Sample, ProjectMember, Role
+from .db import SessionLocal, get_db, get_async_db
+from .models import Run, RunStatus, Workflow, ReferenceSet, Sample, Dataset, ProjectMember, Role
 from .auth import get_current_user
+from .responses import rows_response
+from .variants import submit_ingest
+from .reports import submit_report
+from .metering import submit_metering
+from .s3client import client as s3client, split_uri
+from . import fleet, varstore
+from .scheduler import scheduler
 
 RUNNER_BASE = os.environ.get("RUNNER_BASE", "http://nginx/runner")  # через nginx-прокси внутри compose
+# http — один раннер, запуск живёт внутри HTTP-запроса; queue — задания в БД, их разбирает парк раннеров (app.fleet)
+RUNNER_DISPATCH = os.environ.get("RUNNER_DISPATCH", "http")
+# версия отпечатка: меняется вместе с тем, как create_run собирает задание раннеру
+RUN_FINGERPRINT_VERSION = "1"
 
 router = APIRouter(prefix="/runs", tags=["runs"])
 
-def get_db():
-    db = SessionLocal()
-    try: yield db
-    finally: db.close()
-
 def _is_member(db: Session, user_id: str, project_id: str) -> ProjectMember | None:
     return db.query(ProjectMember).filter(ProjectMember.user_id==user_id, ProjectMember.project_id==project_id).first()
 
-def _require_view(db: Session, user: dict, project_id: str):
+async def _require_view(db: AsyncSession, user: dict, project_id: str):
     if user["role"] == Role.Admin.value: return
-    if not _is_member(db, user["id"], project_id):
+    if not await db.get(ProjectMember, (user["id"], project_id)):
         raise HTTPException(403, "Forbidden")
 
 def _require_edit(db: Session, user: dict, project_id: str):
@@ -31,6 +45,16 @@ def _require_edit(db: Session, user: dict, project_id: str):
     if not pm or pm.role not in [Role.Admin, Role.Editor]:
         raise HTTPException(403, "Forbidden")
 
+class ComputeOverrides(BaseModel):
+    """Переопределения профиля вычислений на запуск; раннер ограничивает их ресурсами узла."""
+    model_config = ConfigDict(extra="forbid")   # лишнее поле (docker_run_options) — 422, а не молча мимо
+    cpus: Optional[int] = Field(None, ge=1)
+    memory_gb: Optional[float] = Field(None, gt=0)
+    queue_size: Optional[int] = Field(None, ge=1)                         # параллельных задач Nextflow
+    max_time: Optional[str] = Field(None, pattern=r"^\d+\.(s|m|h|d)$")    # потолок времени задачи, напр. 12.h
+    scratch: Optional[bool] = None                                         # False — без NVMe scratch
+    # опций docker здесь нет намеренно: они задаются только профилем на раннере
+
 class RunCreate(BaseModel):
     project_id: str
     workflow_id: str
@@ -38,6 +62,8 @@ class RunCreate(BaseModel):
     sample_ids: List[str] = Field(min_items=1)
     params: dict = Field(default_factory=dict)
     compute_profile: str = "local-docker"
+    compute_overrides: Optional[ComputeOverrides] = None
+    reuse: bool = True   # False — выполнить заново, даже если такой же запуск уже завершён
 
 class RunOut(BaseModel):
     id: str
@@ -47,112 +73,335 @@ class RunOut(BaseModel):
     sample_ids: List[str]
     params: dict
     compute_profile: str
+    compute_overrides: Optional[dict] = None
+    compute: Optional[dict] = None
     runner_job_id: Optional[str] = None
     status: RunStatus
     artifacts: List[str]
+    fingerprint: Optional[str] = None
+    reused_from: Optional[str] = None
 
-@router.on_event("startup")
-def _init():
-    Base.metadata.create_all(bind=engine)
+class RunListOut(BaseModel):
+    id: str
+    project_id: str
+    workflow_id: str
+    reference_set_id: str
+    compute_profile: str
+    runner_job_id: Optional[str] = None
+    status: RunStatus
+    sample_count: int
+    artifact_count: int
 
-@router.post("", response_model=RunOut, status_code=201)
-def create_run(payload: RunCreate, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    _require_edit(db, user, payload.project_id)
+_RUN_DOCS = (undefer(Run.sample_ids), undefer(Run.params), undefer(Run.artifacts),
+             undefer(Run.compute_overrides), undefer(Run.compute))
 
-    wf = db.get(Workflow, payload.workflow_id)
+def _backfill_counts():
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Run)
+            .options(undefer(Run.sample_ids), undefer(Run.artifacts))
+            .filter((Run.sample_count.is_(None)) | (Run.artifact_count.is_(None)))
+            .all()
+        )
+        for r in rows:
+            r.sample_count = len(r.sample_ids or [])
+            r.artifact_count = len(r.artifacts or [])
+        db.commit()
+    finally:
+        db.close()
+
+def _runner_samples(db: Session, samples: List[Sample]) -> list[dict]:
+    # R1/R2 датасеты всех сэмплов — одним запросом; раннер строит из этого sarek samplesheet
+    ids = {s.r1_dataset_id for s in samples} | {s.r2_dataset_id for s in samples}
+    ds = {d.id: d for d in db.query(Dataset).filter(Dataset.id.in_(ids)).all()}
+    out = []
+    for s in samples:
+        r1, r2 = ds.get(s.r1_dataset_id), ds.get(s.r2_dataset_id)
+        if not r1 or not r2:
+            raise HTTPException(422, f"Sample {s.name}: R1/R2 dataset not found")
+        out.append({
+            "sample": s.name,
+            "fastq_1": r1.uri, "md5_1": r1.md5,
+            "fastq_2": r2.uri, "md5_2": r2.md5,
+        })
+    return out
+
+# --- кэш результатов: одинаковые воспроизводимые входы → те же артефакты ---
+def _container_digests(lock: dict | None) -> list | None:
+    items = (lock or {}).get("containers") or (lock or {}).get("images") or []
+    if isinstance(items, dict):
+        items = [{"name": k, **(v if isinstance(v, dict) else {"image": v})} for k, v in items.items()]
+    out = []
+    for c in items:
+        c = c if isinstance(c, dict) else {"image": c}
+        image = c.get("image") or c.get("uri") or ""
+        digest = c.get("digest") or c.get("sha256") or (image.split("@", 1)[1] if "@sha256:" in image else None)
+        if not digest:
+            return None   # тег без digest может переехать на другой образ
+        out.append([c.get("name") or c.get("process") or image.split("@", 1)[0], digest])
+    return sorted(out)
+
+def run_fingerprint(wf: Workflow, ref: ReferenceSet, runner_samples: list[dict], params: dict) -> str | None:
+    """sha256 канонического JSON входов; None, если что-то из них не зафиксировано чексуммой."""
+    images = _container_digests(wf.lock)
+    comps = ref.components or []
+    if not wf.git_sha or images is None or any(not c.get("md5") for c in comps):
+        return None
+    if any(not s["md5_1"] or not s["md5_2"] for s in runner_samples):
+        return None
+    doc = {
+        "v": RUN_FINGERPRINT_VERSION,
+        "workflow": {"engine": wf.engine, "git_sha": wf.git_sha, "containers": images},
+        "reference": sorted([c.get("role"), c["md5"].lower()] for c in comps),
+        "samples": sorted([s["sample"], s["md5_1"].lower(), s["md5_2"].lower()] for s in runner_samples),
+        "params": params,
+    }
+    return hashlib.sha256(orjson.dumps(doc, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def _exists(uri: str) -> bool:
+    try:
+        bucket, key = split_uri(uri)
+        s3client().head_object(Bucket=bucket, Key=key)
+        return True
+    except (ValueError, botocore.exceptions.ClientError):
+        return False
+
+def _reusable_many(db: Session, project_id: str, fingerprints: list[str]) -> dict[str, Run]:
+    """fingerprint → последний успешный исходный запуск с целыми артефактами; один запрос на все отпечатки."""
+    # только исходные запуски своего проекта (артефакты чужого проекта не раздаём)
+    rows = (
+        db.query(Run).options(undefer(Run.artifacts))
+        .filter(Run.fingerprint.in_(set(fingerprints)), Run.project_id == project_id,
+                Run.status == RunStatus.Succeeded, Run.reused_from.is_(None))
+        .order_by(Run.created_at.desc())
+        .all()
+    )
+    hits: dict[str, Run] = {}
+    for src in rows:
+        hits.setdefault(src.fingerprint, src)
+    hits = {fp: src for fp, src in hits.items() if src.artifacts}
+    uris = sorted({u for src in hits.values() for u in src.artifacts})
+    if not uris:
+        return {}
+    # артефакты могли удалить по политике хранения — тогда считаем заново
+    with ThreadPoolExecutor(max_workers=min(16, len(uris))) as pool:
+        ok = dict(zip(uris, pool.map(_exists, uris)))
+    return {fp: src for fp, src in hits.items() if all(ok[u] for u in src.artifacts)}
+
+def _reusable(db: Session, project_id: str, fingerprint: str) -> Run | None:
+    return _reusable_many(db, project_id, [fingerprint]).get(fingerprint)
+
+def _out(r: Run) -> RunOut:
+    return RunOut(
+        id=r.id, project_id=r.project_id, workflow_id=r.workflow_id,
+        reference_set_id=r.reference_set_id, sample_ids=r.sample_ids,
+        params=r.params, compute_profile=r.compute_profile,
+        compute_overrides=r.compute_overrides, compute=r.compute,
+        runner_job_id=r.runner_job_id, status=r.status, artifacts=r.artifacts,
+        fingerprint=r.fingerprint, reused_from=r.reused_from,
+    )
+
+def resolve_inputs(db: Session, workflow_id: str, reference_set_id: str) -> tuple[Workflow, ReferenceSet]:
+    wf = db.get(Workflow, workflow_id, options=[undefer(Workflow.lock)])
     if not wf: raise HTTPException(404, "Workflow not found")
-    ref = db.get(ReferenceSet, payload.reference_set_id)
+    ref = db.get(ReferenceSet, reference_set_id)
     if not ref: raise HTTPException(404, "Reference set not found")
     if not ref.is_complete:
         raise HTTPException(422, "Reference set incomplete")
+    if ref.validation_ok == 0:
+        # битый путь/индекс ловим до постановки в очередь (GET /references/{id}/validation — подробности)
+        raise HTTPException(422, "Reference set failed validation")
+    return wf, ref
+
+def link_reused(r: Run, src: Run):
+    # такой же запуск уже есть — ссылаемся на его артефакты, раннер не трогаем
+    r.status = RunStatus.Succeeded
+    r.runner_job_id = src.runner_job_id
+    r.artifacts = list(src.artifacts)
+    r.artifact_count = len(r.artifacts)
+    r.variant_count = src.variant_count
+    r.reused_from = src.id
+
+@router.post("", response_model=RunOut, status_code=201)
+def create_run(payload: RunCreate, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    _require_edit(db, user, payload.project_id)
+    wf, ref = resolve_inputs(db, payload.workflow_id, payload.reference_set_id)
 
     s_rows = db.query(Sample).filter(Sample.id.in_(payload.sample_ids)).all()
     if len(s_rows) != len(payload.sample_ids):
         raise HTTPException(422, "Some sample_ids not found")
     if any(s.project_id != payload.project_id for s in s_rows):
         raise HTTPException(403, "Sample from another project")
+    runner_samples = _runner_samples(db, s_rows)
+    fingerprint = run_fingerprint(wf, ref, runner_samples, payload.params)
+    src = _reusable(db, payload.project_id, fingerprint) if fingerprint and payload.reuse else None
 
     r = Run(
         project_id=payload.project_id,
         workflow_id=payload.workflow_id,
         reference_set_id=payload.reference_set_id,
         sample_ids=payload.sample_ids,
+        sample_count=len(payload.sample_ids),
         params=payload.params,
         compute_profile=payload.compute_profile,
+        compute_overrides=payload.compute_overrides.model_dump(exclude_none=True) if payload.compute_overrides else None,
         status=RunStatus.Queued,
+        fingerprint=fingerprint,
         created_by=user["id"]
     )
+    if src:
+        link_reused(r, src)
+        db.add(r); db.commit()
+        submit_report(r.id, user["id"])   # входы отчёта те же — берётся из кэша
+        return _out(r)
+    # одиночный запуск — через ту же fair-share очередь, что и когорты: раннер выдаёт только scheduler
+    r.queued_at = datetime.utcnow()
     db.add(r); db.commit()
+    scheduler.wake()
+    return _out(r)
+
+def runner_job(r: Run, wf: Workflow, ref: ReferenceSet, runner_samples: list[dict]) -> tuple[str, dict]:
+    """(эндпоинт раннера /run/<kind>, тело задания)."""
+    # ресурсы раннер выводит сам из профиля и своего железа (runner/profiles.py)
+    compute = {"compute_profile": r.compute_profile, "compute_overrides": r.compute_overrides}
+    # если это nf-core/dna-seq — запускаем реальный пайплайн в режиме test,docker,stub
+    if (wf.name or "").startswith("nf-core/dna-seq") or (wf.repo or "").endswith("nf-core/dna-seq"):
+        payload = {
+            "repo": (wf.repo or "https://github.com/nf-core/sarek"),
+            "revision": (wf.revision or wf.version or "3.5.1"),
+            "profile": "test,docker",
+            "stub_run": True,
+            # раннер стейджит компоненты через локальный кэш референсов (в stub-run — пропускает)
+            "reference": [
+                {"role": c.get("role"), "uri": c.get("uri"), "md5": c.get("md5")}
+                for c in (ref.components or [])
+            ],
+            "samples": runner_samples,
+            **compute,
+        }
+
+        if getattr(wf, "revision", None):
+            rev = (wf.revision or "").strip()
+            if rev:
+                payload["revision"] = rev
+        return "nfcore_dna_seq", payload
+    # fallback на контейнерный smoke (другие воркфлоу)
+    return "container_smoke", compute
 
+def execute(db: Session, r: Run, wf: Workflow, ref: ReferenceSet, runner_samples: list[dict], user_id: str | None) -> RunOut:
+    """Отправляет запуск раннеру.
+
+    http — ждёт ответа единственного раннера в потоке scheduler (ошибка → Failed + HTTPException(500));
+    queue — ставит задание в runner_jobs и сразу возвращает Running: задание берёт любой раннер парка (app.fleet),
+    started_at — момент первой выдачи; слотов scheduler выдаёт не больше суммарной capacity живых раннеров.
+    """
+    kind, payload = runner_job(r, wf, ref, runner_samples)
+    if RUNNER_DISPATCH == "queue":
+        fleet.enqueue(db, r, kind, payload)
+        db.commit()
+        return _out(r)
     try:
-        # если это nf-core/dna-seq — запускаем реальный пайплайн в режиме test,docker,stub
-        if (wf.name or "").startswith("nf-core/dna-seq") or (wf.repo or "").endswith("nf-core/dna-seq"):
-            payload = {
-                "repo": (wf.repo or "https://github.com/nf-core/sarek"),
-                "revision": (wf.revision or wf.version or "3.5.1"),
-                "profile": "test,docker",
-                "stub_run": True
-            }
-
-            if getattr(wf, "revision", None):
-                rev = (wf.revision or "").strip()
-                if rev:
-                    payload["revision"] = rev
-
-            req = urllib.request.Request(
-                f"{RUNNER_BASE}/run/nfcore_dna_seq",
-                data=json.dumps(payload).encode("utf-8"),
-                headers={"Content-Type": "application/json"},
-                method="POST"
-            )
-        else:
-            # fallback на контейнерный smoke (другие воркфлоу)
-            req = urllib.request.Request(
-                f"{RUNNER_BASE}/run/container_smoke",
-                headers={"Content-Type": "application/json"},
-                method="POST"
-            )
+        req = urllib.request.Request(
+            f"{RUNNER_BASE}/run/{kind}",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
         with urllib.request.urlopen(req, timeout=3600) as resp:
             data = json.loads(resp.read().decode("utf-8"))
     except Exception as e:
-        r.status = RunStatus.Failed
-        db.commit()
+        mark_failed(db, r)
         raise HTTPException(500, f"Runner error: {e}")
+    apply_result(db, r, data, user_id)
+    return _out(r)
 
+def mark_failed(db: Session, r: Run):
+    r.status = RunStatus.Failed
+    r.artifact_count = 0
+    r.finished_at = datetime.utcnow()
+    db.commit()
+
+def apply_result(db: Session, r: Run, data: dict, user_id: str | None):
+    """Ответ раннера (или результат задания парка) → статус и артефакты запуска, дальше — учёт, варианты, отчёт."""
     r.runner_job_id = data.get("run_id")
     r.status = RunStatus.Succeeded if data.get("status") == "Succeeded" else RunStatus.Failed
     r.artifacts = data.get("artifacts") or []
+    r.artifact_count = len(r.artifacts)
+    r.compute = data.get("compute")
+    r.nextflow_config = data.get("nextflow_config")
+    r.finished_at = datetime.utcnow()
     db.commit()
+    submit_metering(r.id, user_id)   # vCPU·ч из trace.txt + размер артефактов → агрегаты проекта
 
-    return RunOut(
-        id=r.id, project_id=r.project_id, workflow_id=r.workflow_id,
-        reference_set_id=r.reference_set_id, sample_ids=r.sample_ids,
-        params=r.params, compute_profile=r.compute_profile,
-        runner_job_id=r.runner_job_id, status=r.status, artifacts=r.artifacts
-    )
+    vcf_uri = varstore.pick_vcf(r.artifacts) if r.status == RunStatus.Succeeded else None
+    if vcf_uri:
+        # варианты доступны для запросов сразу после запуска, без ручного ingest; отчёт — после QC
+        submit_ingest(r.id, vcf_uri, user_id)
+    else:
+        submit_report(r.id, user_id)
+
+def execute_queued(run_id: str):
+    """Запуск из очереди (scheduler): статус уже Running, входы перечитываются из БД."""
+    db = SessionLocal()
+    try:
+        r = db.get(Run, run_id, options=list(_RUN_DOCS))
+        wf = db.get(Workflow, r.workflow_id, options=[undefer(Workflow.lock)])
+        ref = db.get(ReferenceSet, r.reference_set_id)
+        try:
+            samples = db.query(Sample).filter(Sample.id.in_(r.sample_ids)).all()
+            by_id = {s.id: s for s in samples}
+            runner_samples = _runner_samples(db, [by_id[i] for i in r.sample_ids if i in by_id])
+            execute(db, r, wf, ref, runner_samples, r.created_by)
+        except HTTPException:
+            if r.status != RunStatus.Failed:   # 422 из _runner_samples: датасеты удалили, пока запуск ждал
+                mark_failed(db, r)
+    finally:
+        db.close()
 
 @router.get("/{run_id}", response_model=RunOut)
-def get_run(run_id: str, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    r = db.get(Run, run_id)
+async def get_run(run_id: str, user=Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    r = await db.get(Run, run_id, options=_RUN_DOCS)
     if not r: raise HTTPException(404, "Not found")
-    _require_view(db, user, r.project_id)
-    return RunOut(
-        id=r.id, project_id=r.project_id, workflow_id=r.workflow_id,
-        reference_set_id=r.reference_set_id, sample_ids=r.sample_ids,
-        params=r.params, compute_profile=r.compute_profile,
-        runner_job_id=r.runner_job_id, status=r.status, artifacts=r.artifacts
-    )
+    await _require_view(db, user, r.project_id)
+    return _out(r)
+
+@router.get("/{run_id}/qc")
+async def get_run_qc(run_id: str, user=Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    r = await db.get(Run, run_id, options=[undefer(Run.qc_metrics)])
+    if not r: raise HTTPException(404, "Not found")
+    await _require_view(db, user, r.project_id)
+    # метрики считаются вместе с загрузкой VCF (POST /variants/ingest, автоматически по завершении запуска)
+    qc = r.qc_metrics
+    if qc is None and r.reused_from:
+        src = await db.get(Run, r.reused_from, options=[undefer(Run.qc_metrics)])
+        qc = src.qc_metrics if src else None
+    return {"run_id": r.id, "status": "ready" if qc is not None else "pending", "qc": qc}
+
+@router.get("/{run_id}/nextflow.config", response_class=PlainTextResponse)
+async def get_run_nextflow_config(run_id: str, user=Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """nextflow.config, с которым раннер выполнил запуск (профиль вычислений, развёрнутый на его узле)."""
+    r = await db.get(Run, run_id, options=[undefer(Run.nextflow_config)])
+    if not r: raise HTTPException(404, "Not found")
+    await _require_view(db, user, r.project_id)
+    conf = r.nextflow_config
+    if conf is None and r.reused_from:
+        src = await db.get(Run, r.reused_from, options=[undefer(Run.nextflow_config)])
+        conf = src.nextflow_config if src else None
+    if conf is None:
+        raise HTTPException(404, "Config not available yet")
+    return conf
 
-@router.get("", response_model=list[RunOut])
-def list_runs(project_id: str = Query(...), user=Depends(get_current_user), db: Session = Depends(get_db)):
-    _require_view(db, user, project_id)
-    rows = db.query(Run).filter(Run.project_id==project_id).order_by(Run.created_at.desc()).all()
-    out=[]
-    for r in rows:
-        out.append(RunOut(
-            id=r.id, project_id=r.project_id, workflow_id=r.workflow_id,
-            reference_set_id=r.reference_set_id, sample_ids=r.sample_ids,
-            params=r.params, compute_profile=r.compute_profile,
-            runner_job_id=r.runner_job_id, status=r.status, artifacts=r.artifacts
-        ))
-    return out
\ No newline at end of file
+@router.get("", response_model=list[RunListOut])
+async def list_runs(project_id: str = Query(...), user=Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    await _require_view(db, user, project_id)
+    # sample_ids/params/artifacts не читаем — полный документ отдаёт GET /runs/{id}
+    # строки проекции сериализуются напрямую (orjson), без повторной валидации RunListOut
+    return rows_response(await db.execute(
+        select(
+            Run.id, Run.project_id, Run.workflow_id, Run.reference_set_id, Run.compute_profile,
+            Run.runner_job_id, Run.status,
+            func.coalesce(Run.sample_count, 0).label("sample_count"),
+            func.coalesce(Run.artifact_count, 0).label("artifact_count"),
+        ).where(Run.project_id==project_id).order_by(Run.created_at.desc())
+    ))
\ No newline at end of file
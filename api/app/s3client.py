@@ -1,21 +1,35 @@
-import os, boto3, botocore
+import os
+
+import s3core
+from s3core import (  # noqa: F401 — общий S3-слой (shared/s3core.py), реэкспорт для модулей API
+    MB, S3_ENDPOINT, client, download_file, split_uri, stats, transfer_config, upload_file,
+)
 
-S3_ENDPOINT = os.environ.get("S3_ENDPOINT", "http://minio:9000")
-S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY", "miniokey")
-S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY", "miniopass")
 S3_BUCKET_DATASETS = os.environ.get("S3_BUCKET_DATASETS", "datasets")
+S3_BUCKET_RUNS = os.environ.get("S3_BUCKET_RUNS", "runs")             # артефакты раннера: <runner_job_id>/...
+# адрес S3, видимый из браузера, для presigned-ссылок (внутренний minio:9000 снаружи недоступен)
+S3_PUBLIC_ENDPOINT = os.environ.get("S3_PUBLIC_ENDPOINT", "")
+
+_public_client = None
 
-def client():
-    return boto3.client(
-        "s3",
-        endpoint_url=S3_ENDPOINT,
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY,
-    )
+def presign(uri: str, expires: int = 3600, filename: str | None = None, content_type: str | None = None) -> str:
+    """Presigned GET на s3:// URI; подпись считается локально, без запроса к S3."""
+    global _public_client
+    c = client()
+    if S3_PUBLIC_ENDPOINT:
+        # подпись включает Host — подписываем клиентом с публичным адресом
+        if _public_client is None:
+            with s3core._client_lock:
+                if _public_client is None:
+                    _public_client = s3core.build(S3_PUBLIC_ENDPOINT)
+        c = _public_client
+    bucket, key = split_uri(uri)
+    params = {"Bucket": bucket, "Key": key}
+    if filename:
+        params["ResponseContentDisposition"] = f'inline; filename="{filename}"'
+    if content_type:
+        params["ResponseContentType"] = content_type
+    return c.generate_presigned_url("get_object", Params=params, ExpiresIn=expires)
 
-def ensure_bucket():
-    s3 = client()
-    try:
-        s3.head_bucket(Bucket=S3_BUCKET_DATASETS)
-    except botocore.exceptions.ClientError:
-        s3.create_bucket(Bucket=S3_BUCKET_DATASETS)
+def ensure_bucket(bucket: str = S3_BUCKET_DATASETS, force: bool = False):
+    s3core.ensure_bucket(bucket, force)
@@ -2,31 +2,22 @@ import csv, io, re
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Response, Body
 from pydantic import BaseModel
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from .db import SessionLocal
+from .db import get_db, get_async_db
 from .models import Sample, Dataset, DatasetType, ProjectMember, Role
 from .auth import get_current_user
+from .responses import rows_response
 
 router = APIRouter(prefix="/samples", tags=["samples"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def _is_member(db: Session, user_id: str, project_id: str) -> bool:
-    return db.query(ProjectMember).filter(
-        ProjectMember.user_id == user_id,
-        ProjectMember.project_id == project_id
-    ).first() is not None
-
-def _require_view(db: Session, user: dict, project_id: str):
+async def _require_view(db: AsyncSession, user: dict, project_id: str):
     if user["role"] == Role.Admin.value:
         return
-    if not _is_member(db, user["id"], project_id):
+    if not await db.get(ProjectMember, (user["id"], project_id)):
         raise HTTPException(status_code=403, detail="Forbidden")
 
 def _require_edit(db: Session, user: dict, project_id: str):
@@ -71,23 +62,27 @@ class AutopairResult(BaseModel):
     updated: List[SampleOut]
     orphans: List[str]  # dataset ids без пары/совпадения шаблона
 
+def _sample_rows_query(project_id: str):
+    # один запрос с двумя join на datasets вместо выборки всех датасетов проекта в память
+    r1, r2 = aliased(Dataset), aliased(Dataset)
+    return (
+        select(
+            Sample.id, Sample.project_id, Sample.name, Sample.r1_dataset_id, Sample.r2_dataset_id,
+            func.coalesce(r1.uri, "").label("r1_uri"), func.coalesce(r2.uri, "").label("r2_uri"),
+        )
+        .outerjoin(r1, r1.id == Sample.r1_dataset_id)
+        .outerjoin(r2, r2.id == Sample.r2_dataset_id)
+        .where(Sample.project_id == project_id)
+    )
+
 @router.get("", response_model=List[SampleOut])
-def list_samples(
+async def list_samples(
     project_id: str = Query(...),
     user = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    _require_view(db, user, project_id)
-    rows = db.query(Sample).filter(Sample.project_id == project_id).all()
-    id2uri = {d.id: d.uri for d in db.query(Dataset).filter(Dataset.project_id == project_id).all()}
-    out = []
-    for s in rows:
-        out.append(SampleOut(
-            id=s.id, project_id=s.project_id, name=s.name,
-            r1_dataset_id=s.r1_dataset_id, r2_dataset_id=s.r2_dataset_id,
-            r1_uri=id2uri.get(s.r1_dataset_id, ""), r2_uri=id2uri.get(s.r2_dataset_id, "")
-        ))
-    return out
+    await _require_view(db, user, project_id)
+    return rows_response(await db.execute(_sample_rows_query(project_id)))
 
 @router.post("/autopair", response_model=AutopairResult)
 def autopair(
@@ -96,6 +91,10 @@ def autopair(
     db: Session = Depends(get_db),
 ):
     _require_edit(db, user, project_id)
+    return pair_datasets(db, project_id)
+
+def pair_datasets(db: Session, project_id: str) -> AutopairResult:
+    """Пары R1/R2 по именам FASTQ проекта → сэмплы (создание/обновление); общая для autopair и bulk-регистрации."""
     fastqs = db.query(Dataset).filter(
         Dataset.project_id == project_id,
         Dataset.type.in_([DatasetType.FASTQ, DatasetType.FASTQ_GZ])
@@ -120,27 +119,30 @@ def autopair(
         else:
             orphans.append(d.id)
 
+    # существующие сэмплы — одним запросом, запись — одним коммитом (а не SELECT + COMMIT на stem)
+    pairs = {stem: p for stem, p in stems.items() if p["R1"] and p["R2"]}
+    for p in stems.values():
+        if not (p["R1"] and p["R2"]):
+            orphans.extend(d.id for d in (p["R1"], p["R2"]) if d)
+    existing = {s.name: s for s in db.query(Sample).filter(
+        Sample.project_id == project_id,
+        Sample.name.in_(list(pairs)),
+    )} if pairs else {}
+
     created, updated = [], []
-    for stem, pair in stems.items():
+    for stem, pair in pairs.items():
         r1, r2 = pair["R1"], pair["R2"]
-        if not (r1 and r2):
-            if r1: orphans.append(r1.id)
-            if r2: orphans.append(r2.id)
-            continue
-        s = db.query(Sample).filter(
-            Sample.project_id == project_id,
-            Sample.name == stem
-        ).first()
+        s = existing.get(stem)
         if s:
             changed = (s.r1_dataset_id != r1.id) or (s.r2_dataset_id != r2.id)
             s.r1_dataset_id, s.r2_dataset_id = r1.id, r2.id
-            db.commit()
             if changed:
                 updated.append(s)
         else:
             s = Sample(project_id=project_id, name=stem, r1_dataset_id=r1.id, r2_dataset_id=r2.id)
-            db.add(s); db.commit()
+            db.add(s)
             created.append(s)
+    db.flush()
 
     id2uri = {d.id: d.uri for d in fastqs}
     def to_out(s: Sample) -> SampleOut:
@@ -150,21 +152,24 @@ def autopair(
             r1_uri=id2uri.get(s.r1_dataset_id, ""), r2_uri=id2uri.get(s.r2_dataset_id, "")
         )
 
-    return AutopairResult(
+    # ответ собирается до коммита: после него атрибуты истекают и каждый to_out ходил бы в БД
+    result = AutopairResult(
         created=[to_out(x) for x in created],
         updated=[to_out(x) for x in updated],
         orphans=orphans
     )
+    db.commit()
+    return result
 
 # --- экспорт CSV: sample,r1_uri,r2_uri ---
 @router.get("/export.csv")
-def export_csv(
+async def export_csv(
     project_id: str = Query(...),
     user = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    _require_view(db, user, project_id)
-    rows = list_samples(project_id, user, db)
+    await _require_view(db, user, project_id)
+    rows = (await db.execute(_sample_rows_query(project_id))).all()
     buf = io.StringIO()
     w = csv.writer(buf)
     w.writerow(["sample", "r1_uri", "r2_uri"])
@@ -212,6 +217,10 @@ async def import_samples(
         raise HTTPException(status_code=400, detail="Provide CSV file or JSON body")
 
     dmap = {d.uri: d for d in db.query(Dataset).filter(Dataset.project_id == project_id).all()}
+    names = {it["name"] for it in to_process}
+    existing = {s.name: s for s in db.query(Sample).filter(
+        Sample.project_id == project_id, Sample.name.in_(list(names)),
+    )} if names else {}
 
     created = updated = 0
     for it in to_process:
@@ -221,13 +230,15 @@ async def import_samples(
             raise HTTPException(status_code=422, detail=f"Dataset(s) not found by uri: {it}")
         if r1.type not in [DatasetType.FASTQ, DatasetType.FASTQ_GZ] or r2.type not in [DatasetType.FASTQ, DatasetType.FASTQ_GZ]:
             raise HTTPException(status_code=422, detail="Only FASTQ/FASTQ.GZ supported")
-        s = db.query(Sample).filter(Sample.project_id == project_id, Sample.name == it["name"]).first()
+        s = existing.get(it["name"])
         if s:
             s.r1_dataset_id, s.r2_dataset_id = r1.id, r2.id
             updated += 1
         else:
-            db.add(Sample(project_id=project_id, name=it["name"], r1_dataset_id=r1.id, r2_dataset_id=r2.id))
+            existing[it["name"]] = Sample(project_id=project_id, name=it["name"], r1_dataset_id=r1.id, r2_dataset_id=r2.id)
+            db.add(existing[it["name"]])
             created += 1
-        db.commit()
+    # один коммит: ошибка в любой строке не оставляет импорт наполовину применённым
+    db.commit()
 
     return {"created": created, "updated": updated}
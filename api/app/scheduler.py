@@ -0,0 +1,244 @@
+import heapq, os, threading, traceback
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from statistics import median
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from sqlalchemy import exists, func, select, update
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal, get_db
+from .models import Run, RunStatus, RunnerJob, RunnerJobStatus, RunnerNode, Project, ProjectMember, Role
+from .auth import get_current_user, require_role
+from . import fleet, runs
+
+# Fair-share очередь запусков: свободный слот раннера получает проект с наименьшим
+# (недавнее использование / вес), внутри проекта — пользователь с наименьшим использованием,
+# у него — самый старый запуск. Использование — секунды запусков с затуханием (период полураспада).
+# Слот занят, пока запуск жив, сколько бы он ни шёл: в режиме парка — пока есть его задание в runner_jobs
+# (аренду ведёт app.fleet), в http-режиме — пока процесс API, ждущий ответа раннера, обновляет heartbeat_at.
+# Слотов в http-режиме — SCHED_SLOTS, в режиме парка — сумма capacity живых раннеров (heartbeat в пределах аренды).
+SCHED_ENABLED = os.environ.get("SCHED_ENABLED", "1") == "1"
+SCHED_SLOTS = int(os.environ.get("SCHED_SLOTS", "8"))                 # одновременных запусков на раннере (http)
+SCHED_TICK_S = float(os.environ.get("SCHED_TICK_S", "5"))
+SCHED_HALF_LIFE_H = float(os.environ.get("SCHED_HALF_LIFE_H", "24"))
+SCHED_DEFAULT_RUN_S = float(os.environ.get("SCHED_DEFAULT_RUN_S", "3600"))   # оценка, пока нет истории
+SCHED_LIVENESS_S = float(os.environ.get("SCHED_LIVENESS_S", "120"))  # http-запуск без heartbeat дольше — процесс умер
+
+router = APIRouter(prefix="/queue", tags=["queue"])
+
+def _usage(finished: list, running: list, now: datetime, est: float) -> tuple[dict, dict]:
+    """Секунды использования по проекту и по (проект, пользователь), с затуханием по времени завершения."""
+    by_project: dict = defaultdict(float)
+    by_user: dict = defaultdict(float)
+    hl = SCHED_HALF_LIFE_H * 3600
+    for project_id, user_id, started, finished_at in finished:
+        sec = (finished_at - started).total_seconds() * 0.5 ** ((now - finished_at).total_seconds() / hl)
+        by_project[project_id] += sec
+        by_user[(project_id, user_id)] += sec
+    for project_id, user_id, started in running:
+        # идущий запуск стоит не меньше оценки — иначе только что выданный слот почти «бесплатен»
+        sec = max((now - started).total_seconds(), est)
+        by_project[project_id] += sec
+        by_user[(project_id, user_id)] += sec
+    return by_project, by_user
+
+def plan(queued: list, running: list, finished: list, shares: dict, slots: int, now: datetime, est: float) -> list:
+    """Порядок очереди и оценка старта: [(run_id, project_id, start)] — симуляция выдачи слотов.
+
+    queued — [(run_id, project_id, user_id, queued_at)], running — [(project_id, user_id, started_at)],
+    finished — [(project_id, user_id, started_at, finished_at)] за последние несколько периодов полураспада.
+    """
+    by_project, by_user = _usage(finished, running, now, est)
+    queues: dict = defaultdict(lambda: defaultdict(deque))
+    for run_id, project_id, user_id, queued_at in sorted(queued, key=lambda q: (q[3] or now, q[0])):
+        queues[project_id][user_id].append((run_id, queued_at or now))
+    # моменты освобождения слотов: идущие запуски — по оценке длительности
+    ends = sorted(max(now, started + timedelta(seconds=est)) for _, _, started in running)
+    ends = ends[len(ends) - slots:] if len(ends) >= slots else ends + [now] * (slots - len(ends))
+    heapq.heapify(ends)
+
+    out = []
+    while queues:
+        t = heapq.heappop(ends)
+        p = min(queues, key=lambda p: (by_project[p] / (shares.get(p) or 1.0),
+                                       min(q[0][1] for q in queues[p].values())))
+        u = min(queues[p], key=lambda u: (by_user[(p, u)], queues[p][u][0][1]))
+        run_id, _ = queues[p][u].popleft()
+        if not queues[p][u]:
+            del queues[p][u]
+        if not queues[p]:
+            del queues[p]
+        out.append((run_id, p, t))
+        # виртуальное списание: следующий слот в этой же симуляции уходит другим
+        by_project[p] += est
+        by_user[(p, u)] += est
+        heapq.heappush(ends, t + timedelta(seconds=est))
+    return out
+
+_ACTIVE_JOB = exists().where(RunnerJob.run_id == Run.id,
+                             RunnerJob.status.in_([RunnerJobStatus.Queued, RunnerJobStatus.Leased]))
+
+def reap(db: Session, now: datetime) -> int:
+    """Running без задания парка и без свежего heartbeat — процесс API, ждавший раннер, умер: Failed."""
+    dead = now - timedelta(seconds=SCHED_LIVENESS_S)
+    res = db.execute(
+        update(Run).where(Run.status == RunStatus.Running, ~_ACTIVE_JOB,
+                          func.coalesce(Run.heartbeat_at, Run.started_at) < dead)
+        .values(status=RunStatus.Failed, artifact_count=0, finished_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return res.rowcount
+
+def slots(db: Session, now: datetime) -> int:
+    if runs.RUNNER_DISPATCH != "queue":
+        return SCHED_SLOTS
+    alive = now - timedelta(seconds=fleet.FLEET_LEASE_S)
+    return int(db.scalar(select(func.coalesce(func.sum(RunnerNode.capacity), 0))
+                         .where(RunnerNode.last_seen >= alive)))
+
+def _state(db: Session, now: datetime) -> dict:
+    window = now - timedelta(hours=SCHED_HALF_LIFE_H * 5)
+    queued = db.execute(select(Run.id, Run.project_id, Run.created_by, Run.queued_at)
+                        .where(Run.status == RunStatus.Queued)).all()
+    running = db.execute(select(Run.project_id, Run.created_by, Run.started_at)
+                         .where(Run.status == RunStatus.Running)).all()
+    finished = db.execute(select(Run.project_id, Run.created_by, Run.started_at, Run.finished_at)
+                          .where(Run.finished_at >= window, Run.started_at.isnot(None),
+                                 Run.reused_from.is_(None)).order_by(Run.finished_at)).all()
+    durations = [(f - s).total_seconds() for _, _, s, f in finished[-200:]]
+    shares = {p: s for p, s in db.execute(select(Project.id, Project.share).where(Project.share.isnot(None)))}
+    return {"queued": queued, "running": running, "finished": finished, "shares": shares,
+            "est": median(durations) if durations else SCHED_DEFAULT_RUN_S}
+
+class _Scheduler:
+    def __init__(self):
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pool = ThreadPoolExecutor(max_workers=SCHED_SLOTS, thread_name_prefix="run")
+        self._inflight: set[str] = set()   # запуски, которые этот процесс сейчас ведёт (http-режим)
+
+    def start(self):
+        if not SCHED_ENABLED:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(SCHED_TICK_S)
+            self._wake.clear()
+            try:
+                self.tick()
+            except Exception:
+                traceback.print_exc()
+
+    def tick(self) -> list[str]:
+        """Выдаёт свободные слоты первым в fair-share порядке; возвращает id запущенных."""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            with self._lock:
+                inflight = list(self._inflight)
+            if inflight:
+                db.execute(update(Run).where(Run.id.in_(inflight), Run.status == RunStatus.Running)
+                           .values(heartbeat_at=now).execution_options(synchronize_session=False))
+                db.commit()
+            reap(db, now)
+            st = _state(db, now)
+            total = slots(db, now)
+            free = total - len(st["running"])
+            if free <= 0 or not st["queued"]:
+                return []
+            order = plan(st["queued"], st["running"], st["finished"], st["shares"], total, now, st["est"])
+            started = []
+            for run_id, _, _ in order:
+                if len(started) >= free:
+                    break
+                # захват: отменённый/уже взятый запуск пропускаем
+                res = db.execute(update(Run).where(Run.id == run_id, Run.status == RunStatus.Queued)
+                                 .values(status=RunStatus.Running, started_at=now, heartbeat_at=now))
+                db.commit()
+                if res.rowcount == 1:
+                    started.append(run_id)
+        finally:
+            db.close()
+        for run_id in started:
+            with self._lock:
+                self._inflight.add(run_id)
+            self._pool.submit(self._execute, run_id)
+        return started
+
+    def _execute(self, run_id: str):
+        try:
+            runs.execute_queued(run_id)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._inflight.discard(run_id)
+            self.wake()   # слот освободился
+
+scheduler = _Scheduler()
+
+# --- просмотр очереди ---
+class ShareIn(BaseModel):
+    share: float = Field(gt=0)
+
+@router.get("")
+def get_queue(
+    project_id: str | None = Query(None),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Очередь с позицией и оценкой старта; позиции — глобальные, строки — только своих проектов."""
+    now = datetime.utcnow()
+    st = _state(db, now)
+    total = slots(db, now)
+    # живых раннеров нет — оценка старта по номиналу SCHED_SLOTS
+    order = plan(st["queued"], st["running"], st["finished"], st["shares"], total or SCHED_SLOTS, now, st["est"])
+    if user["role"] == Role.Admin.value:
+        visible = None
+    else:
+        visible = {p for (p,) in db.execute(select(ProjectMember.project_id).where(ProjectMember.user_id == user["id"]))}
+    if project_id:
+        if visible is not None and project_id not in visible:
+            raise HTTPException(403, "Forbidden")
+        visible = {project_id}
+    meta = {r.id: r for r in st["queued"]}
+    items = [{"position": i + 1, "run_id": run_id, "project_id": p, "user_id": meta[run_id].created_by,
+              "queued_at": meta[run_id].queued_at, "estimated_start": start,
+              "estimated_wait_s": round((start - now).total_seconds())}
+             for i, (run_id, p, start) in enumerate(order) if visible is None or p in visible]
+    by_project, _ = _usage(st["finished"], st["running"], now, st["est"])
+    projects = defaultdict(lambda: {"queued": 0, "running": 0})
+    for q in st["queued"]:
+        projects[q.project_id]["queued"] += 1
+    for r in st["running"]:
+        projects[r.project_id]["running"] += 1
+    return {
+        "slots": total, "running": len(st["running"]), "queued": len(st["queued"]),
+        "estimated_run_s": round(st["est"]),
+        "projects": [{"project_id": p, "share": st["shares"].get(p) or 1.0, "usage_s": round(by_project[p]), **c}
+                     for p, c in projects.items() if visible is None or p in visible],
+        "items": items,
+    }
+
+@router.put("/shares/{project_id}", dependencies=[Depends(require_role(Role.Admin))])
+def set_share(project_id: str, payload: ShareIn, db: Session = Depends(get_db)):
+    p = db.get(Project, project_id)
+    if not p:
+        raise HTTPException(404, "Not found")
+    p.share = payload.share
+    db.commit()
+    scheduler.wake()
+    return {"project_id": p.id, "share": p.share}
@@ -0,0 +1,185 @@
+import os, re, json, mmap, time, fcntl, shutil, hashlib, threading
+from collections import OrderedDict
+
+from . import faidx, jobs
+from .refvalidate import parse_fai
+
+# Произвольный доступ к последовательности референса: локальная несжатая копия FASTA + FAI, открытая через mmap.
+# Копия (и её FAI) строится один раз на версию FASTA-компонента (uri + md5) фоновой задачей;
+# страницы файла делятся между воркерами через page cache.
+REF_SEQ_DIR = os.environ.get("REF_SEQ_DIR", "/var/lib/genomeai/refseq")
+SEQ_MAX_OPEN = int(os.environ.get("SEQ_MAX_OPEN", "8"))              # открытых mmap на процесс
+SEQ_MAX_REGION = int(os.environ.get("SEQ_MAX_REGION", "1000000"))    # оснований в одном регионе
+SEQ_RETRY_AFTER = int(os.environ.get("SEQ_RETRY_AFTER", "15"))       # сек, пока копия стейджится
+
+META = "meta.json"
+
+class RegionError(ValueError):
+    pass
+
+class StagingFailed(RuntimeError):
+    pass
+
+class IndexedFasta:
+    """FASTA через mmap: offset основания p = offset + (p // linebases) * linewidth + p % linebases."""
+
+    def __init__(self, path: str):
+        with open(path + ".fai", "rb") as fh:
+            self.index = {c["name"]: (c["length"], c["offset"], c["linebases"], c["linewidth"])
+                          for c in parse_fai(fh.read())}
+        with open(path, "rb") as fh:
+            # пустой файл mmap не открыть; без контигов index тоже пуст
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+
+    def parse_region(self, region: str) -> tuple[str, int, int]:
+        """samtools-нотация (1-based, включительно) → (contig, start0, end). Имя с ':' (HLA) — целиком."""
+        region = region.strip()
+        if region in self.index:
+            name, rng = region, ""
+        else:
+            name, sep, rng = region.rpartition(":")
+            if not sep or name not in self.index:
+                raise RegionError(f"Unknown contig in region '{region}'")
+        length = self.index[name][0]
+        start, end = 1, length
+        if rng:
+            m = re.fullmatch(r"(\d+)(?:-(\d*))?", rng.replace(",", ""))
+            if not m:
+                raise RegionError(f"Malformed region '{region}'")
+            start = int(m[1])
+            if m[2]:
+                end = min(int(m[2]), length)
+        if start < 1 or start > end:
+            raise RegionError(f"Empty or out-of-range region '{region}' ({name} has {length} bp)")
+        if end - start + 1 > SEQ_MAX_REGION:
+            raise RegionError(f"Region '{region}' exceeds {SEQ_MAX_REGION} bp")
+        return name, start - 1, end
+
+    def fetch(self, name: str, start: int, end: int) -> str:
+        """Полуинтервал [start, end) в 0-based координатах."""
+        length, offset, lb, lw = self.index[name]
+        end = min(end, length)
+        if start >= end:
+            return ""
+        a = offset + (start // lb) * lw + start % lb
+        b = offset + ((end - 1) // lb) * lw + (end - 1) % lb + 1
+        if b - a == end - start:
+            # регион внутри одной строки — декодируем прямо из mmap, без промежуточной копии
+            with memoryview(self._mm)[a:b] as view:
+                return str(view, "ascii")
+        return self._mm[a:b].translate(None, b"\r\n").decode("ascii")
+
+class SequenceStore:
+    def __init__(self, root: str = REF_SEQ_DIR, max_open: int = SEQ_MAX_OPEN):
+        self.root = root
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[str, IndexedFasta]" = OrderedDict()
+        self._staging: dict[str, jobs.Job] = {}
+        os.makedirs(os.path.join(root, ".locks"), exist_ok=True)
+
+    @staticmethod
+    def key(uri: str, md5: str | None) -> str:
+        return hashlib.sha256(f"{uri}\0{(md5 or '').lower()}".encode()).hexdigest()[:24]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key, "genome.fa")
+
+    def _get(self, key: str) -> IndexedFasta | None:
+        with self._lock:
+            fa = self._open.get(key)
+            if fa is not None:
+                self._open.move_to_end(key)
+                return fa
+        if not os.path.exists(os.path.join(self.root, key, META)):
+            return None
+        fa = IndexedFasta(self._path(key))
+        with self._lock:
+            self._open[key] = fa
+            # вытесненный mmap закроется сборщиком, когда его отпустят текущие запросы
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return fa
+
+    def open(self, uri: str, md5: str | None, user_id: str | None = None) -> tuple[IndexedFasta | None, jobs.Job | None]:
+        """(копия, None) если готова; иначе (None, задача стейджинга) — одна на версию FASTA в процессе."""
+        key = self.key(uri, md5)
+        fa = self._get(key)
+        if fa is not None:
+            return fa, None
+        with self._lock:
+            job = self._staging.get(key)
+            if job is not None and job.status == "Failed":
+                del self._staging[key]   # следующий запрос попробует заново
+                raise StagingFailed(job.error or "staging failed")
+            if job is None or job.status == "Succeeded":
+                job = self._staging[key] = jobs.submit("reference.stage_sequence", self._stage, uri, md5, key,
+                                                       user_id=user_id, entity_id=uri)
+        return None, job
+
+    def _stage(self, job: jobs.Job, uri: str, md5: str | None, key: str) -> dict:
+        final = os.path.join(self.root, key)
+        with open(os.path.join(self.root, ".locks", f"{key}.lock"), "w") as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)   # другие воркеры API ждут и видят готовую копию
+            if os.path.exists(os.path.join(final, META)):
+                return {"key": key, "cached": True}
+            t0 = time.perf_counter()
+            tmp = f"{final}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            try:
+                raw_md5 = hashlib.md5()
+
+                def raw():
+                    for chunk in faidx.iter_s3(uri):
+                        raw_md5.update(chunk)
+                        yield chunk
+
+                compressed = uri.lower().endswith((".gz", ".bgz"))
+                chunks = faidx.BgzfReader(raw()) if compressed else raw()
+                idx = faidx.FastaIndexer()
+                with open(os.path.join(tmp, "genome.fa"), "wb") as out:
+                    try:
+                        for chunk in chunks:
+                            out.write(chunk)
+                            idx.feed(chunk)
+                            job.update(bytes=idx.position)
+                    finally:
+                        contigs = idx.finish()
+                if md5 and raw_md5.hexdigest() != md5.lower():
+                    raise StagingFailed(f"MD5 mismatch for {uri}: expected {md5}, got {raw_md5.hexdigest()}")
+                with open(os.path.join(tmp, "genome.fa.fai"), "wb") as fh:
+                    fh.write(faidx.render_fai(contigs))
+                with open(os.path.join(tmp, META), "w") as fh:
+                    json.dump({"uri": uri, "md5": md5, "contigs": len(contigs), "created": time.time()}, fh)
+                os.rename(tmp, final)
+            except BaseException:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+        self._drop_old_versions(uri, key)
+        return {"key": key, "contigs": len(contigs), "seconds": round(time.perf_counter() - t0, 3)}
+
+    def _drop_old_versions(self, uri: str, keep: str):
+        for name in os.listdir(self.root):
+            if name == keep or name.startswith(".") or ".tmp-" in name:
+                continue
+            try:
+                with open(os.path.join(self.root, name, META)) as fh:
+                    if json.load(fh).get("uri") != uri:
+                        continue
+            except (FileNotFoundError, ValueError):
+                continue
+            with self._lock:
+                self._open.pop(name, None)
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+_store: SequenceStore | None = None
+_store_lock = threading.Lock()
+
+def get_store() -> SequenceStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SequenceStore()
+    return _store
@@ -0,0 +1,147 @@
+import asyncio, logging, os, time, traceback
+from contextlib import asynccontextmanager, contextmanager
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from . import metering, references, runs, s3client, workflows
+from .auth import ensure_admin
+from .scheduler import scheduler
+from .db import Base, engine, async_engine, ensure_columns, DB_POOL_SIZE
+
+log = logging.getLogger(__name__)
+
+# Старт API: схема, админ, бэкфиллы и прогрев пулов БД/S3 — один раз, с таймингами фаз.
+# В фоне (по умолчанию) порт открывается сразу: /livez жив, /readyz = 503, пока старт не закончен.
+STARTUP_BACKGROUND = os.environ.get("STARTUP_BACKGROUND", "1") == "1"
+STARTUP_RETRY_S = float(os.environ.get("STARTUP_RETRY_S", "2"))       # пауза между попытками, если БД/S3 ещё нет
+DB_WARM_CONNECTIONS = int(os.environ.get("DB_WARM_CONNECTIONS", "4"))
+READY_CACHE_S = float(os.environ.get("READY_CACHE_S", "2"))           # результат проверок зависимостей кэшируется
+READY_TIMEOUT_S = float(os.environ.get("READY_TIMEOUT_S", "2"))
+
+router = APIRouter(tags=["health"])
+
+class _State:
+    def __init__(self):
+        self.ready = False
+        self.attempts = 0
+        self.error: str | None = None
+        self.phases: dict[str, float] = {}
+        self.started_at = time.time()
+        self.finished_at: float | None = None
+
+    def to_dict(self) -> dict:
+        return {"ready": self.ready, "attempts": self.attempts, "error": self.error,
+                "phases_ms": self.phases, "finished_at": self.finished_at,
+                "total_ms": round((self.finished_at - self.started_at) * 1000, 1) if self.finished_at else None}
+
+state = _State()
+_checks: dict = {"at": 0.0, "result": None}
+
+@contextmanager
+def _phase(name: str):
+    t0 = time.perf_counter()
+    yield
+    state.phases[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+def _warm_sync_pool(n: int):
+    # n соединений одновременно: пул заполняется до первых запросов
+    conns = []
+    try:
+        for _ in range(n):
+            c = engine.connect()
+            conns.append(c)
+            c.execute(text("SELECT 1"))
+    finally:
+        for c in conns:
+            c.close()
+
+async def _warm_async_pool(n: int):
+    # соединения asyncpg привязаны к event loop — греем в loop сервера, не в потоке
+    async def one():
+        async with async_engine.connect() as c:
+            await c.execute(text("SELECT 1"))
+    await asyncio.gather(*(one() for _ in range(n)))
+
+def _run_sync():
+    with _phase("schema"):
+        Base.metadata.create_all(bind=engine)
+        ensure_columns(engine)
+    with _phase("admin"):
+        ensure_admin()
+    with _phase("backfill"):
+        workflows._backfill_counts()
+        runs._backfill_counts()
+        references._backfill_counts()
+        metering._backfill_storage()
+    with _phase("db_pool"):
+        _warm_sync_pool(min(DB_WARM_CONNECTIONS, DB_POOL_SIZE))
+    with _phase("s3"):
+        s3client.ensure_bucket()   # импорт boto3, клиент и первое соединение пула
+
+async def start():
+    """Выполняет старт до успеха; ошибки (БД/S3 ещё не поднялись) — повтор через STARTUP_RETRY_S."""
+    while True:
+        state.attempts += 1
+        try:
+            await run_in_threadpool(_run_sync)
+            with _phase("db_pool_async"):
+                await _warm_async_pool(min(DB_WARM_CONNECTIONS, DB_POOL_SIZE))
+        except Exception as e:
+            state.error = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+            await asyncio.sleep(STARTUP_RETRY_S)
+            continue
+        state.error, state.ready, state.finished_at = None, True, time.time()
+        scheduler.start()   # очередь когорт — только на готовой схеме
+        log.info("startup: ready in %s ms %s", state.to_dict()["total_ms"], state.phases)
+        return
+
+@asynccontextmanager
+async def lifespan(app):
+    task = asyncio.create_task(start())
+    if not STARTUP_BACKGROUND:
+        await task
+    yield
+    task.cancel()
+
+async def _check_db():
+    async with async_engine.connect() as c:
+        await c.execute(text("SELECT 1"))
+
+def _check_s3():
+    s3client.client().head_bucket(Bucket=s3client.S3_BUCKET_DATASETS)
+
+async def _timed(coro) -> dict:
+    t0 = time.perf_counter()
+    try:
+        await asyncio.wait_for(coro, READY_TIMEOUT_S)
+        out = {"ok": True}
+    except Exception as e:
+        out = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    out["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return out
+
+async def check_dependencies() -> dict:
+    now = time.monotonic()
+    if _checks["result"] is None or now - _checks["at"] > READY_CACHE_S:
+        db, s3 = await asyncio.gather(_timed(_check_db()), _timed(run_in_threadpool(_check_s3)))
+        _checks.update(at=now, result={"db": db, "s3": s3})
+    return _checks["result"]
+
+@router.get("/livez")
+async def livez():
+    # только «процесс жив и event loop отвечает» — без зависимостей, иначе сбой БД перезапускает все поды
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readyz():
+    if not state.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "startup": state.to_dict()})
+    checks = await check_dependencies()
+    ok = all(c["ok"] for c in checks.values())
+    return JSONResponse(status_code=200 if ok else 503,
+                        content={"status": "ready" if ok else "unavailable", "checks": checks,
+                                 "startup": state.to_dict()})
@@ -0,0 +1,110 @@
+import os
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer
+
+from .db import SessionLocal, get_db, get_async_db
+from .models import Run, ProjectMember, Role
+from .auth import get_current_user
+from . import jobs, varstore, qc
+from .reports import submit_report
+
+router = APIRouter(prefix="/variants", tags=["variants"])
+
+VARIANTS_MAX_LIMIT = int(os.environ.get("VARIANTS_MAX_LIMIT", "10000"))
+VARIANTS_MAX_RUNS = int(os.environ.get("VARIANTS_MAX_RUNS", "100"))
+
+async def _require_view(db: AsyncSession, user: dict, project_id: str):
+    if user["role"] == Role.Admin.value: return
+    if not await db.get(ProjectMember, (user["id"], project_id)):
+        raise HTTPException(403, "Forbidden")
+
+def _require_edit(db: Session, user: dict, project_id: str):
+    if user["role"] == Role.Admin.value: return
+    pm = db.get(ProjectMember, (user["id"], project_id))
+    if not pm or pm.role not in [Role.Admin, Role.Editor]:
+        raise HTTPException(403, "Forbidden")
+
+class IngestIn(BaseModel):
+    run_id: str
+    uri: Optional[str] = None   # по умолчанию — основной VCF из артефактов запуска
+
+# --- загрузка VCF запуска в колоночное хранилище + QC-метрики (фоновая задача, один проход по VCF) ---
+def run_ingest(job: jobs.Job, run_id: str, uri: str) -> dict:
+    acc = qc.QCAccumulator()
+    result = varstore.ingest(run_id, uri, progress=job.update, consumers=(acc,))
+    db = SessionLocal()
+    try:
+        r = db.get(Run, run_id, options=[undefer(Run.artifacts)])
+        if r:
+            job.update(phase="coverage")
+            r.variant_count = result["records"]
+            r.qc_metrics = {"source": uri, "variants": acc.result(), "samples": qc.coverage_metrics(r.artifacts or [])}
+            db.commit()
+    finally:
+        db.close()
+    # отчёт включает QC — собирается после них (при тех же входах берётся из кэша)
+    submit_report(run_id, job.user_id)
+    return {**result, "uri": uri}
+
+def submit_ingest(run_id: str, uri: str, user_id: str | None = None) -> jobs.Job:
+    return jobs.submit("variants.ingest", run_ingest, run_id, uri, user_id=user_id, entity_id=run_id)
+
+@router.post("/ingest", status_code=202)
+def ingest(payload: IngestIn, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    r = db.get(Run, payload.run_id, options=[undefer(Run.artifacts)])
+    if not r:
+        raise HTTPException(404, "Run not found")
+    _require_edit(db, user, r.project_id)
+    uri = payload.uri or varstore.pick_vcf(r.artifacts or [])
+    if not uri:
+        raise HTTPException(422, "Run has no VCF artifacts")
+    if uri not in (r.artifacts or []):
+        raise HTTPException(422, "uri is not an artifact of this run")
+    job = submit_ingest(r.id, uri, user["id"])
+    return {"job_id": job.id, "status": job.status, "uri": uri}
+
+@router.get("")
+async def query_variants(
+    run_id: List[str] = Query(..., description="один или несколько запусков"),
+    region: Optional[str] = Query(None, description="chr1:1000-2000 (1-based, включительно)"),
+    sample: Optional[str] = None,
+    filter: Optional[str] = Query(None, description="PASS или имя фильтра"),
+    limit: int = Query(1000, ge=1),
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if len(run_id) > VARIANTS_MAX_RUNS:
+        raise HTTPException(422, f"At most {VARIANTS_MAX_RUNS} runs per query")
+    limit = min(limit, VARIANTS_MAX_LIMIT)
+    rows = (await db.execute(select(Run.id, Run.project_id, Run.reused_from).where(Run.id.in_(run_id)))).all()
+    found = {rid: pid for rid, pid, _ in rows}
+    # запуск из кэша результатов читает хранилище исходного запуска
+    source = {rid: src or rid for rid, _, src in rows}
+    missing = [rid for rid in run_id if rid not in found]
+    if missing:
+        raise HTTPException(404, f"Run not found: {missing[0]}")
+    for pid in set(found.values()):
+        await _require_view(db, user, pid)
+
+    def collect():
+        out, not_ingested = [], []
+        for rid in dict.fromkeys(run_id):
+            store = varstore.open_run(source[rid])
+            if store is None:
+                not_ingested.append(rid)
+                continue
+            for v in store.query(region, sample, filter, limit - len(out)):
+                out.append({"run_id": rid, **v})
+            if len(out) >= limit:
+                break
+        return {"variants": out, "truncated": len(out) >= limit, "not_ingested": not_ingested}
+
+    try:
+        return await run_in_threadpool(collect)
+    except varstore.VarStoreError as e:
+        raise HTTPException(422, str(e))
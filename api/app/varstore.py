@@ -0,0 +1,321 @@
+import os, re, json, time, uuid, shutil, threading
+from collections import OrderedDict
+from typing import Callable, Iterator
+
+import numpy as np
+
+from . import faidx, vcf
+
+# Колоночное хранилище вариантов запуска: VARSTORE_DIR/<run_id>/c<i>/*.npy — по каталогу на хромосому,
+# строки отсортированы по позиции. Индекс бинов (bins.npy) даёт диапазон строк региона без скана;
+# массивы открываются через mmap, так что запрос к десяткам запусков читает только нужные страницы.
+VARSTORE_DIR = os.environ.get("VARSTORE_DIR", "/var/lib/genomeai/varstore")
+VARSTORE_BIN = int(os.environ.get("VARSTORE_BIN", "16384"))          # bp на бин
+VARSTORE_MAX_OPEN = int(os.environ.get("VARSTORE_MAX_OPEN", "64"))   # открытых запусков на процесс
+# какой VCF из артефактов запуска загружать (по подстроке в пути, по порядку)
+VARSTORE_PREFER = [s for s in os.environ.get(
+    "VARSTORE_PREFER", "deepvariant,haplotypecaller,strelka,freebayes,mutect2").split(",") if s]
+
+META = "meta.json"
+# колонки фиксированной ширины: имя → (dtype, на сэмпл)
+_FIXED = {"pos": (np.int32, False), "qual": (np.float32, False), "filter": (np.uint16, False),
+          "gt": (np.int8, True), "dp": (np.int32, True)}
+_STRINGS = ("ref", "alt")
+
+class VarStoreError(ValueError):
+    pass
+
+def pick_vcf(artifacts: list[str]) -> str | None:
+    """Основной VCF среди артефактов: без gVCF и индексов, с предпочтением по VARSTORE_PREFER."""
+    vcfs = [a for a in artifacts
+            if a.lower().endswith((".vcf", ".vcf.gz")) and not a.lower().endswith((".g.vcf.gz", ".genome.vcf.gz"))]
+
+    def rank(uri: str) -> int:
+        low = uri.lower()
+        return next((i for i, s in enumerate(VARSTORE_PREFER) if s in low), len(VARSTORE_PREFER))
+    return min(vcfs, key=rank) if vcfs else None
+
+# --- запись ---
+class _ChromSpill:
+    """Дописываемые файлы колонок одной хромосомы; сортировка и индекс — в finish()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path)
+        self.count = 0
+        self.sorted = True
+        self._last = -1
+        self._fh: dict = {}
+
+    def _files(self) -> dict:
+        # открыты файлы только текущей хромосомы: у сборок с decoy/HLA контигов тысячи
+        if not self._fh:
+            self._fh = {name: open(os.path.join(self.path, f"{name}.bin"), "ab")
+                        for name in [*_FIXED, *(f"{s}.len" for s in _STRINGS), *(f"{s}.dat" for s in _STRINGS)]}
+        return self._fh
+
+    def close(self):
+        for fh in self._fh.values():
+            fh.close()
+        self._fh = {}
+
+    def append(self, cols: dict):
+        pos = cols["pos"]
+        if len(pos) == 0:
+            return
+        files = self._files()
+        if pos[0] < self._last or np.any(np.diff(pos) < 0):
+            self.sorted = False
+        self._last = int(pos[-1])
+        for name, (dtype, _) in _FIXED.items():
+            files[name].write(np.ascontiguousarray(cols[name], dtype=dtype).tobytes())
+        for s in _STRINGS:
+            enc = [x.encode() for x in cols[s]]
+            files[f"{s}.len"].write(np.fromiter(map(len, enc), dtype=np.int32, count=len(enc)).tobytes())
+            files[f"{s}.dat"].write(b"".join(enc))
+        self.count += len(pos)
+
+    def finish(self, nsamples: int) -> dict:
+        self.close()
+        p = lambda name: os.path.join(self.path, name)  # noqa: E731
+        pos = np.fromfile(p("pos.bin"), dtype=np.int32)
+        order = None if self.sorted else np.argsort(pos, kind="stable")
+        for name, (dtype, per_sample) in _FIXED.items():
+            arr = np.fromfile(p(f"{name}.bin"), dtype=dtype)
+            if per_sample:
+                arr = arr.reshape(self.count, nsamples)
+            if order is not None:
+                arr = arr[order]
+            np.save(p(f"{name}.npy"), arr)
+            os.remove(p(f"{name}.bin"))
+        max_ref = 1
+        for s in _STRINGS:
+            lens = np.fromfile(p(f"{s}.len.bin"), dtype=np.int32)
+            if order is not None:
+                with open(p(f"{s}.dat.bin"), "rb") as fh:
+                    dat = fh.read()
+                off = np.concatenate(([0], np.cumsum(lens, dtype=np.int64)))
+                with open(p(f"{s}.dat"), "wb") as fh:
+                    fh.write(b"".join(dat[off[i]:off[i + 1]] for i in order))
+                os.remove(p(f"{s}.dat.bin"))
+                lens = lens[order]
+            else:
+                os.rename(p(f"{s}.dat.bin"), p(f"{s}.dat"))
+            np.save(p(f"{s}.off.npy"), np.concatenate(([0], np.cumsum(lens, dtype=np.int64))))
+            os.remove(p(f"{s}.len.bin"))
+            if s == "ref" and len(lens):
+                max_ref = int(lens.max())
+        pos = pos[order] if order is not None else pos
+        nbins = int(pos[-1]) // VARSTORE_BIN + 1 if len(pos) else 0
+        # bins[i] = первая строка с pos >= i * BIN; bins[nbins] = count
+        np.save(p("bins.npy"), np.searchsorted(pos, np.arange(nbins + 1, dtype=np.int64) * VARSTORE_BIN))
+        return {"count": self.count, "max_ref_len": max_ref, "sorted_on_ingest": self.sorted}
+
+class StoreWriter:
+    def __init__(self, path: str, samples: list[str], source: str | None = None):
+        self.path = path
+        self.samples = samples
+        self.source = source
+        self._chroms: dict[str, _ChromSpill] = {}
+        self._filters: dict[str, int] = {}
+        self._active: _ChromSpill | None = None
+        os.makedirs(path)
+
+    def _filter_codes(self, values: list[str]) -> np.ndarray:
+        codes = self._filters
+        return np.fromiter((codes.setdefault(v, len(codes)) for v in values), dtype=np.uint16, count=len(values))
+
+    def add(self, batch: vcf.VcfBatch):
+        flt = self._filter_codes(batch.filter)
+        # VCF отсортирован по хромосомам → батч режется на несколько непрерывных отрезков
+        start, n = 0, len(batch)
+        while start < n:
+            name = batch.chrom[start]
+            end = start + 1
+            while end < n and batch.chrom[end] == name:
+                end += 1
+            spill = self._chroms.get(name)
+            if spill is None:
+                spill = self._chroms[name] = _ChromSpill(os.path.join(self.path, f"c{len(self._chroms)}"))
+            if spill is not self._active:
+                if self._active is not None:
+                    self._active.close()
+                self._active = spill
+            sl = slice(start, end)
+            spill.append({"pos": batch.pos[sl], "qual": batch.qual[sl], "filter": flt[sl],
+                          "gt": batch.gt[sl], "dp": batch.dp[sl], "ref": batch.ref[sl], "alt": batch.alt[sl]})
+            start = end
+
+    def finish(self) -> dict:
+        chroms = {}
+        for name, spill in self._chroms.items():
+            chroms[name] = {"dir": os.path.basename(spill.path), **spill.finish(len(self.samples))}
+        meta = {"source": self.source, "samples": self.samples, "bin": VARSTORE_BIN,
+                "filters": [f for f, _ in sorted(self._filters.items(), key=lambda kv: kv[1])],
+                "chroms": chroms, "records": sum(c["count"] for c in chroms.values()), "created": time.time()}
+        with open(os.path.join(self.path, META), "w") as fh:
+            json.dump(meta, fh)
+        return meta
+
+def ingest(run_id: str, uri: str, root: str = VARSTORE_DIR,
+           progress: Callable[..., None] | None = None, consumers: tuple = ()) -> dict:
+    """Стримит VCF из S3 в хранилище запуска; готовый каталог подменяет прежний атомарно.
+
+    consumers — объекты со start(header)/add(batch) (напр. qc.QCAccumulator): получают те же батчи за тот же проход.
+    """
+    progress = progress or (lambda **_: None)
+    final = os.path.join(root, run_id)
+    tmp = os.path.join(root, f".tmp-{run_id}-{uuid.uuid4().hex[:6]}")
+    os.makedirs(root, exist_ok=True)
+    try:
+        header, batches = vcf.read_vcf(faidx.iter_s3(uri))
+        writer = StoreWriter(tmp, header.samples, source=uri)
+        for c in consumers:
+            c.start(header)
+        n = 0
+        for batch in batches:
+            writer.add(batch)
+            for c in consumers:
+                c.add(batch)
+            n += len(batch)
+            progress(records=n)
+        meta = writer.finish()
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    trash = None
+    if os.path.exists(final):
+        trash = os.path.join(root, f".trash-{run_id}-{uuid.uuid4().hex[:6]}")
+        os.rename(final, trash)
+    os.rename(tmp, final)
+    if trash:
+        shutil.rmtree(trash, ignore_errors=True)   # открытые mmap старой версии остаются валидны
+    return {"records": meta["records"], "chroms": len(meta["chroms"]), "samples": len(meta["samples"])}
+
+# --- чтение ---
+class _Chrom:
+    def __init__(self, path: str, info: dict):
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")  # noqa: E731
+        self.count = info["count"]
+        self.max_ref_len = info["max_ref_len"]
+        self.pos, self.qual, self.filter = load("pos"), load("qual"), load("filter")
+        self.gt, self.dp, self.bins = load("gt"), load("dp"), load("bins")
+        self.off = {s: load(f"{s}.off") for s in _STRINGS}
+        self.dat = {s: (np.memmap(os.path.join(path, f"{s}.dat"), dtype=np.uint8, mode="r")
+                        if os.path.getsize(os.path.join(path, f"{s}.dat")) else np.zeros(0, np.uint8))
+                    for s in _STRINGS}
+
+    def string(self, col: str, i: int) -> str:
+        off = self.off[col]
+        return self.dat[col][off[i]:off[i + 1]].tobytes().decode()
+
+    def rows(self, start: int | None, end: int | None) -> tuple[int, int]:
+        """Диапазон строк-кандидатов по индексу бинов (с запасом на длинные REF, начинающиеся раньше)."""
+        if start is None or not len(self.bins):
+            return 0, self.count
+        nbins = len(self.bins) - 1
+        b0 = min(max(0, (start - self.max_ref_len) // VARSTORE_BIN), nbins)
+        b1 = min(end // VARSTORE_BIN + 1, nbins)
+        return int(self.bins[b0]), int(self.bins[b1])
+
+class RunVariants:
+    def __init__(self, path: str):
+        with open(os.path.join(path, META)) as fh:
+            self.meta = json.load(fh)
+        self.path = path
+        self.samples: list[str] = self.meta["samples"]
+        self.filters: list[str] = self.meta["filters"]
+        self._chroms: dict[str, _Chrom] = {}
+        self._lock = threading.Lock()
+
+    def chrom(self, name: str) -> _Chrom | None:
+        info = self.meta["chroms"].get(name)
+        if info is None:
+            return None
+        with self._lock:
+            c = self._chroms.get(name)
+            if c is None:
+                c = self._chroms[name] = _Chrom(os.path.join(self.path, info["dir"]), info)
+        return c
+
+    def parse_region(self, region: str) -> tuple[str, int | None, int | None]:
+        region = region.strip()
+        if region in self.meta["chroms"]:
+            return region, None, None
+        name, sep, rng = region.rpartition(":")
+        m = re.fullmatch(r"(\d+)(?:-(\d+))?", rng.replace(",", "")) if sep else None
+        if not m:
+            if sep and name in self.meta["chroms"]:
+                raise VarStoreError(f"Malformed region '{region}'")
+            # контиг, которого нет в этом запуске, — просто пустой результат
+            return region, None, None
+        start = int(m[1])
+        end = int(m[2]) if m[2] else start
+        if start < 1 or end < start:
+            raise VarStoreError(f"Empty region '{region}'")
+        return name, start, end
+
+    def _filter_codes(self, status: str) -> np.ndarray:
+        return np.array([i for i, f in enumerate(self.filters) if status in f.split(";")], dtype=np.uint16)
+
+    def query(self, region: str | None = None, sample: str | None = None, status: str | None = None,
+              limit: int = 1000) -> Iterator[dict]:
+        si = None
+        if sample is not None:
+            if sample not in self.samples:
+                return
+            si = self.samples.index(sample)
+        targets = [self.parse_region(region)] if region else [(n, None, None) for n in self.meta["chroms"]]
+        codes = self._filter_codes(status) if status else None
+        for name, start, end in targets:
+            c = self.chrom(name)
+            if c is None:
+                continue
+            lo, hi = c.rows(start, end)
+            if hi <= lo:
+                continue
+            mask = np.ones(hi - lo, dtype=bool)
+            if start is not None:
+                pos = c.pos[lo:hi].astype(np.int64)
+                reflen = np.diff(c.off["ref"][lo:hi + 1])
+                mask &= (pos <= end) & (pos + reflen - 1 >= start)
+            if codes is not None:
+                mask &= np.isin(c.filter[lo:hi], codes)
+            if si is not None:
+                mask &= c.gt[lo:hi, si] > 0   # сэмпл несёт альтернативный аллель
+            for i in np.flatnonzero(mask)[:limit] + lo:
+                yield self._row(c, name, int(i), si)
+                limit -= 1
+            if limit <= 0:
+                return
+
+    def _row(self, c: _Chrom, name: str, i: int, si: int | None) -> dict:
+        q = float(c.qual[i])
+        idx = range(len(self.samples)) if si is None else (si,)
+        return {
+            "chrom": name, "pos": int(c.pos[i]), "ref": c.string("ref", i), "alt": c.string("alt", i),
+            "qual": None if np.isnan(q) else q, "filter": self.filters[int(c.filter[i])],
+            "genotypes": {self.samples[j]: {"gt": vcf.GT_NAMES[int(c.gt[i, j])],
+                                            "dp": int(c.dp[i, j]) if c.dp[i, j] >= 0 else None} for j in idx},
+        }
+
+_open: "OrderedDict[str, tuple[float, RunVariants]]" = OrderedDict()
+_open_lock = threading.Lock()
+
+def open_run(run_id: str, root: str = VARSTORE_DIR) -> RunVariants | None:
+    path = os.path.join(root, run_id)
+    try:
+        mtime = os.stat(os.path.join(path, META)).st_mtime
+    except FileNotFoundError:
+        return None
+    with _open_lock:
+        hit = _open.get(path)
+        if hit and hit[0] == mtime:
+            _open.move_to_end(path)
+            return hit[1]
+    rv = RunVariants(path)
+    with _open_lock:
+        _open[path] = (mtime, rv)
+        while len(_open) > VARSTORE_MAX_OPEN:
+            _open.popitem(last=False)
+    return rv
@@ -0,0 +1,143 @@
+import os, zlib
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+import numpy as np
+
+# Потоковый разбор VCF/VCF.GZ батчами фиксированного размера: память ограничена батчем, а не файлом.
+# Общий источник данных для колоночного хранилища вариантов (varstore) и QC-метрик (qc).
+VCF_BATCH = int(os.environ.get("VCF_BATCH", "65536"))
+
+# генотип → код: 0 hom-ref, 1 het, 2 hom-alt, -1 нет вызова
+GT_MISSING, GT_HOMREF, GT_HET, GT_HOMALT = -1, 0, 1, 2
+GT_NAMES = {GT_MISSING: "missing", GT_HOMREF: "hom_ref", GT_HET: "het", GT_HOMALT: "hom_alt"}
+
+class VcfError(ValueError):
+    pass
+
+@dataclass
+class VcfHeader:
+    samples: list[str] = field(default_factory=list)
+    contigs: dict[str, int | None] = field(default_factory=dict)   # ##contig=<ID=..,length=..>
+    filters: list[str] = field(default_factory=list)
+
+@dataclass
+class VcfBatch:
+    chrom: list[str]
+    pos: np.ndarray       # int64, 1-based
+    ref: list[str]
+    alt: list[str]        # как в VCF: "A,T" для мультиаллельных
+    qual: np.ndarray      # float32, NaN для "."
+    filter: list[str]     # "PASS", "." или "q10;s50"
+    gt: np.ndarray        # int8 (n, samples)
+    dp: np.ndarray        # int32 (n, samples), -1 = нет
+
+    def __len__(self) -> int:
+        return len(self.chrom)
+
+def gunzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """gzip/BGZF (конкатенация членов) → несжатые куски."""
+    d = zlib.decompressobj(31)
+    for data in chunks:
+        while data:
+            out = d.decompress(data)
+            if out:
+                yield out
+            if not d.eof:
+                break
+            data = d.unused_data
+            d = zlib.decompressobj(31)
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    rest = b""
+    for data in chunks:
+        lines = (rest + data).split(b"\n")
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+def _gt_code(gt: str) -> int:
+    if not gt or gt[0] == ".":
+        return GT_MISSING
+    alleles = gt.replace("|", "/").split("/")
+    if "." in alleles:
+        return GT_MISSING
+    if all(a == "0" for a in alleles):
+        return GT_HOMREF
+    return GT_HOMALT if len(set(alleles)) == 1 else GT_HET
+
+def _header_line(h: VcfHeader, line: str):
+    if line.startswith("##contig=<"):
+        attrs = dict(kv.split("=", 1) for kv in line[10:].rstrip(">").split(",") if "=" in kv)
+        if "ID" in attrs:
+            h.contigs[attrs["ID"]] = int(attrs["length"]) if attrs.get("length", "").isdigit() else None
+    elif line.startswith("##FILTER=<ID="):
+        h.filters.append(line[13:].split(",", 1)[0].rstrip(">"))
+
+def read_vcf(chunks: Iterable[bytes], batch_size: int = VCF_BATCH,
+             compressed: bool | None = None) -> tuple[VcfHeader, Iterator[VcfBatch]]:
+    """Читает заголовок сразу, записи — лениво батчами. compressed=None → по gzip-магии первого куска."""
+    chunks = iter(chunks)
+    first = next(chunks, b"")
+    if compressed is None:
+        compressed = first[:2] == b"\x1f\x8b"
+
+    def raw():
+        yield first
+        yield from chunks
+
+    lines = iter_lines(gunzip(raw()) if compressed else raw())
+    header = VcfHeader()
+    for b in lines:
+        line = b.decode().rstrip("\r")
+        if line.startswith("##"):
+            _header_line(header, line)
+            continue
+        if not line.startswith("#CHROM"):
+            raise VcfError("VCF header line #CHROM not found")
+        header.samples = line.split("\t")[9:]
+        break
+    else:
+        raise VcfError("Empty VCF")
+    return header, _batches(lines, len(header.samples), batch_size)
+
+def _batches(lines: Iterator[bytes], nsamples: int, batch_size: int) -> Iterator[VcfBatch]:
+    def empty():
+        return [], [], [], [], [], [], [], []
+
+    chrom, pos, ref, alt, qual, flt, gts, dps = empty()
+    for b in lines:
+        if not b or b[0] == 0x23:  # '#'
+            continue
+        f = b.decode().rstrip("\r").split("\t")
+        if len(f) < 8:
+            raise VcfError(f"Malformed VCF record: {b[:80]!r}")
+        chrom.append(f[0]); pos.append(int(f[1])); ref.append(f[3]); alt.append(f[4])
+        qual.append(float("nan") if f[5] == "." else float(f[5]))
+        flt.append(f[6])
+        if nsamples:
+            fmt = f[8].split(":")
+            gi = fmt.index("GT") if "GT" in fmt else None
+            di = fmt.index("DP") if "DP" in fmt else None
+            g, d = [], []
+            for s in f[9:9 + nsamples]:
+                parts = s.split(":")
+                g.append(_gt_code(parts[gi]) if gi is not None and gi < len(parts) else GT_MISSING)
+                v = parts[di] if di is not None and di < len(parts) else "."
+                d.append(int(v) if v.isdigit() else -1)
+            gts.append(g); dps.append(d)
+        if len(chrom) >= batch_size:
+            yield _to_batch(chrom, pos, ref, alt, qual, flt, gts, dps, nsamples)
+            chrom, pos, ref, alt, qual, flt, gts, dps = empty()
+    if chrom:
+        yield _to_batch(chrom, pos, ref, alt, qual, flt, gts, dps, nsamples)
+
+def _to_batch(chrom, pos, ref, alt, qual, flt, gts, dps, nsamples) -> VcfBatch:
+    n = len(chrom)
+    return VcfBatch(
+        chrom=chrom, pos=np.asarray(pos, dtype=np.int64), ref=ref, alt=alt,
+        qual=np.asarray(qual, dtype=np.float32), filter=flt,
+        gt=np.asarray(gts, dtype=np.int8).reshape(n, nsamples),
+        dp=np.asarray(dps, dtype=np.int32).reshape(n, nsamples),
+    )
@@ -1,24 +1,18 @@
 from typing import List, Any, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-import yaml
-from yaml.parser import ParserError
-from yaml.scanner import ScannerError
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer
 
-from .db import SessionLocal, Base, engine
+from .db import SessionLocal, get_db, get_async_db
 from .models import Workflow, Role
 from .auth import get_current_user, require_role
+from .cache import response_cache
+from .responses import rows_to_dicts
 
 router = APIRouter(prefix="/workflows", tags=["workflows"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 class ImportPayload(BaseModel):
     name: str = Field(min_length=1)
     version: str = Field(min_length=1)
@@ -46,21 +40,21 @@ class WorkflowOut(BaseModel):
     git_sha: Optional[str]
     lock: dict
 
-@router.on_event("startup")
-def _init():
-    Base.metadata.create_all(bind=engine)
-
-def _parse_lock(payload: ImportPayload) -> dict:
-    if payload.lockfile_json:
-        return payload.lockfile_json
-    if payload.lockfile_yaml:
-        return yaml.safe_load(payload.lockfile_yaml)
-    raise HTTPException(status_code=422, detail="Provide lockfile_json or lockfile_yaml")
-
 def _count_images(lock: dict) -> int:
     containers = lock.get("containers") or lock.get("images") or []
     return len(containers)
 
+def _backfill_counts():
+    # строки, созданные до появления image_count: считаем один раз
+    db = SessionLocal()
+    try:
+        rows = db.query(Workflow).options(undefer(Workflow.lock)).filter(Workflow.image_count.is_(None)).all()
+        for wf in rows:
+            wf.image_count = _count_images(wf.lock)
+        db.commit()
+    finally:
+        db.close()
+
 @router.post(
     "/import",
     response_model=WorkflowOut,
@@ -69,7 +63,8 @@ def _count_images(lock: dict) -> int:
 )
 def import_workflow(payload: ImportPayload, user=Depends(get_current_user), db: Session = Depends(get_db)):
     lock = _parse_lock(payload)
-    if _count_images(lock) == 0:
+    images = _count_images(lock)
+    if images == 0:
         raise HTTPException(status_code=422, detail="Lockfile must list containers/images")
     wf = Workflow(
         name=payload.name,
@@ -79,38 +74,48 @@ def import_workflow(payload: ImportPayload, user=Depends(get_current_user), db:
         revision=payload.revision,
         git_sha=payload.git_sha,
         lock=lock,
+        image_count=images,
     )
     db.add(wf); db.commit()
+    response_cache.invalidate("workflows")
     return WorkflowOut(
         id=wf.id, name=wf.name, version=wf.version, engine=wf.engine,
         repo=wf.repo, revision=wf.revision, git_sha=wf.git_sha, lock=wf.lock
     )
 
 @router.get("", response_model=List[WorkflowListOut])
-def list_workflows(db: Session = Depends(get_db), user=Depends(get_current_user)):
-    rows = db.query(Workflow).order_by(Workflow.created_at.desc()).all()
-    out = []
-    for r in rows:
-        images = _count_images(r.lock)
-        out.append(WorkflowListOut(id=r.id, name=r.name, version=r.version, git_sha=r.git_sha, images=images))
-    return out
+async def list_workflows(request: Request, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    async def build():
+        # только лёгкие колонки: lock не читаем, число образов посчитано при импорте
+        res = await db.execute(
+            select(
+                Workflow.id, Workflow.name, Workflow.version, Workflow.git_sha,
+                func.coalesce(Workflow.image_count, 0).label("images"),
+            ).order_by(Workflow.created_at.desc())
+        )
+        return rows_to_dicts(list(res.keys()), res.all())
+    return await response_cache.respond(request, "workflows", build)
 
 @router.get("/{workflow_id}", response_model=WorkflowOut)
-def get_workflow(workflow_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    wf = db.get(Workflow, workflow_id)
-    if not wf:
-        raise HTTPException(status_code=404, detail="Not found")
-    return WorkflowOut(
-        id=wf.id, name=wf.name, version=wf.version, engine=wf.engine,
-        repo=wf.repo, revision=wf.revision, git_sha=wf.git_sha, lock=wf.lock
-    )
+async def get_workflow(workflow_id: str, request: Request, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    async def build():
+        wf = await db.get(Workflow, workflow_id, options=[undefer(Workflow.lock)])
+        if not wf:
+            raise HTTPException(status_code=404, detail="Not found")
+        return WorkflowOut(
+            id=wf.id, name=wf.name, version=wf.version, engine=wf.engine,
+            repo=wf.repo, revision=wf.revision, git_sha=wf.git_sha, lock=wf.lock
+        )
+    return await response_cache.respond(request, "workflows", build)
 
 def _parse_lock(payload: ImportPayload) -> dict:
+    import yaml   # лениво: нужен только импорту lock-файла
+
     try:
         if payload.lockfile_json:
             return payload.lockfile_json
         if payload.lockfile_yaml:
             return yaml.safe_load(payload.lockfile_yaml)
         raise HTTPException(422, "Provide lockfile_json or lockfile_yaml")
-    except (ParserError, ScannerError) as e:
+    except (yaml.parser.ParserError, yaml.scanner.ScannerError) as e:
         raise HTTPException(422, f"Invalid YAML: {e}")
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""QC-метрики на VCF масштаба полного генома (по умолчанию ~4.5M записей, как у 30x WGS одного сэмпла).
+
+Запуск из каталога api/:  python -m bench.bench_qc [--records 4500000] [--samples 1] [--batch 65536] [--gzip]
+
+Синтетический VCF (SNV ~85% с Ti/Tv≈2, indel ~15%, 24 контига) собирается в памяти и подаётся кусками
+по 16 МБ, как из S3. Замеряются отдельно: разбор в батчи (vcf.read_vcf), векторный накопитель
+(qc.QCAccumulator) и для сравнения — тот же расчёт построчным Python-циклом на первых батчах.
+"""
+import argparse, gzip, random, time, tracemalloc
+
+import numpy as np
+
+from app import qc, vcf
+
+CONTIGS = [f"chr{i}" for i in range(1, 23)] + ["chrX", "chrY"]
+TI = {"A": "G", "G": "A", "C": "T", "T": "C"}
+TV = {"A": "CT", "G": "CT", "C": "AG", "T": "AG"}
+
+def _synthetic(records: int, samples: int, seed: int = 1) -> bytes:
+    rnd = random.Random(seed)
+    head = ["##fileformat=VCFv4.2"]
+    head += [f"##contig=<ID={c},length={250_000_000 - 9_000_000 * i}>" for i, c in enumerate(CONTIGS)]
+    head.append("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + "\t".join(f"S{i}" for i in range(samples)))
+    per = records // len(CONTIGS)
+    gts = ["0/1", "0/1", "1/1", "0/0", "./."]
+    out = ["\n".join(head)]
+    for c in CONTIGS:
+        pos = 0
+        lines = []
+        for _ in range(per):
+            pos += rnd.randint(50, 1500)
+            ref = rnd.choice("ACGT")
+            r = rnd.random()
+            if r < 0.57:
+                alt = TI[ref]
+            elif r < 0.85:
+                alt = rnd.choice(TV[ref])
+            elif r < 0.93:
+                alt = ref + "A" * rnd.randint(1, 12)
+            else:
+                alt, ref = ref, ref + "T" * rnd.randint(1, 12)
+            flt = "PASS" if rnd.random() < 0.9 else "LowQual"
+            calls = "\t".join(f"{rnd.choice(gts)}:{rnd.randint(5, 80)}" for _ in range(samples))
+            lines.append(f"{c}\t{pos}\t.\t{ref}\t{alt}\t50\t{flt}\t.\tGT:DP\t{calls}")
+        out.append("\n".join(lines))
+    return ("\n".join(out) + "\n").encode()
+
+def _chunks(data: bytes, size: int = 16 * 1024 * 1024):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+def _scalar_qc(batches) -> tuple[int, int]:
+    # тот же Ti/Tv и het/hom построчно — ориентир для векторного накопителя
+    ti = tv = het = hom = 0
+    for b in batches:
+        for i in range(len(b)):
+            if b.filter[i] not in ("PASS", "."):
+                continue
+            ref, alt = b.ref[i].upper(), b.alt[i].split(",")[0].upper()
+            if len(ref) == 1 and len(alt) == 1 and ref != alt:
+                if {ref, alt} in ({"A", "G"}, {"C", "T"}):
+                    ti += 1
+                else:
+                    tv += 1
+            for g in b.gt[i]:
+                het += g == vcf.GT_HET
+                hom += g == vcf.GT_HOMALT
+    return ti, tv
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=4_500_000)
+    ap.add_argument("--samples", type=int, default=1)
+    ap.add_argument("--batch", type=int, default=vcf.VCF_BATCH)
+    ap.add_argument("--gzip", action="store_true", help="подавать VCF.GZ (добавляет распаковку)")
+    ap.add_argument("--trace-memory", action="store_true", help="tracemalloc (сильно замедляет замер)")
+    ap.add_argument("--scalar-batches", type=int, default=8, help="батчей для построчного сравнения")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    data = _synthetic(args.records, args.samples)
+    if args.gzip:
+        data = gzip.compress(data, compresslevel=1)
+    print(f"records={args.records} samples={args.samples} batch={args.batch} "
+          f"input={len(data) / 1e6:.0f} MB{' (gz)' if args.gzip else ''} (generated in {time.perf_counter() - t0:.1f}s)")
+
+    if args.trace_memory:
+        tracemalloc.start()
+    header, batches = vcf.read_vcf(_chunks(data), batch_size=args.batch)
+    acc = qc.QCAccumulator()
+    acc.start(header)
+    parse_s = acc_s = 0.0
+    kept = []
+    t = time.perf_counter()
+    for b in batches:
+        t1 = time.perf_counter()
+        parse_s += t1 - t
+        acc.add(b)
+        t = time.perf_counter()
+        acc_s += t - t1
+        if len(kept) < args.scalar_batches:
+            kept.append(b)
+    if args.trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    m = acc.result()
+
+    n = m["records"]
+    print(f"  parse (vcf.read_vcf)     {parse_s:7.2f} s  {n / parse_s / 1e3:8.0f} k rec/s")
+    print(f"  qc accumulate (numpy)    {acc_s:7.2f} s  {n / acc_s / 1e3:8.0f} k rec/s")
+    if args.trace_memory:
+        print(f"  peak python alloc        {peak / 1e6:7.0f} MB (incl. {len(kept)} kept batches for the scalar run)")
+    kept_n = sum(len(b) for b in kept)
+    t = time.perf_counter()
+    _scalar_qc(kept)
+    sc = time.perf_counter() - t
+    t = time.perf_counter()
+    a2 = qc.QCAccumulator(); a2.start(header)
+    for b in kept:
+        a2.add(b)
+    vec = time.perf_counter() - t
+    print(f"  scalar vs vector on {kept_n} rec: {sc * 1e3:.0f} ms vs {vec * 1e3:.0f} ms  (x{sc / vec:.1f})")
+    print(f"  ti/tv={m['ti_tv']} snv={m['snv']} indel={m['indel']} "
+          f"het/hom(S0)={m['samples'].get('S0', {}).get('het_hom_ratio')}")
+
+if __name__ == "__main__":
+    np.seterr(all="ignore")
+    main()
@@ -0,0 +1,73 @@
+"""Сравнение путей сериализации list-эндпойнтов на 10k строк.
+
+Запуск из каталога api/:  python -m bench.bench_serialization [--rows 10000] [--repeat 5]
+
+baseline — как раньше: RunOut(...) на каждую строку → валидация response_model →
+jsonable-dump → json.dumps (JSONResponse). fast — dict из кортежей проекции → orjson.
+Отдельно замеряется gzip на уровне GZIP_LEVEL (как в GZipMiddleware из main.py).
+"""
+import argparse, gzip, json, statistics, time, uuid
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.models import RunStatus
+from app.runs import RunOut, RunListOut
+from app.responses import dumps, rows_to_dicts, GZIP_LEVEL
+
+def _rows(n: int):
+    keys = ["id", "project_id", "workflow_id", "reference_set_id", "sample_ids", "params",
+            "compute_profile", "runner_job_id", "status", "artifacts"]
+    pid, wid, rid = (str(uuid.uuid4()) for _ in range(3))
+    rows = [
+        (str(uuid.uuid4()), pid, wid, rid, [str(uuid.uuid4())], {"note": "bench", "i": i},
+         "local-docker", f"run_{i}", RunStatus.Succeeded,
+         [f"s3://runs/run_{i}/logs/{f}" for f in ("report.html", "trace.txt", "timeline.html")])
+        for i in range(n)
+    ]
+    return keys, rows
+
+def _baseline(keys, rows, adapter) -> bytes:
+    models = [RunOut(**dict(zip(keys, r))) for r in rows]          # сборка моделей в хэндлере
+    validated = adapter.validate_python(models)                   # FastAPI: проверка response_model
+    content = adapter.dump_python(validated, mode="json")          # FastAPI: serialize_response
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def _fast(keys, rows) -> bytes:
+    return dumps(rows_to_dicts(keys, rows))
+
+def _timeit(fn, repeat: int) -> tuple[float, bytes]:
+    times, out = [], b""
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000, out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    keys, rows = _rows(args.rows)
+    adapter = TypeAdapter(List[RunOut])
+    slim_keys = list(RunListOut.model_fields)
+    slim_rows = [(r[0], r[1], r[2], r[3], r[6], r[7], r[8], len(r[4]), len(r[9])) for r in rows]
+
+    cases = [
+        ("baseline (pydantic + json)", lambda: _baseline(keys, rows, adapter)),
+        ("fast (tuples + orjson)", lambda: _fast(keys, rows)),
+        ("fast, slim RunListOut", lambda: _fast(slim_keys, slim_rows)),
+    ]
+    print(f"rows={args.rows} repeat={args.repeat} (median)")
+    base_ms = None
+    for name, fn in cases:
+        ms, body = _timeit(fn, args.repeat)
+        gz_ms, gz = _timeit(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL), args.repeat)
+        base_ms = base_ms or ms
+        print(f"  {name:28s} {ms:8.1f} ms  x{base_ms / ms:5.1f}  body={len(body) / 1024:8.0f} KiB"
+              f"  gzip={len(gz) / 1024:6.0f} KiB ({gz_ms:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
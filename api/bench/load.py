@@ -0,0 +1,276 @@
+"""Нагрузочный прогон API: UI-смесь запросов по всем роутерам, p50/p95/p99 по эндпойнтам, сравнение с базовой линией.
+
+Запуск из каталога api/ (общий S3-слой — PYTHONPATH=../shared):
+    python -m bench.seed --db sqlite:////tmp/bench.db --scale ci
+    python -m bench.load --db sqlite:////tmp/bench.db --duration 60 --users 32 --baseline bench/baselines/ci.json
+
+По умолчанию приложение поднимается in-process (httpx.ASGITransport), S3 — локальный moto-сервер,
+который засевается отчётами и VCF (bench.seed.seed_s3). --base-url http://host:8080/api — прогон по стенду:
+БД и S3 засеваются заранее (bench.seed --s3), JWT_SECRET — тот же, что у стенда (токены подписываются здесь).
+
+Выход 1, если p95 какого-либо эндпойнта выше --slo-ms (2000 — SLO UI из README), хуже базовой линии
+больше чем на --tolerance, или доля ошибок выше --max-error-rate. --save-baseline записывает результат.
+"""
+import argparse, asyncio, json, logging, os, platform, random, socket, subprocess, sys, tempfile, time
+from collections import defaultdict
+
+SLO_P95_MS = 2000.0
+NOISE_FLOOR_MS = 5.0   # разница p95 меньше этого — шум, не регрессия
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _pct(sorted_ms: list[float], q: float) -> float:
+    # nearest-rank
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, int(round(q / 100 * len(sorted_ms) + 0.5)) - 1))
+    return sorted_ms[k]
+
+# --- пулы идентификаторов из засеянной БД ---
+def _load_pools(engine, sample: int = 20_000) -> dict:
+    from sqlalchemy import func, select
+    from app.models import User, Project, ProjectMember, Run, ReferenceSet, Workflow, Report
+    from bench.seed import BENCH_ADMIN, BENCH_VIEWER
+
+    with engine.connect() as c:
+        users = dict(c.execute(select(User.username, User.id).where(User.username.in_([BENCH_ADMIN, BENCH_VIEWER]))).all())
+        if len(users) < 2:
+            raise SystemExit("БД не засеяна: запустите python -m bench.seed (или передайте --seed-scale)")
+        viewer_projects = [p for (p,) in c.execute(select(ProjectMember.project_id).where(ProjectMember.user_id == users[BENCH_VIEWER]))]
+        rnd_order = func.random()
+        all_projects = [p for (p,) in c.execute(select(Project.id).order_by(rnd_order).limit(sample))]
+        runs = c.execute(select(Run.id, Run.project_id).order_by(rnd_order).limit(sample)).all()
+        viewer_runs = c.execute(select(Run.id).where(Run.project_id.in_(viewer_projects[:1000])).order_by(rnd_order).limit(sample)).all()
+        return {
+            "admin_id": users[BENCH_ADMIN], "viewer_id": users[BENCH_VIEWER],
+            "projects": all_projects, "viewer_projects": viewer_projects,
+            "runs": [r for r, _ in runs], "viewer_runs": [r for (r,) in viewer_runs],
+            "qc_runs": [r for (r,) in c.execute(select(Run.id).where(Run.qc_metrics.isnot(None)).order_by(rnd_order).limit(sample))],
+            "report_runs": [r for (r,) in c.execute(select(Report.run_id).order_by(rnd_order).limit(sample))],
+            "variant_runs": [r for (r,) in c.execute(select(Run.id).where(Run.variant_count.isnot(None)).limit(sample))],
+            "refs": [r for (r,) in c.execute(select(ReferenceSet.id))],
+            "workflows": [w for (w,) in c.execute(select(Workflow.id))],
+            "rows": {t: c.execute(select(func.count()).select_from(m)).scalar()
+                     for t, m in (("projects", Project), ("runs", Run))},
+        }
+
+# --- смесь запросов: (имя, вес, кто, построитель) ---
+def _mix(p: dict, dataset_counter):
+    pick = random.Random.choice
+
+    def proj(rnd, who):
+        return pick(rnd, p["viewer_projects"] if who == "viewer" else p["projects"])
+
+    def run(rnd, who):
+        pool = p["viewer_runs"] if who == "viewer" and p["viewer_runs"] else p["runs"]
+        return pick(rnd, pool)
+
+    mix = [
+        ("GET /healthz", 2, "viewer", lambda r, w: ("GET", "/healthz", None, None)),
+        ("GET /auth/me", 2, "viewer", lambda r, w: ("GET", "/auth/me", None, None)),
+        ("GET /projects", 8, "any", lambda r, w: ("GET", "/projects", None, None)),
+        ("GET /projects/{id}", 4, "any", lambda r, w: ("GET", f"/projects/{proj(r, w)}", None, None)),
+        ("GET /projects/{id}/members", 3, "any", lambda r, w: ("GET", f"/projects/{proj(r, w)}/members", None, None)),
+        ("GET /datasets", 12, "any", lambda r, w: ("GET", "/datasets", {"project_id": proj(r, w)}, None)),
+        ("GET /samples", 10, "any", lambda r, w: ("GET", "/samples", {"project_id": proj(r, w)}, None)),
+        ("GET /samples/export.csv", 1, "any", lambda r, w: ("GET", "/samples/export.csv", {"project_id": proj(r, w)}, None)),
+        ("GET /runs", 14, "any", lambda r, w: ("GET", "/runs", {"project_id": proj(r, w)}, None)),
+        ("GET /runs/{id}", 12, "any", lambda r, w: ("GET", f"/runs/{run(r, w)}", None, None)),
+        ("GET /references", 4, "any", lambda r, w: ("GET", "/references", None, None)),
+        ("GET /references/{id}", 2, "any", lambda r, w: ("GET", f"/references/{pick(r, p['refs'])}", None, None)),
+        ("GET /references/{id}/validation", 1, "any",
+         lambda r, w: ("GET", f"/references/{pick(r, p['refs'])}/validation", None, None)),
+        ("GET /workflows", 4, "any", lambda r, w: ("GET", "/workflows", None, None)),
+        ("GET /workflows/{id}", 2, "any", lambda r, w: ("GET", f"/workflows/{pick(r, p['workflows'])}", None, None)),
+        ("GET /audit", 1, "admin", lambda r, w: ("GET", "/audit", {"limit": 100}, None)),
+        ("POST /projects", 1, "admin", lambda r, w: ("POST", "/projects", None, {"name": f"bench {r.getrandbits(32):08x}"})),
+        ("POST /datasets/register", 2, "admin", lambda r, w: ("POST", "/datasets/register", None, {
+            "project_id": pick(r, p["projects"]), "uri": f"s3://datasets/bench/{next(dataset_counter)}.bam",
+            "type": "BAM", "size_bytes": 10**9, "md5": f"{r.getrandbits(128):032x}"})),
+    ]
+    if p["qc_runs"]:
+        mix.append(("GET /runs/{id}/qc", 4, "admin", lambda r, w: ("GET", f"/runs/{pick(r, p['qc_runs'])}/qc", None, None)))
+    if p["report_runs"]:
+        mix.append(("GET /reports/{id}", 3, "admin", lambda r, w: ("GET", f"/reports/{pick(r, p['report_runs'])}", None, None)))
+    if p["variant_runs"]:
+        mix.append(("GET /variants", 3, "admin", lambda r, w: ("GET", "/variants", {
+            "run_id": r.sample(p["variant_runs"], min(3, len(p["variant_runs"]))),
+            "region": f"chr1:{r.randint(1, 5_000_000)}-{r.randint(5_000_001, 10_000_000)}", "limit": 500}, None)))
+    return mix
+
+async def _replay(client, mix, tokens, seconds: float, users: int, think_ms: float, seed: int, viewer_share: float):
+    names = [m[0] for m in mix]
+    weights = [m[1] for m in mix]
+    by_name = {m[0]: m for m in mix}
+    lat: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    statuses: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    deadline = time.perf_counter() + seconds
+
+    async def vu(i: int):
+        rnd = random.Random(seed * 1000 + i)
+        while time.perf_counter() < deadline:
+            name = rnd.choices(names, weights)[0]
+            _, _, who, build = by_name[name]
+            if who == "any":
+                who = "viewer" if rnd.random() < viewer_share else "admin"
+            method, url, params, body = build(rnd, who)
+            t0 = time.perf_counter()
+            try:
+                res = await client.request(method, url, params=params, json=body,
+                                           headers={"Authorization": f"Bearer {tokens[who]}"})
+                code = res.status_code
+            except Exception:
+                code = 0
+            lat[name].append((time.perf_counter() - t0) * 1000)
+            statuses[name][code] += 1
+            if code == 0 or code >= 400:
+                errors[name] += 1
+            if think_ms:
+                await asyncio.sleep(rnd.expovariate(1 / think_ms) / 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(vu(i) for i in range(users)))
+    return lat, errors, statuses, time.perf_counter() - t0
+
+def summarize(lat, errors, statuses, wall: float) -> dict:
+    endpoints = {}
+    for name, xs in sorted(lat.items()):
+        xs = sorted(xs)
+        endpoints[name] = {"n": len(xs), "errors": errors.get(name, 0),
+                           "p50": round(_pct(xs, 50), 2), "p95": round(_pct(xs, 95), 2),
+                           "p99": round(_pct(xs, 99), 2), "max": round(xs[-1], 2),
+                           "mean": round(sum(xs) / len(xs), 2),
+                           "statuses": {str(k): v for k, v in sorted(statuses[name].items())}}
+    every = sorted(x for xs in lat.values() for x in xs)
+    overall = {"n": len(every), "errors": sum(errors.values()), "rps": round(len(every) / wall, 1),
+               "p50": round(_pct(every, 50), 2), "p95": round(_pct(every, 95), 2), "p99": round(_pct(every, 99), 2)}
+    return {"endpoints": endpoints, "overall": overall}
+
+def compare(result: dict, baseline: dict | None, slo_ms: float, tolerance: float, max_error_rate: float) -> list[str]:
+    problems = []
+    base = (baseline or {}).get("endpoints", {})
+    for name, cur in result["endpoints"].items():
+        if cur["p95"] > slo_ms:
+            problems.append(f"{name}: p95 {cur['p95']:.0f} ms > SLO {slo_ms:.0f} ms")
+        if cur["n"] and cur["errors"] / cur["n"] > max_error_rate:
+            problems.append(f"{name}: {cur['errors']}/{cur['n']} errors, statuses {cur['statuses']}")
+        b = base.get(name)
+        if b and cur["p95"] > b["p95"] * (1 + tolerance) and cur["p95"] - b["p95"] > NOISE_FLOOR_MS:
+            problems.append(f"{name}: p95 {cur['p95']:.1f} ms vs baseline {b['p95']:.1f} ms (+{(cur['p95'] / b['p95'] - 1) * 100:.0f}%)")
+    return problems
+
+def _print(result: dict, baseline: dict | None):
+    base = (baseline or {}).get("endpoints", {})
+    print(f"{'endpoint':<34}{'n':>7}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'Δp95':>8}")
+    for name, e in result["endpoints"].items():
+        b = base.get(name)
+        delta = f"{(e['p95'] / b['p95'] - 1) * 100:+.0f}%" if b and b["p95"] else ""
+        print(f"{name:<34}{e['n']:>7}{e['errors']:>5}{e['p50']:>9.1f}{e['p95']:>9.1f}{e['p99']:>9.1f}{e['max']:>9.1f}{delta:>8}")
+    o = result["overall"]
+    print(f"{'overall':<34}{o['n']:>7}{o['errors']:>5}{o['p50']:>9.1f}{o['p95']:>9.1f}{o['p99']:>9.1f}   {o['rps']} req/s")
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=os.environ.get("DATABASE_URL"), help="URL засеянной БД (по умолчанию DATABASE_URL)")
+    ap.add_argument("--base-url", help="прогон по стенду вместо in-process приложения")
+    ap.add_argument("--seed-scale", help="засеять пустую БД этим масштабом (ci/release) перед прогоном")
+    ap.add_argument("--duration", type=float, default=30, help="сек замера")
+    ap.add_argument("--warmup", type=float, default=5, help="сек прогрева (не учитываются)")
+    ap.add_argument("--users", type=int, default=32, help="виртуальных пользователей (одновременных запросов)")
+    ap.add_argument("--think-ms", type=float, default=0, help="средняя пауза между запросами пользователя")
+    ap.add_argument("--viewer-share", type=float, default=0.7, help="доля запросов от участника проектов (Viewer)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--slo-ms", type=float, default=SLO_P95_MS)
+    ap.add_argument("--baseline", help="JSON предыдущего прогона для сравнения")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост p95 относительно базовой линии")
+    ap.add_argument("--max-error-rate", type=float, default=0.01)
+    ap.add_argument("--out", help="записать результат в JSON")
+    ap.add_argument("--save-baseline", help="записать результат как базовую линию")
+    args = ap.parse_args()
+
+    if args.db:
+        os.environ["DATABASE_URL"] = args.db
+    moto = None
+    if not args.base_url:
+        # in-process: локальный S3 (moto) и временный каталог varstore — до импорта app.*
+        from moto.server import ThreadedMotoServer
+        port = _free_port()
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)   # журнал запросов moto-сервера
+        moto = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+        moto.start()
+        os.environ["S3_ENDPOINT"] = f"http://127.0.0.1:{port}"
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        os.environ.setdefault("VARSTORE_DIR", tempfile.mkdtemp(prefix="bench-varstore-"))
+        os.environ["REF_VALIDATE_ON_WRITE"] = "0"
+
+    import httpx
+    from sqlalchemy import inspect, select
+    from app.db import engine
+    from app.auth import mk_token
+    from app.models import Project, Role
+    from bench import seed as seeder
+
+    try:
+        empty = not inspect(engine).has_table("projects")
+        if not empty:
+            with engine.connect() as c:
+                empty = c.execute(select(Project.id).limit(1)).first() is None
+        if empty:
+            if not args.seed_scale:
+                raise SystemExit("БД пуста: python -m bench.seed --scale ci (или --seed-scale ci)")
+            print(f"seeding scale={args.seed_scale}")
+            seeder.seed_db(engine, seeder.SCALES[args.seed_scale], args.seed)
+        if moto:
+            print("seeding local S3")
+            seeder.seed_s3(engine, seed=args.seed)
+
+        pools = _load_pools(engine)
+        tokens = {"admin": mk_token(pools["admin_id"], Role.Admin.value),
+                  "viewer": mk_token(pools["viewer_id"], Role.Viewer.value)}
+        counter = iter(range(10**12))
+        mix = _mix(pools, counter)
+
+        async def go():
+            if args.base_url:
+                transport, base = None, args.base_url.rstrip("/")
+            else:
+                from main import app
+                transport, base = httpx.ASGITransport(app=app), "http://bench"
+            limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+            async with httpx.AsyncClient(transport=transport, base_url=base, timeout=60, limits=limits) as client:
+                if args.warmup:
+                    await _replay(client, mix, tokens, args.warmup, args.users, args.think_ms, args.seed + 1, args.viewer_share)
+                return await _replay(client, mix, tokens, args.duration, args.users, args.think_ms, args.seed, args.viewer_share)
+
+        result = summarize(*asyncio.run(go()))
+    finally:
+        if moto:
+            moto.stop()
+
+    result["meta"] = {
+        "mode": "remote" if args.base_url else "in-process", "db": engine.url.get_backend_name(),
+        "rows": pools["rows"], "users": args.users, "duration": args.duration, "think_ms": args.think_ms,
+        "git": _git_rev(), "python": platform.python_version(), "cpus": os.cpu_count(), "host": platform.node(),
+    }
+    baseline = json.load(open(args.baseline)) if args.baseline else None
+    _print(result, baseline)
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, "w") as fh:
+            json.dump(result, fh, indent=2, sort_keys=True)
+    problems = compare(result, baseline, args.slo_ms, args.tolerance, args.max_error_rate)
+    for p in problems:
+        print("FAIL", p)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,55 @@
+import logging, os
+
 from fastapi import FastAPI, Depends
-from app.auth import router as auth_router, ensure_admin, require_role
+from fastapi.middleware.gzip import GZipMiddleware
+from app.auth import router as auth_router, require_role
 from app.models import Role
 from app.projects import router as projects_router
 from app.audit import router as audit_router
 from app.datasets import router as datasets_router
-from app.s3client import ensure_bucket
+from app.s3client import stats as s3_stats
 from app.samples import router as samples_router
 from app.references import router as references_router
 from app.workflows import router as workflows_router
+from app.jobs import router as jobs_router
+from app.variants import router as variants_router
+from app.reports import router as reports_router
+from app.artifacts import router as artifacts_router
+from app.cohorts import router as cohorts_router
+from app.scheduler import router as queue_router
+from app.metering import router as usage_router
+from app.fleet import router as fleet_router
+from app.metrics import router as metrics_router, MetricsMiddleware
+from app.profiler import router as profiles_router, ProfilerMiddleware
+from app.startup import router as startup_router, lifespan
+from app.db import pool_stats
+from app.responses import FastJSONResponse, GZIP_MIN_BYTES, GZIP_LEVEL
 
 
+# логи приложения (app.*) — в stderr рядом с логами uvicorn
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
-app = FastAPI(title="GenomeAI API")
+app = FastAPI(title="GenomeAI API", default_response_class=FastJSONResponse, lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_LEVEL)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
 from app.runs import router as runs_router
 
-@app.on_event("startup")
-def _init():
-    ensure_admin()
-    ensure_bucket()
-
 @app.get("/healthz")
 def healthz():
     return {"status":"ok"}
 
+# /livez, /readyz — пробы оркестратора (app.startup)
+app.include_router(startup_router)
+
+@app.get("/admin/db/pool", dependencies=[Depends(require_role(Role.Admin))])
+def db_pool():
+    return pool_stats()
+
+@app.get("/admin/storage/metrics", dependencies=[Depends(require_role(Role.Admin))])
+def storage_metrics():
+    return s3_stats.snapshot()
+
 # auth
 app.include_router(auth_router)
 # projects & audit
@@ -36,5 +63,20 @@ app.include_router(samples_router)
 app.include_router(references_router)
 #workflows
 app.include_router(workflows_router)
+# background jobs
+app.include_router(jobs_router)
 
 app.include_router(runs_router)
+app.include_router(variants_router)
+app.include_router(reports_router)
+app.include_router(artifacts_router)
+# когорты + fair-share очередь запусков
+app.include_router(cohorts_router)
+app.include_router(queue_router)
+# учёт потребления и квоты
+app.include_router(usage_router)
+# парк раннеров: аренда заданий (RUNNER_DISPATCH=queue)
+app.include_router(fleet_router)
+# prometheus + профилировщик запросов
+app.include_router(metrics_router)
+app.include_router(profiles_router)
@@ -0,0 +1,69 @@
+import os, sys, pathlib, tempfile
+import pytest
+
+# тесты гоняем на sqlite (sync: pysqlite, async: aiosqlite) — до импорта app.db
+_TMP = tempfile.mkdtemp(prefix="genomeai-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_TMP}/test.db")
+# S3 — moto in-process (фикстура s3); фоновые проверки референсов на запись не запускаем
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["S3_ENDPOINT"] = ""
+os.environ["REF_VALIDATE_ON_WRITE"] = "0"
+os.environ.setdefault("REF_SEQ_DIR", f"{_TMP}/refseq")
+os.environ.setdefault("VARSTORE_DIR", f"{_TMP}/varstore")
+os.environ.setdefault("PROFILE_DIR", f"{_TMP}/profiles")
+os.environ["SCHED_ENABLED"] = "0"   # очередь тикается вручную (scheduler.tick)
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "shared"))   # s3core (в образе — рядом с main.py)
+
+from fastapi.testclient import TestClient  # noqa: E402
+from main import app  # type: ignore  # noqa: E402
+from app.db import Base, engine, SessionLocal  # noqa: E402
+from app.models import User, Role  # noqa: E402
+from app.auth import mk_token  # noqa: E402
+import s3core  # noqa: E402
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    Base.metadata.create_all(bind=engine)
+    yield
+
+@pytest.fixture()
+def s3():
+    from moto import mock_aws
+    with mock_aws():
+        s3core.reset()
+        yield s3core.client()
+        s3core.reset()
+
+@pytest.fixture()
+def db():
+    s = SessionLocal()
+    try:
+        yield s
+    finally:
+        s.close()
+
+def _user(role: Role) -> dict:
+    db = SessionLocal()
+    try:
+        name = f"test-{role.value.lower()}"
+        u = db.query(User).filter(User.username == name).first()
+        if not u:
+            u = User(username=name, password_hash="!", role=role)
+            db.add(u); db.commit()
+        return {"Authorization": f"Bearer {mk_token(u.id, role.value)}"}
+    finally:
+        db.close()
+
+@pytest.fixture()
+def client():
+    return TestClient(app)
+
+@pytest.fixture()
+def admin_headers():
+    return _user(Role.Admin)
+
+@pytest.fixture()
+def viewer_headers():
+    return _user(Role.Viewer)
@@ -0,0 +1,65 @@
+from app import artifacts
+from app.models import Project, Run, RunStatus, Workflow, ReferenceSet, GenomeBuild
+
+BAM = bytes(range(256)) * 4096   # 1 МБ
+
+def _run(db, s3):
+    s3.create_bucket(Bucket="runs")
+    keys = ["run_a/logs/trace.txt", "run_a/logs/report.html", "run_a/results/S1.bam"] + \
+           [f"run_a/results/vcf/S{i:02d}.vcf.gz" for i in range(5)]
+    for k in keys:
+        s3.put_object(Bucket="runs", Key=k, Body=BAM if k.endswith(".bam") else b"x" * 10)
+    s3.put_object(Bucket="runs", Key="run_ab/other.txt", Body=b"no")   # соседний запуск
+    p = Project(name="artifacts")
+    wf = Workflow(name="nf-core/sarek", version="3.5.1", lock={})
+    ref = ReferenceSet(name="hg38", genome_build=GenomeBuild.GRCh38, is_complete=1, components=[])
+    db.add_all([p, wf, ref]); db.commit()
+    r = Run(project_id=p.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[], params={},
+            status=RunStatus.Succeeded, runner_job_id="run_a", artifacts=["s3://runs/run_a/logs/trace.txt"])
+    db.add(r); db.commit()
+    return r
+
+def test_run_prefix():
+    # корень — <runner_job_id>/, даже если в artifacts перечислены только логи
+    assert artifacts.run_prefix("r1") == ("runs", "r1/")
+    assert artifacts.run_prefix(None) is None
+
+def test_list_artifacts_paginated(s3, db, client, admin_headers, viewer_headers):
+    r = _run(db, s3)
+    top = client.get(f"/runs/{r.id}/artifacts", headers=admin_headers).json()
+    assert top["prefix"] == "s3://runs/run_a/" and top["dirs"] == ["logs/", "results/"] and top["items"] == []
+
+    seen, cursor = [], None
+    while True:
+        q = f"/runs/{r.id}/artifacts?path=results/&recursive=true&limit=2" + (f"&cursor={cursor}" if cursor else "")
+        page = client.get(q, headers=admin_headers).json()
+        assert len(page["items"]) <= 2
+        seen += [i["path"] for i in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == ["results/S1.bam"] + [f"results/vcf/S{i:02d}.vcf.gz" for i in range(5)]
+    item = client.get(f"/runs/{r.id}/artifacts?path=results/", headers=admin_headers).json()["items"][0]
+    assert item["size"] == len(BAM) and "Signature=" in item["url"] and "run_ab" not in item["uri"]
+    assert client.get(f"/runs/{r.id}/artifacts", headers=viewer_headers).status_code == 403
+
+def test_download_ranges(s3, db, client, admin_headers):
+    r = _run(db, s3)
+    url = f"/runs/{r.id}/artifacts/results/S1.bam"
+    full = client.get(url, headers=admin_headers)
+    assert full.status_code == 200 and full.content == BAM
+    assert full.headers["accept-ranges"] == "bytes" and full.headers["content-encoding"] == "identity"   # мимо gzip
+
+    part = client.get(url, headers={**admin_headers, "Range": "bytes=1000-1999"})
+    assert part.status_code == 206 and part.content == BAM[1000:2000]
+    assert part.headers["content-range"] == f"bytes 1000-1999/{len(BAM)}"
+    tail = client.get(url, headers={**admin_headers, "Range": "bytes=-100"})
+    assert tail.status_code == 206 and tail.content == BAM[-100:]
+    # If-Range с чужим ETag — объект «изменился», отдаётся целиком
+    stale = client.get(url, headers={**admin_headers, "Range": "bytes=0-9", "If-Range": '"deadbeef"'})
+    assert stale.status_code == 200 and len(stale.content) == len(BAM)
+    assert client.get(url, headers={**admin_headers, "Range": f"bytes={len(BAM) + 10}-"}).status_code == 416
+
+    head = client.head(url, headers=admin_headers)
+    assert head.status_code == 200 and head.headers["content-length"] == str(len(BAM))
+    assert client.get(f"/runs/{r.id}/artifacts/results/missing.bam", headers=admin_headers).status_code == 404
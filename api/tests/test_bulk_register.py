@@ -0,0 +1,44 @@
+import time
+
+from app import jobs
+from app.models import Dataset, Project, Sample
+
+def _wait(job_id):
+    for _ in range(200):
+        if jobs.get(job_id).finished_at:
+            return jobs.get(job_id)
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+def test_bulk_register_prefix_skips_existing_and_autopairs(s3, db, client, admin_headers):
+    s3.create_bucket(Bucket="seq")
+    for i in range(6):
+        for rd in (1, 2):
+            s3.put_object(Bucket="seq", Key=f"fc1/S{i}_R{rd}_001.fastq.gz", Body=b"@r\nACGT\n+\nIIII\n")
+    s3.put_object(Bucket="seq", Key="fc1/SampleSheet.csv", Body=b"x")
+    s3.put_object(Bucket="seq", Key="fc1/", Body=b"")          # «папка»
+    s3.put_object(Bucket="seq", Key="fc10/S9_R1.fastq.gz", Body=b"x")   # соседний префикс — мимо
+    p = Project(name="bulk")
+    db.add(p); db.commit()
+    db.add(Dataset(project_id=p.id, uri="s3://seq/fc1/S0_R1_001.fastq.gz", type="FASTQ_GZ")); db.commit()
+
+    body = {"project_id": p.id, "prefix": "s3://seq/fc1/", "autopair": True}
+    res = client.post("/datasets/register/bulk", headers=admin_headers, json=body)
+    assert res.status_code == 202
+    job = _wait(res.json()["job_id"])
+    assert job.status == "Succeeded", job.error
+    out = job.result
+    assert out["listed"] == 13 and out["registered"] == 12 and out["skipped_existing"] == 1
+    assert out["by_type"] == {"FASTQ.GZ": 11, "OTHER": 1}
+    assert out["autopair"]["created"] == 6
+
+    ds = db.query(Dataset).filter(Dataset.project_id == p.id, Dataset.uri == "s3://seq/fc1/S1_R2_001.fastq.gz").one()
+    assert ds.size_bytes == 15 and len(ds.md5) == 32   # из листинга (ETag), без HEAD
+    assert db.query(Sample).filter(Sample.project_id == p.id).count() == 6
+
+    # повторный прогон ничего не добавляет; фильтр типов; префикс без s3:// — 422
+    again = _wait(client.post("/datasets/register/bulk", headers=admin_headers,
+                              json={**body, "types": ["FASTQ.GZ"]}).json()["job_id"]).result
+    assert again["registered"] == 0 and again["listed"] == 12
+    assert client.post("/datasets/register/bulk", headers=admin_headers,
+                       json={**body, "prefix": "seq/fc1"}).status_code == 422
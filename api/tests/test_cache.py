@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from starlette.datastructures import MultiDict
+
+from app.cache import ResponseCache, _LocalBackend, etag_matches
+
+LOCK = {"containers": [{"name": "bwa", "image": "bwa:1"}]}
+
+def test_etag_matching():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"x", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+def test_conditional_get_and_invalidation(client, admin_headers):
+    r1 = client.get("/workflows", headers=admin_headers)
+    etag = r1.headers["etag"]
+
+    r2 = client.get("/workflows", headers={**admin_headers, "If-None-Match": etag})
+    assert r2.status_code == 304 and r2.headers["etag"] == etag
+
+    client.post("/workflows/import", headers=admin_headers,
+                json={"name": "wf-cache", "version": "1", "lockfile_json": LOCK})
+    r3 = client.get("/workflows", headers={**admin_headers, "If-None-Match": etag})
+    assert r3.status_code == 200 and r3.headers["etag"] != etag
+    assert any(w["name"] == "wf-cache" for w in r3.json())
+
+def test_reference_detail_invalidated_on_update(client, admin_headers):
+    comps = [{"role": "FASTA", "uri": "s3://r/g.fa"}]
+    rid = client.post("/references", headers=admin_headers,
+                      json={"name": "ref-cache", "genome_build": "GRCh38", "components": comps}).json()["id"]
+    etag = client.get(f"/references/{rid}", headers=admin_headers).headers["etag"]
+    client.patch(f"/references/{rid}", headers=admin_headers, json={"name": "ref-cache-2"})
+    r = client.get(f"/references/{rid}", headers={**admin_headers, "If-None-Match": etag})
+    assert r.status_code == 200 and r.json()["name"] == "ref-cache-2"
+    assert client.get("/references/missing", headers=admin_headers).status_code == 404
+
+def test_invalidation_during_build_skips_store():
+    cache = ResponseCache(_LocalBackend())
+    req = SimpleNamespace(url=SimpleNamespace(path="/workflows"), query_params=MultiDict(), headers={})
+    calls = []
+
+    async def build():
+        calls.append(1)
+        if len(calls) == 1:
+            cache.invalidate("workflows")   # импорт workflow завершился, пока собирался ответ
+        return {"n": len(calls)}
+
+    first = asyncio.run(cache.respond(req, "workflows", build))
+    second = asyncio.run(cache.respond(req, "workflows", build))
+    assert first.body == b'{"n":1}' and second.body == b'{"n":2}'   # устаревшее тело не закэшировано
+    assert asyncio.run(cache.respond(req, "workflows", build)).body == b'{"n":2}'
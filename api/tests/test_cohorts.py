@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+from app import runs, scheduler as sched
+from app.models import (Project, Run, RunStatus, RunnerJob, RunnerJobStatus, Workflow, ReferenceSet, GenomeBuild,
+                        Dataset, DatasetType, Sample)
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+def _q(project, n, user="u", at=NOW):
+    return [(f"{project}-{user}-{i:03d}", project, user, at + timedelta(seconds=i)) for i in range(n)]
+
+def test_plan_interleaves_projects():
+    # A поставил 300 запусков раньше B — B всё равно не ждёт, пока A закончит
+    queued = _q("A", 300) + _q("B", 5, at=NOW + timedelta(minutes=1))
+    order = sched.plan(queued, [], [], {}, slots=4, now=NOW, est=600)
+    assert len(order) == 305
+    b_pos = [i for i, (_, p, _) in enumerate(order) if p == "B"]
+    assert max(b_pos) < 12
+    assert order[0][2] == NOW and order[4][2] == NOW + timedelta(seconds=600)
+
+def test_plan_weights_and_recent_usage():
+    queued = _q("A", 60) + _q("B", 60)
+    order = sched.plan(queued, [], [], {"A": 3.0}, slots=2, now=NOW, est=600)
+    first = [p for _, p, _ in order[:40]]
+    assert first.count("A") == 30 and first.count("B") == 10
+    # B недавно нажёг 10 часов — A идёт первым, пока не догонит
+    finished = [("B", "u", NOW - timedelta(hours=11), NOW - timedelta(hours=1))]
+    order = sched.plan(queued, [], finished, {}, slots=2, now=NOW, est=600)
+    assert [p for _, p, _ in order[:10]] == ["A"] * 10
+
+def test_plan_fair_between_users():
+    queued = _q("A", 20, user="alice") + _q("A", 2, user="bob", at=NOW + timedelta(minutes=5))
+    order = sched.plan(queued, [], [], {}, slots=1, now=NOW, est=60)
+    owner = {q[0]: q[2] for q in queued}
+    users = [owner[run_id] for run_id, _, _ in order]
+    assert users[:4].count("bob") == 2
+
+def _project(db, name, n):
+    p = Project(name=name)
+    wf = Workflow(name="nf-core/sarek", version="3.5.1", lock={})
+    ref = ReferenceSet(name="hg38", genome_build=GenomeBuild.GRCh38, is_complete=1, components=[])
+    db.add_all([p, wf, ref]); db.commit()
+    ds = [Dataset(project_id=p.id, uri=f"s3://datasets/{name}/S{i:02d}_R{r}.fq.gz", type=DatasetType.FASTQ_GZ)
+          for i in range(n) for r in (1, 2)]
+    db.add_all(ds); db.commit()
+    samples = [Sample(project_id=p.id, name=f"S{i:02d}", r1_dataset_id=ds[2 * i].id, r2_dataset_id=ds[2 * i + 1].id)
+               for i in range(n)]
+    db.add_all(samples); db.commit()
+    return p, wf, ref, samples
+
+def test_cohort_queue_and_tick(db, client, admin_headers, viewer_headers, monkeypatch):
+    big, wf, ref, _ = _project(db, "cohort-big", 12)
+    small, _, _, small_samples = _project(db, "cohort-small", 2)
+
+    res = client.post("/cohorts", headers=admin_headers, json={
+        "project_id": big.id, "workflow_id": wf.id, "reference_set_id": ref.id, "samples_per_run": 2})
+    assert res.status_code == 201, res.text
+    out = res.json()
+    assert out["queued"] == 6 and out["reused"] == 0 and len(out["run_ids"]) == 6
+    res = client.post("/cohorts", headers=admin_headers, json={
+        "project_id": small.id, "workflow_id": wf.id, "reference_set_id": ref.id,
+        "sample_ids": [s.id for s in small_samples]})
+    assert res.status_code == 201 and res.json()["queued"] == 2
+    cohort = client.get(f"/cohorts/{res.json()['id']}", headers=admin_headers).json()
+    assert cohort["status_counts"]["Queued"] == 2 and len(cohort["runs"]) == 2
+
+    q = client.get("/queue", headers=admin_headers).json()
+    mine = [i for i in q["items"] if i["project_id"] in (big.id, small.id)]
+    assert len(mine) == 8
+    # малый проект не стоит за всеми шестью запусками большого
+    small_pos = sorted(i["position"] for i in mine if i["project_id"] == small.id)
+    big_pos = sorted(i["position"] for i in mine if i["project_id"] == big.id)
+    assert small_pos[-1] < big_pos[-1]
+    assert all(i["estimated_wait_s"] >= 0 for i in mine)
+
+    # чужие проекты не видны
+    assert client.get(f"/queue?project_id={big.id}", headers=viewer_headers).status_code == 403
+
+    started = []
+    monkeypatch.setattr(runs, "execute_queued", started.append)
+    monkeypatch.setattr(sched.scheduler, "_pool", _Inline())
+    busy = db.query(Run).filter(Run.status == RunStatus.Running).count()
+    monkeypatch.setattr(sched, "SCHED_SLOTS", busy + 3)
+    ids = sched.scheduler.tick()
+    assert len(ids) == 3 and started == ids
+    db.expire_all()
+    assert {r.status for r in db.query(Run).filter(Run.id.in_(ids))} == {RunStatus.Running}
+    assert sched.scheduler.tick() == []   # слоты заняты
+
+def test_slots_held_while_alive_not_by_wall_clock(db):
+    p, wf, ref, samples = _project(db, "liveness", 1)
+    now = datetime.utcnow()
+    long_ago = now - timedelta(hours=10)   # sarek на большой когорте идёт часами
+    mk = lambda **kw: Run(project_id=p.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[samples[0].id],
+                          status=RunStatus.Running, started_at=long_ago, **kw)
+    fleet_run, http_alive, http_dead = mk(), mk(heartbeat_at=now), mk(heartbeat_at=long_ago)
+    db.add_all([fleet_run, http_alive, http_dead]); db.commit()
+    db.add(RunnerJob(run_id=fleet_run.id, kind="nfcore_dna_seq", payload={}, status=RunnerJobStatus.Leased))
+    db.commit()
+
+    sched.reap(db, now)
+    running = {r.id for r in db.query(Run).filter(Run.status == RunStatus.Running)}
+    assert {fleet_run.id, http_alive.id} <= running   # слот держат, хоть и идут дольше любого таймаута
+    db.expire_all()
+    assert db.get(Run, http_dead.id).status == RunStatus.Failed   # процесс API умер — слот освобождён
+
+class _Inline:
+    def submit(self, fn, *args):
+        fn(*args)
+
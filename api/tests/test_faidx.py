@@ -0,0 +1,85 @@
+import hashlib, struct, time, zlib
+
+import pytest
+
+from app import faidx
+
+SEQ = {"chr1": "ACGTacgtNN" * 13, "chr2": "GATTACA" * 9, "chrM": "C"}
+
+def _fasta(width: int = 60, eol: str = "\n") -> bytes:
+    out = ""
+    for name, seq in SEQ.items():
+        out += f">{name} some description{eol}"
+        out += "".join(seq[i:i + width] + eol for i in range(0, len(seq), width))
+    return out.encode()
+
+def _expected_fai(data: bytes, width: int = 60, eol: int = 1) -> list[tuple]:
+    rows = []
+    for name, seq in SEQ.items():
+        offset = data.index(f">{name} ".encode())
+        offset = data.index(b"\n", offset) + 1
+        lb = min(width, len(seq))
+        rows.append((name, len(seq), offset, lb, lb + eol, hashlib.md5(seq.upper().encode()).hexdigest()))
+    return rows
+
+def _bgzf(data: bytes, block: int = 37) -> bytes:
+    def member(payload: bytes) -> bytes:
+        c = zlib.compressobj(6, zlib.DEFLATED, -15)
+        cdata = c.compress(payload) + c.flush()
+        header = b"\x1f\x8b\x08\x04\0\0\0\0\0\xff" + struct.pack("<H", 6) + b"BC" + struct.pack("<HH", 2, len(cdata) + 25)
+        return header + cdata + struct.pack("<II", zlib.crc32(payload), len(payload))
+    return b"".join(member(data[i:i + block]) for i in range(0, len(data), block)) + member(b"")
+
+def _chunks(data: bytes, n: int):
+    return (data[i:i + n] for i in range(0, len(data), n))
+
+def _rows(contigs):
+    return [(c["name"], c["length"], c["offset"], c["linebases"], c["linewidth"], c["md5"]) for c in contigs]
+
+@pytest.mark.parametrize("chunk", [1, 7, 64, 1 << 20])
+@pytest.mark.parametrize("eol", ["\n", "\r\n"])
+def test_index_matches_layout_at_any_chunking(chunk, eol):
+    data = _fasta(width=16, eol=eol)
+    contigs, gzi = faidx.build_index(_chunks(data, chunk))
+    assert gzi is None
+    assert _rows(contigs) == _expected_fai(data, width=16, eol=len(eol))
+
+def test_bgzip_fasta_uses_uncompressed_offsets_and_builds_gzi():
+    data = _fasta(width=16)
+    contigs, gzi = faidx.build_index(_chunks(_bgzf(data), 50), compressed=True)
+    assert _rows(contigs) == _expected_fai(data, width=16)
+    (n,) = struct.unpack("<Q", gzi[:8])
+    assert n >= len(data) // 37 and len(gzi) == 8 + 16 * n
+
+def test_rejects_irregular_lines_and_plain_gzip():
+    with pytest.raises(faidx.FaidxError, match="line length"):
+        faidx.build_index([b">a\nACGT\nAC\nACGT\n"])
+    with pytest.raises(faidx.FaidxError, match="BGZF"):
+        faidx.build_index([zlib.compress(b">a\nACGT\n", wbits=31)], compressed=True)
+
+def test_index_endpoint_registers_components(s3, client, admin_headers):
+    data = _fasta()
+    s3.create_bucket(Bucket="references")
+    s3.put_object(Bucket="references", Key="new/genome.fa", Body=data)
+    comps = [{"role": "FASTA", "uri": "s3://references/new/genome.fa"},
+             {"role": "BWA_INDEX", "uri": "s3://references/new/bwa/genome.fa"}]
+    rid = client.post("/references", headers=admin_headers,
+                      json={"name": "ref-idx", "genome_build": "GRCh38", "components": comps}).json()["id"]
+
+    job_id = client.post(f"/references/{rid}/index", headers=admin_headers).json()["job_id"]
+    for _ in range(100):
+        job = client.get(f"/jobs/{job_id}", headers=admin_headers).json()
+        if job["status"] in ("Succeeded", "Failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "Succeeded", job
+
+    ref = client.get(f"/references/{rid}", headers=admin_headers).json()
+    assert ref["is_complete"]
+    by_role = {c["role"]: c["uri"] for c in ref["components"]}
+    assert by_role["FAI"] == "s3://references/new/genome.fa.fai"
+    assert by_role["DICT"] == "s3://references/new/genome.dict"
+    fai = s3.get_object(Bucket="references", Key="new/genome.fa.fai")["Body"].read().decode()
+    assert fai.splitlines()[1].split("\t")[:3] == ["chr2", "63", str(data.index(b"GATTACA"))]
+    dct = s3.get_object(Bucket="references", Key="new/genome.dict")["Body"].read().decode()
+    assert f"M5:{hashlib.md5(SEQ['chrM'].encode()).hexdigest()}" in dct
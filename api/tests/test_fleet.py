@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+from app import fleet, runs, scheduler as sched
+from app.models import (Project, Run, RunStatus, RunnerJob, RunnerJobStatus, RunnerNode, Workflow, ReferenceSet,
+                        GenomeBuild, Dataset, DatasetType, Sample)
+
+TOKEN = {"X-Runner-Token": "fleet-secret"}
+
+class _Inline:
+    def submit(self, fn, *args):
+        fn(*args)
+
+def _queued_runs(db, client, admin_headers, n, monkeypatch, dispatch=True):
+    p = Project(name="fleet")
+    wf = Workflow(name="nf-core/dna-seq", version="3.5.1", lock={})
+    ref = ReferenceSet(name="hg38", genome_build=GenomeBuild.GRCh38, is_complete=1, components=[])
+    db.add_all([p, wf, ref]); db.commit()
+    r1 = Dataset(project_id=p.id, uri="s3://datasets/f_R1.fq.gz", type=DatasetType.FASTQ_GZ)
+    r2 = Dataset(project_id=p.id, uri="s3://datasets/f_R2.fq.gz", type=DatasetType.FASTQ_GZ)
+    db.add_all([r1, r2]); db.commit()
+    s = Sample(project_id=p.id, name="F1", r1_dataset_id=r1.id, r2_dataset_id=r2.id)
+    db.add(s); db.commit()
+    out = []
+    for i in range(n):
+        res = client.post("/runs", headers=admin_headers, json={
+            "project_id": p.id, "workflow_id": wf.id, "reference_set_id": ref.id, "sample_ids": [s.id],
+            "params": {"i": i}, "reuse": False, "compute_overrides": {"cpus": 8}})
+        assert res.status_code == 201, res.text
+        out.append(res.json())
+    assert all(r["status"] == "Queued" for r in out)   # POST не ждёт раннер: выдаёт только scheduler
+    ids = {r["id"] for r in out}
+    # запуски других тестов в эту выдачу не попадают
+    db.query(Run).filter(Run.status == RunStatus.Queued, Run.id.notin_(ids)).update(
+        {Run.status: RunStatus.Failed}, synchronize_session=False)
+    db.commit()
+    monkeypatch.setattr(sched.scheduler, "_pool", _Inline())
+    monkeypatch.setattr(sched, "SCHED_SLOTS", 10 ** 6)
+    if dispatch:
+        fleet.heartbeat(db, "pool", [], 10 ** 6, None)   # режим парка: слоты — capacity живых раннеров
+        assert set(sched.scheduler.tick()) == ids
+    return out
+
+def test_jobs_leased_heartbeated_and_requeued(s3, db, client, admin_headers, monkeypatch):
+    monkeypatch.setattr(runs, "RUNNER_DISPATCH", "queue")
+    monkeypatch.setattr(fleet, "FLEET_TOKEN", "fleet-secret")
+    created = _queued_runs(db, client, admin_headers, 3, monkeypatch)
+    ids = {r["id"] for r in created}
+
+    assert client.post("/fleet/claim", json={"runner_id": "a", "capacity": 1}).status_code == 401
+    a = client.post("/fleet/claim", headers=TOKEN, json={"runner_id": "a", "capacity": 2}).json()["jobs"]
+    b = client.post("/fleet/claim", headers=TOKEN, json={"runner_id": "b", "capacity": 5}).json()["jobs"]
+    mine = [j for j in a + b if j["run_id"] in ids]
+    assert len(mine) == 3 and len({j["id"] for j in mine}) == 3   # одно задание — одному раннеру
+    assert all(j["kind"] == "nfcore_dna_seq" and j["payload"]["samples"] for j in mine)
+    assert all(j["payload"]["compute_profile"] == "local-docker" and j["payload"]["compute_overrides"] == {"cpus": 8}
+               for j in mine)
+
+    # a жив — аренда продлевается; b «умер»: аренда истекла → задание снова в очереди
+    hb = client.post("/fleet/heartbeat", headers=TOKEN,
+                     json={"runner_id": "a", "capacity": 2, "running": [j["id"] for j in a] + ["ghost"]}).json()
+    assert hb["lost"] == ["ghost"]
+    dead = [j["id"] for j in b if j["run_id"] in ids]
+    db.query(RunnerJob).filter(RunnerJob.id.in_(dead)).update(
+        {RunnerJob.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False)
+    db.commit()
+    c = client.post("/fleet/claim", headers=TOKEN, json={"runner_id": "c", "capacity": 5}).json()["jobs"]
+    retaken = [j for j in c if j["id"] in dead]
+    assert retaken and all(j["attempt"] == 2 for j in retaken)
+
+    # результат «мёртвого» b отклоняется, результат c применяется к запуску
+    job = retaken[0]
+    result = {"run_id": "run_x", "status": "Succeeded", "artifacts": ["s3://runs/run_x/logs/trace.txt"],
+              "compute": {"profile": "local-docker", "cpus": 8}, "nextflow_config": "executor {\n    cpus = 8\n}\n"}
+    assert client.post(f"/fleet/jobs/{job['id']}/complete", headers=TOKEN,
+                       json={"runner_id": "b", "result": result}).status_code == 409
+    res = client.post(f"/fleet/jobs/{job['id']}/complete", headers=TOKEN, json={"runner_id": "c", "result": result})
+    assert res.status_code == 200 and res.json()["status"] == "Succeeded"
+    db.expire_all()
+    r = db.get(Run, job["run_id"])
+    assert r.status == RunStatus.Succeeded and r.runner_job_id == "run_x" and r.finished_at
+    conf = client.get(f"/runs/{r.id}/nextflow.config", headers=admin_headers)
+    assert conf.status_code == 200 and "cpus = 8" in conf.text
+    assert client.get(f"/runs/{r.id}", headers=admin_headers).json()["compute"]["cpus"] == 8
+
+    nodes = {n["id"]: n for n in client.get("/fleet/runners", headers=admin_headers).json()}
+    assert nodes["a"]["alive"] and nodes["a"]["running"] == 2   # "ghost" не удерживается — не считается
+
+def test_lease_expiry_fails_after_max_attempts(db, client, admin_headers, monkeypatch):
+    monkeypatch.setattr(runs, "RUNNER_DISPATCH", "queue")
+    monkeypatch.setattr(fleet, "FLEET_MAX_ATTEMPTS", 2)
+    run_id = _queued_runs(db, client, admin_headers, 1, monkeypatch)[0]["id"]
+    job = db.query(RunnerJob).filter(RunnerJob.run_id == run_id).one()
+    for attempt in (1, 2):
+        now = datetime.utcnow() + timedelta(seconds=fleet.FLEET_LEASE_S * attempt * 2)
+        leased = fleet.claim(db, "n", 100, now=now)
+        assert job.id in {j.id for j in leased}
+    fleet.claim(db, "n", 0, now=datetime.utcnow() + timedelta(seconds=fleet.FLEET_LEASE_S * 10))
+    db.expire_all()
+    assert db.get(RunnerJob, job.id).status == RunnerJobStatus.Failed
+    assert db.get(Run, run_id).status == RunStatus.Failed
+
+def test_queue_slots_follow_live_runners(db, client, admin_headers, monkeypatch):
+    monkeypatch.setattr(runs, "RUNNER_DISPATCH", "queue")
+    ids = {r["id"] for r in _queued_runs(db, client, admin_headers, 3, monkeypatch, dispatch=False)}
+    stale = datetime.utcnow() - timedelta(seconds=fleet.FLEET_LEASE_S + 1)
+    db.query(RunnerNode).update({RunnerNode.last_seen: stale}, synchronize_session=False)
+    db.query(Run).filter(Run.status == RunStatus.Running).update({Run.status: RunStatus.Failed}, synchronize_session=False)
+    db.commit()
+    assert sched.scheduler.tick() == []   # живых раннеров нет — SCHED_SLOTS в режиме парка не действует
+
+    fleet.heartbeat(db, "g", [], 2, None)
+    started = sched.scheduler.tick()
+    assert len(started) == 2 and set(started) <= ids
+    assert sched.scheduler.tick() == []   # capacity узла занята поставленными заданиями
+
+    later = datetime.utcnow() + timedelta(seconds=60)
+    leased = fleet.claim(db, "g", 2, now=later)
+    assert {j.run_id for j in leased} == set(started)
+    db.expire_all()
+    assert all(db.get(Run, i).started_at == later for i in started)   # старт — выдача, а не постановка
@@ -0,0 +1,74 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from app import jobs, metering
+from app.models import Project, Run, RunStatus, Workflow, ReferenceSet, GenomeBuild, UsageRollup
+
+TRACE = (
+    "task_id\thash\tname\tstatus\texit\trealtime\t%cpu\tpeak_rss\n"
+    "1\tab/000001\tBWA (S1)\tCOMPLETED\t0\t1h\t400.0%\t2 GB\n"
+    "2\tab/000002\tFASTQC (S1)\tCOMPLETED\t0\t30m\t100.0%\t512 MB\n"
+    "3\tab/000003\tMARKDUP (S1)\tCACHED\t0\t-\t-\t-\n"
+    "4\tab/000004\tHC (S1)\tFAILED\t1\t1m 30s\t50%\t1 GB\n"
+)
+
+def test_parse_trace_default_and_raw_formats():
+    u = metering.parse_trace(TRACE.splitlines(keepends=True))
+    assert u["tasks"] == 3   # CACHED не выполнялась
+    assert u["cpu_hours"] == pytest.approx(4 + 0.5 + 0.5 * 90 / 3600)
+    assert u["mem_gb_hours"] == pytest.approx(2 + 0.25 + 90 / 3600)
+    # trace.raw = true + cpus/memory в trace.fields: считается выделенное, а не фактическое
+    raw = "task_id\tstatus\trealtime\tcpus\tmemory\t%cpu\n1\tCOMPLETED\t7200000\t8\t34359738368\t150.0\n"
+    u = metering.parse_trace(raw.splitlines())
+    assert u == {"tasks": 1, "cpu_hours": pytest.approx(16), "mem_gb_hours": pytest.approx(64)}
+    with pytest.raises(ValueError):
+        metering.parse_trace(["task_id\tname\n"])
+
+def test_run_metering_rolls_up_and_answers_quota(s3, db, client, admin_headers):
+    s3.create_bucket(Bucket="runs")
+    s3.put_object(Bucket="runs", Key="m1/logs/trace.txt", Body=TRACE.encode())
+    s3.put_object(Bucket="runs", Key="m1/results/out.vcf.gz", Body=b"v" * 1000)
+    p = Project(name="metered")
+    wf = Workflow(name="nf-core/sarek", version="3.5.1", lock={})
+    ref = ReferenceSet(name="hg38", genome_build=GenomeBuild.GRCh38, is_complete=1, components=[])
+    db.add_all([p, wf, ref]); db.commit()
+
+    res = client.post("/datasets/register", headers=admin_headers, json={
+        "project_id": p.id, "uri": "s3://datasets/m/S1_R1.fq.gz", "type": "FASTQ.GZ", "size_bytes": 5000})
+    assert res.status_code == 201
+    finished = datetime.utcnow()
+    r = Run(project_id=p.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[], params={},
+            status=RunStatus.Succeeded, finished_at=finished,
+            artifacts=["s3://runs/m1/logs/trace.txt", "s3://runs/m1/results/out.vcf.gz"])
+    db.add(r); db.commit()
+
+    job = jobs.submit("usage.meter", metering.run_metering, r.id)
+    for _ in range(200):
+        if job.finished_at:
+            break
+        time.sleep(0.02)
+    assert job.status == "Succeeded", job.error
+    assert job.result["artifact_bytes"] == len(TRACE) + 1000
+    # повторный учёт того же запуска агрегаты не трогает
+    assert metering.run_metering(job, r.id)["skipped"]
+
+    rows = {u.granularity: u for u in db.query(UsageRollup).filter(UsageRollup.project_id == p.id)}
+    assert set(rows) == {"hour", "day", "month"}
+    for u in rows.values():
+        assert u.runs == 1 and u.tasks == 3 and u.cpu_hours == pytest.approx(4.5125)
+        assert u.dataset_bytes == 5000 and u.artifact_bytes == len(TRACE) + 1000
+    assert rows["hour"].bucket == metering.buckets(finished)["hour"]
+
+    q = client.get(f"/usage/projects/{p.id}/quota", headers=admin_headers).json()
+    assert q["ok"] and q["cpu_hours"] == pytest.approx(4.5125, abs=1e-4)
+    assert q["storage_bytes"] == 5000 + len(TRACE) + 1000
+    assert client.put(f"/usage/projects/{p.id}/quota", headers=admin_headers,
+                      json={"cpu_hours": 4, "storage_bytes": None}).status_code == 200
+    q = client.get(f"/usage/projects/{p.id}/quota", headers=admin_headers).json()
+    assert not q["ok"] and not q["cpu_ok"] and q["storage_ok"]
+
+    series = client.get(f"/usage/projects/{p.id}?granularity=hour", headers=admin_headers).json()
+    assert len(series["items"]) == 1 and series["total"]["runs"] == 1
+    assert client.get(f"/usage/runs/{r.id}", headers=admin_headers).json()["tasks"] == 3
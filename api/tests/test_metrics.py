@@ -0,0 +1,36 @@
+from prometheus_client.parser import text_string_to_metric_families
+
+def _samples(client):
+    res = client.get("/metrics")
+    assert res.status_code == 200 and res.headers["content-type"].startswith("text/plain")
+    return {(s.name, tuple(sorted(s.labels.items()))): s.value
+            for f in text_string_to_metric_families(res.text) for s in f.samples}
+
+def test_metrics_per_route_latency_and_db(client, admin_headers):
+    for _ in range(3):
+        assert client.get("/projects", headers=admin_headers).status_code == 200
+    client.get("/no/such/path")
+    m = _samples(client)
+    key = ("http_request_duration_seconds_count", (("method", "GET"), ("route", "/projects"), ("status", "200")))
+    assert m[key] >= 3
+    assert m[("db_queries_per_request_sum", (("route", "/projects"),))] >= 3   # пользователь + проекты
+    assert ("http_request_duration_seconds_count", (("method", "GET"), ("route", "<unmatched>"), ("status", "404"))) in m
+    assert ("db_pool_limit", (("engine", "sync"),)) in m
+    assert client.get("/healthz").json() == {"status": "ok"}
+
+def test_s3_connection_error_counted(monkeypatch):
+    import socket
+    import botocore.exceptions
+    import pytest
+    import s3core
+
+    with socket.socket() as sock:   # свободный порт, на котором никто не слушает
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(s3core, "S3_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(s3core, "S3_CONNECT_TIMEOUT", 1)
+    c = s3core.build(f"http://127.0.0.1:{port}")
+    before = s3core.stats.snapshot()["ops"].get("HeadBucket", {}).get("errors", 0)
+    with pytest.raises(botocore.exceptions.EndpointConnectionError):
+        c.head_bucket(Bucket="datasets")
+    assert s3core.stats.snapshot()["ops"]["HeadBucket"]["errors"] == before + 1
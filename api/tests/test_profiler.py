@@ -0,0 +1,57 @@
+import time
+
+from app import profiler, samples
+from app.models import Dataset, DatasetType, Project
+
+def _flush():
+    profiler._writer.submit(lambda: None).result()
+
+def _records(client, admin_headers, **params):
+    _flush()
+    res = client.get("/admin/profiles", headers=admin_headers, params=params)
+    assert res.status_code == 200
+    return res.json()
+
+def test_fingerprint_collapses_literals_and_in_lists():
+    a = profiler.fingerprint("SELECT * FROM samples WHERE id IN (?, ?, ?) AND name = 'x' LIMIT 1")
+    b = profiler.fingerprint("SELECT *  FROM samples\nWHERE id IN (?, ?) AND name = 'yy' LIMIT 20")
+    assert a == b == "SELECT * FROM samples WHERE id IN (?+) AND name = ? LIMIT ?"
+
+def test_repeated_statement_is_flagged(client, admin_headers):
+    rec = profiler._Recorder()
+    rec.statements["SELECT samples.id FROM samples WHERE samples.name = ?"] = [25, 0.05]
+    profiler._finish(rec, {"method": "POST", "path": "/x"}, 200, 0.01)
+    out = _records(client, admin_headers, kind="n_plus_one", route="<unmatched>")
+    assert out and out[0]["n_plus_one"][0]["count"] == 25 and not out[0]["slow"]
+    assert client.get("/admin/profiles", headers=admin_headers | {"Authorization": "Bearer x"}).status_code == 401
+
+def test_autopair_queries_do_not_grow_with_pairs(db, client, admin_headers, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_SLOW_MS", 0)   # записываем каждый запрос
+    p = Project(name="prof")
+    db.add(p); db.commit()
+    db.add_all(Dataset(project_id=p.id, uri=f"s3://datasets/{p.id}/S{i}_R{rd}.fastq.gz", type=DatasetType.FASTQ_GZ)
+               for i in range(30) for rd in (1, 2))
+    db.commit()
+    for _ in range(2):   # создание, затем обновление существующих
+        assert len(client.post(f"/samples/autopair?project_id={p.id}", headers=admin_headers).json()["created"]) in (0, 30)
+    runs = _records(client, admin_headers, route="/samples/autopair")[:2]
+    assert all(r["queries"] < 10 and not r["n_plus_one"] for r in runs)
+
+def test_slow_request_has_stack_samples(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_SLOW_MS", 50)
+    monkeypatch.setattr(profiler, "PROFILE_SAMPLE_AFTER_MS", 0)
+    rows_response = samples.rows_response
+
+    def slow_rows(result):
+        time.sleep(0.1)
+        return rows_response(result)
+
+    monkeypatch.setattr(samples, "rows_response", slow_rows)
+    p = client.post("/projects", json={"name": "P-slow"}, headers=admin_headers).json()["id"]
+    assert client.get(f"/samples?project_id={p}", headers=admin_headers).status_code == 200
+    rec = _records(client, admin_headers, kind="slow", route="/samples")[0]
+    assert rec["samples"] > 0
+    full = client.get(f"/admin/profiles/{rec['id']}", headers=admin_headers).json()
+    assert any("slow_rows" in frame for s in full["stacks"] for frame in s["stack"])
+    folded = client.get(f"/admin/profiles/{rec['id']}", headers=admin_headers, params={"format": "folded"}).text
+    assert "slow_rows" in folded
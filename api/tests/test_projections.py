@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine, inspect, text
+
+from app.db import ensure_columns
+
+LOCK = {"containers": [{"name": "bwa", "image": "bwa:1"}, {"name": "gatk", "image": "gatk:4"}]}
+
+def test_workflow_list_uses_precomputed_count(client, admin_headers):
+    r = client.post("/workflows/import", headers=admin_headers,
+                    json={"name": "wf-proj", "version": "1.0", "lockfile_json": LOCK})
+    assert r.status_code == 201
+    wid = r.json()["id"]
+
+    row = next(w for w in client.get("/workflows", headers=admin_headers).json() if w["id"] == wid)
+    assert row["images"] == 2
+    assert "lock" not in row
+    assert client.get(f"/workflows/{wid}", headers=admin_headers).json()["lock"] == LOCK
+
+def test_reference_list_is_slim(client, admin_headers):
+    comps = [{"role": "FASTA", "uri": "s3://r/g.fa"}, {"role": "FAI", "uri": "s3://r/g.fa.fai"}]
+    r = client.post("/references", headers=admin_headers,
+                    json={"name": "ref-proj", "genome_build": "GRCh38", "components": comps})
+    rid = r.json()["id"]
+
+    row = next(x for x in client.get("/references", headers=admin_headers).json() if x["id"] == rid)
+    assert row["component_count"] == 2 and "components" not in row
+    assert len(client.get(f"/references/{rid}", headers=admin_headers).json()["components"]) == 2
+
+    r = client.patch(f"/references/{rid}", headers=admin_headers, json={"components": comps[:1]})
+    row = next(x for x in client.get("/references", headers=admin_headers).json() if x["id"] == rid)
+    assert row["component_count"] == 1
+
+def test_ensure_columns_adds_missing(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with eng.begin() as c:
+        c.execute(text("CREATE TABLE workflows (id VARCHAR PRIMARY KEY, name VARCHAR NOT NULL, "
+                       "version VARCHAR NOT NULL, engine VARCHAR NOT NULL, repo VARCHAR, revision VARCHAR, "
+                       "git_sha VARCHAR, lock JSON NOT NULL, created_at DATETIME)"))
+    ensure_columns(eng)
+    assert "image_count" in {c["name"] for c in inspect(eng).get_columns("workflows")}
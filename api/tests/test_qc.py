@@ -0,0 +1,99 @@
+import gzip, time
+
+import pytest
+
+from app import qc, vcf, jobs, runs
+from app.db import SessionLocal
+from app.models import Project, Run, RunStatus, Workflow, ReferenceSet, GenomeBuild
+from app.variants import run_ingest
+
+VCF = """##fileformat=VCFv4.2
+##contig=<ID=chr1,length=2000000>
+##contig=<ID=chr2,length=1000000>
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2
+chr1\t10\t.\tA\tG\t50\tPASS\t.\tGT:DP\t0/1:30\t1/1:20
+chr1\t20\t.\tc\tt\t50\tPASS\t.\tGT:DP\t1|1:40\t0/1:10
+chr1\t30\t.\tA\tC\t50\tPASS\t.\tGT:DP\t0/1:50\t0/0:60
+chr1\t40\t.\tG\tT\t50\tLowQual\t.\tGT:DP\t0/1:5\t0/1:5
+chr1\t50\t.\tAT\tA\t50\t.\t.\tGT:DP\t0/1:22\t./.:.
+chr2\t60\t.\tT\tTAAA,TA\t50\tPASS\t.\tGT:DP\t1/2:25\t0/1:26
+chr2\t70\t.\tG\t<DEL>\t50\tPASS\t.\tGT\t0/1\t0/1
+"""
+
+@pytest.mark.parametrize("batch", [1, 3, 1000])
+def test_vcf_metrics_independent_of_batching(batch):
+    header, batches = vcf.read_vcf([VCF.encode()], batch_size=batch)
+    m = qc.accumulate(batches, header)
+    assert (m["records"], m["filtered"]) == (7, 1)
+    assert (m["snv"], m["indel"], m["other"], m["multiallelic"]) == (3, 2, 1, 1)
+    assert (m["ti"], m["tv"], m["ti_tv"]) == (2, 1, 2.0)
+    sizes = dict(zip(range(-qc.QC_INDEL_MAX, qc.QC_INDEL_MAX + 1), m["indel_sizes"]["counts"]))
+    assert sizes[-1] == 1 and sizes[3] == 1
+    assert m["samples"]["S1"]["het"] == 5 and m["samples"]["S1"]["hom_alt"] == 1
+    assert m["samples"]["S1"]["het_hom_ratio"] == 5.0
+    assert m["samples"]["S2"]["variant_dp"] == {"n": 4, "mean": 29.0, "median": 26}
+    assert m["contigs"]["chr1"] == {"variants": 4, "per_mb": 2.0}
+
+def test_coverage_and_duplicate_parsers():
+    summary = "chrom\tlength\tbases\tmean\tmin\tmax\nchr1\t100\t3000\t30.00\t0\t60\ntotal\t100\t3000\t30.00\t0\t60\n"
+    assert qc.parse_mosdepth_summary(summary) == {"mean_coverage": 30.0, "per_contig": {"chr1": 30.0}}
+    dist = "chr1\t30\t0.50\ntotal\t30\t0.50\ntotal\t20\t0.90\ntotal\t10\t0.99\ntotal\t1\t1.00\n"
+    assert qc.parse_mosdepth_dist(dist) == {"pct_ge_1x": 100.0, "pct_ge_10x": 99.0, "pct_ge_20x": 90.0, "pct_ge_30x": 50.0}
+    md = ("## METRICS CLASS\tpicard.sam.DuplicationMetrics\n"
+          "LIBRARY\tUNPAIRED_READS_EXAMINED\tREAD_PAIRS_EXAMINED\tPERCENT_DUPLICATION\n"
+          "lib1\t10\t1000\t0.0831\n")
+    assert qc.parse_markduplicates(md) == {"percent_duplication": 8.31, "read_pairs_examined": 1000}
+
+def test_run_qc_stored_after_ingest(s3, client, admin_headers, db):
+    s3.create_bucket(Bucket="runs")
+    vcf_uri = "s3://runs/q/variant_calling/haplotypecaller/S1/S1.vcf.gz"
+    cov_uri = "s3://runs/q/reports/mosdepth/S1/S1.mosdepth.summary.txt"
+    s3.put_object(Bucket="runs", Key=vcf_uri[len("s3://runs/"):], Body=gzip.compress(VCF.encode()))
+    s3.put_object(Bucket="runs", Key=cov_uri[len("s3://runs/"):], Body=b"chrom\tlength\tbases\tmean\tmin\tmax\ntotal\t1\t1\t31.5\t0\t9\n")
+    p = Project(name="qc"); wf = Workflow(name="wf", version="1", lock={})
+    ref = ReferenceSet(name="r", genome_build=GenomeBuild.GRCh38, components=[])
+    db.add_all([p, wf, ref]); db.commit()
+    r = Run(project_id=p.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[],
+            status=RunStatus.Succeeded, artifacts=[vcf_uri, cov_uri])
+    db.add(r); db.commit()
+
+    assert client.get(f"/runs/{r.id}/qc", headers=admin_headers).json()["status"] == "pending"
+    run_ingest(jobs.Job("variants.ingest", None, r.id), r.id, vcf_uri)
+    res = client.get(f"/runs/{r.id}/qc", headers=admin_headers).json()
+    assert res["status"] == "ready"
+    assert res["qc"]["variants"]["ti_tv"] == 2.0
+    assert res["qc"]["samples"]["S1"]["coverage"]["mean_coverage"] == 31.5
+
+def test_runner_result_to_run_qc(s3, db):
+    # ответ раннера с опубликованными выходами (runs/<run_id>/...) → apply_result → ingest → Run.qc_metrics
+    s3.create_bucket(Bucket="runs")
+    outputs = {
+        "variant_calling/haplotypecaller/S1/S1.haplotypecaller.vcf.gz": gzip.compress(VCF.encode()),
+        "variant_calling/haplotypecaller/S1/S1.haplotypecaller.vcf.gz.tbi": b"tbi",
+        "reports/mosdepth/S1/S1.md.mosdepth.summary.txt": b"chrom\tlength\tbases\tmean\tmin\tmax\ntotal\t1\t1\t31.5\t0\t9\n",
+        "reports/markduplicates/S1/S1.md.cram.metrics": (b"## METRICS CLASS\tpicard.sam.DuplicationMetrics\n"
+            b"LIBRARY\tREAD_PAIRS_EXAMINED\tPERCENT_DUPLICATION\nlib1\t1000\t0.05\n"),
+    }
+    for rel, body in outputs.items():
+        s3.put_object(Bucket="runs", Key=f"job1/{rel}", Body=body)
+    p = Project(name="qc-e2e"); wf = Workflow(name="wf", version="1", lock={})
+    ref = ReferenceSet(name="r", genome_build=GenomeBuild.GRCh38, components=[])
+    db.add_all([p, wf, ref]); db.commit()
+    r = Run(project_id=p.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[], status=RunStatus.Running)
+    db.add(r); db.commit()
+
+    runs.apply_result(db, r, {"run_id": "job1", "status": "Succeeded",
+                              "artifacts": ["s3://runs/job1/logs/nextflow.log"] + [f"s3://runs/job1/{k}" for k in outputs]}, None)
+    for _ in range(200):
+        s = SessionLocal()
+        try:
+            qcm = s.get(Run, r.id).qc_metrics
+        finally:
+            s.close()
+        if qcm:
+            break
+        time.sleep(0.02)
+    assert qcm["source"].endswith("S1.haplotypecaller.vcf.gz")
+    assert qcm["variants"]["records"] == 7
+    assert qcm["samples"]["S1"]["coverage"]["mean_coverage"] == 31.5
+    assert qcm["samples"]["S1"]["duplicates"]["percent_duplication"] == 5.0
@@ -0,0 +1,85 @@
+import hashlib, time
+
+from app import refvalidate
+
+SEQ = {"chr1": "ACGT" * 30, "chr2": "GGCC" * 12 + "A"}
+
+def _fasta_and_fai(width: int = 50):
+    fa, fai = b"", []
+    for name, seq in SEQ.items():
+        fa += f">{name} test contig\n".encode()
+        offset = len(fa)
+        fa += b"".join(seq[i:i + width].encode() + b"\n" for i in range(0, len(seq), width))
+        fai.append(f"{name}\t{len(seq)}\t{offset}\t{width}\t{width + 1}")
+    return fa, ("\n".join(fai) + "\n").encode()
+
+def _dict(lengths: dict) -> bytes:
+    lines = ["@HD\tVN:1.6\tSO:unsorted"] + [f"@SQ\tSN:{n}\tLN:{ln}" for n, ln in lengths.items()]
+    return ("\n".join(lines) + "\n").encode()
+
+def _put_reference(s3, prefix: str, dict_lengths: dict, bwa=("amb", "ann", "bwt", "pac", "sa")):
+    s3.create_bucket(Bucket="references")
+    fa, fai = _fasta_and_fai()
+    s3.put_object(Bucket="references", Key=f"{prefix}/g.fa", Body=fa)
+    s3.put_object(Bucket="references", Key=f"{prefix}/g.fa.fai", Body=fai)
+    s3.put_object(Bucket="references", Key=f"{prefix}/g.dict", Body=_dict(dict_lengths))
+    for ext in bwa:
+        s3.put_object(Bucket="references", Key=f"{prefix}/bwa/g.fa.{ext}", Body=b"x")
+    base = f"s3://references/{prefix}"
+    return [
+        {"role": "FASTA", "uri": f"{base}/g.fa", "md5": hashlib.md5(fa).hexdigest(), "size_bytes": len(fa)},
+        {"role": "FAI", "uri": f"{base}/g.fa.fai"},
+        {"role": "DICT", "uri": f"{base}/g.dict"},
+        {"role": "BWA_INDEX", "uri": f"{base}/bwa/g.fa"},
+    ]
+
+def test_valid_reference(s3):
+    comps = _put_reference(s3, "good", {n: len(s) for n, s in SEQ.items()})
+    report = refvalidate.validate(comps)
+    assert report["ok"], report
+    assert report["consistency"]["checked"] and report["consistency"]["contigs"] == 2
+    assert [c["status"] for c in report["components"]] == ["ok"] * 4
+
+def test_broken_reference_reports_every_problem(s3):
+    comps = _put_reference(s3, "bad", {"chr1": 120, "chr2": 999}, bwa=("amb", "ann", "bwt", "pac"))
+    s3.put_object(Bucket="references", Key="bad/bwa/g.fa.old/g.fa.sa", Body=b"x")   # соседний префикс не в счёт
+    comps[0]["md5"] = "0" * 32
+    comps.append({"role": "VEP_CACHE", "uri": "s3://references/bad/vep/"})
+    report = refvalidate.validate(comps)
+    assert not report["ok"]
+    by_role = {c["role"]: c for c in report["components"]}
+    assert by_role["FASTA"]["status"] == "mismatch"
+    assert "BWA index incomplete" in by_role["BWA_INDEX"]["errors"][0]
+    assert by_role["VEP_CACHE"]["status"] == "missing"
+    assert any("chr2: FAI length 49 != DICT length 999" in e for e in report["consistency"]["errors"])
+
+def test_validate_endpoint_stores_report(s3, client, admin_headers):
+    comps = _put_reference(s3, "api", {n: len(s) for n, s in SEQ.items()})
+    rid = client.post("/references", headers=admin_headers,
+                      json={"name": "ref-val", "genome_build": "GRCh38", "components": comps}).json()["id"]
+    assert client.get(f"/references/{rid}/validation", headers=admin_headers).json()["ok"] is None
+
+    job_id = client.post(f"/references/{rid}/validate", headers=admin_headers).json()["job_id"]
+    for _ in range(100):
+        job = client.get(f"/jobs/{job_id}", headers=admin_headers).json()
+        if job["status"] in ("Succeeded", "Failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "Succeeded", job
+
+    v = client.get(f"/references/{rid}/validation", headers=admin_headers).json()
+    assert v["ok"] is True and v["report"]["consistency"]["contigs"] == 2
+    row = next(x for x in client.get("/references", headers=admin_headers).json() if x["id"] == rid)
+    assert row["validation_ok"] is True
+
+def test_malformed_fai_rows_rejected(s3):
+    import pytest
+    for row in ("chr1\t120\t6\t0\t1", "chr1\t120\t6\t-50\t51", "chr1\t120\t6\t50\t40", "chr1\tx\t6\t50\t51"):
+        with pytest.raises(refvalidate.ValidationError):
+            refvalidate.parse_fai(row.encode())
+    # битый FAI в наборе → ошибка валидации в отчёте, а не 500
+    comps = _put_reference(s3, "zero", {n: len(s) for n, s in SEQ.items()})
+    s3.put_object(Bucket="references", Key="zero/g.fa.fai", Body=b"chr1\t120\t6\t0\t1\n")
+    report = refvalidate.validate(comps)
+    assert not report["ok"] and not report["consistency"]["checked"]
+    assert any("FAI line 1" in e for e in report["consistency"]["errors"])
@@ -0,0 +1,67 @@
+import time
+
+from app import jobs, reports
+from app.models import Project, Run, RunStatus, Workflow, ReferenceSet, GenomeBuild, Report, ReportStatus
+
+def _run(db, project, wf, ref, artifacts, qc=None):
+    r = Run(project_id=project.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[],
+            status=RunStatus.Succeeded, artifacts=artifacts, qc_metrics=qc)
+    db.add(r); db.commit()
+    return r
+
+def _wait(job_id):
+    for _ in range(200):
+        if jobs.get(job_id).finished_at:
+            return jobs.get(job_id)
+        time.sleep(0.02)
+    raise AssertionError("job did not finish")
+
+def _fixtures(s3, db):
+    s3.create_bucket(Bucket="runs")
+    s3.put_object(Bucket="runs", Key="x/logs/trace.txt", Body=b"task_id\tname\n1\tFASTQC\n")
+    p = Project(name="rep")
+    wf = Workflow(name="nf-core/sarek", version="3.5.1", lock={"containers": [{"name": "bwa", "image": "bwa:0.7.17"}]})
+    ref = ReferenceSet(name="hg38", genome_build=GenomeBuild.GRCh38,
+                       components=[{"role": "FASTA", "uri": "s3://refs/hg38.fa", "md5": "a" * 32}])
+    db.add_all([p, wf, ref]); db.commit()
+    return p, wf, ref
+
+def test_render_is_cached_by_inputs_and_shared_by_clones(s3, db):
+    p, wf, ref = _fixtures(s3, db)
+    qc = {"source": "s3://runs/x/s.vcf.gz", "variants": {"records": 10, "ti_tv": 2.1, "samples": {}}, "samples": {}}
+    first = _run(db, p, wf, ref, ["s3://runs/x/logs/trace.txt"], qc)
+    res = reports.run_report(jobs.Job("report.render", None, first.id), first.id)
+    assert res["cached"] is False
+    body = s3.get_object(Bucket="reports", Key=f"{res['input_hash']}/report.html")["Body"].read().decode()
+    assert "a" * 32 in body and "bwa:0.7.17" in body and "2.1" in body and first.id in body
+
+    # тот же запуск повторно и клон с теми же входами — без рендера, один объект в S3
+    assert reports.run_report(jobs.Job("report.render", None, first.id), first.id)["cached"] is True
+    clone = _run(db, p, wf, ref, ["s3://runs/x/logs/trace.txt"], qc)
+    again = reports.run_report(jobs.Job("report.render", None, clone.id), clone.id)
+    assert again == {**res, "cached": True}
+    # изменились входы (QC) — новый хэш
+    other = _run(db, p, wf, ref, ["s3://runs/x/logs/trace.txt"], None)
+    assert reports.run_report(jobs.Job("report.render", None, other.id), other.id)["input_hash"] != res["input_hash"]
+
+def test_report_endpoint_pending_then_presigned(s3, db, client, admin_headers):
+    p, wf, ref = _fixtures(s3, db)
+    r = _run(db, p, wf, ref, ["s3://runs/x/logs/trace.txt", "s3://runs/x/missing.vcf.gz"])
+
+    res = client.get(f"/reports/{r.id}", headers=admin_headers)
+    assert res.status_code == 202 and res.headers["Retry-After"]
+    assert _wait(res.json()["job_id"]).status == "Succeeded"
+
+    res = client.get(f"/reports/{r.id}", headers=admin_headers)
+    assert res.status_code == 200
+    out = res.json()
+    assert out["status"] == "ready" and out["pdf_available"] in (True, False)
+    assert f"{out['input_hash']}/report.html" in out["url"]
+    red = client.get(f"/reports/{r.id}", headers=admin_headers, params={"redirect": True}, follow_redirects=False)
+    assert red.status_code == 307 and "Signature" in red.headers["location"]
+    assert db.get(Report, r.id).status == ReportStatus.Ready
+
+def test_report_requires_project_access(s3, db, client, viewer_headers):
+    p, wf, ref = _fixtures(s3, db)
+    r = _run(db, p, wf, ref, [])
+    assert client.get(f"/reports/{r.id}", headers=viewer_headers).status_code == 403
@@ -0,0 +1,34 @@
+
+from app.responses import dumps, rows_to_dicts
+from app.models import RunStatus
+
+def test_dumps_handles_enums_and_rows():
+    rows = rows_to_dicts(["id", "status"], [("r1", RunStatus.Succeeded)])
+    assert dumps(rows) == b'[{"id":"r1","status":"Succeeded"}]'
+
+def test_list_samples_projection_and_gzip(client, admin_headers):
+    pid = client.post("/projects", json={"name": "P-resp"}, headers=admin_headers).json()["id"]
+    for i in range(60):
+        for rd in (1, 2):
+            client.post("/datasets/register", headers=admin_headers, json={
+                "project_id": pid, "uri": f"s3://datasets/{pid}/S{i}_R{rd}.fastq.gz", "type": "FASTQ.GZ"})
+    client.post(f"/samples/autopair?project_id={pid}", headers=admin_headers)
+
+    r = client.get(f"/samples?project_id={pid}", headers={**admin_headers, "Accept-Encoding": "gzip"})
+    assert r.status_code == 200 and r.headers.get("content-encoding") == "gzip"
+    rows = r.json()
+    assert len(rows) == 60
+    s0 = next(s for s in rows if s["name"] == "S0")
+    assert s0["r1_uri"].endswith("S0_R1.fastq.gz") and s0["r2_uri"].endswith("S0_R2.fastq.gz")
+
+    ds = client.get(f"/datasets?project_id={pid}", headers=admin_headers).json()
+    assert ds[0]["type"] == "FASTQ.GZ"
+
+    csv = client.get(f"/samples/export.csv?project_id={pid}", headers=admin_headers).text
+    assert csv.splitlines()[0] == "sample,r1_uri,r2_uri" and len(csv.splitlines()) == 61
+
+def test_reference_list_bool(client, admin_headers):
+    client.post("/references", headers=admin_headers,
+                json={"name": "ref-bool", "genome_build": "GRCh38", "components": []})
+    row = next(x for x in client.get("/references", headers=admin_headers).json() if x["name"] == "ref-bool")
+    assert row["is_complete"] is False
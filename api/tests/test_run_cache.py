@@ -0,0 +1,83 @@
+from app import runs
+from app.models import (Project, Run, RunStatus, Workflow, ReferenceSet, GenomeBuild, Dataset, DatasetType, Sample)
+
+DIGEST = "sha256:" + "1" * 64
+
+def _inputs(db, s3, md5="b" * 32):
+    s3.create_bucket(Bucket="runs")
+    s3.put_object(Bucket="runs", Key="src/logs/trace.txt", Body=b"x")
+    p = Project(name="cache")
+    wf = Workflow(name="nf-core/sarek", version="3.5.1", git_sha="abc123",
+                  lock={"containers": [{"name": "bwa", "image": f"quay.io/bwa@{DIGEST}"}]})
+    ref = ReferenceSet(name="hg38", genome_build=GenomeBuild.GRCh38, is_complete=1,
+                       components=[{"role": "FASTA", "uri": "s3://refs/hg38.fa", "md5": "a" * 32}])
+    db.add_all([p, wf, ref]); db.commit()
+    r1 = Dataset(project_id=p.id, uri="s3://datasets/s_R1.fq.gz", type=DatasetType.FASTQ_GZ, md5=md5)
+    r2 = Dataset(project_id=p.id, uri="s3://datasets/s_R2.fq.gz", type=DatasetType.FASTQ_GZ, md5="c" * 32)
+    db.add_all([r1, r2]); db.commit()
+    s = Sample(project_id=p.id, name="S1", r1_dataset_id=r1.id, r2_dataset_id=r2.id)
+    db.add(s); db.commit()
+    return p, wf, ref, s
+
+def _body(p, wf, ref, s, **kw):
+    return {"project_id": p.id, "workflow_id": wf.id, "reference_set_id": ref.id,
+            "sample_ids": [s.id], "params": {"tools": "haplotypecaller"}, **kw}
+
+def test_identical_inputs_reuse_artifacts(s3, db, client, admin_headers):
+    p, wf, ref, s = _inputs(db, s3)
+    fp = runs.run_fingerprint(wf, ref, runs._runner_samples(db, [s]), {"tools": "haplotypecaller"})
+    assert fp
+    src = Run(project_id=p.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[s.id],
+              params={"tools": "haplotypecaller"}, status=RunStatus.Succeeded, fingerprint=fp,
+              runner_job_id="run_1", artifacts=["s3://runs/src/logs/trace.txt"])
+    db.add(src); db.commit()
+
+    res = client.post("/runs", headers=admin_headers, json=_body(p, wf, ref, s))
+    assert res.status_code == 201, res.text
+    out = res.json()
+    assert out["reused_from"] == src.id and out["status"] == "Succeeded"
+    assert out["artifacts"] == src.artifacts and out["fingerprint"] == fp
+
+    # другой params — другой отпечаток; opt-out — в любом случае в очередь к раннеру
+    for body in (_body(p, wf, ref, s, params={"tools": "deepvariant"}), _body(p, wf, ref, s, reuse=False)):
+        res = client.post("/runs", headers=admin_headers, json=body)
+        assert res.status_code == 201 and res.json()["status"] == "Queued" and res.json()["reused_from"] is None
+    # опции docker на запуск не принимаются (только профиль раннера)
+    body = _body(p, wf, ref, s, compute_overrides={"docker_run_options": "--privileged -v /:/host"})
+    assert client.post("/runs", headers=admin_headers, json=body).status_code == 422
+
+def test_no_fingerprint_without_checksums(s3, db):
+    p, wf, ref, s = _inputs(db, s3, md5=None)
+    assert runs.run_fingerprint(wf, ref, runs._runner_samples(db, [s]), {}) is None
+    wf.lock = {"containers": ["quay.io/bwa:0.7.17"]}   # тег без digest
+    assert runs._container_digests(wf.lock) is None
+
+def test_cohort_reuse_looks_up_all_chunks_at_once(s3, db, client, admin_headers, monkeypatch):
+    p, wf, ref, s0 = _inputs(db, s3)
+    more = []
+    for i, md5 in ((1, "d" * 32), (2, "e" * 32)):
+        r1 = Dataset(project_id=p.id, uri=f"s3://datasets/s{i}_R1.fq.gz", type=DatasetType.FASTQ_GZ, md5=md5)
+        r2 = Dataset(project_id=p.id, uri=f"s3://datasets/s{i}_R2.fq.gz", type=DatasetType.FASTQ_GZ, md5="c" * 32)
+        db.add_all([r1, r2]); db.commit()
+        more.append(Sample(project_id=p.id, name=f"S{i + 1}", r1_dataset_id=r1.id, r2_dataset_id=r2.id))
+    db.add_all(more); db.commit()
+    params = {"tools": "haplotypecaller"}
+    fps = [runs.run_fingerprint(wf, ref, runs._runner_samples(db, [s]), params) for s in (s0, *more)]
+    # S1 — целые артефакты, S2 — артефакты удалены, S3 — не считался
+    ok = Run(project_id=p.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[s0.id], params=params,
+             status=RunStatus.Succeeded, fingerprint=fps[0], artifacts=["s3://runs/src/logs/trace.txt"])
+    gone = Run(project_id=p.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[more[0].id], params=params,
+               status=RunStatus.Succeeded, fingerprint=fps[1], artifacts=["s3://runs/gone/logs/trace.txt"])
+    db.add_all([ok, gone]); db.commit()
+    checked = []
+    exists = runs._exists
+    monkeypatch.setattr(runs, "_exists", lambda u: checked.append(u) or exists(u))
+
+    res = client.post("/cohorts", headers=admin_headers, json={
+        "project_id": p.id, "workflow_id": wf.id, "reference_set_id": ref.id, "params": params})
+    assert res.status_code == 201, res.text
+    assert res.json()["reused"] == 1 and res.json()["queued"] == 2
+    assert sorted(checked) == ["s3://runs/gone/logs/trace.txt", "s3://runs/src/logs/trace.txt"]   # только найденные
+    db.expire_all()
+    reused = [r for r in db.query(Run).filter(Run.id.in_(res.json()["run_ids"])) if r.reused_from]
+    assert [r.reused_from for r in reused] == [ok.id]
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from app import faidx, seqstore
+
+SEQ = {"chr1": "ACGTACGTAAcccgggtttA" * 3, "HLA-A*01:01:01:01": "GATTACA" * 3}
+
+def _fasta(width: int = 7) -> bytes:
+    out = b""
+    for name, seq in SEQ.items():
+        out += f">{name}\n".encode() + b"".join(seq[i:i + width].encode() + b"\n" for i in range(0, len(seq), width))
+    return out
+
+@pytest.fixture()
+def fasta(tmp_path):
+    data = _fasta()
+    path = tmp_path / "g.fa"
+    path.write_bytes(data)
+    contigs, _ = faidx.build_index([data])
+    (tmp_path / "g.fa.fai").write_bytes(faidx.render_fai(contigs))
+    return seqstore.IndexedFasta(str(path))
+
+@pytest.mark.parametrize("region,expected", [
+    ("chr1:1-7", SEQ["chr1"][0:7]),                # внутри одной строки
+    ("chr1:5-30", SEQ["chr1"][4:30]),              # через переводы строк
+    ("chr1:1,000-2,000", None),                    # за пределами контига
+    ("chr1:55", SEQ["chr1"][54:]),                 # до конца контига
+    ("chr1", SEQ["chr1"]),
+    ("HLA-A*01:01:01:01:2-4", SEQ["HLA-A*01:01:01:01"][1:4]),
+])
+def test_slices_match_sequence(fasta, region, expected):
+    if expected is None:
+        with pytest.raises(seqstore.RegionError):
+            fasta.parse_region(region)
+        return
+    name, start, end = fasta.parse_region(region)
+    assert fasta.fetch(name, start, end) == expected
+
+def test_sequence_endpoint_stages_then_serves(s3, client, admin_headers):
+    s3.create_bucket(Bucket="references")
+    s3.put_object(Bucket="references", Key="seq/g.fa", Body=_fasta())
+    comps = [{"role": "FASTA", "uri": "s3://references/seq/g.fa"}]
+    rid = client.post("/references", headers=admin_headers,
+                      json={"name": "ref-seq", "genome_build": "GRCh38", "components": comps}).json()["id"]
+
+    r = client.get(f"/references/{rid}/sequence", params={"region": "chr1:5-30"}, headers=admin_headers)
+    assert r.status_code == 503 and r.headers["Retry-After"]
+    job_id = r.json()["detail"]["job_id"]
+    for _ in range(100):
+        if client.get(f"/jobs/{job_id}", headers=admin_headers).json()["status"] in ("Succeeded", "Failed"):
+            break
+        time.sleep(0.05)
+
+    r = client.get(f"/references/{rid}/sequence", params={"region": "chr1:5-30"}, headers=admin_headers)
+    assert r.status_code == 200 and r.json()["sequence"] == SEQ["chr1"][4:30]
+
+    r = client.post(f"/references/{rid}/sequence", headers=admin_headers,
+                    json={"regions": ["chr1:1-3", "HLA-A*01:01:01:01:1-2"]})
+    assert [x["sequence"] for x in r.json()] == ["ACG", "GA"]
+    r = client.post(f"/references/{rid}/sequence", headers=admin_headers, json={"regions": ["chrX:1-2"]})
+    assert r.status_code == 422
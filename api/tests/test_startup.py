@@ -0,0 +1,32 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from main import app
+from app import startup
+
+def test_readyz_waits_for_startup_then_checks_dependencies(s3, admin_headers, monkeypatch):
+    monkeypatch.setattr(startup, "state", startup._State())
+    monkeypatch.setattr(startup, "_checks", {"at": 0.0, "result": None})
+    bare = TestClient(app)   # без lifespan: старт не выполнялся
+    assert bare.get("/readyz").status_code == 503
+    assert bare.get("/livez").json() == {"status": "ok"}
+    assert bare.get("/healthz").json() == {"status": "ok"}
+
+    with TestClient(app) as client:
+        for _ in range(200):
+            res = client.get("/readyz")
+            if res.status_code == 200:
+                break
+            time.sleep(0.02)
+        out = res.json()
+        assert res.status_code == 200, out
+        assert out["checks"]["db"]["ok"] and out["checks"]["s3"]["ok"]
+        assert {"schema", "admin", "backfill", "db_pool", "s3", "db_pool_async"} <= set(out["startup"]["phases_ms"])
+
+        # результат проверок кэшируется: упавший S3 виден не раньше READY_CACHE_S
+        s3.delete_bucket(Bucket="datasets")
+        assert client.get("/readyz").status_code == 200
+        monkeypatch.setattr(startup, "READY_CACHE_S", 0)
+        res = client.get("/readyz")
+        assert res.status_code == 503 and not res.json()["checks"]["s3"]["ok"]
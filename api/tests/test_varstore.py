@@ -0,0 +1,66 @@
+import gzip
+
+from app import varstore
+from app.models import Project, Run, RunStatus, Workflow, ReferenceSet, GenomeBuild
+
+HEADER = """##fileformat=VCFv4.2
+##contig=<ID=chr1,length=1000000>
+##contig=<ID=chr2,length=500000>
+##FILTER=<ID=PASS,Description="All filters passed">
+##FILTER=<ID=LowQual,Description="Low quality">
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tNA1\tNA2
+"""
+RECORDS = [
+    "chr1\t100\t.\tA\tG\t50\tPASS\t.\tGT:DP\t0/1:30\t0/0:25",
+    "chr1\t40000\t.\tC\tT\t20\tLowQual\t.\tGT:DP\t1/1:10\t./.:.",
+    "chr1\t39990\t.\tACGTACGTACGTAC\tA\t60\tPASS\t.\tGT:DP\t0/0:40\t0|1:33",   # не по порядку
+    "chr1\t70000\t.\tG\tC,T\t.\tLowQual;PASS\t.\tGT\t1/2\t0/1",
+    "chr2\t5\t.\tT\tTA\t99\tPASS\t.\tGT:DP\t0/1:12\t1/1:9",
+]
+
+def _put_vcf(s3, key: str) -> str:
+    s3.create_bucket(Bucket="runs")
+    body = gzip.compress((HEADER + "\n".join(RECORDS) + "\n").encode())
+    s3.put_object(Bucket="runs", Key=key, Body=body)
+    return f"s3://runs/{key}"
+
+def test_ingest_sorts_indexes_and_filters(s3, tmp_path):
+    uri = _put_vcf(s3, "r1/variant_calling/deepvariant/s1.vcf.gz")
+    assert varstore.ingest("r1", uri, root=str(tmp_path))["records"] == 5
+    store = varstore.open_run("r1", root=str(tmp_path))
+
+    chr1 = [v["pos"] for v in store.query("chr1")]
+    assert chr1 == [100, 39990, 40000, 70000]
+    # делеция с 39990 перекрывает 40001 и находится, хотя начинается в предыдущем бине
+    assert [v["pos"] for v in store.query("chr1:40001-40002")] == [39990]
+    assert [v["pos"] for v in store.query(None, status="PASS")] == [100, 39990, 70000, 5]
+    assert [v["pos"] for v in store.query(None, sample="NA2")] == [39990, 70000, 5]
+    v = next(store.query("chr2:5", sample="NA1"))
+    assert v["genotypes"] == {"NA1": {"gt": "het", "dp": 12}} and v["alt"] == "TA"
+    assert list(store.query("chrX:1-10")) == []
+
+def test_pick_vcf_prefers_callers_and_skips_gvcf():
+    arts = ["s3://runs/x/strelka/s.genome.vcf.gz", "s3://runs/x/strelka/s.variants.vcf.gz",
+            "s3://runs/x/haplotypecaller/s.vcf.gz", "s3://runs/x/multiqc.html"]
+    assert varstore.pick_vcf(arts) == "s3://runs/x/haplotypecaller/s.vcf.gz"
+    assert varstore.pick_vcf(arts[3:]) is None
+
+def test_query_endpoint_across_runs(s3, client, admin_headers, db):
+    p = Project(name="vp"); wf = Workflow(name="wf", version="1", lock={})
+    ref = ReferenceSet(name="r", genome_build=GenomeBuild.GRCh38, components=[])
+    db.add_all([p, wf, ref]); db.commit()
+    uri = _put_vcf(s3, "rx/s.vcf.gz")
+    runs = []
+    for _ in range(2):
+        r = Run(project_id=p.id, workflow_id=wf.id, reference_set_id=ref.id, sample_ids=[],
+                status=RunStatus.Succeeded, artifacts=[uri])
+        db.add(r); db.commit()
+        runs.append(r.id)
+    varstore.ingest(runs[0], uri)
+
+    res = client.get("/variants", headers=admin_headers,
+                     params={"run_id": runs, "region": "chr1:1-50000", "filter": "PASS"}).json()
+    assert [(v["run_id"], v["pos"]) for v in res["variants"]] == [(runs[0], 100), (runs[0], 39990)]
+    assert res["not_ingested"] == [runs[1]]
+    assert client.get("/variants", headers=admin_headers,
+                      params={"run_id": runs[0], "region": "chr1:x-y"}).status_code == 422
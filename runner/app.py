@@ -1,11 +1,20 @@
-import os, time, subprocess, uuid
+import os, re, time, subprocess, uuid
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse
-from s3client import client as s3client, ensure_bucket, S3_BUCKET_RUNS
+from s3client import ensure_bucket, upload_file, stats as s3_stats, S3_BUCKET_RUNS
+from refcache import get_cache as get_ref_cache
+from staging import stage_samples
+import metrics
+import profiles
+import worker
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from fastapi.responses import Response
 import tempfile
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from fastapi import Body
 from typing import Optional, List
 
@@ -13,17 +22,85 @@ from typing import Optional, List
 app = FastAPI(title="GenomeAI Runner")
 
 BASE_RUN_DIR = os.environ.get("WORK_DIR", "/nfwork")
+# выходы пайплайна (--outdir), которые нужны API: варианты (varstore, QC), покрытие и дубликаты (qc);
+# BAM/CRAM и промежуточные файлы не выгружаются
+PUBLISH_SUFFIXES = tuple(s for s in os.environ.get(
+    "RUNNER_PUBLISH_SUFFIXES",
+    ".vcf,.vcf.gz,.vcf.gz.tbi,.vcf.gz.csi,.mosdepth.summary.txt,.mosdepth.global.dist.txt,.metrics",
+).split(",") if s)
+PUBLISH_WORKERS = int(os.environ.get("RUNNER_PUBLISH_WORKERS", "8"))
 PIPE = "/app/pipelines/hello.nf"
 
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.register(BASE_RUN_DIR)
+
 @app.on_event("startup")
 def _init():
     os.makedirs(BASE_RUN_DIR, exist_ok=True)
     ensure_bucket()
+    if worker.RUNNER_WORKER:
+        # узел парка: задания берутся из API (RUNNER_DISPATCH=queue), HTTP-эндпоинты /run/* остаются
+        worker.Worker({
+            "nfcore_dna_seq": lambda p: run_nfcore_dna_seq(NFCoreDNASeqIn(**p)),
+            "container_smoke": lambda p: run_container_smoke(ComputeIn(**p)),
+        }).start()
 
 @app.get("/healthz")
 def healthz():
     return {"status":"ok"}
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/storage/metrics")
+def storage_metrics():
+    return s3_stats.snapshot()
+
+class ReferenceComponentIn(BaseModel):
+    role: str
+    uri: str
+    md5: Optional[str] = None
+
+class StageReferenceIn(BaseModel):
+    components: List[ReferenceComponentIn]
+
+@app.post("/references/stage")
+def stage_reference(payload: StageReferenceIn):
+    # прогрев кэша: компоненты качаются один раз, дальше запуски получают локальные пути сразу
+    try:
+        with get_ref_cache().stage([c.model_dump() for c in payload.components]) as paths:
+            return {"paths": paths}
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Reference staging failed: {e}")
+
+@app.get("/references/cache")
+def reference_cache_stats():
+    return get_ref_cache().stats()
+
+# --- профили вычислений ---
+class ComputeOverridesIn(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    cpus: Optional[int] = Field(None, ge=1)
+    memory_gb: Optional[float] = Field(None, gt=0)
+    queue_size: Optional[int] = Field(None, ge=1)
+    max_time: Optional[str] = Field(None, pattern=r"^\d+\.(s|m|h|d)$")
+    scratch: Optional[bool] = None
+
+class ComputeIn(BaseModel):
+    compute_profile: str = "local-docker"
+    compute_overrides: Optional[ComputeOverridesIn] = None
+
+@app.get("/profiles")
+def list_profiles():
+    # как профили разворачиваются на этом узле
+    return {name: profiles.resolve(name) for name in profiles.PROFILES}
+
+def _compute(payload: ComputeIn, work_dir: str, docker_user: str, legacy: dict | None = None) -> tuple[dict, str]:
+    overrides = {**(legacy or {}), **(payload.compute_overrides.model_dump(exclude_none=True) if payload.compute_overrides else {})}
+    res = profiles.resolve(payload.compute_profile, overrides)
+    return res, profiles.render(res, work_dir, docker_user)
+
 @app.post("/run/hello")
 def run_hello():
     run_id = f"run_{int(time.time())}_{uuid.uuid4().hex[:6]}"
@@ -42,21 +119,19 @@ def run_hello():
         "-w", os.path.join(run_dir, "work")
     ]
     try:
-        proc = subprocess.run(cmd, cwd=run_dir, capture_output=True, text=True, timeout=600)
-        stdout, stderr, rc = proc.stdout, proc.stderr, proc.returncode
+        rc, stdout, stderr = _run(cmd, cwd=run_dir, timeout=600)
     except subprocess.TimeoutExpired:
         return JSONResponse(status_code=500, content={"run_id": run_id, "status":"Failed","error":"Timeout"})
 
     status = "Succeeded" if rc == 0 else "Failed"
 
     # upload artifacts → S3
-    s3 = s3client()
     key_prefix = f"{run_id}/logs/"
     artifacts = []
     for p in (report, trace, timeline):
         if os.path.exists(p):
             key = key_prefix + os.path.basename(p)
-            s3.upload_file(p, S3_BUCKET_RUNS, key)
+            upload_file(p, S3_BUCKET_RUNS, key)
             artifacts.append(f"s3://{S3_BUCKET_RUNS}/{key}")
 
     return {
@@ -68,18 +143,16 @@ def run_hello():
     }
 
 @app.post("/run/container_smoke")
-def run_container_smoke():
+def run_container_smoke(payload: Optional[ComputeIn] = Body(None)):
     run_id = f"run_{int(time.time())}_{uuid.uuid4().hex[:6]}"
     run_dir = os.path.join(BASE_RUN_DIR, run_id)
     os.makedirs(run_dir, exist_ok=True)
 
-    # Конфиг Nextflow: Docker + scratch + корректный process.shell (см. nf-core advisory)
-    nfconf = f"""
-    process.executor = 'local'
-    docker.enabled   = true
-    docker.runOptions = '-u 0:0'
-    workDir          = '{os.path.join(run_dir, "work")}'
-    """
+    # Конфиг Nextflow из профиля вычислений: Docker, лимиты executor'а, scratch
+    try:
+        compute, nfconf = _compute(payload or ComputeIn(), os.path.join(run_dir, "work"), "0:0")
+    except profiles.ProfileError as e:
+        return JSONResponse(status_code=422, content={"run_id": run_id, "status": "Failed", "error": str(e)})
 
     with open(os.path.join(run_dir, "nextflow.config"), "w") as fh:
         fh.write(nfconf)
@@ -97,21 +170,19 @@ def run_container_smoke():
         "-w", os.path.join(run_dir, "work"),
     ]
     try:
-        proc = subprocess.run(cmd, cwd=run_dir, capture_output=True, text=True, timeout=900)
-        stdout, stderr, rc = proc.stdout, proc.stderr, proc.returncode
+        rc, stdout, stderr = _run(cmd, cwd=run_dir, timeout=900)
     except subprocess.TimeoutExpired:
         raise HTTPException(status_code=500, detail="Timeout")
 
     status = "Succeeded" if rc == 0 else "Failed"
 
     # S3 upload
-    s3 = s3client()
     key_prefix = f"{run_id}/logs/"
     artifacts = []
     for pth in [report, trace, timeline]:
         if os.path.exists(pth):
             key = key_prefix + os.path.basename(pth)
-            s3.upload_file(pth, S3_BUCKET_RUNS, key)
+            upload_file(pth, S3_BUCKET_RUNS, key)
             artifacts.append(f"s3://{S3_BUCKET_RUNS}/{key}")
 
     # добавить хвост nextflow-лога для анализа
@@ -127,29 +198,105 @@ def run_container_smoke():
         "artifacts": artifacts,
         "stdout_tail": stdout.splitlines()[-10:] if stdout else [],
         "stderr_tail": stderr.splitlines()[-10:] if stderr else [],
-        "nextflow_log_tail": [l.rstrip("\n") for l in log_tail]
+        "nextflow_log_tail": [l.rstrip("\n") for l in log_tail],
+        "nextflow_config": nfconf,
+        "compute": compute,
     }
 
-class NFCoreDNASeqIn(BaseModel):
+class SampleIn(BaseModel):
+    sample: str
+    patient: Optional[str] = None
+    lane: Optional[str] = None
+    fastq_1: str
+    fastq_2: str
+    md5_1: Optional[str] = None
+    md5_2: Optional[str] = None
+
+class NFCoreDNASeqIn(ComputeIn):
     # Ключевая правка: по умолчанию бежим sarek
     repo: str = "https://github.com/nf-core/sarek"
     revision: str | None = "3.5.1"   # или None, чтобы брать default-ветку
     profile: str = "test,docker"
     stub_run: bool = True
-    docker_user: str = "0:0"
+    docker_user: str = Field("0:0", pattern=r"^\w+(:\w+)?$")   # уходит в docker -u
     outdir: Optional[str] = None
     extra_args: Optional[List[str]] = None
-    # безопасные лимиты для маленькой машины
-    max_memory: str = "3.GB"
-    max_cpus: int = 2
-    max_time: str = "2.h"
+    # устаревшие лимиты (max_*): если заданы — работают как compute_overrides; по умолчанию — профиль
+    max_memory: Optional[str] = None
+    max_cpus: Optional[int] = None
+    max_time: Optional[str] = None
+    # компоненты Reference Set [{role, uri, md5?}] — стейджатся через локальный кэш (кроме stub-run)
+    reference: Optional[List[ReferenceComponentIn]] = None
+    # сэмплы запуска → samplesheet + FASTQ в run_dir/inputs (кроме stub-run)
+    samples: Optional[List[SampleIn]] = None
+
+# роль компонента → параметр nf-core/sarek
+SAREK_REF_PARAMS = {
+    "FASTA": "--fasta",
+    "FAI": "--fasta_fai",
+    "DICT": "--dict",
+    "BWA_INDEX": "--bwa",
+    "VEP_CACHE": "--vep_cache",
+}
+
+def _publish(outdir: str, key_prefix: str) -> list[str]:
+    """Выходы из outdir → s3://<runs>/<run_id>/<путь относительно outdir>; возвращает URI (по порядку путей)."""
+    files = sorted(
+        os.path.relpath(os.path.join(d, f), outdir)
+        for d, _, names in os.walk(outdir) for f in names if f.lower().endswith(PUBLISH_SUFFIXES)
+    )
 
-def _run(cmd, cwd):
-    proc = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, timeout=3600)
-    return proc.returncode, proc.stdout, proc.stderr
+    def put(rel: str) -> str:
+        key = key_prefix + rel.replace(os.sep, "/")
+        upload_file(os.path.join(outdir, rel), S3_BUCKET_RUNS, key)   # publishDir-симлинки читаются как файлы
+        return f"s3://{S3_BUCKET_RUNS}/{key}"
+
+    with ThreadPoolExecutor(max_workers=max(1, min(PUBLISH_WORKERS, len(files)))) as pool:
+        return list(pool.map(put, files))
+
+def _memory_gb(v: str) -> float:
+    # нотация Nextflow: "3.GB", "512.MB", "1 TB"
+    m = re.match(r"^\s*(\d+(?:\.\d+)?)\s*\.?\s*([KMGT])B\s*$", v, re.I)
+    if not m:
+        raise profiles.ProfileError(f"Bad memory value: {v}")
+    return float(m.group(1)) * {"K": 1 / 1024 ** 2, "M": 1 / 1024, "G": 1, "T": 1024}[m.group(2).upper()]
+
+def _reference_args(paths: dict) -> list:
+    args = ["--igenomes_ignore"]
+    for role, path in paths.items():
+        flag = SAREK_REF_PARAMS.get(role)
+        if not flag:
+            continue
+        if role == "BWA_INDEX" and not os.path.isdir(path):
+            path = os.path.dirname(path)  # префикс индекса → каталог, sarek ждёт каталог
+        args += [flag, path]
+    return args
+
+class _Phases:
+    """Длительности фаз запуска, сек (lap — время с предыдущей отметки); уходят в ответ как timings."""
+    def __init__(self):
+        self.t0 = self.last = time.perf_counter()
+        self.timings: dict[str, float] = {}
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        self.timings[name] = round(self.timings.get(name, 0.0) + now - self.last, 4)
+        self.last = now
+
+    def done(self) -> dict:
+        self.timings["total"] = round(time.perf_counter() - self.t0, 4)
+        metrics.observe_phases(self.timings)
+        return self.timings
+
+def _run(cmd, cwd, timeout=3600):
+    # через worker.run: в режиме парка подпроцесс убивается при потере аренды задания
+    with metrics.subprocess_active(cmd[0]):
+        return worker.run(cmd, cwd, timeout)
 
 @app.post("/run/nfcore_dna_seq")
+@metrics.run_inflight()
 def run_nfcore_dna_seq(payload: NFCoreDNASeqIn = Body(...)):
+    phase = _Phases()
     run_id = f"run_{int(time.time())}_{uuid.uuid4().hex[:6]}"
     run_dir = os.path.join(BASE_RUN_DIR, run_id)
     os.makedirs(run_dir, exist_ok=True)
@@ -161,15 +308,16 @@ def run_nfcore_dna_seq(payload: NFCoreDNASeqIn = Body(...)):
     outdir = payload.outdir or os.path.join(run_dir, "out")
     os.makedirs(outdir, exist_ok=True)
 
-    # nextflow.config: docker включён + принудительный user
-    nfconf = (
-        "process.executor = 'local'\n"
-        "docker.enabled = true\n"
-        f"process.containerOptions = '--user {payload.docker_user}'\n"
-        f"workDir = '{os.path.join(run_dir,'work')}'\n"
-    )
+    # nextflow.config из профиля вычислений: доля ресурсов хоста, scratch, docker с принудительным user
+    try:
+        legacy = {"cpus": payload.max_cpus, "max_time": payload.max_time,
+                  "memory_gb": _memory_gb(payload.max_memory) if payload.max_memory else None}
+        compute, nfconf = _compute(payload, os.path.join(run_dir, "work"), payload.docker_user, legacy)
+    except profiles.ProfileError as e:
+        return JSONResponse(status_code=422, content={"run_id": run_id, "status": "Failed", "error": str(e)})
     with open(os.path.join(run_dir,"nextflow.config"), "w") as fh:
         fh.write(nfconf)
+    phase.lap("prepare")
 
     # === ключевая часть: локальный clone в кеш и запуск из локального пути ===
     cache_root = os.environ.get("NFCORE_CACHE", "/opt/nfcore_cache")
@@ -208,6 +356,8 @@ def run_nfcore_dna_seq(payload: NFCoreDNASeqIn = Body(...)):
             if rc2 != 0:
                 return JSONResponse(status_code=500, content={"run_id": run_id, "status":"Failed","error":"git checkout failed","stderr_tail": (err2 or err).splitlines()[-20:]})
 
+    phase.lap("pipeline_sync")
+
     # теперь запускаем pipeline ИЗ ЛОКАЛЬНОГО ПУТИ, а не по URL
     cmd = [
         "nextflow","run", pipeline_dir,
@@ -229,27 +379,52 @@ def run_nfcore_dna_seq(payload: NFCoreDNASeqIn = Body(...)):
     # игнорируем проверку "req > avail" — иначе даже stub-run может падать
     env["NXF_IGNORE_MAX_RESOURCES"] = "true"
 
-    try:
-        rc, stdout, stderr = _run(cmd, cwd=run_dir)
-    except subprocess.TimeoutExpired:
-        return JSONResponse(status_code=500, content={"run_id": run_id, "status":"Failed","error":"Timeout"})
+    staging = None
+    with ExitStack() as stack:
+        # референсы пинятся в кэше на время запуска и не вытесняются, пока Nextflow их читает
+        if payload.reference and not payload.stub_run:
+            try:
+                refs = stack.enter_context(get_ref_cache().stage([c.model_dump() for c in payload.reference]))
+            except Exception as e:
+                return JSONResponse(status_code=500, content={"run_id": run_id, "status":"Failed","error":f"reference staging failed: {e}"})
+            cmd.extend(_reference_args(refs))
+        phase.lap("reference_staging")
+        if payload.samples and not payload.stub_run:
+            samplesheet = os.path.join(run_dir, "samplesheet.csv")
+            try:
+                staging = stage_samples((x.model_dump() for x in payload.samples), run_dir, samplesheet)
+            except Exception as e:
+                return JSONResponse(status_code=500, content={"run_id": run_id, "status":"Failed","error":f"input staging failed: {e}"})
+            cmd.extend(["--input", samplesheet])
+        phase.lap("input_staging")
+        try:
+            rc, stdout, stderr = _run(cmd, cwd=run_dir)
+        except subprocess.TimeoutExpired:
+            return JSONResponse(status_code=500, content={"run_id": run_id, "status":"Failed","error":"Timeout"})
+        phase.lap("nextflow")
 
     status = "Succeeded" if rc == 0 else "Failed"
 
-    # загрузим артефакты в S3
-    s3 = s3client()
+    # загрузим артефакты в S3: логи — в <run_id>/logs/, выходы пайплайна — в <run_id>/<путь в outdir>
     key_prefix = f"{run_id}/logs/"
     artifacts = []
     for pth in [report, trace, timeline]:
         if os.path.exists(pth):
             key = key_prefix + os.path.basename(pth)
-            s3.upload_file(pth, S3_BUCKET_RUNS, key)
+            upload_file(pth, S3_BUCKET_RUNS, key)
             artifacts.append(f"s3://{S3_BUCKET_RUNS}/{key}")
+    if status == "Succeeded" and not payload.stub_run:   # в stub-run выходы — пустые заглушки
+        artifacts += _publish(outdir, f"{run_id}/")
+    phase.lap("upload")
 
     return {
         "run_id": run_id,
         "status": status,
         "artifacts": artifacts,
         "stdout_tail": stdout.splitlines()[-20:] if stdout else [],
-        "stderr_tail": stderr.splitlines()[-20:] if stderr else []
+        "stderr_tail": stderr.splitlines()[-20:] if stderr else [],
+        "staging": staging,
+        "nextflow_config": nfconf,
+        "compute": compute,
+        "timings": phase.done(),
     }
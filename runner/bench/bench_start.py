@@ -0,0 +1,202 @@
+"""Накладные расходы раннера на старт задачи: фазы /run/nfcore_dna_seq при растущей конкурентности.
+
+Запуск из каталога runner/ (общий S3-слой — PYTHONPATH=../shared):
+    python -m bench.bench_start --levels 1,2,4,8,16 --runs 16
+    python -m bench.bench_start --git-cache cold --nxf-startup 3 --nxf-run 0.5 --out /tmp/start.json
+
+nextflow и git подменяются фейковыми исполняемыми файлами в PATH (задержки, trace на N задач,
+отчёт заданного размера, артефакты в --outdir), S3 — локальный moto-сервер, WORK_DIR/NFCORE_CACHE —
+во временном каталоге. Раннер вызывается in-process (httpx.ASGITransport) и сам меряет фазы
+(поле timings ответа): prepare, pipeline_sync, reference_staging, input_staging, nextflow, upload.
+
+Старт задачи = всё до nextflow + старт JVM (--nxf-startup); очередь = ответ клиенту минус total раннера.
+Выход 1, если p95 старта на каком-либо уровне выше --slo-s (60 — SLO из README).
+"""
+import argparse, asyncio, json, logging, os, socket, sys, tempfile, textwrap, time
+
+SLO_START_S = 60.0
+PHASES = ["prepare", "pipeline_sync", "reference_staging", "input_staging", "nextflow", "upload"]
+START_PHASES = PHASES[:4]
+
+FAKE_NEXTFLOW = '''
+import os, sys, time
+args = sys.argv[1:]
+def opt(name):
+    return args[args.index(name) + 1] if name in args else None
+time.sleep(float(os.environ.get("BENCH_NXF_STARTUP", "0")))   # старт JVM
+time.sleep(float(os.environ.get("BENCH_NXF_RUN", "0")))
+tasks = int(os.environ.get("BENCH_NXF_TASKS", "50"))
+if opt("-with-trace"):
+    with open(opt("-with-trace"), "w") as fh:
+        fh.write("task_id\\thash\\tname\\tstatus\\texit\\trealtime\\n")
+        for i in range(1, tasks + 1):
+            fh.write(f"{i}\\tab/{i:06x}\\tNFCORE_SAREK:TASK_{i % 7} (S{i})\\tCOMPLETED\\t0\\t{i % 60}s\\n")
+if opt("-with-report"):
+    with open(opt("-with-report"), "w") as fh:
+        fh.write("<html>" + "x" * int(float(os.environ.get("BENCH_NXF_REPORT_KB", "512")) * 1024) + "</html>")
+if opt("-with-timeline"):
+    with open(opt("-with-timeline"), "w") as fh:
+        fh.write("<html>timeline</html>")
+if opt("--outdir"):
+    os.makedirs(os.path.join(opt("--outdir"), "pipeline_info"), exist_ok=True)
+    with open(os.path.join(opt("--outdir"), "pipeline_info", "params.json"), "w") as fh:
+        fh.write("{}")
+print("N E X T F L O W  ~  fake")
+sys.exit(int(os.environ.get("BENCH_NXF_EXIT", "0")))
+'''
+
+FAKE_GIT = '''
+import os, sys, time
+args = sys.argv[1:]
+if args[:1] == ["clone"]:
+    time.sleep(float(os.environ.get("BENCH_GIT_CLONE", "0")))
+    os.makedirs(os.path.join(args[-1], ".git"), exist_ok=True)
+    with open(os.path.join(args[-1], "main.nf"), "w") as fh:
+        fh.write("workflow {}\\n")
+elif args[:1] == ["fetch"]:
+    time.sleep(float(os.environ.get("BENCH_GIT_FETCH", "0")))
+elif args[:1] == ["checkout"]:
+    time.sleep(float(os.environ.get("BENCH_GIT_CHECKOUT", "0")))
+'''
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _pct(values: list[float], q: float) -> float:
+    # nearest-rank
+    if not values:
+        return 0.0
+    v = sorted(values)
+    return v[max(0, min(len(v) - 1, int(round(q / 100 * len(v) + 0.5)) - 1))]
+
+def _install_fakes(root: str, args) -> str:
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, body in (("nextflow", FAKE_NEXTFLOW), ("git", FAKE_GIT)):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as fh:
+            fh.write(f"#!{sys.executable}\n" + textwrap.dedent(body))
+        os.chmod(path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+    os.environ.update({
+        "BENCH_NXF_STARTUP": str(args.nxf_startup), "BENCH_NXF_RUN": str(args.nxf_run),
+        "BENCH_NXF_TASKS": str(args.tasks), "BENCH_NXF_REPORT_KB": str(args.report_kb),
+        "BENCH_GIT_CLONE": str(args.git_clone), "BENCH_GIT_FETCH": str(args.git_fetch),
+        "BENCH_GIT_CHECKOUT": str(args.git_checkout),
+    })
+    return bin_dir
+
+def _start_s3():
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    port = _free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    os.environ.update({"S3_ENDPOINT": f"http://127.0.0.1:{port}", "S3_ACCESS_KEY": "bench", "S3_SECRET_KEY": "bench",
+                       "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1")})
+    return server
+
+async def _level(client, concurrency: int, runs: int, cold: bool, tag: str) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    results, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        # cold: уникальная ревизия → отдельный каталог в NFCORE_CACHE → git clone на каждый запуск
+        body = {"revision": f"{tag}-{i}" if cold else "3.5.1", "stub_run": True}
+        async with sem:
+            t0 = time.perf_counter()
+            res = await client.post("/run/nfcore_dna_seq", json=body)
+            wall = time.perf_counter() - t0
+        out = res.json() if res.headers.get("content-type", "").startswith("application/json") else {}
+        if res.status_code != 200 or out.get("status") != "Succeeded":
+            errors += 1
+            return
+        results.append((wall, out["timings"]))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    elapsed = time.perf_counter() - t0
+
+    totals = [t["total"] for _, t in results]
+    phases = {p: [t.get(p, 0.0) for _, t in results] for p in PHASES}
+    sum_total = sum(totals) or 1.0
+    start = [sum(t.get(p, 0.0) for p in START_PHASES) for _, t in results]
+    return {
+        "concurrency": concurrency, "n": len(results), "errors": errors,
+        "throughput_rps": round(len(results) / elapsed, 3) if elapsed else 0.0,
+        "total_p50_s": round(_pct(totals, 50), 4), "total_p95_s": round(_pct(totals, 95), 4),
+        "queue_p95_s": round(_pct([max(0.0, w - t["total"]) for w, t in results], 95), 4),
+        "overhead_p95_s": round(_pct([t["total"] - t.get("nextflow", 0.0) for _, t in results], 95), 4),
+        "start_p95_s": round(_pct(start, 95), 4),
+        "phases": {p: {"mean_s": round(sum(v) / len(v), 4) if v else 0.0, "p95_s": round(_pct(v, 95), 4),
+                       "share": round(sum(v) / sum_total, 3)} for p, v in phases.items()},
+    }
+
+def _print(levels: list[dict], jvm_s: float, slo_s: float):
+    print(f"{'conc':>5} {'n':>5} {'err':>4} {'runs/s':>8} {'p50 s':>8} {'p95 s':>8} {'queue95':>8} {'start95':>8}  фазы (доля total)")
+    for lv in levels:
+        shares = " ".join(f"{p}={lv['phases'][p]['share']:.0%}" for p in PHASES)
+        print(f"{lv['concurrency']:>5} {lv['n']:>5} {lv['errors']:>4} {lv['throughput_rps']:>8.2f} {lv['total_p50_s']:>8.3f} "
+              f"{lv['total_p95_s']:>8.3f} {lv['queue_p95_s']:>8.3f} {lv['start_p95_s'] + jvm_s:>8.3f}  {shares}")
+    print(f"старт = фазы до nextflow + старт JVM ({jvm_s}s); SLO {slo_s}s")
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--levels", default="1,2,4,8", help="уровни конкурентности через запятую")
+    ap.add_argument("--runs", type=int, default=16, help="запусков на уровень")
+    ap.add_argument("--git-cache", choices=["warm", "cold"], default="warm")
+    ap.add_argument("--nxf-startup", type=float, default=0.5, help="имитация старта JVM, с")
+    ap.add_argument("--nxf-run", type=float, default=0.2, help="имитация работы пайплайна, с")
+    ap.add_argument("--tasks", type=int, default=200, help="строк в trace.txt")
+    ap.add_argument("--report-kb", type=float, default=512)
+    ap.add_argument("--git-clone", type=float, default=1.0)
+    ap.add_argument("--git-fetch", type=float, default=0.3)
+    ap.add_argument("--git-checkout", type=float, default=0.05)
+    ap.add_argument("--slo-s", type=float, default=SLO_START_S)
+    ap.add_argument("--out", help="JSON с результатами")
+    args = ap.parse_args(argv)
+
+    root = tempfile.mkdtemp(prefix="bench-runner-")
+    _install_fakes(root, args)
+    os.environ["WORK_DIR"] = os.path.join(root, "nfwork")
+    os.environ["NFCORE_CACHE"] = os.path.join(root, "nfcore_cache")
+    server = _start_s3()
+    try:
+        import httpx
+        import app as runner
+        from s3client import ensure_bucket
+
+        os.makedirs(runner.BASE_RUN_DIR, exist_ok=True)
+        ensure_bucket()
+
+        async def drive():
+            transport = httpx.ASGITransport(app=runner.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://runner", timeout=None) as client:
+                if args.git_cache == "warm":
+                    await _level(client, 1, 1, False, "warmup")   # клон в кэш до замеров
+                levels = []
+                for i, c in enumerate(int(x) for x in args.levels.split(",")):
+                    levels.append(await _level(client, c, args.runs, args.git_cache == "cold", f"l{i}"))
+                return levels
+
+        levels = asyncio.run(drive())
+    finally:
+        server.stop()
+
+    _print(levels, args.nxf_startup, args.slo_s)
+    result = {"config": {k: v for k, v in vars(args).items() if k != "out"}, "levels": levels}
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(result, fh, indent=2)
+    bad = [lv["concurrency"] for lv in levels if lv["errors"] or lv["start_p95_s"] + args.nxf_startup > args.slo_s]
+    if bad:
+        print(f"FAIL: ошибки или старт выше SLO на уровнях {bad}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
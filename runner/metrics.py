@@ -0,0 +1,114 @@
+import os, shutil, threading, time
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, SummaryMetricFamily
+
+from s3client import stats as s3_stats
+
+# Prometheus-метрики раннера. На запрос — один observe(); S3 и диск читаются только в момент scrape.
+_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 7200)
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Время обработки запроса",
+                         ["method", "route", "status"], buckets=_BUCKETS)
+RUN_PHASE = Histogram("runner_run_phase_seconds", "Длительность фаз запуска (timings ответа)",
+                      ["phase"], buckets=_BUCKETS)
+
+_lock = threading.Lock()
+_inflight = 0                       # запуски, принятые раннером
+_procs: dict[str, int] = {}         # активные подпроцессы: nextflow / git
+
+@contextmanager
+def run_inflight():
+    global _inflight
+    with _lock:
+        _inflight += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _inflight -= 1
+
+@contextmanager
+def subprocess_active(cmd: str):
+    with _lock:
+        _procs[cmd] = _procs.get(cmd, 0) + 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _procs[cmd] -= 1
+
+def observe_phases(timings: dict):
+    for phase, seconds in timings.items():
+        RUN_PHASE.labels(phase).observe(seconds)
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность по шаблону маршрута."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        t0 = time.perf_counter()
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            HTTP_LATENCY.labels(scope["method"], route, str(status)).observe(time.perf_counter() - t0)
+
+class _SnapshotCollector:
+    """Очередь, подпроцессы, S3 и диск рабочего каталога — на момент scrape."""
+    def __init__(self, work_dir: str):
+        self.work_dir = work_dir
+
+    def collect(self):
+        with _lock:
+            inflight, procs = _inflight, dict(_procs)
+        g = GaugeMetricFamily("runner_runs_inflight", "Запуски в работе (от приёма до загрузки артефактов)")
+        g.add_metric([], inflight)
+        yield g
+        g = GaugeMetricFamily("runner_queue_depth", "Принятые запуски, ещё не запустившие nextflow")
+        g.add_metric([], max(0, inflight - procs.get("nextflow", 0)))
+        yield g
+        g = GaugeMetricFamily("runner_subprocesses_active", "Активные подпроцессы", labels=["cmd"])
+        for cmd in ("nextflow", "git"):
+            g.add_metric([cmd], procs.get(cmd, 0))
+        yield g
+
+        snap = s3_stats.snapshot()
+        ops = SummaryMetricFamily("s3_operation_seconds", "Вызовы S3 API", labels=["op"])
+        errors = CounterMetricFamily("s3_operation_errors", "Ошибки вызовов S3 API", labels=["op"])
+        for op, o in snap["ops"].items():
+            ops.add_metric([op], o["count"], o["seconds"])
+            errors.add_metric([op], o["errors"])
+        nbytes = CounterMetricFamily("s3_transfer_bytes", "Байты upload/download", labels=["kind"])
+        tsecs = SummaryMetricFamily("s3_transfer_seconds", "Трансферы upload/download", labels=["kind"])
+        for kind, t in snap["transfers"].items():
+            nbytes.add_metric([kind], t["bytes"])
+            tsecs.add_metric([kind], t["count"], t["seconds"])
+        yield from (ops, errors, nbytes, tsecs)
+
+        # statvfs — O(1), без обхода дерева work/
+        if os.path.isdir(self.work_dir):
+            du = shutil.disk_usage(self.work_dir)
+            g = GaugeMetricFamily("runner_workdir_bytes", "Диск рабочего каталога", labels=["kind"])
+            for kind in ("total", "used", "free"):
+                g.add_metric([kind], getattr(du, kind))
+            yield g
+            g = GaugeMetricFamily("runner_workdir_runs", "Каталогов запусков в рабочем каталоге")
+            with os.scandir(self.work_dir) as it:
+                g.add_metric([], sum(1 for e in it if e.is_dir()))
+            yield g
+
+def register(work_dir: str):
+    REGISTRY.register(_SnapshotCollector(work_dir))
@@ -0,0 +1,128 @@
+import math, os, re, shutil
+from functools import lru_cache
+
+# Профили вычислений (имя = Run.compute_profile): ресурсы хоста определяются по cgroup/ОС, делятся между
+# слотами раннера, и из них рендерится nextflow.config — лимиты executor'а, resourceLimits процессов,
+# process.scratch на локальном NVMe и опции Docker. Поля профиля переопределяются на запуск (overrides).
+RUNNER_SLOTS = int(os.environ.get("RUNNER_SLOTS", "2"))                  # одновременных запусков на узле
+RESERVE_CPUS = int(os.environ.get("PROFILE_RESERVE_CPUS", "1"))          # под раннер, docker, ОС
+RESERVE_MEMORY_GB = float(os.environ.get("PROFILE_RESERVE_MEMORY_GB", "2"))
+SCRATCH_DIR = os.environ.get("RUNNER_SCRATCH_DIR", "")                   # NVMe, тот же путь виден docker-демону
+SCRATCH_MIN_FREE_GB = float(os.environ.get("RUNNER_SCRATCH_MIN_FREE_GB", "50"))
+DEFAULT_MAX_TIME = os.environ.get("PROFILE_MAX_TIME", "48.h")
+
+GB = 1024 ** 3
+
+# share — доля хоста на запуск: "slot" = 1 / RUNNER_SLOTS, число — явная доля;
+# docker_run_options — только в профиле (задаёт оператор узла), на запуск не переопределяется
+PROFILES: dict[str, dict] = {
+    "local-docker": {"executor": "local", "share": "slot", "docker": True, "scratch": True},
+    "local-docker-exclusive": {"executor": "local", "share": 1.0, "docker": True, "scratch": True},
+    "local-docker-small": {"executor": "local", "share": "slot", "docker": True, "scratch": False,
+                           "cpus": 2, "memory_gb": 6},
+}
+
+# что можно переопределить на запуск: ресурсы, но не опции docker (--privileged, -v /:/host …)
+OVERRIDABLE = {"cpus", "memory_gb", "queue_size", "max_time", "scratch"}
+_DURATION = re.compile(r"^\d+\.(s|m|h|d)$")   # вставляется в конфиг как Groovy-литерал, без кавычек
+
+class ProfileError(ValueError):
+    pass
+
+def _cgroup_cpus() -> float | None:
+    try:
+        quota, period = open("/sys/fs/cgroup/cpu.max").read().split()
+        return int(quota) / int(period) if quota != "max" else None
+    except (OSError, ValueError):
+        return None
+
+def _cgroup_memory() -> int | None:
+    try:
+        v = open("/sys/fs/cgroup/memory.max").read().strip()
+        return int(v) if v != "max" else None
+    except (OSError, ValueError):
+        return None
+
+@lru_cache(maxsize=1)
+def host() -> dict:
+    """CPU и память, доступные процессу (лимиты контейнера учитываются); на время жизни процесса."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    quota = _cgroup_cpus()
+    if quota:
+        cpus = min(cpus, max(1, math.floor(quota)))
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    limit = _cgroup_memory()
+    if limit:
+        memory = min(memory, limit)
+    return {"cpus": cpus, "memory_bytes": memory}
+
+def scratch() -> dict | None:
+    """Локальный scratch: каталог задач Nextflow переносится туда, в work/ копируются только выходы."""
+    if not SCRATCH_DIR or not os.path.isdir(SCRATCH_DIR):
+        return None
+    free = shutil.disk_usage(SCRATCH_DIR).free
+    if free < SCRATCH_MIN_FREE_GB * GB:
+        return None   # забитый NVMe хуже сетевого work/: задачи падают по ENOSPC
+    return {"dir": SCRATCH_DIR, "free_bytes": free}
+
+def resolve(name: str, overrides: dict | None = None, slots: int | None = None) -> dict:
+    """Итоговые ресурсы запуска: профиль + доля хоста + overrides, ограниченные хостом."""
+    if name not in PROFILES:
+        raise ProfileError(f"Unknown compute profile: {name}")
+    overrides = {k: v for k, v in (overrides or {}).items() if v is not None}
+    if set(overrides) - OVERRIDABLE:
+        raise ProfileError(f"Not overridable per run: {', '.join(sorted(set(overrides) - OVERRIDABLE))}")
+    spec = {**PROFILES[name], **overrides}
+    max_time = str(spec.get("max_time") or DEFAULT_MAX_TIME)
+    if not _DURATION.match(max_time):
+        raise ProfileError(f"Bad max_time: {max_time} (expected e.g. 12.h)")
+    h = host()
+    avail_cpus = max(1, h["cpus"] - RESERVE_CPUS)
+    avail_mem_gb = max(1.0, h["memory_bytes"] / GB - RESERVE_MEMORY_GB)
+    share = 1 / max(1, slots or RUNNER_SLOTS) if spec["share"] == "slot" else float(spec["share"])
+    cpus = min(int(spec.get("cpus") or max(1, math.floor(avail_cpus * share))), avail_cpus)
+    memory_gb = min(float(spec.get("memory_gb") or avail_mem_gb * share), avail_mem_gb)
+    memory_gb = max(1, math.floor(memory_gb))
+    sc = scratch() if spec.get("scratch") else None
+    return {
+        "profile": name, "executor": spec["executor"], "cpus": cpus, "memory_gb": memory_gb,
+        "queue_size": int(spec.get("queue_size") or cpus),
+        "max_time": max_time,
+        "scratch": sc["dir"] if sc else None, "docker": bool(spec.get("docker")),
+        "docker_run_options": spec.get("docker_run_options") or "",
+        "host": {"cpus": h["cpus"], "memory_gb": round(h["memory_bytes"] / GB, 1),
+                 "scratch_free_gb": round(sc["free_bytes"] / GB, 1) if sc else None},
+    }
+
+def _q(v: str) -> str:
+    return "'" + str(v).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+def render(res: dict, work_dir: str, docker_user: str | None = "0:0") -> str:
+    """nextflow.config по resolve(): executor ограничен долей хоста, задачи — resourceLimits (Nextflow ≥ 24.04)."""
+    lines = [
+        f"// compute profile: {res['profile']} (host {res['host']['cpus']} cpu / {res['host']['memory_gb']} GB)",
+        f"workDir = {_q(work_dir)}",
+        "",
+        "executor {",
+        f"    name = {_q(res['executor'])}",
+        f"    cpus = {res['cpus']}",
+        f"    memory = {_q(str(res['memory_gb']) + ' GB')}",
+        f"    queueSize = {res['queue_size']}",
+        "}",
+        "",
+        "process {",
+        f"    executor = {_q(res['executor'])}",
+        f"    resourceLimits = [cpus: {res['cpus']}, memory: {res['memory_gb']}.GB, time: {res['max_time']}]",
+        f"    scratch = {_q(res['scratch']) if res['scratch'] else 'false'}",
+        "}",
+    ]
+    if res["docker"]:
+        opts = " ".join(o for o in (f"-u {docker_user}" if docker_user else "", res["docker_run_options"]) if o)
+        lines += [
+            "",
+            "docker {",
+            "    enabled = true",
+            f"    runOptions = {_q(opts)}",
+            "}",
+        ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,297 @@
+import os, json, time, uuid, fcntl, shutil, hashlib, threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import botocore
+from boto3.s3.transfer import TransferConfig
+
+from s3client import client as s3client, download_file, split_uri, MB
+
+# Локальный кэш компонентов Reference Set (FASTA/FAI/DICT/BWA_INDEX/VEP_CACHE) на NVMe.
+# Каждая версия компонента качается один раз, хранится read-only и разделяется между запусками.
+REF_CACHE_DIR = os.environ.get("REF_CACHE_DIR", "/refcache")
+REF_CACHE_BUDGET_GB = float(os.environ.get("REF_CACHE_BUDGET_GB", "500"))
+REF_CACHE_FILE_WORKERS = int(os.environ.get("REF_CACHE_FILE_WORKERS", "4"))  # файлов параллельно (префиксы)
+
+# крупные объекты (BWA .bwt/.sa, FASTA) — параллельными ranged GET по 128 МБ
+REF_TRANSFER = TransferConfig(
+    multipart_threshold=int(os.environ.get("REF_CACHE_PART_MB", "128")) * MB,
+    multipart_chunksize=int(os.environ.get("REF_CACHE_PART_MB", "128")) * MB,
+    max_concurrency=int(os.environ.get("REF_CACHE_CONCURRENCY", "16")),
+    use_threads=True,
+)
+
+META = ".meta.json"
+
+class RefCacheError(RuntimeError):
+    pass
+
+def md5_file(path: str, bufsize: int = 8 * MB) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(bufsize)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def _make_writable(path: str):
+    for dirpath, _, files in os.walk(path):
+        os.chmod(dirpath, 0o755)
+        for f in files:
+            os.chmod(os.path.join(dirpath, f), 0o644)
+
+def _make_readonly(path: str):
+    for dirpath, _, files in os.walk(path, topdown=False):
+        for f in files:
+            os.chmod(os.path.join(dirpath, f), 0o444)
+        os.chmod(dirpath, 0o555)
+
+class ReferenceCache:
+    def __init__(self, root: str = REF_CACHE_DIR, budget_bytes: int | None = None):
+        self.root = root
+        self.budget = budget_bytes if budget_bytes is not None else int(REF_CACHE_BUDGET_GB * 1024 ** 3)
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._pins: Counter = Counter()
+        self._pin_fds: dict[str, int] = {}   # key → fd .locks/<key>.pin под LOCK_SH, пока запись запинена
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(root, ".locks"), exist_ok=True)
+
+    # --- удалённая сторона ---
+    @staticmethod
+    def _list(s3, bucket: str, prefix: str) -> list:
+        objs = []
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            objs.extend((o["Key"], o["Size"], o["ETag"].strip('"')) for o in page.get("Contents", []))
+        return objs
+
+    @staticmethod
+    def _resolve(uri: str):
+        """uri → (bucket, parent, name, [(key, size, etag)]). Префикс (BWA-индекс, VEP cache) → все объекты под ним."""
+        bucket, key = split_uri(uri)
+        s3 = s3client()
+        try:
+            h = s3.head_object(Bucket=bucket, Key=key)
+            objs = [(key, h["ContentLength"], h["ETag"].strip('"'))]
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                raise
+            # каталог (…/bwa/) — с "/" на конце: иначе захватываются соседние bwamem2/, bwa.old/;
+            # нет каталога — индекс как базовое имя файлов (…/GRCh38 → GRCh38.amb, GRCh38.bwt) рядом с ним
+            base = key.rstrip("/")
+            objs = ReferenceCache._list(s3, bucket, base + "/")
+            if not objs:
+                objs = [o for o in ReferenceCache._list(s3, bucket, base)
+                        if o[0][len(base):].startswith(".") and "/" not in o[0][len(base):]]
+            if not objs:
+                raise RefCacheError(f"Reference component not found: {uri}")
+        base = key.rstrip("/")
+        return bucket, os.path.dirname(base), os.path.basename(base), objs
+
+    @staticmethod
+    def _entry_key(uri: str, objs) -> str:
+        # версия компонента = uri + (key, size, etag) всех объектов: изменился объект → новая запись
+        h = hashlib.sha256(uri.encode())
+        for k, size, etag in sorted(objs):
+            h.update(f"{k}\0{size}\0{etag}\n".encode())
+        return h.hexdigest()[:24]
+
+    # --- локальная сторона ---
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _complete(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self._entry(key), META))
+
+    def _touch(self, key: str):
+        # mtime .meta.json = время последнего использования (для LRU)
+        try:
+            os.utime(os.path.join(self._entry(key), META))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        out = []
+        for name in os.listdir(self.root):
+            if name.startswith("."):
+                continue
+            meta = os.path.join(self.root, name, META)
+            try:
+                st = os.stat(meta)
+                with open(meta) as fh:
+                    size = json.load(fh).get("size", 0)
+            except (FileNotFoundError, ValueError):
+                continue
+            out.append((st.st_mtime, name, size))
+        return out
+
+    def _pin_path(self, key: str) -> str:
+        return os.path.join(self.root, ".locks", f"{key}.pin")
+
+    def _evict(self, key: str) -> bool:
+        # проверка пина и rename — под одним локом: acquire() не получит путь к удаляемой записи;
+        # пины других процессов/контейнеров на том же REF_CACHE_DIR — shared flock на .pin
+        trash = os.path.join(self.root, f".trash-{key}-{uuid.uuid4().hex[:6]}")
+        with self._lock:
+            if self._pins[key] > 0:
+                return False
+            fd = os.open(self._pin_path(key), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False   # запись читает другой процесс
+                os.rename(self._entry(key), trash)
+            finally:
+                os.close(fd)
+        _make_writable(trash)
+        shutil.rmtree(trash, ignore_errors=True)
+        return True
+
+    def _make_room(self, need: int, keep: str):
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        if total + need <= self.budget:
+            return
+        for _, name, size in sorted(entries):
+            if name == keep or not self._evict(name):
+                continue
+            total -= size
+            if total + need <= self.budget:
+                return
+        raise RefCacheError(
+            f"Reference cache budget exceeded: need {need} B, used {total} B of {self.budget} B (pinned entries)"
+        )
+
+    @staticmethod
+    def _verify(path: str, objs, md5: str | None):
+        if len(objs) != 1:
+            return
+        etag = objs[0][2]
+        expected = (md5 or "").lower() or (etag if "-" not in etag else None)
+        if expected and md5_file(path) != expected:
+            raise RefCacheError(f"MD5 mismatch for {objs[0][0]}: expected {expected}")
+
+    def _materialize(self, key: str, uri: str, bucket: str, parent: str, name: str, objs, md5: str | None):
+        lock_path = os.path.join(self.root, ".locks", f"{key}.lock")
+        with open(lock_path, "w") as lf:
+            # межпроцессный single-flight: второй процесс дождётся и увидит готовую запись
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            if self._complete(key):
+                return
+            size = sum(s for _, s, _ in objs)
+            self._make_room(size, keep=key)
+            tmp = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex[:6]}")
+            try:
+                def fetch(obj):
+                    okey = obj[0]
+                    rel = okey[len(parent) + 1:] if parent else okey
+                    dest = os.path.join(tmp, rel)
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    download_file(bucket, okey, dest, config=REF_TRANSFER)
+                    return dest
+
+                with ThreadPoolExecutor(max_workers=REF_CACHE_FILE_WORKERS) as pool:
+                    paths = list(pool.map(fetch, objs))
+                self._verify(paths[0], objs, md5)
+                with open(os.path.join(tmp, META), "w") as fh:
+                    json.dump({"uri": uri, "name": name, "size": size, "objects": len(objs),
+                               "created": time.time()}, fh)
+                _make_readonly(tmp)
+                os.rename(tmp, self._entry(key))
+            except BaseException:
+                if os.path.exists(tmp):
+                    _make_writable(tmp)
+                    shutil.rmtree(tmp, ignore_errors=True)
+                raise
+
+    def acquire(self, component: dict) -> tuple[str, str]:
+        """Возвращает (entry_key, локальный путь) и пинит запись от вытеснения до release()."""
+        uri = component["uri"]
+        bucket, parent, name, objs = self._resolve(uri)
+        key = self._entry_key(uri, objs)
+        with self._lock:
+            self._pins[key] += 1
+            if key not in self._pin_fds:
+                # первый пин в процессе: shared flock держится до последнего release()
+                fd = os.open(self._pin_path(key), os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                self._pin_fds[key] = fd
+            fut = self._inflight.get(key)
+            owner = fut is None and not self._complete(key)
+            if owner:
+                fut = self._inflight[key] = Future()
+        try:
+            if owner:
+                self.misses += 1
+                try:
+                    self._materialize(key, uri, bucket, parent, name, objs, component.get("md5"))
+                    fut.set_result(key)
+                except BaseException as e:
+                    fut.set_exception(e)
+                    raise
+                finally:
+                    with self._lock:
+                        self._inflight.pop(key, None)
+            elif fut is not None:
+                fut.result()  # single-flight: ждём того, кто уже качает
+            else:
+                self.hits += 1
+        except BaseException:
+            self.release(key)
+            raise
+        self._touch(key)
+        return key, os.path.join(self._entry(key), name)
+
+    def release(self, key: str):
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key] <= 0:
+                del self._pins[key]
+                fd = self._pin_fds.pop(key, None)
+                if fd is not None:
+                    os.close(fd)   # снимает LOCK_SH
+
+    @contextmanager
+    def stage(self, components: list[dict]):
+        """Материализует компоненты параллельно; отдаёт {role: path}, по выходу снимает пины."""
+        keys: list[str] = []
+        with ThreadPoolExecutor(max_workers=max(1, len(components))) as pool:
+            futures = [(c["role"], pool.submit(self.acquire, c)) for c in components]
+            paths, error = {}, None
+            for role, f in futures:
+                try:
+                    key, path = f.result()
+                    keys.append(key)
+                    paths[role] = path
+                except Exception as e:
+                    error = error or e
+        try:
+            if error:
+                raise error
+            yield paths
+        finally:
+            for k in keys:
+                self.release(k)
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        with self._lock:
+            pinned = len(self._pins)
+        return {"entries": len(entries), "bytes": sum(s for _, _, s in entries), "budget": self.budget,
+                "pinned": pinned, "hits": self.hits, "misses": self.misses}
+
+_cache: ReferenceCache | None = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> ReferenceCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ReferenceCache()
+    return _cache
@@ -1,21 +1,11 @@
-import os, boto3, botocore
+import os
 
-S3_ENDPOINT = os.environ.get("S3_ENDPOINT", "http://minio:9000")
-S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY", "miniokey")
-S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY", "miniopass")
-S3_BUCKET_RUNS = os.environ.get("S3_BUCKET_RUNS", "runs")
+import s3core
+from s3core import (  # noqa: F401 — общий S3-слой (shared/s3core.py), реэкспорт для модулей раннера
+    MB, S3_ENDPOINT, client, download_file, split_uri, stats, transfer_config, upload_file,
+)
 
-def client():
-    return boto3.client(
-        "s3",
-        endpoint_url=S3_ENDPOINT,
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY,
-    )
+S3_BUCKET_RUNS = os.environ.get("S3_BUCKET_RUNS", "runs")
 
-def ensure_bucket():
-    s3 = client()
-    try:
-        s3.head_bucket(Bucket=S3_BUCKET_RUNS)
-    except botocore.exceptions.ClientError:
-        s3.create_bucket(Bucket=S3_BUCKET_RUNS)
+def ensure_bucket(bucket: str = S3_BUCKET_RUNS, force: bool = False):
+    s3core.ensure_bucket(bucket, force)
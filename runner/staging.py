@@ -0,0 +1,151 @@
+import os, csv, time, fcntl, shutil, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable
+
+import botocore
+from boto3.s3.transfer import TransferConfig
+
+from s3client import client as s3client, download_file, split_uri, MB
+from refcache import md5_file
+
+# Стейджинг входных FASTQ из S3 и генерация nf-core samplesheet.
+# Файлы качаются один раз в общий STAGE_DIR (ключ = s3 bucket/key) и хардлинкаются в run_dir/inputs,
+# поэтому повторные и клонированные запуски пропускают уже скачанные файлы с совпадающей контрольной суммой.
+STAGE_DIR = os.environ.get("STAGE_DIR", os.path.join(os.environ.get("WORK_DIR", "/nfwork"), ".staged"))
+STAGE_WORKERS = int(os.environ.get("STAGE_WORKERS", "16"))
+
+# на файл — до 4 параллельных ranged GET: STAGE_WORKERS × 4 ≤ S3_MAX_POOL_CONNECTIONS
+STAGE_TRANSFER = TransferConfig(
+    multipart_threshold=int(os.environ.get("STAGE_PART_MB", "32")) * MB,
+    multipart_chunksize=int(os.environ.get("STAGE_PART_MB", "32")) * MB,
+    max_concurrency=int(os.environ.get("STAGE_FILE_CONCURRENCY", "4")),
+    use_threads=True,
+)
+
+SAREK_COLUMNS = ["patient", "sample", "lane", "fastq_1", "fastq_2"]
+
+class StagingError(RuntimeError):
+    pass
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.staged = self.skipped = self.bytes = 0
+
+    def add(self, skipped: bool, nbytes: int):
+        with self._lock:
+            if skipped:
+                self.skipped += 1
+            else:
+                self.staged += 1
+                self.bytes += nbytes
+
+def _read_sidecar(path: str) -> dict | None:
+    try:
+        with open(path + ".stage") as fh:
+            md5, size, etag = fh.read().split()
+        return {"md5": md5, "size": int(size), "etag": etag}
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_sidecar(path: str, md5: str, size: int, etag: str):
+    tmp = path + ".stage.tmp"
+    with open(tmp, "w") as fh:
+        fh.write(f"{md5} {size} {etag or '-'}\n")
+    os.replace(tmp, path + ".stage")
+
+def _fresh(cached: dict | None, md5: str | None, head: dict | None) -> bool:
+    if not cached:
+        return False
+    if md5:
+        return cached["md5"] == md5
+    return head is not None and cached["size"] == head["size"] and cached["etag"] == head["etag"]
+
+def stage_file(uri: str, md5: str | None = None, counters: _Counters | None = None) -> str:
+    """Скачивает объект в STAGE_DIR (если ещё нет с той же md5/etag) и возвращает локальный путь."""
+    bucket, key = split_uri(uri)
+    dest = os.path.join(STAGE_DIR, bucket, key)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    md5 = (md5 or "").lower() or None
+    with open(dest + ".lock", "w") as lf:
+        fcntl.flock(lf, fcntl.LOCK_EX)  # один и тот же FASTQ из параллельных запусков качается один раз
+        head = None
+        if not md5:
+            try:
+                h = s3client().head_object(Bucket=bucket, Key=key)
+            except botocore.exceptions.ClientError as e:
+                raise StagingError(f"Input not found: {uri} ({e})")
+            head = {"size": h["ContentLength"], "etag": h["ETag"].strip('"')}
+        cached = _read_sidecar(dest) if os.path.exists(dest) else None
+        if _fresh(cached, md5, head):
+            if counters:
+                counters.add(True, 0)
+            return dest
+        tmp = dest + ".part"
+        try:
+            download_file(bucket, key, tmp, config=STAGE_TRANSFER)
+        except botocore.exceptions.ClientError as e:
+            raise StagingError(f"Download failed: {uri} ({e})")
+        actual = md5_file(tmp)
+        if md5 and actual != md5:
+            os.remove(tmp)
+            raise StagingError(f"MD5 mismatch for {uri}: expected {md5}, got {actual}")
+        os.replace(tmp, dest)
+        size = os.path.getsize(dest)
+        _write_sidecar(dest, actual, size, head["etag"] if head else "-")
+        if counters:
+            counters.add(False, size)
+        return dest
+
+def _link_into(src: str, dst: str):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)       # тот же том WORK_DIR → без копирования
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def stage_samples(samples: Iterable[dict], run_dir: str, samplesheet: str, workers: int = STAGE_WORKERS) -> dict:
+    """Стейджит R1/R2 всех сэмплов ограниченным пулом и пишет sarek samplesheet.
+
+    samples — итерируемое {sample, patient?, lane?, fastq_1, fastq_2, md5_1?, md5_2?}; читается лениво,
+    в полёте не больше 2×workers файлов, так что тысячи сэмплов не держатся в памяти.
+    """
+    t0 = time.perf_counter()
+    counters = _Counters()
+    inputs = os.path.join(run_dir, "inputs")
+    max_inflight = workers * 2
+
+    def one(uri: str, md5: str | None, local: str):
+        _link_into(stage_file(uri, md5, counters), local)
+
+    n = 0
+    with open(samplesheet, "w", newline="") as fh, ThreadPoolExecutor(max_workers=workers) as pool:
+        w = csv.writer(fh)
+        w.writerow(SAREK_COLUMNS)
+        pending = set()
+        for s in samples:
+            name = s["sample"]
+            row = [s.get("patient") or name, name, s.get("lane") or "lane_1"]
+            for i in (1, 2):
+                uri = s[f"fastq_{i}"]
+                local = os.path.join(inputs, name, os.path.basename(split_uri(uri)[1]))
+                row.append(local)
+                pending.add(pool.submit(one, uri, s.get(f"md5_{i}"), local))
+            w.writerow(row)
+            n += 1
+            while len(pending) >= max_inflight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    f.result()
+        for f in pending:
+            f.result()
+
+    return {
+        "samples": n,
+        "staged": counters.staged,
+        "skipped": counters.skipped,
+        "bytes": counters.bytes,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
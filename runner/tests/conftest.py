@@ -0,0 +1,18 @@
+import os, sys, pathlib
+import pytest
+
+# S3 — moto in-process; раннер видит его через тот же boto3-клиент
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["S3_ENDPOINT"] = ""
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "shared"))   # s3core (в образе — рядом с app.py)
+
+from moto import mock_aws  # noqa: E402
+import s3core  # noqa: E402
+
+@pytest.fixture()
+def s3():
+    with mock_aws():
+        s3core.reset()
+        yield s3core.client()
+        s3core.reset()
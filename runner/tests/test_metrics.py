@@ -0,0 +1,35 @@
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+import app as runner
+import metrics
+
+def test_metrics_endpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "_inflight", 0)
+    client = TestClient(runner.app)
+    assert client.get("/healthz").json() == {"status": "ok"}
+    metrics.observe_phases({"prepare": 0.01, "total": 0.5})
+    with metrics.run_inflight(), metrics.subprocess_active("git"):
+        text = client.get("/metrics").text
+    m = {(s.name, tuple(s.labels.values())): s.value for f in text_string_to_metric_families(text) for s in f.samples}
+    assert m[("runner_runs_inflight", ())] == 1 and m[("runner_queue_depth", ())] == 1
+    assert m[("runner_subprocesses_active", ("git",))] == 1
+    assert m[("runner_run_phase_seconds_count", ("total",))] >= 1
+    assert m[("http_request_duration_seconds_count", ("GET", "/healthz", "200"))] >= 1
+
+def test_s3_connection_error_counted(monkeypatch):
+    import socket
+    import botocore.exceptions
+    import pytest
+    import s3core
+
+    with socket.socket() as sock:   # свободный порт, на котором никто не слушает
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(s3core, "S3_ENDPOINT", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(s3core, "S3_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(s3core, "S3_CONNECT_TIMEOUT", 1)
+    before = s3core.stats.snapshot()["ops"].get("HeadBucket", {}).get("errors", 0)
+    with pytest.raises(botocore.exceptions.EndpointConnectionError):
+        s3core.build().head_bucket(Bucket="runs")
+    assert s3core.stats.snapshot()["ops"]["HeadBucket"]["errors"] == before + 1
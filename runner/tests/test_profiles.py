@@ -0,0 +1,55 @@
+import pytest
+
+import app as runner
+import profiles
+
+GB = 1024 ** 3
+
+@pytest.fixture
+def host32(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiles, "host", lambda: {"cpus": 32, "memory_bytes": 128 * GB})
+    monkeypatch.setattr(profiles, "SCRATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(profiles, "SCRATCH_MIN_FREE_GB", 0)
+    return tmp_path
+
+def test_profile_scales_to_host(host32):
+    res = profiles.resolve("local-docker", slots=2)
+    assert (res["cpus"], res["memory_gb"], res["queue_size"]) == (15, 63, 15)   # (32 - 1) / 2, (128 - 2) / 2
+    assert res["scratch"] == str(host32)
+    assert profiles.resolve("local-docker-exclusive")["cpus"] == 31
+
+    conf = profiles.render(res, "/nfwork/run_1/work", "0:0")
+    assert "cpus = 15" in conf and "queueSize = 15" in conf and "memory = '63 GB'" in conf
+    assert "resourceLimits = [cpus: 15, memory: 63.GB, time: 48.h]" in conf
+    assert f"scratch = '{host32}'" in conf and "runOptions = '-u 0:0'" in conf
+
+def test_overrides_clamped_and_validated(host32, monkeypatch):
+    res = profiles.resolve("local-docker", {"cpus": 64, "memory_gb": 4, "scratch": False, "queue_size": None})
+    assert (res["cpus"], res["memory_gb"], res["queue_size"]) == (31, 4, 31)
+    assert "scratch = false" in profiles.render(res, "/w")
+    with pytest.raises(profiles.ProfileError):
+        profiles.resolve("slurm")
+
+    # устаревшие max_* запроса sarek → overrides; неизвестный профиль → Failed без запуска nextflow
+    legacy = runner.NFCoreDNASeqIn(max_cpus=4, max_memory="8.GB", compute_overrides={"max_time": "6.h"})
+    res, conf = runner._compute(legacy, "/w", "0:0", {"cpus": legacy.max_cpus,
+                                                       "memory_gb": runner._memory_gb(legacy.max_memory)})
+    assert (res["cpus"], res["memory_gb"], res["max_time"]) == (4, 8, "6.h")
+    monkeypatch.setattr(runner, "BASE_RUN_DIR", str(host32 / "work"))
+    out = runner.run_container_smoke(runner.ComputeIn(compute_profile="slurm"))
+    assert out.status_code == 422
+
+def test_unsafe_values_rejected(host32, monkeypatch):
+    # опции docker на запуск не переопределяются; max_time попадает в конфиг без кавычек
+    with pytest.raises(profiles.ProfileError):
+        profiles.resolve("local-docker", {"docker_run_options": "--privileged -v /:/host"})
+    for bad in ("2.h]\nprocess.containerOptions = '--privileged'", "forever"):
+        with pytest.raises(profiles.ProfileError):
+            profiles.resolve("local-docker", {"max_time": bad})
+    monkeypatch.setattr(runner, "BASE_RUN_DIR", str(host32 / "work"))
+    out = runner.run_nfcore_dna_seq(runner.NFCoreDNASeqIn(max_time="1.h] //"))
+    assert out.status_code == 422 and "max_time" in out.body.decode()
+    with pytest.raises(ValueError):
+        runner.ComputeIn(compute_overrides={"docker_run_options": "--pid=host"})
+    with pytest.raises(ValueError):
+        runner.NFCoreDNASeqIn(docker_user="0:0 --privileged")
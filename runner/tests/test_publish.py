@@ -0,0 +1,39 @@
+import os
+
+import app as runner
+
+OUTPUTS = {
+    "variant_calling/haplotypecaller/S1/S1.haplotypecaller.filtered.vcf.gz": b"vcf",
+    "variant_calling/haplotypecaller/S1/S1.haplotypecaller.filtered.vcf.gz.tbi": b"tbi",
+    "reports/mosdepth/S1/S1.md.mosdepth.summary.txt": b"chrom\tlength\tbases\tmean\tmin\tmax\n",
+    "reports/markduplicates/S1/S1.md.cram.metrics": b"## METRICS\n",
+    "preprocessing/markduplicates/S1/S1.md.cram": b"cram",       # не нужен API — не выгружается
+}
+
+def test_pipeline_outputs_become_artifacts(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, "BASE_RUN_DIR", str(tmp_path / "work"))
+    monkeypatch.setenv("NFCORE_CACHE", str(tmp_path / "cache"))
+
+    def fake_run(cmd, cwd):
+        if cmd[:2] == ["git", "clone"]:
+            os.makedirs(os.path.join(cmd[-1], ".git"))
+        if cmd[0] == "nextflow":
+            outdir = cmd[cmd.index("--outdir") + 1]
+            for rel, body in OUTPUTS.items():
+                os.makedirs(os.path.dirname(os.path.join(outdir, rel)), exist_ok=True)
+                with open(os.path.join(outdir, rel), "wb") as fh:
+                    fh.write(body)
+        return 0, "", ""
+
+    monkeypatch.setattr(runner, "_run", fake_run)
+    s3.create_bucket(Bucket="runs")
+    out = runner.run_nfcore_dna_seq(runner.NFCoreDNASeqIn(stub_run=False))
+    assert out["status"] == "Succeeded"
+    rid = out["run_id"]
+    published = {a for a in out["artifacts"] if "/logs/" not in a}
+    assert published == {f"s3://runs/{rid}/{rel}" for rel in OUTPUTS if not rel.endswith(".cram")}
+    vcf = "variant_calling/haplotypecaller/S1/S1.haplotypecaller.filtered.vcf.gz"
+    assert s3.get_object(Bucket="runs", Key=f"{rid}/{vcf}")["Body"].read() == b"vcf"
+
+    stub = runner.run_nfcore_dna_seq(runner.NFCoreDNASeqIn(stub_run=True))
+    assert all("/logs/" in a for a in stub["artifacts"])   # заглушки stub-run не выгружаются
@@ -0,0 +1,101 @@
+import hashlib, os, threading
+
+import pytest
+
+import refcache
+from refcache import ReferenceCache, RefCacheError
+
+FASTA = b">chr1\nACGTACGTAC\n" * 200
+
+def _put(s3, key, body):
+    s3.put_object(Bucket="references", Key=key, Body=body)
+
+@pytest.fixture()
+def refs(s3):
+    s3.create_bucket(Bucket="references")
+    _put(s3, "GRCh38/GRCh38.fa", FASTA)
+    for ext in ("amb", "ann", "bwt", "pac", "sa"):
+        _put(s3, f"GRCh38/bwa/GRCh38.{ext}", ext.encode() * 100)
+    return s3
+
+def test_stage_file_and_prefix_read_only(refs, tmp_path):
+    cache = ReferenceCache(str(tmp_path), budget_bytes=10 ** 6)
+    comps = [
+        {"role": "FASTA", "uri": "s3://references/GRCh38/GRCh38.fa", "md5": hashlib.md5(FASTA).hexdigest()},
+        {"role": "BWA_INDEX", "uri": "s3://references/GRCh38/bwa/GRCh38"},
+    ]
+    with cache.stage(comps) as paths:
+        assert open(paths["FASTA"], "rb").read() == FASTA
+        assert os.path.exists(paths["BWA_INDEX"] + ".bwt")
+        assert not os.access(paths["FASTA"], os.W_OK) or os.geteuid() == 0
+        assert cache.stats()["pinned"] == 2
+    assert cache.stats()["pinned"] == 0
+
+    with cache.stage(comps):
+        pass
+    assert cache.misses == 2 and cache.hits == 2
+
+def test_md5_mismatch_leaves_no_entry(refs, tmp_path):
+    cache = ReferenceCache(str(tmp_path), budget_bytes=10 ** 6)
+    with pytest.raises(RefCacheError):
+        cache.acquire({"role": "FASTA", "uri": "s3://references/GRCh38/GRCh38.fa", "md5": "0" * 32})
+    assert cache.stats()["entries"] == 0
+
+def test_single_flight(refs, tmp_path, monkeypatch):
+    cache = ReferenceCache(str(tmp_path), budget_bytes=10 ** 6)
+    calls = []
+    real = refcache.download_file
+    monkeypatch.setattr(refcache, "download_file", lambda *a, **kw: (calls.append(a), real(*a, **kw)))
+    comp = {"role": "FASTA", "uri": "s3://references/GRCh38/GRCh38.fa"}
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(cache.acquire(comp)[1])) for _ in range(8)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert len(calls) == 1 and len(set(paths)) == 1
+
+def test_lru_eviction_skips_pinned(refs, tmp_path):
+    _put(refs, "GRCh37/GRCh37.fa", FASTA)
+    _put(refs, "T2T/T2T.fa", FASTA)
+    cache = ReferenceCache(str(tmp_path), budget_bytes=2 * len(FASTA))
+    k38, _ = cache.acquire({"role": "FASTA", "uri": "s3://references/GRCh38/GRCh38.fa"})   # остаётся запиненным
+    k37, _ = cache.acquire({"role": "FASTA", "uri": "s3://references/GRCh37/GRCh37.fa"})
+    cache.release(k37)
+    cache.acquire({"role": "FASTA", "uri": "s3://references/T2T/T2T.fa"})
+    names = {n for _, n, _ in cache._entries()}
+    assert k38 in names and k37 not in names
+    with pytest.raises(RefCacheError):
+        cache.acquire({"role": "BWA_INDEX", "uri": "s3://references/GRCh38/bwa/GRCh38"})
+
+def test_eviction_skips_entries_pinned_by_other_process(refs, tmp_path):
+    import fcntl
+    _put(refs, "GRCh37/GRCh37.fa", FASTA)
+    cache = ReferenceCache(str(tmp_path), budget_bytes=len(FASTA))
+    k38, _ = cache.acquire({"role": "FASTA", "uri": "s3://references/GRCh38/GRCh38.fa"})
+    cache.release(k38)
+    # другой раннер на том же каталоге держит запись (отдельное open file description — как чужой процесс)
+    other = ReferenceCache(str(tmp_path), budget_bytes=len(FASTA))
+    assert other.acquire({"role": "FASTA", "uri": "s3://references/GRCh38/GRCh38.fa"})[0] == k38
+    with open(os.path.join(tmp_path, ".locks", f"{k38}.pin")) as fh:
+        with pytest.raises(BlockingIOError):
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    with pytest.raises(RefCacheError):
+        cache.acquire({"role": "FASTA", "uri": "s3://references/GRCh37/GRCh37.fa"})
+    assert k38 in {n for _, n, _ in cache._entries()}
+
+    other.release(k38)
+    k37, _ = cache.acquire({"role": "FASTA", "uri": "s3://references/GRCh37/GRCh37.fa"})
+    assert {n for _, n, _ in cache._entries()} == {k37}
+
+def test_prefix_does_not_capture_siblings(refs, tmp_path):
+    for key in ("GRCh38/bwamem2/GRCh38.0123", "GRCh38/bwa.old/GRCh38.bwt", "GRCh38/bwa/GRCh38.old/x"):
+        _put(refs, key, b"sibling")
+    cache = ReferenceCache(str(tmp_path), budget_bytes=10 ** 6)
+    index = [f"GRCh38.{e}" for e in ("amb", "ann", "bwt", "pac", "sa")]
+    files = lambda root: sorted(os.path.relpath(os.path.join(d, f), root)
+                                for d, _, fs in os.walk(root) for f in fs if f != refcache.META)
+    with cache.stage([{"role": "DIR", "uri": "s3://references/GRCh38/bwa"},
+                      {"role": "BASE", "uri": "s3://references/GRCh38/bwa/GRCh38"}]) as paths:
+        # каталог bwa/ целиком, без соседних bwamem2/ и bwa.old/
+        assert files(paths["DIR"]) == sorted(index + ["GRCh38.old/x"])
+        # базовое имя — только файлы индекса рядом с ним
+        assert files(os.path.dirname(paths["BASE"])) == index
@@ -0,0 +1,45 @@
+import csv, hashlib, os
+
+import pytest
+
+import staging
+from staging import stage_samples, StagingError
+
+def _fq(i, rd):
+    return f"@r{i}/{rd}\nACGT\n+\nIIII\n".encode() * 50
+
+@pytest.fixture()
+def inputs(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, "STAGE_DIR", str(tmp_path / "staged"))
+    s3.create_bucket(Bucket="datasets")
+    samples = []
+    for i in range(30):
+        row = {"sample": f"S{i}"}
+        for rd in (1, 2):
+            body = _fq(i, rd)
+            s3.put_object(Bucket="datasets", Key=f"p/S{i}_R{rd}.fastq.gz", Body=body)
+            row[f"fastq_{rd}"] = f"s3://datasets/p/S{i}_R{rd}.fastq.gz"
+            row[f"md5_{rd}"] = hashlib.md5(body).hexdigest() if i % 2 else None
+        samples.append(row)
+    return samples
+
+def test_samplesheet_and_skip_on_restage(inputs, tmp_path):
+    run1 = tmp_path / "run1"
+    run1.mkdir()
+    st = stage_samples(iter(inputs), str(run1), str(run1 / "ss.csv"), workers=4)
+    assert st["samples"] == 30 and st["staged"] == 60 and st["skipped"] == 0
+
+    rows = list(csv.DictReader(open(run1 / "ss.csv")))
+    assert [r["sample"] for r in rows] == [f"S{i}" for i in range(30)]
+    assert open(rows[3]["fastq_2"], "rb").read() == _fq(3, 2)
+
+    run2 = tmp_path / "run2"
+    run2.mkdir()
+    st = stage_samples(iter(inputs), str(run2), str(run2 / "ss.csv"), workers=4)
+    assert st["staged"] == 0 and st["skipped"] == 60
+    assert os.path.samefile(run2 / "inputs" / "S0" / "S0_R1.fastq.gz", run1 / "inputs" / "S0" / "S0_R1.fastq.gz")
+
+def test_checksum_mismatch_fails(inputs, tmp_path):
+    bad = [dict(inputs[0], md5_1="0" * 32)]
+    with pytest.raises(StagingError):
+        stage_samples(bad, str(tmp_path), str(tmp_path / "ss.csv"))
@@ -0,0 +1,25 @@
+import os
+
+import app as runner
+
+def test_run_reports_phase_timings(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, "BASE_RUN_DIR", str(tmp_path / "work"))
+    monkeypatch.setenv("NFCORE_CACHE", str(tmp_path / "cache"))
+    calls = []
+
+    def fake_run(cmd, cwd):
+        calls.append(cmd[:2])
+        if cmd[:2] == ["git", "clone"]:
+            os.makedirs(os.path.join(cmd[-1], ".git"))
+        if cmd[0] == "nextflow":
+            with open(cmd[cmd.index("-with-trace") + 1], "w") as fh:
+                fh.write("task_id\tname\n")
+        return 0, "", ""
+
+    monkeypatch.setattr(runner, "_run", fake_run)
+    s3.create_bucket(Bucket="runs")
+    out = runner.run_nfcore_dna_seq(runner.NFCoreDNASeqIn())
+    assert out["status"] == "Succeeded" and ["git", "clone"] in calls
+    t = out["timings"]
+    assert list(t) == ["prepare", "pipeline_sync", "reference_staging", "input_staging", "nextflow", "upload", "total"]
+    assert abs(sum(v for k, v in t.items() if k != "total") - t["total"]) < 0.01
@@ -0,0 +1,72 @@
+import threading, time
+
+import worker
+
+class FakeAPI:
+    """Стенд API парка в процессе: очередь заданий, аренда по runner_id."""
+    def __init__(self, jobs):
+        self.queue = list(jobs)
+        self.leased: dict[str, str] = {}
+        self.completed: dict[str, dict] = {}
+        self.beats: list[dict] = []
+        self.lock = threading.Lock()
+
+    def post(self, runner_id):
+        def _post(path, body):
+            with self.lock:
+                if path == "/fleet/claim":
+                    assert body["runner_id"] == runner_id
+                    take, self.queue = self.queue[:body["capacity"]], self.queue[body["capacity"]:]
+                    for j in take:
+                        self.leased[j["id"]] = runner_id
+                    return {"jobs": take, "heartbeat_s": 1}
+                if path == "/fleet/heartbeat":
+                    self.beats.append(body)
+                    return {"lost": [j for j in body["running"] if self.leased.get(j) != runner_id]}
+                job_id = path.split("/")[3]
+                self.completed[job_id] = body["result"]
+                return {"status": body["result"]["status"]}
+        return _post
+
+def test_worker_claims_up_to_capacity_and_reports(monkeypatch):
+    gate = threading.Event()
+    api = FakeAPI([{"id": f"j{i}", "run_id": f"r{i}", "kind": "smoke", "payload": {"n": i}} for i in range(3)]
+                  + [{"id": "bad", "run_id": "rb", "kind": "unknown", "payload": {}}])
+    w = worker.Worker({"smoke": lambda p: gate.wait(5) and {"status": "Succeeded", "artifacts": [], "n": p["n"]}},
+                      slots=2, runner_id="node-a")
+    monkeypatch.setattr(w, "_post", api.post("node-a"))
+
+    assert w.claim_once() == 2 and w.free() == 0
+    assert w.claim_once() == 0                       # слоты заняты — в API не ходим за новыми
+    assert sorted(w.heartbeat_once()) == []
+    assert sorted(api.beats[-1]["running"]) == ["j0", "j1"]
+    api.leased["j1"] = "node-b"                      # аренду перехватили
+    assert w.heartbeat_once() == ["j1"]
+
+    gate.set()
+    w._pool.shutdown(wait=True)
+    w._pool = worker.ThreadPoolExecutor(max_workers=2)
+    assert w.free() == 2 and api.completed["j0"]["n"] == 0
+    assert w.claim_once() == 2
+    w._pool.shutdown(wait=True)
+    assert api.completed["j2"]["status"] == "Succeeded"
+    assert api.completed["bad"]["status"] == "Failed" and "KeyError" in api.completed["bad"]["error"]
+
+def test_lost_lease_kills_subprocess_and_frees_slot(monkeypatch, tmp_path):
+    api = FakeAPI([{"id": "j", "run_id": "r", "kind": "sleep", "payload": {}}])
+    rcs = []
+    w = worker.Worker({"sleep": lambda p: rcs.append(worker.run(["sleep", "30"], str(tmp_path), 60)[0])
+                       or {"status": "Succeeded", "artifacts": []}}, slots=1, runner_id="node-a")
+    monkeypatch.setattr(w, "_post", api.post("node-a"))
+
+    assert w.claim_once() == 1
+    for _ in range(200):
+        if w._procs.get("j"):
+            break
+        time.sleep(0.01)
+    api.leased["j"] = "node-b"                      # аренду перехватили
+    assert w.heartbeat_once() == ["j"]
+    assert w.free() == 1                            # слот свободен сразу, не по завершении sleep
+    w._pool.shutdown(wait=True)
+    assert rcs and rcs[0] < 0                       # sleep убит сигналом
+    assert "j" not in api.completed                 # результат отменённого задания не отправляется
@@ -0,0 +1,181 @@
+import json, logging, os, signal, socket, subprocess, threading, time, traceback, urllib.error, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Режим парка: раннер сам забирает задания из API (POST /fleet/claim) под свободные слоты, пока они
+# выполняются — продлевает аренду heartbeat'ом, результат отправляет в /fleet/jobs/{id}/complete.
+# Раннер упал — аренда истекает, API возвращает задание в очередь, его берёт другой узел.
+RUNNER_WORKER = os.environ.get("RUNNER_WORKER", "0") == "1"
+API_BASE = os.environ.get("API_BASE", "http://api:8000")
+RUNNER_TOKEN = os.environ.get("RUNNER_TOKEN", "")
+RUNNER_ID = os.environ.get("RUNNER_ID", "") or socket.gethostname()
+RUNNER_SLOTS = int(os.environ.get("RUNNER_SLOTS", "2"))            # одновременных запусков на узле
+RUNNER_POLL_S = float(os.environ.get("RUNNER_POLL_S", "5"))
+RUNNER_HTTP_TIMEOUT = float(os.environ.get("RUNNER_HTTP_TIMEOUT", "30"))
+
+log = logging.getLogger(__name__)
+_current = threading.local()   # (worker, job_id) задания, которое выполняет поток пула
+
+def run(cmd: list[str], cwd: str, timeout: float) -> tuple[int, str, str]:
+    """subprocess.run(capture_output, text) с регистрацией процесса за заданием парка: потеря аренды — kill."""
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                            start_new_session=True)   # своя группа: сигнал получают и дочерние процессы nextflow
+    owner = getattr(_current, "job", None)
+    if owner:
+        owner[0]._track(owner[1], proc)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill(proc)
+        proc.communicate()
+        raise
+    finally:
+        if owner:
+            owner[0]._untrack(owner[1], proc)
+    return proc.returncode, stdout, stderr
+
+def _kill(proc: subprocess.Popen):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+class Worker:
+    def __init__(self, handlers: dict, slots: int = RUNNER_SLOTS, runner_id: str = RUNNER_ID):
+        self.handlers = handlers          # kind → fn(payload: dict) -> dict (ответ /run/<kind>)
+        self.slots = slots
+        self.runner_id = runner_id
+        self.heartbeat_s = 30.0           # уточняется ответом claim
+        self._running: dict[str, float] = {}   # job_id → время старта
+        self._procs: dict[str, list[subprocess.Popen]] = {}   # job_id → живые подпроцессы задания
+        self._cancelled: set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=slots, thread_name_prefix="fleet-job")
+        self._threads: list[threading.Thread] = []
+
+    # --- API ---
+    def _post(self, path: str, body: dict) -> dict:
+        req = urllib.request.Request(
+            f"{API_BASE}{path}", data=json.dumps(body).encode("utf-8"), method="POST",
+            headers={"Content-Type": "application/json", "X-Runner-Token": RUNNER_TOKEN},
+        )
+        with urllib.request.urlopen(req, timeout=RUNNER_HTTP_TIMEOUT) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def free(self) -> int:
+        with self._lock:
+            return self.slots - len(self._running)
+
+    def claim_once(self) -> int:
+        """Забирает задания под свободные слоты; возвращает число принятых."""
+        free = self.free()
+        if free <= 0:
+            return 0
+        out = self._post("/fleet/claim", {"runner_id": self.runner_id, "capacity": free})
+        self.heartbeat_s = float(out.get("heartbeat_s") or self.heartbeat_s)
+        for job in out["jobs"]:
+            with self._lock:
+                self._running[job["id"]] = time.time()
+            self._pool.submit(self._execute, job)
+        return len(out["jobs"])
+
+    def heartbeat_once(self) -> list[str]:
+        with self._lock:
+            running = list(self._running)
+        out = self._post("/fleet/heartbeat", {
+            "runner_id": self.runner_id, "capacity": self.slots, "running": running,
+            "info": {"cpus": os.cpu_count(), "pid": os.getpid()},
+        })
+        for job_id in out.get("lost") or []:
+            # задание перехвачено другим узлом: подпроцессы убиваем, слот освобождаем сразу
+            log.warning("fleet: lease lost for job %s", job_id)
+            self.cancel(job_id)
+        return out.get("lost") or []
+
+    def cancel(self, job_id: str):
+        with self._lock:
+            if job_id not in self._running:
+                return
+            self._cancelled.add(job_id)
+            self._running.pop(job_id)
+            procs = list(self._procs.get(job_id, ()))
+        for p in procs:
+            _kill(p)
+        self._wake.set()
+
+    def _track(self, job_id: str, proc: subprocess.Popen):
+        with self._lock:
+            self._procs.setdefault(job_id, []).append(proc)
+            cancelled = job_id in self._cancelled
+        if cancelled:   # аренду потеряли до старта подпроцесса
+            _kill(proc)
+
+    def _untrack(self, job_id: str, proc: subprocess.Popen):
+        with self._lock:
+            procs = self._procs.get(job_id, [])
+            if proc in procs:
+                procs.remove(proc)
+
+    def _execute(self, job: dict):
+        _current.job = (self, job["id"])
+        try:
+            try:
+                handler = self.handlers[job["kind"]]
+                result = handler(job.get("payload") or {})
+                if hasattr(result, "body"):   # JSONResponse обработчика с ошибкой
+                    result = json.loads(result.body)
+            except Exception as e:
+                traceback.print_exc()
+                result = {"status": "Failed", "error": f"{type(e).__name__}: {e}", "artifacts": []}
+            with self._lock:
+                cancelled = job["id"] in self._cancelled
+            if not cancelled:   # результат отменённого задания API всё равно отклонит (409)
+                self._complete(job["id"], result)
+        finally:
+            _current.job = None
+            with self._lock:
+                self._running.pop(job["id"], None)
+                self._procs.pop(job["id"], None)
+                self._cancelled.discard(job["id"])
+            self._wake.set()   # слот освободился — забрать следующее, не дожидаясь опроса
+
+    def _complete(self, job_id: str, result: dict):
+        for attempt in range(5):
+            try:
+                self._post(f"/fleet/jobs/{job_id}/complete", {"runner_id": self.runner_id, "result": result})
+                return
+            except urllib.error.HTTPError as e:
+                if e.code in (404, 409):   # аренда потеряна — задание уже у другого узла
+                    log.warning("fleet: result for job %s rejected (%s)", job_id, e.code)
+                    return
+            except Exception:
+                traceback.print_exc()
+            time.sleep(min(2 ** attempt, 30))
+
+    # --- циклы ---
+    def _claim_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.claim_once()
+            except Exception:
+                traceback.print_exc()
+            self._wake.wait(RUNNER_POLL_S)
+            self._wake.clear()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_s):
+            try:
+                self.heartbeat_once()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        for target, name in ((self._claim_loop, "fleet-claim"), (self._heartbeat_loop, "fleet-heartbeat")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,151 @@
+import os, time, threading
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
+import botocore.exceptions   # лёгкий; boto3 (~150 мс импорта) — лениво, при создании клиента
+
+if TYPE_CHECKING:
+    from boto3.s3.transfer import TransferConfig
+
+# Общий S3-слой API и раннера: клиент (пул, ретраи, таймауты), метрики вызовов и трансферов, multipart.
+# Образы копируют модуль при сборке (контекст — корень репозитория); специфичное — в <сервис>/s3client.py.
+S3_ENDPOINT = os.environ.get("S3_ENDPOINT", "http://minio:9000")
+S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY", "miniokey")
+S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY", "miniopass")
+
+# --- пул/ретраи/таймауты ---
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "64"))
+S3_MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", "5"))
+S3_CONNECT_TIMEOUT = float(os.environ.get("S3_CONNECT_TIMEOUT", "5"))
+S3_READ_TIMEOUT = float(os.environ.get("S3_READ_TIMEOUT", "60"))
+
+# --- multipart transfer ---
+MB = 1024 * 1024
+S3_MULTIPART_THRESHOLD = int(os.environ.get("S3_MULTIPART_THRESHOLD_MB", "64")) * MB
+S3_MULTIPART_CHUNK = int(os.environ.get("S3_MULTIPART_CHUNK_MB", "64")) * MB
+S3_TRANSFER_CONCURRENCY = int(os.environ.get("S3_TRANSFER_CONCURRENCY", "16"))
+
+_client = None
+_transfer_config = None
+_client_lock = threading.Lock()
+_known_buckets: set[str] = set()
+
+# --- метрики: вызовы API (кол-во, время, ошибки) и байты трансферов ---
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ops = defaultdict(lambda: {"count": 0, "errors": 0, "seconds": 0.0})
+        self.transfers = defaultdict(lambda: {"count": 0, "bytes": 0, "seconds": 0.0})
+
+    def observe_op(self, op: str, seconds: float, error: bool):
+        with self._lock:
+            o = self.ops[op]
+            o["count"] += 1
+            o["seconds"] += seconds
+            o["errors"] += int(error)
+
+    def observe_transfer(self, kind: str, nbytes: int, seconds: float):
+        with self._lock:
+            t = self.transfers[kind]
+            t["count"] += 1
+            t["bytes"] += nbytes
+            t["seconds"] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"ops": {k: dict(v) for k, v in self.ops.items()},
+                    "transfers": {k: dict(v) for k, v in self.transfers.items()}}
+
+stats = _Stats()
+
+def _before_call(context, model, **_):
+    context["_t0"] = time.perf_counter()
+    context["_op"] = model.name   # after-call-error приходит без model
+
+def _after_call(context, model, http_response, **_):
+    t0 = context.get("_t0")
+    if t0 is not None:
+        stats.observe_op(model.name, time.perf_counter() - t0, http_response.status_code >= 400)
+
+def _after_call_error(context, **_):
+    t0 = context.get("_t0")
+    if t0 is not None:
+        stats.observe_op(context["_op"], time.perf_counter() - t0, True)
+
+def build(endpoint: str | None = None):
+    """Новый клиент с метриками; endpoint по умолчанию — S3_ENDPOINT (пусто → стандартный AWS)."""
+    import boto3
+    from botocore.config import Config
+
+    c = boto3.session.Session().client(
+        "s3",
+        endpoint_url=(S3_ENDPOINT if endpoint is None else endpoint) or None,
+        aws_access_key_id=S3_ACCESS_KEY,
+        aws_secret_access_key=S3_SECRET_KEY,
+        config=Config(
+            max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+            retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "standard"},
+            connect_timeout=S3_CONNECT_TIMEOUT,
+            read_timeout=S3_READ_TIMEOUT,
+            tcp_keepalive=True,
+        ),
+    )
+    c.meta.events.register("before-call.s3", _before_call)
+    c.meta.events.register("after-call.s3", _after_call)
+    c.meta.events.register("after-call-error.s3", _after_call_error)
+    return c
+
+def client():
+    # один клиент на процесс: клиент потокобезопасен, а его создание дорогое и не потокобезопасно
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build()
+    return _client
+
+def transfer_config() -> "TransferConfig":
+    global _transfer_config
+    if _transfer_config is None:
+        from boto3.s3.transfer import TransferConfig
+        _transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNK,
+            max_concurrency=S3_TRANSFER_CONCURRENCY,
+            use_threads=True,
+        )
+    return _transfer_config
+
+def ensure_bucket(bucket: str, force: bool = False):
+    # существование бакета проверяется один раз за жизнь процесса (на старте)
+    if bucket in _known_buckets and not force:
+        return
+    s3 = client()
+    try:
+        s3.head_bucket(Bucket=bucket)
+    except botocore.exceptions.ClientError:
+        s3.create_bucket(Bucket=bucket)
+    _known_buckets.add(bucket)
+
+def upload_file(path: str, bucket: str, key: str):
+    t0 = time.perf_counter()
+    client().upload_file(path, bucket, key, Config=transfer_config())
+    stats.observe_transfer("upload", os.path.getsize(path), time.perf_counter() - t0)
+
+def download_file(bucket: str, key: str, path: str, config: "TransferConfig | None" = None):
+    # s3transfer качает крупные объекты параллельными ranged GET (multipart_chunksize × max_concurrency)
+    t0 = time.perf_counter()
+    client().download_file(bucket, key, path, Config=config or transfer_config())
+    stats.observe_transfer("download", os.path.getsize(path), time.perf_counter() - t0)
+
+def split_uri(uri: str) -> tuple[str, str]:
+    if not uri.startswith("s3://"):
+        raise ValueError(f"Not an s3:// URI: {uri}")
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+def reset():
+    """Сбрасывает клиент и кэш бакетов (тесты: новый mock S3)."""
+    global _client
+    _client = None
+    _known_buckets.clear()
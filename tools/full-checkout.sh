@@ -194,6 +194,13 @@ create_run_dnaseq_stub() {
   echo "$resp" | jq -C . | sed 's/^/  /'
   status=$(echo "$resp" | json '.status')
   rid=$(echo "$resp" | json '.id')
+  # POST ставит запуск в очередь (scheduler), дальше — раннер или парк раннеров: ждём завершения
+  local i=0
+  while [[ "$status" == "Running" || "$status" == "Queued" ]] && (( i++ < 360 )); do
+    sleep 10
+    resp=$(api_get "$token" "$EP_RUNS/$rid") || fail "GET /runs/$rid failed"
+    status=$(echo "$resp" | json '.status')
+  done
   rrun=$(echo "$resp" | json '.runner_job_id')
   echo "status: $status | run_id: $rrun | api_id: $rid"
   echo "artifacts:"; echo "$resp" | jq -r '.artifacts[]?' | sed 's/^/ - /' || true